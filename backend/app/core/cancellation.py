@@ -0,0 +1,52 @@
+"""
+Cancel request handlers when the HTTP client goes away
+"""
+
+import asyncio
+import contextlib
+import logging
+from collections.abc import Coroutine
+from typing import Any, TypeVar
+
+from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# nginx と同じく「クライアントが接続を閉じた」ことを表すステータス
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnectedError(Exception):
+    """処理完了前にクライアントが切断した"""
+
+
+async def run_until_disconnect(
+    request: Request,
+    coro: Coroutine[Any, Any, T],
+    poll_interval: float = 1.0,
+) -> T:
+    """
+    コルーチンを実行し、クライアントが切断したらキャンセルする
+
+    キャンセルは処理中のFFmpegサブプロセスの停止まで伝播する。
+
+    Raises:
+        ClientDisconnectedError: 完了前にクライアントが切断した場合
+    """
+    task = asyncio.create_task(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected, cancelling {request.url.path}")
+                task.cancel()
+                with contextlib.suppress(asyncio.CancelledError):
+                    await task
+                raise ClientDisconnectedError
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
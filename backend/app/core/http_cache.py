@@ -0,0 +1,235 @@
+"""
+HTTP caching of read endpoints: ETags, conditional requests and compression
+
+Read endpoints polled by the frontend answer with a content-hash ``ETag`` and
+return ``304 Not Modified`` when ``If-None-Match`` still matches, so an
+unchanged analysis or video list costs a hash instead of a transfer.
+Responses that never change while the process runs are serialized once
+(``PreserializedJSON``). Responses embedding signed URLs may only be cached
+until the earliest URL expires (``signed_url_cache_control``).
+
+``CompressionMiddleware`` compresses complete JSON/text bodies with brotli
+(when the ``brotli`` package is installed, ``poetry install -E compression``)
+or gzip, according to ``Accept-Encoding``. Streaming responses such as the
+Server-Sent Events progress feed are passed through untouched.
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import time
+from typing import Any
+
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from app.core.telemetry import REGISTRY
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# 内容が変わるたびにETagで再検証させる（変わらなければ 304）
+REVALIDATE = "private, no-cache"
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+NOT_MODIFIED = REGISTRY.counter(
+    "http_not_modified_total",
+    "Conditional GET requests answered with 304 by route",
+    ("route",),
+)
+COMPRESSED_BYTES = REGISTRY.counter(
+    "http_compressed_bytes_saved_total",
+    "Response bytes saved by compression by encoding (br, gzip)",
+    ("encoding",),
+)
+
+
+def content_etag(body: bytes) -> str:
+    """本文のハッシュから求める強いETag"""
+    return f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """``If-None-Match`` がETagに一致するか（弱い比較）"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return etag.removeprefix("W/") in candidates
+
+
+def _route_path(request: Request) -> str:
+    route = request.scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+def conditional_response(
+    request: Request,
+    body: bytes,
+    *,
+    cache_control: str = REVALIDATE,
+    etag: str | None = None,
+    media_type: str = "application/json",
+) -> Response:
+    """ETag付きのレスポンス（``If-None-Match`` が一致すれば本文なしの 304）"""
+    etag = etag or content_etag(body)
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if etag_matches(request, etag):
+        NOT_MODIFIED.inc(route=_route_path(request))
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type=media_type, headers=headers)
+
+
+def cached_json(
+    request: Request, content: BaseModel | list[BaseModel], **kwargs: Any
+) -> Response:
+    """モデルをJSONにし、本文のハッシュをETagとして返す"""
+    if isinstance(content, list):
+        body = b"[" + b",".join(item.model_dump_json().encode() for item in content)
+        body += b"]"
+    else:
+        body = content.model_dump_json().encode()
+    return conditional_response(request, body, **kwargs)
+
+
+class PreserializedJSON:
+    """一度だけシリアライズし、本文とETagを使い回すレスポンス"""
+
+    def __init__(self, content: BaseModel, cache_control: str):
+        self.body = content.model_dump_json().encode()
+        self.etag = content_etag(self.body)
+        self.cache_control = cache_control
+
+    def response(self, request: Request) -> Response:
+        return conditional_response(
+            request, self.body, etag=self.etag, cache_control=self.cache_control
+        )
+
+
+def signed_url_cache_control(
+    expires_at: float | None, margin: float, now: float | None = None
+) -> str:
+    """
+    署名付きURLを含むレスポンスの ``Cache-Control``
+
+    最も早く期限切れになるURLの ``margin`` 秒前までキャッシュを許す。
+    """
+    if expires_at is None:
+        return "private, no-store"
+    now = time.time() if now is None else now
+    max_age = int(expires_at - now - margin)
+    if max_age <= 0:
+        return "private, no-store"
+    return f"private, max-age={max_age}"
+
+
+def accepted_encoding(accept_encoding: str) -> str | None:
+    """``Accept-Encoding`` から使う圧縮方式を選ぶ（br を優先）"""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.strip().replace(" ", "") in ("q=0", "q=0.0"):
+            continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    1回で送られるJSON/テキストの本文を圧縮するASGIミドルウェア
+
+    ``minimum_size`` バイト未満の本文、圧縮済み・ストリーミングのレスポンスは
+    そのまま返す。圧縮した場合は強いETagを弱いETagにする（表現が変わるため）。
+    """
+
+    def __init__(self, app: Any, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = accepted_encoding(accept)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: dict | None = None
+        passthrough = False
+
+        async def send_wrapper(message: dict) -> None:
+            nonlocal start, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if passthrough or start is None or message["type"] != "http.response.body":
+                await send(message)
+                return
+            if message.get("more_body", False):
+                # ストリーミング（SSEなど）は圧縮せずにそのまま流す
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+            await self._send_body(start, message, encoding, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _send_body(
+        self, start: dict, message: dict, encoding: str, send: Any
+    ) -> None:
+        body = message.get("body", b"")
+        headers = list(start.get("headers", []))
+        names = {key.lower(): value for key, value in headers}
+        content_type = names.get(b"content-type", b"").decode("latin-1")
+        compressible = content_type.startswith(COMPRESSIBLE_TYPES)
+        if compressible:
+            headers.append((b"vary", b"Accept-Encoding"))
+        if (
+            not compressible
+            or b"content-encoding" in names
+            or len(body) < self.minimum_size
+        ):
+            await send({**start, "headers": headers})
+            await send(message)
+            return
+
+        compressed = compress(body, encoding)
+        COMPRESSED_BYTES.inc(len(body) - len(compressed), encoding=encoding)
+        rewritten = []
+        for key, value in headers:
+            lower = key.lower()
+            if lower == b"content-length":
+                continue
+            if lower == b"etag" and not value.startswith(b"W/"):
+                value = b"W/" + value
+            rewritten.append((key, value))
+        rewritten += [
+            (b"content-encoding", encoding.encode()),
+            (b"content-length", str(len(compressed)).encode()),
+        ]
+        await send({**start, "headers": rewritten})
+        await send({**message, "body": compressed})
@@ -0,0 +1,88 @@
+"""
+Deferred imports of heavy SDKs
+
+The Google SDKs (``google.genai``, ``google.generativeai``,
+``google.cloud.storage``, ``google.auth``) take hundreds of milliseconds to
+import, which every cold start paid even when the instance only served
+``/api/upload/init`` or ``/health``. Modules refer to them through
+:func:`lazy_import` proxies that import the real module on the first
+attribute access. :func:`warm_lazy_modules` imports them ahead of time, e.g.
+in the background once the server is listening.
+
+The proxy for a name is shared, so ``patch("app.services.x.storage.Client")``
+affects every user of the proxy as it did with the real module, and patches of
+the real module (``patch("google.cloud.storage.Client")``) are seen through it.
+"""
+
+import importlib
+import logging
+import sys
+import threading
+import time
+from types import ModuleType
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+_proxies: dict[str, "LazyModule"] = {}
+_lock = threading.Lock()
+
+
+class LazyModule(ModuleType):
+    """最初に属性を参照したときに実際のモジュールを import する代理"""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_target"] = None
+
+    def _load(self) -> ModuleType:
+        module = self.__dict__["_lazy_target"]
+        if module is None:
+            started = time.perf_counter()
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_lazy_target"] = module
+            logger.debug(
+                f"Imported {self.__name__} in {time.perf_counter() - started:.3f}s"
+            )
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        # パッチの差し替えが反映されるよう、属性はキャッシュせず毎回参照する
+        return getattr(self._load(), attr)
+
+    def __dir__(self) -> list[str]:
+        return dir(self._load())
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+    @property
+    def loaded(self) -> bool:
+        return self.__dict__["_lazy_target"] is not None or self.__name__ in sys.modules
+
+
+def lazy_import(name: str) -> Any:
+    """``name`` のモジュールの代理（型は Any として扱う）"""
+    with _lock:
+        if name not in _proxies:
+            _proxies[name] = LazyModule(name)
+        return _proxies[name]
+
+
+def warm_lazy_modules() -> dict[str, float]:
+    """登録済みの代理のモジュールをすべて import し、モジュールごとの秒数を返す"""
+    timings = {}
+    for name, proxy in list(_proxies.items()):
+        started = time.perf_counter()
+        try:
+            proxy._load()
+        except ImportError as e:
+            logger.warning(f"Failed to preload {name}: {e!s}")
+            continue
+        timings[name] = time.perf_counter() - started
+    logger.info(
+        "Preloaded "
+        + ", ".join(f"{name} ({seconds:.2f}s)" for name, seconds in timings.items())
+    )
+    return timings
@@ -0,0 +1,270 @@
+"""
+Opt-in request profiling
+
+A profile session collects, for a single request:
+
+- a sampling profile of the Python threads (collapsed stacks, flamegraph-ready)
+- every telemetry span finished during the request (GCS transfer, model wait, ...)
+- resource usage and ``-progress``/``-benchmark`` output of each FFmpeg child
+
+Profiling is enabled per request with the ``X-Profile`` header or globally with
+``PROFILING_ENABLED``. The finished session is stored as a JSON artifact,
+together with the tenant that made the request, and linked from the response
+headers; only that tenant can read it back.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from types import FrameType
+
+    from app.core.settings import Settings
+
+PROFILE_REQUEST_HEADER = "X-Profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+
+# プロファイル対象のパス（コストの高いエンドポイントのみ）
+PROFILED_PATH_PREFIXES = ("/api/extract", "/api/analyze", "/api/render")
+
+MAX_STACK_DEPTH = 64
+
+_profile_var: ContextVar[ProfileSession | None] = ContextVar(
+    "profile_session", default=None
+)
+
+
+def active_profile() -> ProfileSession | None:
+    """現在のリクエストで有効なプロファイルセッション"""
+    return _profile_var.get()
+
+
+def _frame_label(frame: FrameType) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", "?")
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+def _collapse_stack(frame: FrameType | None) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    ``sys._current_frames()`` を一定間隔で採取するサンプリングプロファイラ
+
+    イベントループのスレッドは複数リクエストで共有されるため、同時実行中の
+    他リクエストのスタックも含まれる点に注意。
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+
+    def _run(self) -> None:
+        own_ident = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():  # noqa: SLF001
+                if ident == own_ident:
+                    continue
+                thread_name = names.get(ident, str(ident))
+                self.samples[f"{thread_name};{_collapse_stack(frame)}"] += 1
+            self.sample_count += 1
+
+    def collapsed(self) -> list[str]:
+        """flamegraph.pl / speedscope 互換の collapsed stack 形式"""
+        return [f"{stack} {count}" for stack, count in self.samples.most_common()]
+
+    def top_functions(self, limit: int = 20) -> list[dict[str, Any]]:
+        """スタック先頭（自己時間）の関数ごとのサンプル数"""
+        leaf_counts: Counter[str] = Counter()
+        for stack, count in self.samples.items():
+            leaf_counts[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaf_counts.values()) or 1
+        return [
+            {"function": name, "samples": count, "ratio": round(count / total, 4)}
+            for name, count in leaf_counts.most_common(limit)
+        ]
+
+
+class ProfileSession:
+    """1リクエスト分のプロファイル結果"""
+
+    def __init__(
+        self,
+        method: str,
+        path: str,
+        sample_interval: float,
+        tenant: str | None = None,
+    ):
+        self.profile_id = uuid.uuid4().hex
+        self.method = method
+        self.path = path
+        self.tenant = tenant
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.wall_time: float | None = None
+        self.cpu_time_start = time.process_time()
+        self.cpu_time: float | None = None
+        self.spans: list[dict[str, Any]] = []
+        self.ffmpeg_runs: list[dict[str, Any]] = []
+        self.sampler = SamplingProfiler(sample_interval)
+
+    def record_span(self, name: str, duration: float, status: str) -> None:
+        self.spans.append(
+            {"name": name, "duration_seconds": round(duration, 6), "status": status}
+        )
+
+    def record_ffmpeg(self, run: dict[str, Any]) -> None:
+        self.ffmpeg_runs.append(run)
+
+    def start(self) -> None:
+        self.sampler.start()
+
+    def finish(self) -> None:
+        self.sampler.stop()
+        self.wall_time = time.perf_counter() - self._start
+        self.cpu_time = time.process_time() - self.cpu_time_start
+
+    def stage_summary(self) -> dict[str, float]:
+        """ステージ名ごとの合計時間"""
+        totals: dict[str, float] = {}
+        for span in self.spans:
+            totals[span["name"]] = (
+                totals.get(span["name"], 0.0) + span["duration_seconds"]
+            )
+        return {name: round(total, 6) for name, total in totals.items()}
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "profile_id": self.profile_id,
+            "tenant": self.tenant,
+            "method": self.method,
+            "path": self.path,
+            "started_at": self.started_at,
+            "wall_time_seconds": self.wall_time,
+            "process_cpu_seconds": self.cpu_time,
+            "stages": self.stage_summary(),
+            "spans": self.spans,
+            "ffmpeg": self.ffmpeg_runs,
+            "python_samples": {
+                "interval_seconds": self.sampler.interval,
+                "sample_count": self.sampler.sample_count,
+                "top_functions": self.sampler.top_functions(),
+                "collapsed": self.sampler.collapsed(),
+            },
+        }
+
+
+SaveArtifact = Callable[[str, dict[str, Any]], Awaitable[None]]
+# ASGIのスコープからリクエストのテナントを求める（求められなければ None）
+TenantOf = Callable[[dict], str | None]
+
+
+class ProfilingMiddleware:
+    """
+    プロファイル対象リクエストでセッションを開始し、成果物を保存するASGIミドルウェア
+
+    レスポンスには ``X-Profile-Id`` と ``Link: </api/profiles/{id}>; rel="profile"``
+    を付与する。成果物には tenant_of で求めたテナントを記録する。
+    """
+
+    def __init__(
+        self,
+        app: Any,
+        settings: Settings,
+        save_artifact: SaveArtifact,
+        tenant_of: TenantOf | None = None,
+    ):
+        self.app = app
+        self.settings = settings
+        self.save_artifact = save_artifact
+        self.tenant_of = tenant_of
+
+    def _should_profile(self, scope: dict) -> bool:
+        if not scope.get("path", "").startswith(PROFILED_PATH_PREFIXES):
+            return False
+        if self.settings.profiling_enabled:
+            return True
+        header_name = PROFILE_REQUEST_HEADER.lower().encode()
+        for key, value in scope.get("headers", []):
+            if key == header_name:
+                return value.strip().lower() in (b"1", b"true", b"yes", b"on")
+        return False
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not self._should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(
+            scope.get("method", ""),
+            scope.get("path", ""),
+            self.settings.profiling_sample_interval_ms / 1000,
+            tenant=self.tenant_of(scope) if self.tenant_of else None,
+        )
+        token = _profile_var.set(session)
+        session.start()
+        finished = False
+
+        async def finalize() -> None:
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            session.finish()
+            await self.save_artifact(session.profile_id, session.to_dict())
+
+        async def send_wrapper(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                await finalize()
+                headers = list(message.get("headers", []))
+                headers.append(
+                    (PROFILE_ID_HEADER.lower().encode(), session.profile_id.encode())
+                )
+                headers.append(
+                    (
+                        b"link",
+                        f'</api/profiles/{session.profile_id}>; rel="profile"'.encode(),
+                    )
+                )
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _profile_var.reset(token)
+            if not finished:
+                # レスポンス開始前に例外で終了した場合もサンプラーは止める
+                await asyncio.shield(finalize())
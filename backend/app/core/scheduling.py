@@ -0,0 +1,360 @@
+"""
+Fair scheduling and daily quotas of expensive endpoints per tenant
+
+Analyses and extraction jobs (extract, render, thumbnails) run through two
+queues with a fixed number of slots. Waiting jobs are ordered by start-time
+fair queuing: each job gets a virtual finish tag ``start + cost / weight``
+where ``start`` is the later of the queue's virtual time and the tenant's
+previous finish tag, so a tenant submitting many jobs cannot starve the
+others and tenants receive slots in proportion to their weights. Each tenant
+may also hold only a limited number of slots and queued jobs at a time.
+Tenants are the names the API keys map to in ``TENANT_KEYS``; requests with a
+missing or unknown key are rejected with 401, and without any registered keys
+every request belongs to the anonymous tenant.
+
+The resources a job consumed (model seconds, FFmpeg CPU seconds, bytes uploaded)
+are metered while it runs and charged to the tenant's daily usage (UTC) in
+the store. Requests over a daily quota or over the queued-job limit are
+rejected with 429, ``Retry-After`` and the remaining-budget headers.
+"""
+
+import asyncio
+import bisect
+import itertools
+import logging
+import time
+from collections import Counter as Tally
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core.settings import Settings
+from app.core.telemetry import REGISTRY
+from app.core.usage import UsageMeter, metering
+from app.store import TenantUsageRecord, get_store
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS = "analysis"
+EXTRACTION = "extraction"
+
+ANONYMOUS_TENANT = "anonymous"
+
+QUOTA_HEADERS = {
+    "model_seconds": "X-Quota-Remaining-Model-Seconds",
+    "ffmpeg_cpu_seconds": "X-Quota-Remaining-FFmpeg-CPU-Seconds",
+    "egress_bytes": "X-Quota-Remaining-Egress-Bytes",
+}
+
+JOBS = REGISTRY.counter(
+    "tenant_jobs_total",
+    "Jobs per queue by admission outcome (admitted, queue_full, quota_exceeded)",
+    ("queue", "outcome"),
+)
+QUEUE_WAIT = REGISTRY.histogram(
+    "tenant_queue_wait_seconds",
+    "Time jobs waited for a slot in a fair queue",
+    ("queue",),
+)
+
+
+class TenantLimitError(Exception):
+    """テナントの上限（キュー・日次クォータ）を超えた（429 で返す）"""
+
+    def __init__(self, message: str, headers: dict[str, str], reason: str):
+        super().__init__(message)
+        self.headers = headers
+        self.reason = reason
+
+
+class UnknownTenantError(Exception):
+    """登録されていないAPIキー（401 で返す）"""
+
+
+@dataclass(order=True)
+class _Waiter:
+    finish: float
+    seq: int
+    start: float = field(compare=False)
+    tenant: str = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+
+
+class FairQueue:
+    """
+    テナント間で重み付き公平に枠を割り当てるキュー
+
+    Args:
+        name: キュー名（メトリクスのラベル）
+        capacity: 全テナント合計で同時に実行できるジョブ数
+        per_tenant: 1テナントが同時に実行できるジョブ数
+        max_queued: 1テナントが待たせておけるジョブ数
+    """
+
+    def __init__(self, name: str, capacity: int, per_tenant: int, max_queued: int):
+        self.name = name
+        self.capacity = capacity
+        self.per_tenant = per_tenant
+        self.max_queued = max_queued
+        self._virtual_time = 0.0
+        self._last_finish: dict[str, float] = {}
+        self._running: Tally[str] = Tally()
+        self._waiting: list[_Waiter] = []
+        self._seq = itertools.count()
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    def queued(self, tenant: str | None = None) -> int:
+        if tenant is None:
+            return len(self._waiting)
+        return sum(1 for w in self._waiting if w.tenant == tenant)
+
+    async def acquire(self, tenant: str, weight: float = 1.0, cost: float = 1.0):
+        """
+        枠が割り当てられるまで待つ（終わったら release を呼ぶ）
+
+        Raises:
+            TenantLimitError: テナントの待ちジョブが上限に達している場合
+        """
+        start = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+        waiter = _Waiter(
+            finish=start + cost / max(weight, 1e-9),
+            seq=next(self._seq),
+            start=start,
+            tenant=tenant,
+            future=asyncio.get_running_loop().create_future(),
+        )
+        bisect.insort(self._waiting, waiter)
+        self._dispatch()
+        if not waiter.future.done() and self.queued(tenant) > self.max_queued:
+            self._waiting.remove(waiter)
+            msg = f"Too many queued {self.name} jobs for this tenant"
+            raise TenantLimitError(
+                msg,
+                {"Retry-After": "1"},
+                reason="queue_full",
+            )
+        # 実際に投入されたジョブだけがテナントの仮想時刻を進める
+        self._last_finish[tenant] = waiter.finish
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # 枠の割り当てとキャンセルが重なった場合は枠を返す
+                self.release(tenant)
+            elif waiter in self._waiting:
+                self._waiting.remove(waiter)
+            raise
+
+    def release(self, tenant: str) -> None:
+        self._running[tenant] -= 1
+        if self._running[tenant] <= 0:
+            del self._running[tenant]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """空いた枠を、仮想終了時刻の早い順に同時実行数に余裕のあるテナントへ割り当てる"""
+        while self.running < self.capacity:
+            waiter = next(
+                (
+                    w
+                    for w in self._waiting
+                    if self._running[w.tenant] < self.per_tenant and not w.future.done()
+                ),
+                None,
+            )
+            if waiter is None:
+                return
+            self._waiting.remove(waiter)
+            self._virtual_time = max(self._virtual_time, waiter.start)
+            self._running[waiter.tenant] += 1
+            waiter.future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(
+        self, tenant: str, weight: float = 1.0, cost: float = 1.0
+    ) -> AsyncIterator[None]:
+        await self.acquire(tenant, weight, cost)
+        try:
+            yield
+        finally:
+            self.release(tenant)
+
+
+_queues: dict[str, FairQueue] = {}
+
+
+def fair_queue(name: str, settings: Settings) -> FairQueue:
+    """名前ごとのキュー（最初に使われたときの設定で作る）"""
+    if name not in _queues:
+        capacity = (
+            settings.analysis_concurrency
+            if name == ANALYSIS
+            else settings.extraction_concurrency
+        )
+        _queues[name] = FairQueue(
+            name,
+            capacity=capacity,
+            per_tenant=min(settings.tenant_concurrency, capacity),
+            max_queued=settings.tenant_max_queued,
+        )
+    return _queues[name]
+
+
+def reset_queues() -> None:
+    """キューを破棄する（テストや設定の変更後に使う）"""
+    _queues.clear()
+
+
+def resolve_tenant(request: Request, settings: Settings) -> str:
+    """
+    APIキーを登録済みのキーと照合して求めるテナント
+
+    ``TENANT_KEYS`` が空の場合はすべてのリクエストが匿名のテナントになる
+    （クライアントが送るキーごとにテナントを作ると、キーを変えるだけで
+    クォータと公平な割り当てを回避できるため）。
+
+    Raises:
+        UnknownTenantError: キーが登録されていない・送られていない場合
+    """
+    if not settings.tenant_keys:
+        return ANONYMOUS_TENANT
+    key = request.headers.get(settings.tenant_header, "").strip()
+    tenant = settings.tenant_keys.get(key) if key else None
+    if tenant is None:
+        msg = f"Missing or unknown {settings.tenant_header}"
+        raise UnknownTenantError(msg)
+    return tenant
+
+
+def tenant_weight(tenant: str, settings: Settings) -> float:
+    return settings.tenant_weights.get(tenant, 1.0)
+
+
+def _today() -> str:
+    return datetime.now(UTC).date().isoformat()
+
+
+def _seconds_until_reset() -> int:
+    now = datetime.now(UTC)
+    midnight = datetime.combine(
+        now.date() + timedelta(days=1), datetime.min.time(), UTC
+    )
+    return max(1, int((midnight - now).total_seconds()))
+
+
+def _limits(settings: Settings) -> dict[str, float]:
+    """設定されている日次クォータ（0 は無制限のため含めない）"""
+    limits = {
+        "model_seconds": settings.tenant_daily_model_seconds,
+        "ffmpeg_cpu_seconds": settings.tenant_daily_ffmpeg_cpu_seconds,
+        "egress_bytes": settings.tenant_daily_egress_bytes,
+    }
+    return {name: limit for name, limit in limits.items() if limit > 0}
+
+
+def remaining_budget(usage: TenantUsageRecord, settings: Settings) -> dict[str, str]:
+    """設定されているクォータごとの残量ヘッダー"""
+    headers = {}
+    for name, limit in _limits(settings).items():
+        remaining = max(0.0, limit - getattr(usage, name))
+        value = int(remaining) if name == "egress_bytes" else round(remaining, 3)
+        headers[QUOTA_HEADERS[name]] = str(value)
+    return headers
+
+
+async def check_quota(tenant: str, settings: Settings) -> None:
+    """
+    テナントの当日の使用量が日次クォータに達していないか確認する
+
+    Raises:
+        TenantLimitError: いずれかのクォータを使い切っている場合
+    """
+    limits = _limits(settings)
+    if not limits:
+        return
+    usage = await get_store().get_tenant_usage(tenant, _today())
+    exhausted = [
+        name for name, limit in limits.items() if getattr(usage, name) >= limit
+    ]
+    if exhausted:
+        msg = f"Daily quota exceeded: {', '.join(exhausted)}"
+        raise TenantLimitError(
+            msg,
+            {
+                "Retry-After": str(_seconds_until_reset()),
+                **remaining_budget(usage, settings),
+            },
+            reason="quota_exceeded",
+        )
+
+
+async def record_usage(
+    tenant: str, meter: UsageMeter, settings: Settings
+) -> TenantUsageRecord | None:
+    """計測した使用量をテナントの当日の使用量に加算する（失敗時は None）"""
+    try:
+        return await get_store().add_tenant_usage(
+            tenant,
+            _today(),
+            model_seconds=meter.model_seconds,
+            ffmpeg_cpu_seconds=meter.ffmpeg_cpu_seconds,
+            egress_bytes=meter.egress_bytes,
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record usage of tenant {tenant}: {e!s}")
+        return None
+
+
+async def take_prerender_budget(tenant: str, settings: Settings) -> bool:
+    """
+    テナントの当日の先行の切り出しの予算から1つ使う（失敗時は使わずに False）
+
+    数はストアに記録するため、再起動しても戻らず、複数のプロセスで共有される。
+    """
+    try:
+        return await get_store().take_prerender_clip(
+            tenant, _today(), settings.prerender_tenant_daily_clips
+        )
+    except Exception as e:
+        logger.warning(f"Failed to take pre-render budget of tenant {tenant}: {e!s}")
+        return False
+
+
+@asynccontextmanager
+async def admit(
+    tenant: str, response: Response, queue_name: str, settings: Settings
+) -> AsyncIterator[UsageMeter]:
+    """
+    テナントの日次クォータを確認し、公平キューの枠を得てジョブを実行する
+
+    ジョブ中の使用量を計測してテナントの当日の使用量に加算し、
+    クォータの残量を response のヘッダーに設定する。
+
+    Raises:
+        TenantLimitError: クォータ超過・待ちジョブ数の上限の場合
+    """
+    queue = fair_queue(queue_name, settings)
+    try:
+        await check_quota(tenant, settings)
+        enqueued_at = time.perf_counter()
+        await queue.acquire(tenant, tenant_weight(tenant, settings))
+    except TenantLimitError as e:
+        JOBS.inc(queue=queue_name, outcome=e.reason)
+        raise
+    JOBS.inc(queue=queue_name, outcome="admitted")
+    QUEUE_WAIT.observe(time.perf_counter() - enqueued_at, queue=queue_name)
+    try:
+        with metering() as meter:
+            yield meter
+    finally:
+        queue.release(tenant)
+        usage = await record_usage(tenant, meter, settings)
+        if usage is not None:
+            response.headers.update(remaining_budget(usage, settings))
@@ -5,10 +5,14 @@ Application settings using pydantic-settings
 import os
 from functools import lru_cache
 from pathlib import Path
+from typing import Literal
 
 from pydantic import Field, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
+# 解析のセグメント分割の方式
+Segmentation = Literal["fixed", "scenes", "transcript", "keyframes"]
+
 
 class Settings(BaseSettings):
     """Application settings"""
@@ -35,6 +39,70 @@ class Settings(BaseSettings):
     gcs_processed_prefix: str = Field(
         default="processed/", description="Prefix for processed files"
     )
+    gcs_profiles_prefix: str = Field(
+        default="profiles/", description="Prefix for profiling artifacts"
+    )
+    gcs_normalized_prefix: str = Field(
+        default="normalized/",
+        description="Prefix for uploads normalized to faststart MP4 at ingest",
+    )
+
+    # Ingest normalization
+    ingest_keep_original: bool = Field(
+        default=True,
+        description="Keep the uploaded original after normalizing it (false: delete)",
+    )
+    ingest_x264_preset: str = Field(
+        default="veryfast",
+        description="x264 preset when an upload's video codec must be transcoded",
+    )
+    ingest_crf: int = Field(
+        default=18,
+        ge=0,
+        le=51,
+        description="x264 CRF when an upload's video codec must be transcoded",
+    )
+
+    # Full-object transfers
+    transfer_slice_threshold_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        ge=0,
+        description="Transfer objects at least this large in parallel slices "
+        "(0: always single stream)",
+    )
+    transfer_slice_bytes: int = Field(
+        default=32 * 1024 * 1024,
+        ge=5 * 1024 * 1024,
+        description="Size of one slice (multipart parts are at least 5 MiB)",
+    )
+    transfer_workers: int = Field(
+        default=8, ge=1, description="Parallel slices of one transfer"
+    )
+    transfer_verify_checksums: bool = Field(
+        default=True, description="Verify CRC32C of downloads and uploads"
+    )
+
+    # Persistence
+    database_url: str = Field(
+        default="",
+        description="Video/analysis store URL (default: sqlite:///<storage>/videos.db)",
+    )
+
+    # Semantic search
+    embedding_model: str = Field(
+        default="",
+        description="sentence-transformers model for highlight embeddings "
+        "(empty: deterministic hashing embedder)",
+    )
+    vector_index_dir: str = Field(
+        default="",
+        description="Directory of the vector index (default: <storage>/vectors)",
+    )
+    vector_ann_threshold: int = Field(
+        default=50_000,
+        ge=0,
+        description="Use the approximate (IVF) index at or above this many vectors",
+    )
 
     # Google Cloud Authentication
     google_application_credentials: str = Field(
@@ -50,9 +118,240 @@ class Settings(BaseSettings):
     )
     google_api_key: str = Field(default="", description="Google AI API key")
 
+    # Gemini context caching (Vertex AI)
+    context_cache_enabled: bool = Field(
+        default=False,
+        description="Cache each video's tokens once and run analyses against the handle",
+    )
+    context_cache_ttl_seconds: int = Field(
+        default=3600, ge=60, description="TTL of a cached video (extended on use)"
+    )
+    context_cache_min_duration_seconds: float = Field(
+        default=60.0,
+        ge=0,
+        description="Do not cache videos known to be shorter (below the token minimum)",
+    )
+    context_cache_discount: float = Field(
+        default=0.75,
+        ge=0,
+        le=1,
+        description="Price reduction of cached input tokens, for savings estimates",
+    )
+
+    # Analysis segmentation
+    analysis_segmentation: Segmentation = Field(
+        default="fixed",
+        description="fixed: 30-second segments; scenes: candidates from scene cuts "
+        "and audio pauses, scored by the model; transcript: candidates from a "
+        "local speech-to-text transcript, scored from the text and a few keyframes; "
+        "keyframes: scene candidates scored from sampled frames only",
+    )
+    scene_threshold: float = Field(
+        default=0.3, gt=0, lt=1, description="FFmpeg scene score counted as a cut"
+    )
+    segment_min_seconds: float = Field(
+        default=5.0, gt=0, description="Shortest candidate segment"
+    )
+    segment_max_seconds: float = Field(
+        default=45.0, gt=0, description="Longest candidate segment"
+    )
+    keyframes_per_segment: int = Field(
+        default=3,
+        ge=1,
+        le=10,
+        description="Frames sampled per candidate segment (segmentation=keyframes)",
+    )
+    keyframe_width: int = Field(
+        default=384, ge=64, le=1920, description="Width of sampled keyframes (px)"
+    )
+
+    # Near-duplicate reuse (perceptual fingerprints)
+    fingerprint_enabled: bool = Field(
+        default=False,
+        description="Fingerprint videos and reuse highlights of already analyzed "
+        "near-duplicates; only the non-overlapping ranges are sent to the model",
+    )
+    fingerprint_max_distance: int = Field(
+        default=10,
+        ge=0,
+        le=32,
+        description="Bits (of 64) in which per-second frame hashes may differ",
+    )
+    fingerprint_min_overlap_seconds: float = Field(
+        default=10.0, gt=0, description="Shortest aligned run reused from a video"
+    )
+
+    # Speculative pre-rendering of top highlights
+    prerender_top_k: int = Field(
+        default=0,
+        ge=0,
+        le=10,
+        description="Top highlights by score cut and uploaded in the background "
+        "after an analysis, while the extraction queue is idle (0: off)",
+    )
+    prerender_tenant_daily_clips: int = Field(
+        default=20, ge=0, description="Speculative clips per tenant per day (UTC)"
+    )
+
+    # Local speech-to-text (transcript segmentation)
+    speech_engine: Literal["faster-whisper", "stub"] = Field(
+        default="faster-whisper",
+        description="faster-whisper (CPU, poetry install -E speech) or stub "
+        "(deterministic placeholder text for tests and benchmarks)",
+    )
+    speech_model: str = Field(
+        default="small", description="faster-whisper model size or path"
+    )
+    speech_language: str = Field(
+        default="", description="Spoken language code (empty: detect)"
+    )
+    transcript_keyframes: int = Field(
+        default=4,
+        ge=0,
+        le=16,
+        description="Keyframes sent with the transcript instead of the video",
+    )
+
+    # Tenant scheduling and quotas
+    tenant_header: str = Field(
+        default="X-API-Key", description="Request header identifying the tenant"
+    )
+    tenant_keys: dict[str, str] = Field(
+        default_factory=dict,
+        description="Tenant name per API key (JSON object); when set, requests "
+        "without a registered key are rejected with 401, when empty every "
+        "request belongs to the anonymous tenant",
+    )
+    tenant_weights: dict[str, float] = Field(
+        default_factory=dict,
+        description="Fair-queuing weight per tenant name (JSON object, default 1)",
+    )
+    analysis_concurrency: int = Field(
+        default=4, ge=1, description="Analyses running at once across all tenants"
+    )
+    extraction_concurrency: int = Field(
+        default=2,
+        ge=1,
+        description="Extract/render/thumbnail jobs running at once across all tenants",
+    )
+    tenant_concurrency: int = Field(
+        default=2,
+        ge=1,
+        description="Jobs per tenant running at once in each queue "
+        "(across all workers with JOB_EXECUTION=queue)",
+    )
+    tenant_max_queued: int = Field(
+        default=20, ge=0, description="Waiting jobs per tenant before returning 429"
+    )
+    tenant_daily_model_seconds: float = Field(
+        default=0, ge=0, description="Daily model time per tenant (0: unlimited)"
+    )
+    tenant_daily_ffmpeg_cpu_seconds: float = Field(
+        default=0, ge=0, description="Daily FFmpeg CPU time per tenant (0: unlimited)"
+    )
+    tenant_daily_egress_bytes: int = Field(
+        default=0, ge=0, description="Daily bytes uploaded per tenant (0: unlimited)"
+    )
+
+    # Worker tier
+    job_execution: Literal["inline", "queue"] = Field(
+        default="inline",
+        description="inline: run analyze/extract in the API process; "
+        "queue: enqueue them for `python -m app.worker`",
+    )
+    job_broker_url: str = Field(
+        default="",
+        description="Job queue URL (default: sqlite:///<storage>/jobs.db)",
+    )
+    job_lease_seconds: float = Field(
+        default=120.0, gt=0, description="A job is retried if its worker is silent"
+    )
+    job_max_attempts: int = Field(
+        default=3, ge=1, description="Attempts before a job is marked failed"
+    )
+    worker_concurrency: int = Field(
+        default=2, ge=1, description="Jobs one worker process runs at once"
+    )
+    worker_poll_seconds: float = Field(
+        default=1.0, gt=0, description="Wait between polls of an empty queue"
+    )
+
+    # HTTP caching
+    http_compression_enabled: bool = Field(
+        default=True,
+        description="Compress responses in the app (disable behind a compressing proxy)",
+    )
+    http_compression_min_bytes: int = Field(
+        default=1024,
+        ge=0,
+        description="Compress JSON/text responses at least this large (br or gzip)",
+    )
+    signed_url_cache_margin_seconds: float = Field(
+        default=300.0,
+        ge=0,
+        description="Responses with signed URLs are cacheable until this long "
+        "before the earliest URL expires",
+    )
+
     # CORS
     cors_origins: list[str] = Field(default=["*"], description="Allowed CORS origins")
 
+    # Logging / Telemetry
+    log_level: str = Field(default="INFO", description="Log level")
+    telemetry_enabled: bool = Field(
+        default=True, description="Record stage spans and expose /metrics"
+    )
+    otel_exporter_endpoint: str = Field(
+        default="",
+        description="OTLP/HTTP traces endpoint (empty disables trace export)",
+    )
+    otel_service_name: str = Field(
+        default="short-video-ai-generator-backend",
+        description="service.name resource attribute for exported traces",
+    )
+
+    # FFmpeg
+    ffmpeg_timeout_seconds: float = Field(
+        default=600.0, gt=0, description="Deadline for a single FFmpeg run"
+    )
+
+    # Rendering
+    render_x264_preset: str = Field(
+        default="veryfast", description="x264 preset for rendered highlight reels"
+    )
+    render_crf: int = Field(
+        default=20, ge=0, le=51, description="x264 CRF for rendered highlight reels"
+    )
+
+    # Timeline thumbnails
+    thumbnail_interval_seconds: float = Field(
+        default=2.0, gt=0, description="Seconds between timeline preview frames"
+    )
+    thumbnail_width: int = Field(
+        default=160, ge=32, le=640, description="Width of one sprite tile"
+    )
+    thumbnail_columns: int = Field(default=10, ge=1, description="Sprite columns")
+    thumbnail_rows: int = Field(default=10, ge=1, description="Sprite rows")
+    thumbnail_format: Literal["jpg", "webp"] = Field(
+        default="jpg", description="Image format of sprites and highlight thumbnails"
+    )
+
+    # Startup
+    preload_sdks: bool = Field(
+        default=True,
+        description="Import the Google SDKs in the background after startup "
+        "(otherwise on first use)",
+    )
+
+    # Profiling
+    profiling_enabled: bool = Field(
+        default=False,
+        description="Profile every extract/analyze request (X-Profile header otherwise)",
+    )
+    profiling_sample_interval_ms: float = Field(
+        default=5.0, gt=0, description="Python stack sampling interval in milliseconds"
+    )
+
     # Model configuration
     model_config = SettingsConfigDict(
         env_file=".env",
@@ -110,6 +409,13 @@ class Settings(BaseSettings):
         path.mkdir(parents=True, exist_ok=True)
         return path
 
+    @property
+    def profiles_dir(self) -> Path:
+        """Get local profiling artifacts directory path"""
+        path = self.storage_root / "profiles"
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
 
 @lru_cache
 def get_settings() -> Settings:
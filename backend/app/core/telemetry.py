@@ -0,0 +1,438 @@
+"""
+Request tracing and per-stage latency metrics
+
+Spans are timed with ``time.perf_counter`` and, when telemetry is enabled,
+recorded into Prometheus-style histograms exposed on ``/metrics``. When an
+OTLP endpoint is configured and the OpenTelemetry SDK is installed, every span
+is also exported as an OpenTelemetry trace span.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any
+
+from app.core.profiling import active_profile
+
+if TYPE_CHECKING:
+    from app.core.settings import Settings
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# リクエストIDはContextVarで保持し、ログとスパンに伝播させる
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+DEFAULT_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    120.0,
+    300.0,
+)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(
+        f'{name}="{_escape_label_value(value)}"'
+        for name, value in zip(labelnames, values, strict=True)
+    )
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonically increasing counter"""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        )
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...],
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., +Inf count, sum]
+        self._values: dict[tuple[str, ...], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, Any]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [0.0] * (len(self.buckets) + 2)
+                self._values[key] = state
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[index] += 1
+            state[-2] += 1
+            state[-1] += value
+
+    def count(self, **labels: Any) -> int:
+        state = self._values.get(self._key(labels))
+        return int(state[-2]) if state else 0
+
+    def sum(self, **labels: Any) -> float:
+        state = self._values.get(self._key(labels))
+        return state[-1] if state else 0.0
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            items = sorted((key, list(state)) for key, state in self._values.items())
+        bucket_labelnames = (*self.labelnames, "le")
+        for key, state in items:
+            for bound, count in zip(
+                (*self.buckets, float("inf")), state[:-1], strict=True
+            ):
+                labels = _format_labels(bucket_labelnames, (*key, _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {_format_value(count)}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{labels} {_format_value(state[-2])}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(state[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: dict[str, Counter | Histogram] = {}
+        self._lock = threading.Lock()
+
+    def counter(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> Counter:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Counter(name, documentation, labelnames)
+            return self._metrics[name]  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(
+                    name, documentation, labelnames, buckets
+                )
+            return self._metrics[name]  # type: ignore[return-value]
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "video_stage_duration_seconds",
+    "Duration of processing stages (download, ffmpeg, upload, analysis, ...)",
+    ("stage", "status"),
+)
+STAGE_BYTES = REGISTRY.counter(
+    "video_stage_bytes_total",
+    "Bytes moved by processing stages",
+    ("stage",),
+)
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total",
+    "HTTP requests by route and status code",
+    ("method", "route", "status"),
+)
+HTTP_DURATION = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route",
+    ("method", "route"),
+)
+
+
+class _TelemetryState:
+    enabled: bool = True
+    tracer: Any = None
+
+
+_state = _TelemetryState()
+
+
+class Span:
+    """A timed stage. Duration is always measured so callers can log it."""
+
+    __slots__ = ("_otel", "attributes", "end", "name", "start", "status")
+
+    def __init__(self, name: str, attributes: dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.end: float | None = None
+        self.status = "ok"
+        self._otel: Any = None
+
+    @property
+    def duration(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return end - self.start
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+        if self._otel is not None:
+            self._otel.set_attribute(key, value)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span]:
+    """
+    処理ステージを計測するスパン
+
+    Args:
+        name: ステージ名（例: "extract.download"）
+        **attributes: スパンに付与する属性。``bytes`` はバイト数カウンタにも加算
+
+    Yields:
+        計測中のSpan
+    """
+    current = Span(name, attributes)
+    profile = active_profile()
+    if not _state.enabled:
+        try:
+            yield current
+        except BaseException:
+            current.status = "error"
+            raise
+        finally:
+            current.end = time.perf_counter()
+            if profile is not None:
+                profile.record_span(name, current.duration, current.status)
+        return
+
+    otel_cm = None
+    if _state.tracer is not None:
+        otel_cm = _state.tracer.start_as_current_span(name)
+        current._otel = otel_cm.__enter__()  # noqa: SLF001
+        current._otel.set_attribute("request.id", request_id_var.get())  # noqa: SLF001
+        for key, value in attributes.items():
+            current._otel.set_attribute(key, value)  # noqa: SLF001
+
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        if otel_cm is not None:
+            otel_cm.__exit__(type(e), e, e.__traceback__)
+            otel_cm = None
+        raise
+    finally:
+        current.end = time.perf_counter()
+        if otel_cm is not None:
+            otel_cm.__exit__(None, None, None)
+        STAGE_DURATION.observe(current.duration, stage=name, status=current.status)
+        if profile is not None:
+            profile.record_span(name, current.duration, current.status)
+        transferred = current.attributes.get("bytes")
+        if transferred:
+            STAGE_BYTES.inc(transferred, stage=name)
+        logger.debug(
+            "span finished",
+            extra={
+                "span": name,
+                "duration_seconds": round(current.duration, 6),
+                "status": current.status,
+            },
+        )
+
+
+def telemetry_enabled() -> bool:
+    return _state.enabled
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+def _install_log_record_factory() -> None:
+    """全てのログレコードに request_id 属性を付与する"""
+    previous_factory = logging.getLogRecordFactory()
+    if getattr(previous_factory, "_injects_request_id", False):
+        return
+
+    def factory(*args: Any, **kwargs: Any) -> logging.LogRecord:
+        record = previous_factory(*args, **kwargs)
+        record.request_id = request_id_var.get()
+        return record
+
+    factory._injects_request_id = True  # type: ignore[attr-defined]
+    logging.setLogRecordFactory(factory)
+
+
+def _build_tracer(settings: Settings) -> Any:
+    """OTLPエクスポーターを構成する（SDK未インストール時はNone）"""
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        logger.warning(
+            "OTEL_EXPORTER_ENDPOINT is set but opentelemetry-sdk / "
+            "opentelemetry-exporter-otlp are not installed; trace export disabled"
+        )
+        return None
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": settings.otel_service_name})
+    )
+    provider.add_span_processor(
+        BatchSpanProcessor(OTLPSpanExporter(endpoint=settings.otel_exporter_endpoint))
+    )
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer("short-video-ai-generator")
+
+
+def configure_telemetry(settings: Settings) -> None:
+    """設定に基づいてメトリクス・トレース・ログを初期化する"""
+    _state.enabled = settings.telemetry_enabled
+    _install_log_record_factory()
+    logging.basicConfig(
+        level=settings.log_level.upper(),
+        format="%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s",
+    )
+    _state.tracer = None
+    if _state.enabled and settings.otel_exporter_endpoint:
+        _state.tracer = _build_tracer(settings)
+
+
+class RequestContextMiddleware:
+    """
+    リクエストIDの付与・伝播とHTTPメトリクスの記録を行うASGIミドルウェア
+
+    ``X-Request-ID`` ヘッダーがあればそれを使い、なければ新規に採番する。
+    レスポンスにも同じヘッダーを返す。
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = new_request_id()
+        header_name = REQUEST_ID_HEADER.lower().encode()
+        for key, value in scope.get("headers", []):
+            if key == header_name and value:
+                request_id = value.decode("latin-1")[:128]
+                break
+        token = request_id_var.set(request_id)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: dict) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((header_name, request_id.encode("latin-1")))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if _state.enabled:
+                route = scope.get("route")
+                route_path = getattr(route, "path", "unmatched")
+                method = scope.get("method", "")
+                HTTP_DURATION.observe(
+                    time.perf_counter() - start, method=method, route=route_path
+                )
+                HTTP_REQUESTS.inc(method=method, route=route_path, status=status_code)
+            request_id_var.reset(token)
+
+
+def render_metrics() -> str:
+    return REGISTRY.render()
@@ -0,0 +1,71 @@
+"""
+Resource usage of the current request
+
+A ``UsageMeter`` is installed for a request that runs under the tenant
+scheduler. Model calls add their wall time, FFmpeg runs add their CPU time
+(``-benchmark``) and uploads (to Cloud Storage and the Google AI Files API)
+add their byte counts as egress; downloads are not charged. The total is
+charged to the tenant's daily quota when the request finishes.
+"""
+
+import threading
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+
+@dataclass
+class UsageMeter:
+    model_seconds: float = 0.0
+    ffmpeg_cpu_seconds: float = 0.0
+    egress_bytes: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(
+        self,
+        *,
+        model_seconds: float = 0.0,
+        ffmpeg_cpu_seconds: float = 0.0,
+        egress_bytes: int = 0,
+    ) -> None:
+        # モデル呼び出しはスレッドで実行されるためロックする
+        with self._lock:
+            self.model_seconds += model_seconds
+            self.ffmpeg_cpu_seconds += ffmpeg_cpu_seconds
+            self.egress_bytes += egress_bytes
+
+
+_meter_var: ContextVar[UsageMeter | None] = ContextVar("usage_meter", default=None)
+
+
+def active_meter() -> UsageMeter | None:
+    """現在のリクエストの使用量メーター（計測しない場合は None）"""
+    return _meter_var.get()
+
+
+def charge(
+    *,
+    model_seconds: float = 0.0,
+    ffmpeg_cpu_seconds: float = 0.0,
+    egress_bytes: int = 0,
+) -> None:
+    """現在のリクエストの使用量に加算する（計測していなければ何もしない）"""
+    meter = _meter_var.get()
+    if meter is not None:
+        meter.add(
+            model_seconds=model_seconds,
+            ffmpeg_cpu_seconds=ffmpeg_cpu_seconds,
+            egress_bytes=egress_bytes,
+        )
+
+
+@contextmanager
+def metering() -> Iterator[UsageMeter]:
+    """ブロック内（とそこから起動したタスク・スレッド）の使用量を計測する"""
+    meter = UsageMeter()
+    token = _meter_var.set(meter)
+    try:
+        yield meter
+    finally:
+        _meter_var.reset(token)
@@ -0,0 +1,90 @@
+"""
+Durable queue of analyze/extract jobs run by worker processes
+
+The broker is selected by the scheme of ``JOB_BROKER_URL``
+(``sqlite:///path/to/jobs.db`` by default). Additional brokers register a
+factory with :func:`register_broker_backend`.
+"""
+
+from collections.abc import Callable
+from pathlib import Path
+
+from app.core.settings import Settings
+from app.jobs.base import (
+    FAILED,
+    QUEUED,
+    RUNNING,
+    SUCCEEDED,
+    JobBroker,
+    JobRecord,
+    QueueFullError,
+)
+from app.jobs.sqlite import SQLiteJobBroker
+
+BrokerFactory = Callable[[str, Settings], JobBroker]
+
+_BACKENDS: dict[str, BrokerFactory] = {}
+_broker: JobBroker | None = None
+
+
+def register_broker_backend(scheme: str, factory: BrokerFactory) -> None:
+    """URLスキームに対応するブローカーの生成関数を登録する"""
+    _BACKENDS[scheme] = factory
+
+
+def _sqlite_factory(url: str, _settings: Settings) -> JobBroker:
+    path = url.removeprefix("sqlite://")
+    path = path.removeprefix("/") if path != "/:memory:" else ":memory:"
+    return SQLiteJobBroker(path or ":memory:")
+
+
+register_broker_backend("sqlite", _sqlite_factory)
+
+
+def broker_url(settings: Settings) -> str:
+    if settings.job_broker_url:
+        return settings.job_broker_url
+    return f"sqlite:///{Path(settings.storage_root) / 'jobs.db'}"
+
+
+def create_broker(settings: Settings) -> JobBroker:
+    url = broker_url(settings)
+    scheme = url.split("://", 1)[0]
+    if scheme not in _BACKENDS:
+        msg = f"Unsupported JOB_BROKER_URL scheme: {scheme}"
+        raise ValueError(msg)
+    return _BACKENDS[scheme](url, settings)
+
+
+def get_broker(settings: Settings | None = None) -> JobBroker:
+    """プロセス共有のブローカー（初回呼び出し時に生成する）"""
+    global _broker  # noqa: PLW0603
+    if _broker is None:
+        if settings is None:
+            from app.core.settings import get_settings  # noqa: PLC0415
+
+            settings = get_settings()
+        _broker = create_broker(settings)
+    return _broker
+
+
+def set_broker(broker: JobBroker | None) -> None:
+    """共有ブローカーを差し替える（テスト用）"""
+    global _broker  # noqa: PLW0603
+    _broker = broker
+
+
+__all__ = [
+    "FAILED",
+    "QUEUED",
+    "RUNNING",
+    "SUCCEEDED",
+    "JobBroker",
+    "JobRecord",
+    "QueueFullError",
+    "SQLiteJobBroker",
+    "create_broker",
+    "get_broker",
+    "register_broker_backend",
+    "set_broker",
+]
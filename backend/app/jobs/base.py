@@ -0,0 +1,113 @@
+"""
+Broker-agnostic interface of the durable job queue
+
+The API process enqueues analyze/extract jobs and reads their results; worker
+processes (``python -m app.worker``) claim jobs with a lease, extend it while
+they run and report the result. A job whose lease expires (its worker died)
+is claimed again, up to a maximum number of attempts.
+
+Jobs are claimed in the same weighted fair order as the in-process
+:class:`~app.core.scheduling.FairQueue`: each job gets a virtual finish tag
+when it is enqueued, the job with the earliest tag among tenants below their
+running-job limit is claimed first, and a tenant may keep only a limited
+number of jobs queued.
+"""
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+@dataclass
+class JobRecord:
+    job_id: str
+    kind: str
+    payload: dict[str, Any]
+    status: str
+    tenant: str
+    created_at: float
+    updated_at: float
+    attempts: int = 0
+    available_at: float = 0.0
+    start_tag: float = 0.0
+    finish_tag: float = 0.0
+    worker_id: str | None = None
+    lease_expires_at: float | None = None
+    result: dict[str, Any] | None = None
+    error: str | None = None
+
+
+class QueueFullError(Exception):
+    """テナントの待ちジョブが上限に達している"""
+
+
+class JobBroker(ABC):
+    """ジョブキューの抽象インターフェース"""
+
+    @abstractmethod
+    async def enqueue(
+        self,
+        kind: str,
+        payload: dict[str, Any],
+        *,
+        tenant: str,
+        weight: float = 1.0,
+        max_queued: int | None = None,
+    ) -> JobRecord:
+        """
+        ジョブを登録する
+
+        仮想終了時刻は「キューの仮想時刻とテナントの前のジョブの終了時刻の
+        遅いほう + 1 / weight」とする。
+
+        Raises:
+            QueueFullError: テナントの待ちジョブが max_queued に達している場合
+        """
+
+    @abstractmethod
+    async def claim(
+        self,
+        worker_id: str,
+        *,
+        lease_seconds: float,
+        max_attempts: int,
+        kinds: list[str] | None = None,
+        per_tenant: int | None = None,
+    ) -> JobRecord | None:
+        """
+        実行可能なジョブを1件取り出して実行中にする（なければ None）
+
+        仮想終了時刻の早い順に、実行中のジョブが per_tenant 未満のテナントの
+        ジョブを取り出す。リースの切れた実行中のジョブも、試行回数が
+        max_attempts 未満なら取り出す。
+        """
+
+    @abstractmethod
+    async def extend_lease(
+        self, job_id: str, worker_id: str, *, lease_seconds: float
+    ) -> bool:
+        """リースを延長する（他のワーカーに取られていれば False）"""
+
+    @abstractmethod
+    async def complete(
+        self, job_id: str, worker_id: str, result: dict[str, Any]
+    ) -> None:
+        """ジョブを成功として結果を保存する"""
+
+    @abstractmethod
+    async def fail(
+        self, job_id: str, worker_id: str, error: str, *, retry_at: float | None
+    ) -> None:
+        """ジョブを失敗にする（retry_at を指定するとその時刻以降に再実行する）"""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> JobRecord | None:
+        """ジョブの状態と結果"""
+
+    async def close(self) -> None:  # noqa: B027
+        """接続などを解放する"""
@@ -0,0 +1,282 @@
+"""
+SQLite implementation of the job broker
+
+The database file may be shared by the API and worker processes on one host;
+jobs are claimed with a single ``UPDATE ... RETURNING`` so that two workers
+never take the same job. Virtual tags are computed in the ``INSERT`` from
+the jobs already in the table (the queue's virtual time is the latest start
+tag of a claimed job), so they stay consistent across processes.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, TypeVar
+
+from app.jobs.base import (
+    FAILED,
+    QUEUED,
+    RUNNING,
+    SUCCEEDED,
+    JobBroker,
+    JobRecord,
+    QueueFullError,
+)
+
+T = TypeVar("T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    tenant TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL DEFAULT 0,
+    worker_id TEXT,
+    lease_expires_at REAL,
+    result TEXT,
+    error TEXT
+);
+"""
+
+# 公平な順序のための列（古いデータベースには列を追加する）
+FAIR_COLUMNS = {
+    "start_tag": "REAL NOT NULL DEFAULT 0",
+    "finish_tag": "REAL NOT NULL DEFAULT 0",
+}
+
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_jobs_queued
+    ON jobs (available_at, created_at) WHERE status = 'queued';
+CREATE INDEX IF NOT EXISTS idx_jobs_running
+    ON jobs (lease_expires_at) WHERE status = 'running';
+CREATE INDEX IF NOT EXISTS idx_jobs_tenant ON jobs (tenant, finish_tag);
+CREATE INDEX IF NOT EXISTS idx_jobs_started ON jobs (start_tag) WHERE attempts > 0;
+"""
+
+
+def _job(row: sqlite3.Row) -> JobRecord:
+    data = dict(row)
+    data["payload"] = json.loads(data["payload"])
+    data["result"] = json.loads(data["result"]) if data["result"] else None
+    return JobRecord(**data)
+
+
+class SQLiteJobBroker(JobBroker):
+    """SQLiteによるジョブキュー（ローカル開発・単一ホスト向け）"""
+
+    def __init__(self, path: str | Path):
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # 別プロセスの書き込み中はロックの解放を待つ
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+            columns = {
+                row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")
+            }
+            for name, definition in FAIR_COLUMNS.items():
+                if name not in columns:
+                    self._conn.execute(
+                        f"ALTER TABLE jobs ADD COLUMN {name} {definition}"
+                    )
+            self._conn.executescript(INDEXES)
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        def locked() -> T:
+            with self._lock, self._conn:
+                return fn(self._conn)
+
+        return await asyncio.to_thread(locked)
+
+    async def enqueue(
+        self,
+        kind: str,
+        payload: dict[str, Any],
+        *,
+        tenant: str,
+        weight: float = 1.0,
+        max_queued: int | None = None,
+    ) -> JobRecord:
+        now = time.time()
+        job = JobRecord(
+            job_id=uuid.uuid4().hex,
+            kind=kind,
+            payload=payload,
+            status=QUEUED,
+            tenant=tenant,
+            created_at=now,
+            updated_at=now,
+            available_at=now,
+        )
+        # 上限の確認と仮想時刻の計算を1文で行い、他のプロセスの登録と競合させない
+        row = await self._run(
+            lambda conn: conn.execute(
+                """
+                INSERT INTO jobs (job_id, kind, payload, status, tenant,
+                                  created_at, updated_at, available_at,
+                                  start_tag, finish_tag)
+                SELECT ?, ?, ?, ?, ?, ?, ?, ?, tag.start, tag.start + ?
+                FROM (
+                    SELECT MAX(
+                        (SELECT COALESCE(MAX(start_tag), 0) FROM jobs
+                         WHERE attempts > 0),
+                        (SELECT COALESCE(MAX(finish_tag), 0) FROM jobs
+                         WHERE tenant = ?)
+                    ) AS start
+                ) AS tag
+                WHERE ? IS NULL OR (
+                    SELECT COUNT(*) FROM jobs WHERE tenant = ? AND status = ?
+                ) < ?
+                RETURNING start_tag, finish_tag
+                """,
+                (
+                    job.job_id,
+                    kind,
+                    json.dumps(payload),
+                    QUEUED,
+                    tenant,
+                    now,
+                    now,
+                    now,
+                    1.0 / max(weight, 1e-9),
+                    tenant,
+                    max_queued,
+                    tenant,
+                    QUEUED,
+                    max_queued,
+                ),
+            ).fetchone()
+        )
+        if row is None:
+            msg = "Too many queued jobs for this tenant"
+            raise QueueFullError(msg)
+        job.start_tag = row["start_tag"]
+        job.finish_tag = row["finish_tag"]
+        return job
+
+    async def claim(
+        self,
+        worker_id: str,
+        *,
+        lease_seconds: float,
+        max_attempts: int,
+        kinds: list[str] | None = None,
+        per_tenant: int | None = None,
+    ) -> JobRecord | None:
+        def run(conn: sqlite3.Connection) -> sqlite3.Row | None:
+            now = time.time()
+            # リースが切れたまま試行回数を使い切ったジョブは失敗にする
+            conn.execute(
+                """
+                UPDATE jobs SET status = ?, error = 'Worker lease expired',
+                                updated_at = ?, worker_id = NULL
+                WHERE status = ? AND lease_expires_at < ? AND attempts >= ?
+                """,
+                (FAILED, now, RUNNING, now, max_attempts),
+            )
+            kind_filter = ""
+            params: list[Any] = [RUNNING, worker_id, now + lease_seconds, now]
+            params += [QUEUED, now, RUNNING, now]
+            if kinds:
+                kind_filter = f"AND kind IN ({', '.join('?' * len(kinds))})"
+                params += kinds
+            # リースが有効な実行中のジョブが per_tenant 未満のテナントだけ
+            params += [per_tenant, RUNNING, now, per_tenant]
+            return conn.execute(
+                f"""
+                UPDATE jobs SET status = ?, worker_id = ?, lease_expires_at = ?,
+                                attempts = attempts + 1, updated_at = ?
+                WHERE job_id = (
+                    SELECT job_id FROM jobs AS candidate
+                    WHERE ((status = ? AND available_at <= ?)
+                           OR (status = ? AND lease_expires_at < ?))
+                          {kind_filter}
+                          AND (? IS NULL OR (
+                              SELECT COUNT(*) FROM jobs AS running
+                              WHERE running.tenant = candidate.tenant
+                                    AND running.status = ?
+                                    AND running.lease_expires_at >= ?
+                          ) < ?)
+                    ORDER BY finish_tag, available_at, created_at
+                    LIMIT 1
+                )
+                RETURNING *
+                """,
+                params,
+            ).fetchone()
+
+        row = await self._run(run)
+        return _job(row) if row else None
+
+    async def extend_lease(
+        self, job_id: str, worker_id: str, *, lease_seconds: float
+    ) -> bool:
+        def run(conn: sqlite3.Connection) -> bool:
+            now = time.time()
+            cursor = conn.execute(
+                """
+                UPDATE jobs SET lease_expires_at = ?, updated_at = ?
+                WHERE job_id = ? AND worker_id = ? AND status = ?
+                """,
+                (now + lease_seconds, now, job_id, worker_id, RUNNING),
+            )
+            return cursor.rowcount > 0
+
+        return await self._run(run)
+
+    async def complete(
+        self, job_id: str, worker_id: str, result: dict[str, Any]
+    ) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                """
+                UPDATE jobs SET status = ?, result = ?, error = NULL,
+                                lease_expires_at = NULL, updated_at = ?
+                WHERE job_id = ? AND worker_id = ?
+                """,
+                (SUCCEEDED, json.dumps(result), time.time(), job_id, worker_id),
+            )
+        )
+
+    async def fail(
+        self, job_id: str, worker_id: str, error: str, *, retry_at: float | None
+    ) -> None:
+        status = QUEUED if retry_at is not None else FAILED
+        await self._run(
+            lambda conn: conn.execute(
+                """
+                UPDATE jobs SET status = ?, error = ?, available_at = ?,
+                                worker_id = NULL, lease_expires_at = NULL,
+                                updated_at = ?
+                WHERE job_id = ? AND worker_id = ?
+                """,
+                (status, error, retry_at or 0.0, time.time(), job_id, worker_id),
+            )
+        )
+
+    async def get(self, job_id: str) -> JobRecord | None:
+        row = await self._run(
+            lambda conn: conn.execute(
+                "SELECT * FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        )
+        return _job(row) if row else None
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,15 +1,40 @@
-from pydantic import BaseModel
+from typing import Any, Literal
+
+from pydantic import BaseModel, Field
+
+# クライアントが計算したファイル全体のハッシュ（GCSのメタデータと照合できる形式）
+CONTENT_HASH_PATTERN = r"^(md5:[0-9a-fA-F]{32}|crc32c:[0-9a-fA-F]{8})$"
 
 
 class SignedUploadUrlRequest(BaseModel):
     fileName: str
     fileSize: int
     contentType: str
+    # "md5:<hex>" または "crc32c:<hex>"（一致する動画があればアップロードを省く）
+    contentHash: str | None = Field(default=None, pattern=CONTENT_HASH_PATTERN)
 
 
 class SignedUploadUrlResponse(BaseModel):
-    uploadUrl: str
+    # 既存の動画を使う場合（deduplicated）は None
+    uploadUrl: str | None = None
     fileId: str
+    # 同じ内容の動画がアップロード済みで、その fileId を返した
+    deduplicated: bool = False
+
+
+class IngestResponse(BaseModel):
+    fileId: str
+    # none: 元の動画をそのまま使う / remux: ストリームコピー / transcode: 再エンコード
+    action: Literal["none", "remux", "transcode"]
+    # 解析・切り出しに使うオブジェクト
+    sourceBlob: str
+    # 元の動画（破棄した場合は None）
+    originalBlob: str | None = None
+    duration: float | None = None
+    width: int | None = None
+    height: int | None = None
+    videoCodec: str | None = None
+    audioCodec: str | None = None
 
 
 class Highlight(BaseModel):
@@ -24,18 +49,142 @@ class AnalysisResult(BaseModel):
     highlights: list[Highlight]
 
 
+class RangeAnalysisRequest(BaseModel):
+    start: float = Field(ge=0)
+    end: float = Field(gt=0)
+    # セグメントの長さ（秒）。細かく分割し直す場合は小さくする
+    granularity: float = Field(default=10, ge=1, le=60)
+
+
 class VideoSegment(BaseModel):
     start: float
     end: float
 
 
+RenditionName = Literal["source", "1080p", "720p", "480p", "hls"]
+
+
 class ExtractRequest(BaseModel):
     fileId: str
     segments: list[VideoSegment]
+    renditions: list[RenditionName] = []
+
+
+class Rendition(BaseModel):
+    name: str
+    downloadUrl: str
+    contentType: str
+    height: int | None = None
 
 
 class GenerateVideoResponse(BaseModel):
     downloadUrl: str
+    renditions: list[Rendition] = []
+
+
+class RenderOutputSpec(BaseModel):
+    aspectRatio: Literal["source", "9:16", "1:1", "16:9"] = "9:16"
+    cropMode: Literal["center", "saliency"] = "center"
+    height: int = Field(default=1920, ge=144, le=4320)
+    transition: Literal["none", "crossfade"] = "crossfade"
+    transitionDuration: float = Field(default=0.5, gt=0, le=5)
+    normalizeAudio: bool = True
+
+
+class RenderRequest(BaseModel):
+    fileId: str
+    segments: list[VideoSegment]
+    preset: str | None = None
+    output: RenderOutputSpec | None = None
+    renditions: list[RenditionName] = []
+
+
+class ThumbnailRequest(BaseModel):
+    highlights: list[VideoSegment] = []
+
+
+class ThumbnailsResponse(BaseModel):
+    fileId: str
+    interval: float
+    tileWidth: int
+    tileHeight: int
+    columns: int
+    rows: int
+    frameCount: int
+    sprites: list[str]
+    vttUrl: str
+    highlightThumbnails: list[str]
+
+
+class VideoInfo(BaseModel):
+    fileId: str
+    fileName: str
+    contentType: str
+    fileSize: int
+    createdAt: str
+    duration: float | None = None
+    width: int | None = None
+    height: int | None = None
+
+
+class VideosResponse(BaseModel):
+    videos: list[VideoInfo]
+    nextCursor: str | None = None
+
+
+class StoredAnalysis(BaseModel):
+    id: int
+    fileId: str
+    provider: str
+    model: str
+    promptVersion: str
+    createdAt: str
+    highlights: list[Highlight]
+
+
+class AnalysesResponse(BaseModel):
+    fileId: str
+    analyses: list[StoredAnalysis]
+
+
+class JobInfo(BaseModel):
+    jobId: str
+    kind: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    attempts: int
+    createdAt: str
+    updatedAt: str
+    result: dict[str, Any] | None = None
+    error: str | None = None
+
+
+class ClipInfo(BaseModel):
+    id: int | None = None
+    kind: str
+    blobName: str
+    params: dict[str, Any]
+    createdAt: str
+
+
+class TopHighlight(Highlight):
+    fileId: str
+    analysisId: int
+    analyzedAt: str
+
+
+class SimilarHighlight(Highlight):
+    fileId: str
+    analysisId: int
+    similarity: float
+
+
+class SimilarHighlightsResponse(BaseModel):
+    highlights: list[SimilarHighlight]
+
+
+class TopHighlightsResponse(BaseModel):
+    highlights: list[TopHighlight]
+    nextCursor: str | None = None
 
 
 class VideoMetadata(BaseModel):
@@ -57,3 +206,29 @@ class ProviderModels(BaseModel):
 
 class ModelsResponse(BaseModel):
     providers: dict[str, ProviderModels]
+
+
+class ContextCacheInfo(BaseModel):
+    name: str
+    fileId: str
+    model: str
+    # キャッシュした動画・システム指示のトークン数
+    tokenCount: int
+    createdAt: str
+    expiresAt: str
+    expired: bool
+    hits: int
+    # キャッシュから読まれた入力トークンの累計
+    cachedTokens: int
+    # 割引率（CONTEXT_CACHE_DISCOUNT）から見積もった節約トークン数（保存料金は含まない）
+    estimatedTokensSaved: int
+
+
+class ContextCachesResponse(BaseModel):
+    caches: list[ContextCacheInfo]
+    totalCachedTokens: int
+    totalEstimatedTokensSaved: int
+
+
+class DeleteContextCachesResponse(BaseModel):
+    deleted: int
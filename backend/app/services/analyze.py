@@ -1,15 +1,60 @@
+from __future__ import annotations
+
+import asyncio
 import logging
 import os
-import time
+import tempfile
+from collections.abc import Callable
+from pathlib import Path
 
-from google import genai
-from google.genai.types import GenerateContentConfig, HttpOptions, Part
 from pydantic import BaseModel
 
+from app.core.lazy import lazy_import
 from app.core.settings import Settings
+from app.core.telemetry import span
+from app.core.usage import charge
 from app.models.schemas import AnalysisResult, Highlight
-from app.services.analyze_google_ai import analyze_video_with_google_ai
-from app.services.gcs_utils import get_file_info
+from app.services.analyze_google_ai import (
+    analyze_video_with_google_ai,
+    generate_with_google_ai,
+    generate_with_google_ai_images,
+)
+from app.services.context_cache import (
+    acquire_video_cache,
+    forget_video_cache,
+    record_cache_use,
+)
+from app.services.fingerprints import find_near_duplicate
+from app.services.gcs_utils import download_video_from_gcs, get_file_info
+from app.services.keyframes import KeyframeContext, prepare_keyframe_analysis
+from app.services.library import (
+    find_stored_analysis,
+    known_duration,
+    record_analysis,
+)
+from app.services.model_output import ResponseT, resolve_response
+from app.services.prompts import (
+    ANALYSIS_MEDIA_RESOLUTION,
+    ANALYSIS_SYSTEM_INSTRUCTION,
+    KEYFRAME_ANALYSIS_PROMPT,
+    SCENE_ANALYSIS_PROMPT,
+    SCENE_OUTPUT_EXAMPLE,
+    SEGMENT_ANALYSIS_PROMPT,
+    SEGMENT_ANALYSIS_PROMPT_WITH_EXAMPLE,
+    TRANSCRIPT_ANALYSIS_PROMPT,
+    keyframe_analysis_prompt,
+    keyframe_label,
+    prompt_version,
+    scene_analysis_prompt,
+    transcript_analysis_prompt,
+)
+from app.services.scenes import detect_candidates
+from app.services.transcripts import TranscriptContext, prepare_transcript_analysis
+from app.services.upload import verify_uploaded_content
+
+genai = lazy_import("google.genai")
+errors = lazy_import("google.genai.errors")
+types = lazy_import("google.genai.types")
 
 logger = logging.getLogger(__name__)
 
@@ -27,77 +72,315 @@ class GeminiResponse(BaseModel):
     segments: list[GeminiSegment]
 
 
-async def analyze_video_service(file_id: str, settings: Settings) -> AnalysisResult:
+# 候補セグメントの採点（時間の代わりに候補の番号で答える）
+class GeminiCandidate(BaseModel):
+    index: int
+    title: str
+    description: str
+    score: float
+
+
+class GeminiCandidateResponse(BaseModel):
+    segments: list[GeminiCandidate]
+
+
+def select_provider(settings: Settings) -> tuple[str, str, str | None]:
+    """
+    解析に使うプロバイダー
+
+    Returns:
+        (プロバイダー名, モデル, Google AI APIキー（Vertex AI の場合は None）)
+    """
+    google_api_key = os.environ.get("GOOGLE_API_KEY")
+    if google_api_key:
+        return "google_ai", settings.google_ai_model, google_api_key
+    return "vertex_ai", settings.vertex_ai_model, None
+
+
+def vertex_client(settings: Settings) -> genai.Client:
+    # Google Cloud プロジェクトIDを取得
+    if not settings.gcs_project_id:
+        msg = "GCS_PROJECT_ID environment variable is not set"
+        raise ValueError(msg)
+
+    return genai.Client(
+        http_options=types.HttpOptions(api_version="v1"),
+        vertexai=True,
+        project=settings.gcs_project_id,
+        location="us-central1",
+    )
+
+
+def generate_with_vertex(
+    media: types.Part | list[types.Part],
+    prompt: str,
+    settings: Settings,
+    response_type: type[ResponseT] = GeminiResponse,
+    duration: float | None = None,
+    cached_content: str | None = None,
+    on_usage: Callable[[types.GenerateContentResponseUsageMetadata], None]
+    | None = None,
+) -> ResponseT:
+    """
+    Vertex AI（Gemini）に動画（または画像のリスト）とプロンプトを送り、
+    ``response_type`` の応答を得る
+
+    応答は検証・修復し、途中で途切れた場合は続きだけを要求する
+    （``duration`` が分かっていればセグメントをその範囲に収める）。
+    ``cached_content`` を指定した場合は動画を送らず、キャッシュ済みの動画と
+    システム指示に対してプロンプトだけを送る。
+    モデルの応答を待ってブロックするため、非同期のコードからは
+    ``asyncio.to_thread`` で呼ぶ。
+    """
+    client = vertex_client(settings)
+    if cached_content:
+        prefix = []
+        context = {"cached_content": cached_content}
+    else:
+        prefix = media if isinstance(media, list) else [media]
+        context = {"system_instruction": ANALYSIS_SYSTEM_INSTRUCTION}
+
+    def generate(text_prompt: str) -> str:
+        with span(
+            "analyze.vertex.generate",
+            model=settings.vertex_ai_model,
+            cached=cached_content is not None,
+        ) as generate_span:
+            response = client.models.generate_content(
+                model=settings.vertex_ai_model,
+                contents=[*prefix, text_prompt],
+                config=types.GenerateContentConfig(
+                    response_mime_type="application/json",
+                    response_schema=response_type,
+                    media_resolution=ANALYSIS_MEDIA_RESOLUTION,
+                    **context,
+                ),
+            )
+        logger.info(
+            f"Vertex AI analysis completed in {generate_span.duration:.2f} seconds"
+        )
+        charge(model_seconds=generate_span.duration)
+        if on_usage is not None and response.usage_metadata is not None:
+            on_usage(response.usage_metadata)
+        return response.text or ""
+
+    text = generate(prompt)
+
+    # レスポンスを解析
+    with span("analyze.vertex.parse"):
+        return resolve_response(
+            text,
+            response_type,
+            prompt=prompt,
+            generate=generate,
+            provider="vertex_ai",
+            duration=duration,
+        )
+
+
+def analysis_prompt(provider: str, segmentation: str = "fixed") -> str:
+    """解析結果のバージョンの元になるプロンプト（候補を埋め込む前のテンプレート）"""
+    if segmentation == "scenes":
+        if provider == "google_ai":
+            return SCENE_ANALYSIS_PROMPT + SCENE_OUTPUT_EXAMPLE
+        return SCENE_ANALYSIS_PROMPT
+    if segmentation == "transcript":
+        if provider == "google_ai":
+            return TRANSCRIPT_ANALYSIS_PROMPT + SCENE_OUTPUT_EXAMPLE
+        return TRANSCRIPT_ANALYSIS_PROMPT
+    if segmentation == "keyframes":
+        if provider == "google_ai":
+            return KEYFRAME_ANALYSIS_PROMPT + SCENE_OUTPUT_EXAMPLE
+        return KEYFRAME_ANALYSIS_PROMPT
+    if provider == "google_ai":
+        return SEGMENT_ANALYSIS_PROMPT_WITH_EXAMPLE
+    return SEGMENT_ANALYSIS_PROMPT
+
+
+def candidate_highlights(
+    candidates: list[tuple[float, float]], scores: list[GeminiCandidate]
+) -> list[Highlight]:
+    """候補セグメントの採点結果をハイライトにする（範囲外・重複した番号は無視）"""
+    highlights: dict[int, Highlight] = {}
+    for scored in scores:
+        if not 0 <= scored.index < len(candidates) or scored.index in highlights:
+            continue
+        start, end = candidates[scored.index]
+        highlights[scored.index] = Highlight(
+            start=start,
+            end=end,
+            title=scored.title,
+            description=scored.description,
+            score=scored.score,
+        )
+    return [highlights[i] for i in sorted(highlights)]
+
+
+async def analyze_video_service(
+    file_id: str,
+    settings: Settings,
+    refresh: bool = False,
+    segmentation: str | None = None,
+) -> AnalysisResult:
     """
     動画のAI解析処理
+
+    同じモデル・プロンプトでの解析結果が保存済みであればそれを返す
+    （``refresh=True`` の場合は再解析する）。``segmentation="scenes"`` の場合は
+    シーンの切り替わりと音声の区切りから求めた候補セグメントをモデルに採点させる
+    （検出に失敗した場合は30秒ごとのセグメントで解析する）。
+    ``segmentation="transcript"`` の場合は動画の代わりに文字起こしと代表フレームを
+    送り、発話の区切りから求めた候補セグメントを採点させる（音声認識を使えない
+    場合は同じく30秒ごとのセグメントで解析する）。``segmentation="keyframes"`` の
+    場合は動画の代わりにシーンの候補セグメントごとの代表フレームだけを送る。
+    ``FINGERPRINT_ENABLED`` の場合は、解析済みの近い動画と重なる区間のハイライトを
+    引き継ぎ、残りの区間だけを解析する。
+    """
+    segmentation = segmentation or settings.analysis_segmentation
+    provider, model, google_api_key = select_provider(settings)
+    version = prompt_version(analysis_prompt(provider, segmentation))
+
+    if not refresh:
+        stored = await find_stored_analysis(file_id, model=model, version=version)
+        if stored is not None:
+            logger.info(f"Using stored analysis for {file_id} ({model}, {version})")
+            return stored
+
+    # 取り込みを経ずに解析される動画も、申告されたハッシュをここで照合する
+    await verify_uploaded_content(file_id, settings)
+
+    if settings.fingerprint_enabled:
+        reused = await _run_near_duplicate_analysis(
+            file_id, model, version, google_api_key, settings
+        )
+        if reused is not None:
+            await record_analysis(
+                file_id,
+                provider=provider,
+                model=model,
+                version=version,
+                result=reused,
+                settings=settings,
+            )
+            return reused
+
+    candidates = None
+    if segmentation == "scenes":
+        try:
+            candidates = await detect_candidates(file_id, settings)
+        except Exception as e:
+            logger.warning(
+                f"Scene detection failed for {file_id}, using fixed segments: {e!s}"
+            )
+        if not candidates:
+            version = prompt_version(analysis_prompt(provider))
+
+    transcript = None
+    if segmentation == "transcript":
+        try:
+            transcript = await prepare_transcript_analysis(file_id, settings)
+        except Exception as e:
+            logger.warning(
+                f"Transcription failed for {file_id}, using fixed segments: {e!s}"
+            )
+        if transcript is None or not transcript.candidates:
+            transcript = None
+            version = prompt_version(analysis_prompt(provider))
+
+    keyframes = None
+    if segmentation == "keyframes":
+        try:
+            keyframes = await prepare_keyframe_analysis(file_id, settings)
+        except Exception as e:
+            logger.warning(
+                f"Keyframe sampling failed for {file_id}, using fixed segments: {e!s}"
+            )
+        if keyframes is None or not keyframes.frames:
+            keyframes = None
+            version = prompt_version(analysis_prompt(provider))
+
+    if transcript is not None:
+        result = await _run_transcript_analysis(transcript, google_api_key, settings)
+    elif keyframes is not None:
+        result = await _run_keyframe_analysis(keyframes, google_api_key, settings)
+    elif candidates:
+        result = await _run_scene_analysis(
+            file_id, candidates, google_api_key, settings
+        )
+    else:
+        result = await _run_analysis(file_id, google_api_key, settings)
+    await record_analysis(
+        file_id,
+        provider=provider,
+        model=model,
+        version=version,
+        result=result,
+        settings=settings,
+    )
+    return result
+
+
+async def _run_near_duplicate_analysis(
+    file_id: str,
+    model: str,
+    version: str,
+    google_api_key: str | None,
+    settings: Settings,
+) -> AnalysisResult | None:
+    """
+    解析済みの近い動画と重なる区間はそのハイライトを移し、残りの区間だけを解析する
+
+    指紋を求められない場合・近い動画がない場合は None（動画全体を解析する）。
     """
+    # analyze_range は本モジュールを使うため、循環しないようにここで読み込む
+    from app.services.analyze_range import analyze_windows  # noqa: PLC0415
+
+    try:
+        match = await find_near_duplicate(file_id, model, version, settings)
+    except Exception as e:
+        logger.warning(
+            f"Fingerprinting failed for {file_id}, analyzing the whole video: {e!s}"
+        )
+        return None
+    if match is None:
+        return None
+
+    logger.info(
+        f"Reusing {match.alignment.seconds:g}s of {match.source_file_id} for "
+        f"{file_id} (offset {match.alignment.offset}s); analyzing "
+        f"{len(match.windows)} remaining ranges"
+    )
+    with span("analyze.near_duplicate", windows=len(match.windows)):
+        analyzed = await analyze_windows(
+            file_id, match.windows, google_api_key, settings
+        )
+    return AnalysisResult(
+        highlights=sorted(
+            [*match.highlights, *analyzed], key=lambda h: (h.start, h.end)
+        )
+    )
+
+
+async def _run_analysis(
+    file_id: str, google_api_key: str | None, settings: Settings
+) -> AnalysisResult:
+    # 動画の長さが記録済みならセグメントをその範囲に収める
+    duration = await known_duration(file_id)
     try:
         # Google AI API キーが設定されている場合は Google AI API を使用
-        google_api_key = os.environ.get("GOOGLE_API_KEY")
         if google_api_key:
             logger.info("Using Google AI API for video analysis")
-            return await analyze_video_with_google_ai(file_id, google_api_key, settings)
+            return await analyze_video_with_google_ai(
+                file_id, google_api_key, settings, duration=duration
+            )
 
         # それ以外は Vertex AI を使用
         logger.info("Using Vertex AI for video analysis")
 
-        # Google Cloud プロジェクトIDを取得
-        if not settings.gcs_project_id:
-            raise ValueError("GCS_PROJECT_ID environment variable is not set")
-
-        # Gemini クライアントを初期化
-        client = genai.Client(
-            http_options=HttpOptions(api_version="v1"),
-            vertexai=True,
-            project=settings.gcs_project_id,
-            location="us-central1",
-        )
-
-        # Cloud Storage上の動画ファイルパスを構築
-        file_extension, mime_type = await get_file_info(file_id, settings)
-        gs_path = f"gs://{settings.gcs_bucket_name}/{settings.gcs_uploads_prefix}{file_id}{file_extension}"
-
-        logger.info(f"Analyzing video with Vertex AI model: {settings.vertex_ai_model}")
-        logger.info(f"Video location: {gs_path} (MIME: {mime_type})")
-
         # Geminiに動画解析をリクエスト
-        prompt = """
-        この動画を30秒ごとのセグメントに分割して分析してください。
-        各セグメントについて以下の情報を提供してください：
-        - start: セグメントの開始時間（秒）
-        - end: セグメントの終了時間（秒）
-        - title: そのセグメントの簡潔なタイトル（日本語）
-        - description: セグメントの内容説明（日本語）
-        - score: そのセグメントの重要度スコア（0.0〜1.0）
-
-        重要度スコアは以下の基準で評価してください：
-        - 視覚的に魅力的なシーン: +0.2
-        - 重要な情報が含まれている: +0.3
-        - アクションや動きがある: +0.2
-        - 音声で重要な説明がある: +0.3
-        """
-
-        analysis_start = time.time()
-        response = client.models.generate_content(
-            model=settings.vertex_ai_model,
-            contents=[
-                Part.from_uri(
-                    file_uri=gs_path,
-                    mime_type=mime_type,
-                ),
-                prompt,
-            ],
-            config=GenerateContentConfig(
-                response_mime_type="application/json",
-                response_schema=GeminiResponse,
-                media_resolution="MEDIA_RESOLUTION_LOW",
-            ),
+        gemini_data = await generate_for_upload(
+            file_id, SEGMENT_ANALYSIS_PROMPT, settings, duration=duration
         )
-        analysis_time = time.time() - analysis_start
-        logger.info(f"Vertex AI analysis completed in {analysis_time:.2f} seconds")
-
-        # レスポンスを解析
-        gemini_data = GeminiResponse.model_validate_json(response.text)
         highlights = [
             Highlight(
                 start=segment.start,
@@ -114,3 +397,162 @@ async def analyze_video_service(file_id: str, settings: Settings) -> AnalysisRes
     except Exception as e:
         logger.error(f"Error analyzing video: {e!s}")
         raise
+
+
+async def generate_for_upload(
+    file_id: str,
+    prompt: str,
+    settings: Settings,
+    response_type: type[ResponseT] = GeminiResponse,
+    duration: float | None = None,
+) -> ResponseT:
+    """
+    アップロード済みの動画を Vertex AI で解析する
+
+    コンテキストキャッシュが有効なら、動画のキャッシュに対してプロンプトだけを送る
+    （キャッシュが使えなければ動画を送る通常の呼び出しに戻す）。
+    """
+    video = await uploaded_video_part(file_id, settings)
+    if settings.context_cache_enabled:
+        client = vertex_client(settings)
+        name = await acquire_video_cache(client, file_id, video, settings)
+        if name is not None:
+            usage: list[types.GenerateContentResponseUsageMetadata] = []
+            try:
+                response = await asyncio.to_thread(
+                    generate_with_vertex,
+                    video,
+                    prompt,
+                    settings,
+                    response_type,
+                    duration=duration,
+                    cached_content=name,
+                    on_usage=usage.append,
+                )
+            except errors.ClientError as e:
+                if e.code == 429:
+                    raise
+                # 期限切れ・削除済みのキャッシュ
+                logger.warning(f"Context cache {name} is unusable: {e!s}")
+                await forget_video_cache(name)
+            else:
+                cached_tokens = sum(u.cached_content_token_count or 0 for u in usage)
+                await record_cache_use(client, file_id, name, cached_tokens, settings)
+                return response
+    return await asyncio.to_thread(
+        generate_with_vertex, video, prompt, settings, response_type, duration=duration
+    )
+
+
+async def uploaded_video_part(file_id: str, settings: Settings) -> types.Part:
+    """Cloud Storage上のアップロード済み動画を参照するPart"""
+    blob_name, mime_type = await get_file_info(file_id, settings)
+    gs_path = f"gs://{settings.gcs_bucket_name}/{blob_name}"
+
+    logger.info(f"Analyzing video with Vertex AI model: {settings.vertex_ai_model}")
+    logger.info(f"Video location: {gs_path} (MIME: {mime_type})")
+    return types.Part.from_uri(file_uri=gs_path, mime_type=mime_type)
+
+
+async def _run_scene_analysis(
+    file_id: str,
+    candidates: list[tuple[float, float]],
+    google_api_key: str | None,
+    settings: Settings,
+) -> AnalysisResult:
+    """候補セグメントをモデルに採点させる"""
+    prompt = scene_analysis_prompt(candidates, with_example=google_api_key is not None)
+    if google_api_key:
+        logger.info("Using Google AI API for scene-based video analysis")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            blob_name, _ = await get_file_info(file_id, settings)
+            local_video_path = await download_video_from_gcs(
+                blob_name, Path(temp_dir), settings
+            )
+            response = await asyncio.to_thread(
+                generate_with_google_ai,
+                local_video_path,
+                prompt,
+                google_api_key,
+                settings,
+                GeminiCandidateResponse,
+            )
+    else:
+        logger.info("Using Vertex AI for scene-based video analysis")
+        response = await generate_for_upload(
+            file_id, prompt, settings, GeminiCandidateResponse
+        )
+    return AnalysisResult(
+        highlights=candidate_highlights(candidates, response.segments)
+    )
+
+
+async def _run_transcript_analysis(
+    context: TranscriptContext, google_api_key: str | None, settings: Settings
+) -> AnalysisResult:
+    """文字起こしと代表フレームから候補セグメントをモデルに採点させる"""
+    times = [time for time, _ in context.keyframes]
+    images = [jpeg for _, jpeg in context.keyframes]
+    prompt = transcript_analysis_prompt(
+        context.candidates,
+        context.texts,
+        times,
+        with_example=google_api_key is not None,
+    )
+    if google_api_key:
+        logger.info("Using Google AI API for transcript-based analysis")
+        response = await asyncio.to_thread(
+            generate_with_google_ai_images,
+            images,
+            prompt,
+            google_api_key,
+            settings,
+            GeminiCandidateResponse,
+        )
+    else:
+        logger.info("Using Vertex AI for transcript-based analysis")
+        parts = [
+            types.Part.from_bytes(data=jpeg, mime_type="image/jpeg") for jpeg in images
+        ]
+        response = await asyncio.to_thread(
+            generate_with_vertex, parts, prompt, settings, GeminiCandidateResponse
+        )
+    return AnalysisResult(
+        highlights=candidate_highlights(context.candidates, response.segments)
+    )
+
+
+async def _run_keyframe_analysis(
+    context: KeyframeContext, google_api_key: str | None, settings: Settings
+) -> AnalysisResult:
+    """候補セグメントごとの代表フレームだけから候補セグメントを採点させる"""
+    prompt = keyframe_analysis_prompt(
+        context.candidates, with_example=google_api_key is not None
+    )
+    if google_api_key:
+        logger.info("Using Google AI API for keyframe-based analysis")
+        images: list[bytes | str] = []
+        for frame in context.frames:
+            images += [keyframe_label(frame.index, frame.time), frame.jpeg]
+        response = await asyncio.to_thread(
+            generate_with_google_ai_images,
+            images,
+            prompt,
+            google_api_key,
+            settings,
+            GeminiCandidateResponse,
+        )
+    else:
+        logger.info("Using Vertex AI for keyframe-based analysis")
+        parts = []
+        for frame in context.frames:
+            parts += [
+                types.Part.from_text(text=keyframe_label(frame.index, frame.time)),
+                types.Part.from_bytes(data=frame.jpeg, mime_type="image/jpeg"),
+            ]
+        response = await asyncio.to_thread(
+            generate_with_vertex, parts, prompt, settings, GeminiCandidateResponse
+        )
+    return AnalysisResult(
+        highlights=candidate_highlights(context.candidates, response.segments)
+    )
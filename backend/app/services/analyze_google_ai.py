@@ -1,14 +1,23 @@
+from __future__ import annotations
+
+import asyncio
 import logging
 import tempfile
 import time
 from pathlib import Path
 
-import google.generativeai as genai
 from pydantic import BaseModel
 
+from app.core.lazy import lazy_import
 from app.core.settings import Settings
+from app.core.telemetry import span
+from app.core.usage import charge
 from app.models.schemas import AnalysisResult, Highlight
 from app.services.gcs_utils import download_video_from_gcs, get_file_info
+from app.services.model_output import ResponseT, resolve_response
+from app.services.prompts import SEGMENT_ANALYSIS_PROMPT_WITH_EXAMPLE
+
+genai = lazy_import("google.generativeai")
 
 logger = logging.getLogger(__name__)
 
@@ -27,91 +36,30 @@ class GeminiResponse(BaseModel):
 
 
 async def analyze_video_with_google_ai(
-    file_id: str, api_key: str, settings: Settings
+    file_id: str, api_key: str, settings: Settings, duration: float | None = None
 ) -> AnalysisResult:
     """
     Google AI API を使用した動画解析処理
     """
     try:
-        # Google AI API を設定
-        genai.configure(api_key=api_key)
-
-        # モデルを取得
-        model = genai.GenerativeModel(settings.google_ai_model)
-        logger.info(f"Using Google AI model: {settings.google_ai_model}")
-
         # 一時ディレクトリを作成
         with tempfile.TemporaryDirectory() as temp_dir:
             temp_path = Path(temp_dir)
 
             # GCSから動画をダウンロード
-            file_extension, mime_type = await get_file_info(file_id, settings)
+            blob_name, _ = await get_file_info(file_id, settings)
             local_video_path = await download_video_from_gcs(
-                file_id, file_extension, temp_path, settings
+                blob_name, temp_path, settings
             )
 
-            logger.info(f"Uploading video to Google AI Files API: {local_video_path}")
-
-            # Google AI Files APIにアップロード
-            file_ref = genai.upload_file(path=str(local_video_path))
-
-            # ファイルの処理を待つ
-            while file_ref.state.name == "PROCESSING":
-                logger.info(f"File state: {file_ref.state.name}, name: {file_ref.name}")
-                logger.info("Waiting for video to be processed...")
-                time.sleep(5)
-                file_ref = genai.get_file(name=file_ref.name)
-
-            if file_ref.state.name != "ACTIVE":
-                msg = f"File upload failed with state: {file_ref.state.name}"
-                raise RuntimeError(msg)
-
-            logger.info("Video upload completed")
-
-            # プロンプト
-            prompt = """
-            この動画を30秒ごとのセグメントに分割して分析してください。
-            各セグメントについて以下の情報を提供してください：
-            - start: セグメントの開始時間（秒）
-            - end: セグメントの終了時間（秒）
-            - title: そのセグメントの簡潔なタイトル（日本語）
-            - description: セグメントの内容説明（日本語）
-            - score: そのセグメントの重要度スコア（0.0〜1.0）
-
-            重要度スコアは以下の基準で評価してください：
-            - 視覚的に魅力的なシーン: +0.2
-            - 重要な情報が含まれている: +0.3
-            - アクションや動きがある: +0.2
-            - 音声で重要な説明がある: +0.3
-
-            必ず以下のJSON形式で返答してください：
-            {
-                "segments": [
-                    {
-                        "start": 0,
-                        "end": 30,
-                        "title": "タイトル",
-                        "description": "説明",
-                        "score": 0.8
-                    }
-                ]
-            }
-            """
-
-            # 動画解析を実行
-            logger.info(f"Starting Google AI analysis for file: {file_ref.name}")
-            analysis_start = time.time()
-            response = model.generate_content(
-                [file_ref, prompt],
-                generation_config=genai.GenerationConfig(
-                    response_mime_type="application/json",
-                ),
+            gemini_data = await asyncio.to_thread(
+                generate_with_google_ai,
+                local_video_path,
+                SEGMENT_ANALYSIS_PROMPT_WITH_EXAMPLE,
+                api_key,
+                settings,
+                duration=duration,
             )
-            analysis_time = time.time() - analysis_start
-            logger.info(f"Google AI analysis completed in {analysis_time:.2f} seconds")
-
-            # レスポンスを解析
-            gemini_data = GeminiResponse.model_validate_json(response.text)
             highlights = [
                 Highlight(
                     start=segment.start,
@@ -122,16 +70,134 @@ async def analyze_video_with_google_ai(
                 )
                 for segment in gemini_data.segments
             ]
-
-            # アップロードしたファイルを削除
-            try:
-                genai.delete_file(file_ref.name)
-                logger.info("Deleted uploaded file from Google AI")
-            except Exception as e:
-                logger.warning(f"Failed to delete file from Google AI: {e!s}")
-
             return AnalysisResult(highlights=highlights)
 
     except Exception as e:
         logger.exception(f"Error analyzing video with Google AI: {e!s}")
         raise
+
+
+def generate_with_google_ai(
+    video_path: Path,
+    prompt: str,
+    api_key: str,
+    settings: Settings,
+    response_type: type[ResponseT] = GeminiResponse,
+    duration: float | None = None,
+) -> ResponseT:
+    """
+    ローカルの動画を Google AI Files API にアップロードし、プロンプトで解析する
+
+    応答のJSONは ``response_type`` として検証・修復する（途中で途切れた場合は
+    アップロード済みのファイルに対して続きだけを要求する）。
+    アップロード・処理待ち・応答を待ってブロックするため、非同期のコードからは
+    ``asyncio.to_thread`` で呼ぶ。
+    """
+    # Google AI API を設定
+    genai.configure(api_key=api_key)
+
+    # モデルを取得
+    model = genai.GenerativeModel(settings.google_ai_model)
+    logger.info(f"Using Google AI model: {settings.google_ai_model}")
+
+    logger.info(f"Uploading video to Google AI Files API: {video_path}")
+
+    # Google AI Files APIにアップロード
+    upload_size = video_path.stat().st_size
+    with span("analyze.google_ai.upload_file", bytes=upload_size):
+        file_ref = genai.upload_file(path=str(video_path))
+    charge(egress_bytes=upload_size)
+
+    # ファイルの処理を待つ
+    with span("analyze.google_ai.wait_processing"):
+        while file_ref.state.name == "PROCESSING":
+            logger.info(f"File state: {file_ref.state.name}, name: {file_ref.name}")
+            logger.info("Waiting for video to be processed...")
+            time.sleep(5)
+            file_ref = genai.get_file(name=file_ref.name)
+
+    if file_ref.state.name != "ACTIVE":
+        msg = f"File upload failed with state: {file_ref.state.name}"
+        raise RuntimeError(msg)
+
+    logger.info("Video upload completed")
+
+    try:
+        # 動画解析を実行
+        logger.info(f"Starting Google AI analysis for file: {file_ref.name}")
+        return _generate_content(
+            model, [file_ref], prompt, settings, response_type, duration
+        )
+    finally:
+        # アップロードしたファイルを削除
+        try:
+            genai.delete_file(file_ref.name)
+            logger.info("Deleted uploaded file from Google AI")
+        except Exception as e:
+            logger.warning(f"Failed to delete file from Google AI: {e!s}")
+
+
+def generate_with_google_ai_images(
+    images: list[bytes | str],
+    prompt: str,
+    api_key: str,
+    settings: Settings,
+    response_type: type[ResponseT] = GeminiResponse,
+) -> ResponseT:
+    """
+    JPEG画像（代表フレーム）をリクエストに含めて送り、プロンプトで解析する
+
+    ``images`` の文字列はその位置にテキスト（画像のラベルなど）として送る。
+    """
+    genai.configure(api_key=api_key)
+    model = genai.GenerativeModel(settings.google_ai_model)
+    logger.info(f"Using Google AI model: {settings.google_ai_model}")
+    parts = [
+        image if isinstance(image, str) else {"mime_type": "image/jpeg", "data": image}
+        for image in images
+    ]
+    return _generate_content(model, parts, prompt, settings, response_type)
+
+
+def _generate_content(
+    model: genai.GenerativeModel,
+    prefix: list,
+    prompt: str,
+    settings: Settings,
+    response_type: type[ResponseT],
+    duration: float | None = None,
+) -> ResponseT:
+    """
+    ``prefix``（動画・画像）とプロンプトを送り、応答を ``response_type`` にする
+
+    途中で途切れた場合は同じ ``prefix`` に対して続きだけを要求する。
+    """
+
+    def generate(text_prompt: str) -> str:
+        with span(
+            "analyze.google_ai.generate", model=settings.google_ai_model
+        ) as generate_span:
+            response = model.generate_content(
+                [*prefix, text_prompt],
+                generation_config=genai.GenerationConfig(
+                    response_mime_type="application/json",
+                ),
+            )
+        logger.info(
+            f"Google AI analysis completed in {generate_span.duration:.2f} seconds"
+        )
+        charge(model_seconds=generate_span.duration)
+        return response.text
+
+    text = generate(prompt)
+
+    # レスポンスを解析
+    with span("analyze.google_ai.parse"):
+        return resolve_response(
+            text,
+            response_type,
+            prompt=prompt,
+            generate=generate,
+            provider="google_ai",
+            duration=duration,
+        )
@@ -0,0 +1,277 @@
+"""
+Range-scoped re-analysis
+
+Re-scores one time window of an already analyzed video. FFmpeg seeks into the
+upload through a signed URL (only the needed byte ranges are fetched), encodes
+the window as a small low-frame-rate clip, and only that clip is sent to the
+model. The returned highlights replace the stored ones inside the window; the
+rest of the stored analysis is kept as is. Cost and latency therefore scale
+with the length of the window rather than the video.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import tempfile
+from datetime import timedelta
+from pathlib import Path
+
+from app.core.lazy import lazy_import
+from app.core.settings import Settings
+from app.core.telemetry import span
+from app.models.schemas import AnalysisResult, Highlight, RangeAnalysisRequest
+from app.services.analyze import (
+    GeminiSegment,
+    generate_with_vertex,
+    select_provider,
+)
+from app.services.analyze_google_ai import generate_with_google_ai
+from app.services.ffmpeg import run_ffmpeg
+from app.services.gcs_utils import find_upload_blob, generate_signed_url
+from app.services.library import find_latest_analysis, record_analysis
+from app.services.prompts import range_analysis_prompt
+
+storage = lazy_import("google.cloud.storage")
+types = lazy_import("google.genai.types")
+
+logger = logging.getLogger(__name__)
+
+MAX_RANGE_SECONDS = 300.0
+# モデルは1fps程度でサンプリングするため、低解像度・低フレームレートで十分
+WINDOW_HEIGHT = 360
+WINDOW_FPS = 5
+MIN_HIGHLIGHT_SECONDS = 0.5
+# 複数の区間をまとめて解析する場合のセグメントの長さ（全体の解析と同じ30秒）
+WINDOW_GRANULARITY = 30.0
+
+
+def validate_range(request: RangeAnalysisRequest) -> None:
+    if request.end <= request.start:
+        msg = "end must be greater than start"
+        raise ValueError(msg)
+    if request.end - request.start > MAX_RANGE_SECONDS:
+        msg = f"Range must be at most {MAX_RANGE_SECONDS:g} seconds"
+        raise ValueError(msg)
+    if request.granularity > request.end - request.start:
+        msg = "granularity must not exceed the range"
+        raise ValueError(msg)
+
+
+def build_window_command(
+    source: str, output_path: str, start: float, end: float
+) -> list[str]:
+    """区間だけを解析用の小さなクリップに書き出すコマンド（入力シーク）"""
+    return [
+        "ffmpeg",
+        "-y",
+        "-ss",
+        f"{start:.3f}",
+        "-i",
+        source,
+        "-t",
+        f"{end - start:.3f}",
+        "-map",
+        "0:v:0",
+        "-map",
+        "0:a:0?",
+        "-vf",
+        f"scale=-2:'min({WINDOW_HEIGHT},ih)',fps={WINDOW_FPS}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "veryfast",
+        "-crf",
+        "32",
+        "-c:a",
+        "aac",
+        "-ac",
+        "1",
+        "-b:a",
+        "64k",
+        "-movflags",
+        "+faststart",
+        output_path,
+    ]
+
+
+def window_highlights(
+    segments: list[GeminiSegment], start: float, end: float
+) -> list[Highlight]:
+    """クリップ先頭からの時刻を元の動画の時刻に直し、区間内に収める"""
+    highlights = []
+    for segment in segments:
+        h_start = min(max(start + segment.start, start), end)
+        h_end = min(max(start + segment.end, start), end)
+        if h_end - h_start < MIN_HIGHLIGHT_SECONDS:
+            continue
+        highlights.append(
+            Highlight(
+                start=round(h_start, 3),
+                end=round(h_end, 3),
+                title=segment.title,
+                description=segment.description,
+                score=segment.score,
+            )
+        )
+    return highlights
+
+
+def splice_highlights(
+    existing: list[Highlight], replacement: list[Highlight], start: float, end: float
+) -> list[Highlight]:
+    """
+    区間内のハイライトを差し替える
+
+    区間にまたがる既存のハイライトは区間外の部分だけを残す。
+    """
+    kept = []
+    for highlight in existing:
+        if highlight.end <= start or highlight.start >= end:
+            kept.append(highlight)
+            continue
+        if start - highlight.start >= MIN_HIGHLIGHT_SECONDS:
+            kept.append(highlight.model_copy(update={"end": start}))
+        if highlight.end - end >= MIN_HIGHLIGHT_SECONDS:
+            kept.append(highlight.model_copy(update={"start": end}))
+    return sorted([*kept, *replacement], key=lambda h: (h.start, h.end))
+
+
+def window_source(blob: storage.Blob, settings: Settings) -> str:
+    """FFmpegが範囲リクエストで読む入力（署名付きURL）"""
+    return generate_signed_url(
+        blob, method="GET", expiration=timedelta(hours=1), settings=settings
+    )
+
+
+async def analyze_window(
+    file_id: str,
+    source: str,
+    start: float,
+    end: float,
+    granularity: float,
+    google_api_key: str | None,
+    settings: Settings,
+) -> list[Highlight]:
+    """区間だけを小さなクリップにしてモデルに送り、元の動画の時刻のハイライトを返す"""
+    prompt = range_analysis_prompt(
+        start, end, granularity, with_example=google_api_key is not None
+    )
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+        clip_path = Path(temp_dir) / "window.mp4"
+        with span("analyze.range.cut", duration=end - start):
+            result = await run_ffmpeg(
+                build_window_command(source, str(clip_path), start, end),
+                label="analyze_range",
+                timeout=settings.ffmpeg_timeout_seconds,
+            )
+        if result.returncode != 0:
+            msg = f"FFmpeg error: {result.stderr}"
+            raise RuntimeError(msg)
+
+        logger.info(
+            f"Analyzing {file_id} [{start:g}s, {end:g}s] "
+            f"({clip_path.stat().st_size} bytes)"
+        )
+        if google_api_key:
+            gemini_data = await asyncio.to_thread(
+                generate_with_google_ai, clip_path, prompt, google_api_key, settings
+            )
+        else:
+            video = types.Part.from_bytes(
+                data=clip_path.read_bytes(), mime_type="video/mp4"
+            )
+            gemini_data = await asyncio.to_thread(
+                generate_with_vertex, video, prompt, settings
+            )
+    return window_highlights(gemini_data.segments, start, end)
+
+
+async def analyze_windows(
+    file_id: str,
+    windows: list[tuple[float, float]],
+    google_api_key: str | None,
+    settings: Settings,
+) -> list[Highlight]:
+    """
+    複数の区間を順に解析する（長い区間は ``MAX_RANGE_SECONDS`` ごとに分ける）
+
+    Raises:
+        FileNotFoundError: アップロードされた動画が見つからない場合
+    """
+    if not windows:
+        return []
+    bucket = storage.Client().bucket(settings.gcs_bucket_name)
+    blob = find_upload_blob(bucket, file_id, settings)
+    if blob is None:
+        msg = f"Input file not found in GCS for fileId: {file_id}"
+        raise FileNotFoundError(msg)
+    source = window_source(blob, settings)
+
+    highlights: list[Highlight] = []
+    for start, end in windows:
+        while end - start > 0:
+            window_end = min(start + MAX_RANGE_SECONDS, end)
+            highlights += await analyze_window(
+                file_id,
+                source,
+                start,
+                window_end,
+                min(WINDOW_GRANULARITY, window_end - start),
+                google_api_key,
+                settings,
+            )
+            start = window_end
+    return highlights
+
+
+async def analyze_range_service(
+    file_id: str, request: RangeAnalysisRequest, settings: Settings
+) -> AnalysisResult:
+    """
+    指定区間だけを再解析し、保存済みの解析結果に差し込む
+
+    差し込む先は同じモデルの最新の解析で、全体の解析がどの区切り方
+    （segmentation）で行われたかは問わない。保存済みの解析がない場合は
+    ValueError（先に全体を解析する）。
+    """
+    validate_range(request)
+    provider, model, google_api_key = select_provider(settings)
+    latest = await find_latest_analysis(file_id, model=model)
+    if latest is None:
+        msg = f"No stored analysis for {file_id}; analyze the whole video first"
+        raise ValueError(msg)
+    version, stored = latest
+
+    bucket = storage.Client().bucket(settings.gcs_bucket_name)
+    blob = find_upload_blob(bucket, file_id, settings)
+    if blob is None:
+        msg = f"Input file not found in GCS for fileId: {file_id}"
+        raise FileNotFoundError(msg)
+
+    logger.info(f"Re-analyzing a range of {file_id} with {model}")
+    replacement = await analyze_window(
+        file_id,
+        window_source(blob, settings),
+        request.start,
+        request.end,
+        request.granularity,
+        google_api_key,
+        settings,
+    )
+    spliced = AnalysisResult(
+        highlights=splice_highlights(
+            stored.highlights, replacement, request.start, request.end
+        )
+    )
+    # 元の解析と同じモデル・プロンプトの最新の解析として保存する
+    # （以後の同じ区切り方の解析要求はこれを返す）
+    await record_analysis(
+        file_id,
+        provider=provider,
+        model=model,
+        version=version,
+        result=spliced,
+        settings=settings,
+    )
+    return spliced
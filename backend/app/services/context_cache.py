@@ -0,0 +1,228 @@
+"""
+Gemini context caching of uploaded videos (Vertex AI)
+
+The first analysis of a video creates a cached content handle holding the
+video and the system instruction; later analyses of the same video (other
+prompts, refreshes, continuations of truncated responses) send only their
+prompt and reference the handle, so the video tokens are not ingested again.
+The cached video is tokenized at the same media resolution as uncached calls,
+so cached-token counts and savings compare against the same baseline.
+Handles are tracked in the store with their token counts, hits and the
+number of input tokens served from the cache. The TTL is extended when a
+handle is used and expired entries are dropped from the registry.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import UTC, datetime
+
+from app.core.lazy import lazy_import
+from app.core.settings import Settings
+from app.core.telemetry import REGISTRY, span
+from app.models.schemas import ContextCacheInfo, ContextCachesResponse
+from app.services.library import known_duration
+from app.services.prompts import (
+    ANALYSIS_MEDIA_RESOLUTION,
+    ANALYSIS_SYSTEM_INSTRUCTION,
+)
+from app.store import ContextCacheRecord, get_store
+
+genai = lazy_import("google.genai")
+types = lazy_import("google.genai.types")
+
+logger = logging.getLogger(__name__)
+
+# 解析中に期限が切れないよう、残り時間がこれ未満のキャッシュは使わない
+MIN_REMAINING_SECONDS = 120
+
+CACHE_REQUESTS = REGISTRY.counter(
+    "gemini_context_cache_requests_total",
+    "Context cache lookups by outcome (hit, created, skipped, error)",
+    ("outcome",),
+)
+CACHED_TOKENS = REGISTRY.counter(
+    "gemini_context_cached_tokens_total",
+    "Input tokens served from context caches instead of being ingested again",
+)
+
+
+def _low_resolution(video: types.Part) -> types.Part:
+    """
+    キャッシュに入れる動画の Part（送るときと同じメディア解像度）
+
+    キャッシュの作成には生成設定の media_resolution を指定できないため、
+    Part に指定する。
+    """
+    return video.model_copy(
+        update={
+            "media_resolution": types.PartMediaResolution(
+                level=ANALYSIS_MEDIA_RESOLUTION
+            )
+        }
+    )
+
+
+async def acquire_video_cache(
+    client: genai.Client, file_id: str, video: types.Part, settings: Settings
+) -> str | None:
+    """
+    動画のコンテキストキャッシュの名前（なければ作成する）
+
+    キャッシュを使わない・作れない場合は None（通常の呼び出しで解析する）。
+    """
+    if not settings.context_cache_enabled:
+        return None
+    model = settings.vertex_ai_model
+    now = time.time()
+    store = get_store()
+    try:
+        cached = await store.find_context_cache(
+            file_id, model=model, valid_until=now + MIN_REMAINING_SECONDS
+        )
+    except Exception as e:
+        logger.warning(f"Failed to look up context cache of {file_id}: {e!s}")
+        cached = None
+    if cached is not None:
+        CACHE_REQUESTS.inc(outcome="hit")
+        return cached.name
+
+    duration = await known_duration(file_id)
+    if duration is not None and duration < settings.context_cache_min_duration_seconds:
+        CACHE_REQUESTS.inc(outcome="skipped")
+        return None
+
+    try:
+        with span("analyze.context_cache.create", model=model):
+            cache = await asyncio.to_thread(
+                client.caches.create,
+                model=model,
+                config=types.CreateCachedContentConfig(
+                    contents=[
+                        types.Content(role="user", parts=[_low_resolution(video)])
+                    ],
+                    system_instruction=ANALYSIS_SYSTEM_INSTRUCTION,
+                    ttl=f"{settings.context_cache_ttl_seconds}s",
+                    display_name=f"video-{file_id}"[:128],
+                ),
+            )
+    except Exception as e:
+        CACHE_REQUESTS.inc(outcome="error")
+        logger.warning(f"Failed to create context cache for {file_id}: {e!s}")
+        return None
+
+    CACHE_REQUESTS.inc(outcome="created")
+    token_count = cache.usage_metadata.total_token_count if cache.usage_metadata else 0
+    expires_at = (
+        cache.expire_time.timestamp()
+        if cache.expire_time
+        else now + settings.context_cache_ttl_seconds
+    )
+    logger.info(f"Created context cache {cache.name} ({token_count} tokens)")
+    try:
+        await store.delete_context_caches(expired_before=now)
+        await store.put_context_cache(
+            ContextCacheRecord(
+                name=cache.name,
+                file_id=file_id,
+                model=model,
+                token_count=token_count or 0,
+                created_at=now,
+                expires_at=expires_at,
+            )
+        )
+    except Exception as e:
+        logger.warning(f"Failed to register context cache {cache.name}: {e!s}")
+    return cache.name
+
+
+async def record_cache_use(
+    client: genai.Client,
+    file_id: str,
+    name: str,
+    cached_tokens: int,
+    settings: Settings,
+) -> None:
+    """キャッシュの利用を記録し、期限が近ければ延長する"""
+    CACHED_TOKENS.inc(cached_tokens)
+    store = get_store()
+    ttl = settings.context_cache_ttl_seconds
+    now = time.time()
+    try:
+        records = [
+            c for c in await store.list_context_caches(file_id) if c.name == name
+        ]
+        expires_at = records[0].expires_at if records else now + ttl
+        if expires_at - now < ttl / 2:
+            await asyncio.to_thread(
+                client.caches.update,
+                name=name,
+                config=types.UpdateCachedContentConfig(ttl=f"{ttl}s"),
+            )
+            expires_at = now + ttl
+        await store.record_context_cache_use(
+            name, cached_tokens=cached_tokens, expires_at=expires_at
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record use of context cache {name}: {e!s}")
+
+
+async def forget_video_cache(name: str) -> None:
+    """使えなくなったキャッシュ（期限切れ・削除済み）を登録から外す"""
+    try:
+        await get_store().delete_context_caches(names=[name])
+    except Exception as e:
+        logger.warning(f"Failed to unregister context cache {name}: {e!s}")
+
+
+async def delete_video_caches(client: genai.Client, file_id: str | None = None) -> int:
+    """動画（省略時はすべて）のキャッシュを削除し、削除した数を返す"""
+    store = get_store()
+    records = await store.list_context_caches(file_id)
+    now = time.time()
+    for record in records:
+        if record.expires_at <= now:
+            continue
+        try:
+            await asyncio.to_thread(client.caches.delete, name=record.name)
+        except Exception as e:
+            logger.warning(f"Failed to delete context cache {record.name}: {e!s}")
+    await store.delete_context_caches(names=[r.name for r in records])
+    return len(records)
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=UTC).isoformat()
+
+
+def _estimated_tokens_saved(record: ContextCacheRecord, settings: Settings) -> int:
+    return round(record.cached_tokens * settings.context_cache_discount)
+
+
+async def context_caches_service(
+    settings: Settings, file_id: str | None = None
+) -> ContextCachesResponse:
+    """登録済みのキャッシュと、キャッシュによる入力トークンの節約量"""
+    records = await get_store().list_context_caches(file_id)
+    caches = [
+        ContextCacheInfo(
+            name=r.name,
+            fileId=r.file_id,
+            model=r.model,
+            tokenCount=r.token_count,
+            createdAt=_iso(r.created_at),
+            expiresAt=_iso(r.expires_at),
+            expired=r.expires_at <= time.time(),
+            hits=r.hits,
+            cachedTokens=r.cached_tokens,
+            estimatedTokensSaved=_estimated_tokens_saved(r, settings),
+        )
+        for r in records
+    ]
+    return ContextCachesResponse(
+        caches=caches,
+        totalCachedTokens=sum(c.cachedTokens for c in caches),
+        totalEstimatedTokensSaved=sum(c.estimatedTokensSaved for c in caches),
+    )
@@ -0,0 +1,110 @@
+"""
+Text embeddings for semantic highlight search
+
+``EMBEDDING_MODEL`` selects a local sentence-transformers model (CPU, installed
+with ``poetry install -E embeddings``). Without it — or when the package is
+missing — a deterministic hashing embedder over character n-grams is used, so
+tests and offline runs produce stable vectors.
+"""
+
+import hashlib
+import logging
+from functools import lru_cache
+from typing import Protocol
+
+import numpy as np
+
+from app.core.settings import Settings
+from app.store.text import normalize
+
+logger = logging.getLogger(__name__)
+
+HASHING_DIM = 256
+HASHING_NGRAMS = (1, 2, 3)
+
+
+class Embedder(Protocol):
+    name: str
+    dim: int
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """L2正規化したfloat32のベクトル（len(texts) x dim）"""
+        ...
+
+
+def _l2_normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class HashingEmbedder:
+    """
+    文字n-gramの特徴ハッシングによる決定的な埋め込み
+
+    意味的な言い換えは捉えられないが、表記の近いテキストは近いベクトルになる。
+    """
+
+    def __init__(self, dim: int = HASHING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> list[tuple[int, float]]:
+        text = normalize(text)
+        features = []
+        for n in HASHING_NGRAMS:
+            for i in range(len(text) - n + 1):
+                gram = text[i : i + n]
+                if gram.isspace():
+                    continue
+                digest = hashlib.blake2b(gram.encode(), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                sign = 1.0 if value & 1 else -1.0
+                features.append(((value >> 1) % self.dim, sign * n))
+        return features
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for column, weight in self._features(text):
+                vectors[row, column] += weight
+        return _l2_normalize(vectors)
+
+
+class SentenceTransformerEmbedder:
+    """sentence-transformers のモデルをCPUで実行する"""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer  # noqa: PLC0415
+
+        self._model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self._model.get_sentence_embedding_dimension()
+        self.name = model_name
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        vectors = self._model.encode(
+            texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True
+        )
+        return np.asarray(vectors, dtype=np.float32)
+
+
+@lru_cache
+def _embedder(model_name: str) -> Embedder:
+    if not model_name:
+        return HashingEmbedder()
+    try:
+        return SentenceTransformerEmbedder(model_name)
+    except ImportError:
+        logger.warning(
+            "EMBEDDING_MODEL is set but sentence-transformers is not installed; "
+            "falling back to the hashing embedder"
+        )
+        return HashingEmbedder()
+
+
+def get_embedder(settings: Settings) -> Embedder:
+    return _embedder(settings.embedding_model)
+
+
+def highlight_text(title: str, description: str) -> str:
+    """ハイライトの埋め込み対象テキスト"""
+    return f"{title}\n{description}"
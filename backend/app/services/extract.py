@@ -1,122 +1,256 @@
+from __future__ import annotations
+
 import asyncio
 import logging
 import tempfile
-import time
 from datetime import timedelta
 from pathlib import Path
 
-from google.cloud import storage
-
+from app.core.lazy import lazy_import
 from app.core.settings import Settings
+from app.core.telemetry import REGISTRY, span
 from app.models.schemas import ExtractRequest, GenerateVideoResponse
-from app.services.gcs_utils import generate_signed_url
+from app.services.ffmpeg import progress_seconds, run_ffmpeg
+from app.services.gcs_utils import find_upload_blob, generate_signed_url
+from app.services.library import record_clip
+from app.services.progress import finish_progress, report_progress
+from app.services.renditions import (
+    LadderPlan,
+    build_ladder,
+    requested_ladder,
+    upload_renditions,
+)
+from app.services.transfer import download_blob, upload_blob
+from app.store import get_store
+
+storage = lazy_import("google.cloud.storage")
 
 logger = logging.getLogger(__name__)
 
+PRERENDER_LOOKUPS = REGISTRY.counter(
+    "prerender_lookups_total",
+    "Extract requests by whether a speculatively pre-rendered clip was used (hit, miss)",
+    ("outcome",),
+)
 
-async def extract_video_service(
+
+async def find_prerendered_clip(
+    request: ExtractRequest, bucket: storage.Bucket
+) -> storage.Blob | None:
+    """
+    同じセグメントを先行して切り出したクリップ（まだ残っているもの）
+
+    レンディションを指定した要求には使わない。
+    """
+    if request.renditions:
+        return None
+    segments = [segment.model_dump() for segment in request.segments]
+    try:
+        clips = await get_store().list_clips(request.fileId)
+    except Exception as e:
+        logger.warning(f"Failed to look up pre-rendered clips: {e!s}")
+        return None
+    for clip in clips:
+        if clip.kind != "prerender" or clip.params.get("segments") != segments:
+            continue
+        blob = bucket.blob(clip.blob_name)
+        if await asyncio.to_thread(blob.exists):
+            return blob
+    return None
+
+
+async def _serve_prerendered_clip(
     request: ExtractRequest, settings: Settings
+) -> GenerateVideoResponse | None:
+    """先行して切り出したクリップがあれば、切り出しの結果として返す"""
+    bucket = storage.Client().bucket(settings.gcs_bucket_name)
+    with span("extract.prerender_lookup"):
+        prerendered = await find_prerendered_clip(request, bucket)
+    PRERENDER_LOOKUPS.inc(outcome="hit" if prerendered else "miss")
+    if prerendered is None:
+        return None
+    logger.info(f"Using pre-rendered clip {prerendered.name}")
+    await record_clip(request.fileId, "extract", prerendered.name, request.model_dump())
+    download_url = generate_signed_url(
+        prerendered,
+        method="GET",
+        expiration=timedelta(days=1),
+        settings=settings,
+    )
+    finish_progress()
+    return GenerateVideoResponse(downloadUrl=download_url)
+
+
+async def _download_input(
+    bucket: storage.Bucket, file_id: str, temp_path: Path, settings: Settings
+) -> Path:
+    """切り出し元の動画を一時ディレクトリにダウンロードする"""
+    # 入力ファイルを探す（正規化済みの動画を優先する）
+    with span("extract.locate_input"):
+        input_blob = find_upload_blob(bucket, file_id, settings)
+
+    if not input_blob:
+        msg = f"Input file not found in GCS for fileId: {file_id}"
+        raise FileNotFoundError(msg)
+
+    # 一時ファイルにダウンロード
+    input_path = temp_path / Path(input_blob.name).name
+    logger.info(f"Downloading from GCS: {input_blob.name}")
+    report_progress(stage="downloading")
+    with span("extract.download", blob=input_blob.name) as download_span:
+        input_size = await download_blob(input_blob, input_path, settings)
+        download_span.set_attribute("bytes", input_size)
+    file_size_mb = input_size / (1024 * 1024)
+    logger.info(
+        f"Download completed: {input_blob.name} ({file_size_mb:.2f} MB) in {download_span.duration:.2f} seconds"
+    )
+    return input_path
+
+
+async def _upload_clip(
+    bucket: storage.Bucket, output_path: Path, output_blob_name: str, settings: Settings
+) -> str:
+    """切り出した動画をGCSにアップロードし、署名付きダウンロードURLを返す"""
+    output_blob = bucket.blob(output_blob_name)
+
+    logger.info(f"Uploading to GCS: {output_blob_name}")
+    output_size = output_path.stat().st_size
+    with span(
+        "extract.upload", blob=output_blob_name, bytes=output_size
+    ) as upload_span:
+        await upload_blob(output_blob, output_path, settings)
+    output_size_mb = output_size / (1024 * 1024)
+    logger.info(
+        f"Upload completed: {output_blob_name} ({output_size_mb:.2f} MB) in {upload_span.duration:.2f} seconds"
+    )
+
+    # 署名付きダウンロードURLを生成
+    return generate_signed_url(
+        output_blob,
+        method="GET",
+        expiration=timedelta(days=1),
+        settings=settings,
+    )
+
+
+async def extract_video_service(
+    request: ExtractRequest, settings: Settings, *, speculative: bool = False
 ) -> GenerateVideoResponse:
     """
     動画切り出し処理
     選択された単一セグメントを切り出す
+
+    先行して切り出したクリップがあれば、切り出さずにそれを返す。
+    ``speculative=True`` は先行の切り出しで、クリップを "prerender" として記録する。
     """
     # セグメントが空の場合はエラー
     if not request.segments:
-        raise ValueError("No segments provided")
+        msg = "No segments provided"
+        raise ValueError(msg)
 
     # 複数セグメントはサポートしない
     if len(request.segments) > 1:
-        raise ValueError(
-            "Multiple segments are not supported. Please select only one segment."
-        )
+        msg = "Multiple segments are not supported. Please select only one segment."
+        raise ValueError(msg)
+
+    if settings.prerender_top_k > 0 and not speculative:
+        prerendered = await _serve_prerendered_clip(request, settings)
+        if prerendered is not None:
+            return prerendered
 
     try:
         segment = request.segments[0]
         output_filename = (
             f"{request.fileId}_extracted_{int(segment.start)}_{int(segment.end)}.mp4"
         )
+        output_blob_name = f"{settings.gcs_processed_prefix}{output_filename}"
 
         # Google Cloud Storageを使用する場合
-        with tempfile.TemporaryDirectory() as temp_dir:
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
             temp_path = Path(temp_dir)
 
             # GCSから動画をダウンロード
             storage_client = storage.Client()
             bucket = storage_client.bucket(settings.gcs_bucket_name)
-
-            # 入力ファイルを探す（複数の拡張子を試す）
-            input_blob = None
-            for ext in ["mp4", "mov", "avi", "webm"]:
-                blob_name = f"{settings.gcs_uploads_prefix}{request.fileId}.{ext}"
-                blob = bucket.blob(blob_name)
-                if blob.exists():
-                    input_blob = blob
-                    input_filename = f"{request.fileId}.{ext}"
-                    break
-
-            if not input_blob:
-                raise FileNotFoundError(
-                    f"Input file not found in GCS for fileId: {request.fileId}"
-                )
-
-            # 一時ファイルにダウンロード
-            input_path = temp_path / input_filename
-            logger.info(f"Downloading from GCS: {input_blob.name}")
-            download_start = time.time()
-            input_blob.download_to_filename(str(input_path))
-            download_time = time.time() - download_start
-            file_size_mb = input_path.stat().st_size / (1024 * 1024)
-            logger.info(
-                f"Download completed: {input_blob.name} ({file_size_mb:.2f} MB) in {download_time:.2f} seconds"
+            input_path = await _download_input(
+                bucket, request.fileId, temp_path, settings
             )
 
             # 出力パス
             output_path = temp_path / output_filename
 
+            # 追加レンディションは同じFFmpegの出力として1回のデコードで生成する
+            ladder = None
+            if requested_ladder(request.renditions):
+                ladder = build_ladder(
+                    "0:v:0", "0:a:0?", request.renditions, output_path, settings
+                )
+
             # FFmpegで動画を切り出し
             logger.info(f"Extracting video segment: {segment.start}s - {segment.end}s")
-            extract_start = time.time()
-            await extract_video_segment(
-                str(input_path), str(output_path), segment.start, segment.end
+            with span(
+                "extract.ffmpeg", duration=segment.end - segment.start
+            ) as ffmpeg_span:
+                await extract_video_segment(
+                    str(input_path),
+                    str(output_path),
+                    segment.start,
+                    segment.end,
+                    timeout=settings.ffmpeg_timeout_seconds,
+                    ladder=ladder,
+                )
+            logger.info(
+                f"Video extraction completed in {ffmpeg_span.duration:.2f} seconds"
             )
-            extract_time = time.time() - extract_start
-            logger.info(f"Video extraction completed in {extract_time:.2f} seconds")
 
             # 処理済み動画をGCSにアップロード
-            output_blob_name = f"{settings.gcs_processed_prefix}{output_filename}"
-            output_blob = bucket.blob(output_blob_name)
-
-            logger.info(f"Uploading to GCS: {output_blob_name}")
-            upload_start = time.time()
-            output_blob.upload_from_filename(str(output_path))
-            upload_time = time.time() - upload_start
-            output_size_mb = output_path.stat().st_size / (1024 * 1024)
-            logger.info(
-                f"Upload completed: {output_blob_name} ({output_size_mb:.2f} MB) in {upload_time:.2f} seconds"
-            )
+            report_progress(stage="uploading")
+            renditions = []
+            if request.renditions:
+                download_url, renditions = await upload_renditions(
+                    bucket, output_path, ladder.outputs if ladder else [], settings
+                )
+            else:
+                download_url = await _upload_clip(
+                    bucket, output_path, output_blob_name, settings
+                )
 
-            # 署名付きダウンロードURLを生成
-            download_url = generate_signed_url(
-                output_blob,
-                method="GET",
-                expiration=timedelta(days=1),
-                settings=settings,
+            await record_clip(
+                request.fileId,
+                "prerender" if speculative else "extract",
+                output_blob_name,
+                request.model_dump(),
+            )
+            finish_progress()
+            return GenerateVideoResponse(
+                downloadUrl=download_url, renditions=renditions
             )
 
-            return GenerateVideoResponse(downloadUrl=download_url)
-
+    except asyncio.CancelledError:
+        finish_progress(error="cancelled")
+        raise
     except Exception as e:
         logger.exception(f"Video extraction failed: {e!s}")
         msg = f"Video extraction failed: {e!s}"
+        finish_progress(error=msg)
         raise RuntimeError(msg)
 
 
 async def extract_video_segment(
-    input_path: str, output_path: str, start: float, end: float
+    input_path: str,
+    output_path: str,
+    start: float,
+    end: float,
+    timeout: float | None = None,
+    ladder: LadderPlan | None = None,
 ) -> None:
     """
     FFmpegを使用して動画セグメントを切り出す
+
+    進捗は現在のリクエストIDの進捗フィードに配信される。
+    ``timeout`` 秒を超えるか、呼び出し元がキャンセルされるとFFmpegを停止する。
+    ``ladder`` を指定すると、ストリームコピーの主出力に加えて
+    同じデコード結果から各レンディションを書き出す。
     """
     duration = end - start
     logger.info(f"FFmpeg extraction: duration={duration:.2f}s")
@@ -136,18 +270,31 @@ async def extract_video_segment(
         "make_zero",  # タイムスタンプの調整
         output_path,  # 出力ファイル
     ]
+    if ladder is not None:
+        # 主出力の前に明示的なマップを入れ、フィルタ出力と混ざらないようにする
+        output_index = cmd.index("-c")
+        cmd[output_index:output_index] = ["-map", "0:v:0", "-map", "0:a:0?"]
+        cmd += ["-filter_complex", ";".join(ladder.graph), *ladder.args]
+
+    def on_progress(block: dict[str, str]) -> None:
+        seconds = progress_seconds(block)
+        report_progress(
+            stage="extracting",
+            out_time_seconds=seconds,
+            ratio=min(seconds / duration, 1.0) if seconds and duration > 0 else None,
+            speed=block.get("speed"),
+        )
 
     # FFmpegコマンドの実行
-    logger.debug(f"FFmpeg command: {' '.join(cmd)}")
-    process = await asyncio.create_subprocess_exec(
-        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    report_progress(stage="extracting", ratio=0.0)
+    result = await run_ffmpeg(
+        cmd, label="extract_video_segment", on_progress=on_progress, timeout=timeout
     )
 
-    _, stderr = await process.communicate()
-
-    if process.returncode != 0:
-        error_message = stderr.decode("utf-8")
+    if result.returncode != 0:
+        error_message = result.stderr
         logger.error(f"FFmpeg failed: {error_message}")
-        raise RuntimeError(f"FFmpeg error: {error_message}")
+        msg = f"FFmpeg error: {error_message}"
+        raise RuntimeError(msg)
 
     logger.info("FFmpeg extraction successful")
@@ -0,0 +1,339 @@
+"""
+FFmpeg subprocess runner
+"""
+
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import deque
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from app.core.profiling import active_profile
+from app.core.usage import active_meter
+
+logger = logging.getLogger(__name__)
+
+_BENCH_TIME_RE = re.compile(
+    r"bench: utime=(?P<utime>[\d.]+)s stime=(?P<stime>[\d.]+)s rtime=(?P<rtime>[\d.]+)s"
+)
+_BENCH_RSS_RE = re.compile(r"bench: maxrss=(?P<maxrss>\d+)\s*(?P<unit>[kK]i?B)")
+
+PROC_IO_POLL_INTERVAL = 0.2
+STDERR_TAIL_LINES = 50
+STDERR_CHUNK_BYTES = 8192
+TERMINATE_GRACE_SECONDS = 2.0
+
+
+@dataclass
+class FFmpegResult:
+    returncode: int
+    stderr: str
+    wall_time: float
+    benchmark: dict[str, float] = field(default_factory=dict)
+    progress: dict[str, str] = field(default_factory=dict)
+    io: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class MediaInfo:
+    duration: float
+    width: int
+    height: int
+    has_audio: bool
+    video_codec: str | None = None
+    audio_codec: str | None = None
+    format_name: str | None = None
+
+
+def parse_probe(data: dict[str, Any]) -> MediaInfo:
+    """ffprobe の JSON 出力から MediaInfo を組み立てる"""
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    if video is None:
+        msg = "No video stream found"
+        raise ValueError(msg)
+    fmt = data.get("format", {})
+    duration = fmt.get("duration") or video.get("duration") or 0
+    return MediaInfo(
+        duration=float(duration),
+        width=int(video.get("width", 0)),
+        height=int(video.get("height", 0)),
+        has_audio=audio is not None,
+        video_codec=video.get("codec_name"),
+        audio_codec=audio.get("codec_name") if audio else None,
+        format_name=fmt.get("format_name"),
+    )
+
+
+async def probe_media(path: str) -> MediaInfo:
+    """ffprobe で動画の長さ・解像度・ストリーム構成を取得する"""
+    cmd = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-print_format",
+        "json",
+        "-show_format",
+        "-show_streams",
+        path,
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if process.returncode != 0:
+        msg = f"ffprobe error: {stderr.decode('utf-8', errors='replace')}"
+        raise RuntimeError(msg)
+    return parse_probe(json.loads(stdout))
+
+
+def parse_benchmark(stderr: str) -> dict[str, float]:
+    """``-benchmark`` の出力からCPU時間と最大RSSを取り出す"""
+    result: dict[str, float] = {}
+    if match := _BENCH_TIME_RE.search(stderr):
+        result.update(
+            {
+                "utime_seconds": float(match["utime"]),
+                "stime_seconds": float(match["stime"]),
+                "rtime_seconds": float(match["rtime"]),
+            }
+        )
+    if match := _BENCH_RSS_RE.search(stderr):
+        result["maxrss_kb"] = float(match["maxrss"])
+    return result
+
+
+def progress_seconds(block: dict[str, str]) -> float | None:
+    """進捗ブロックの出力済み時間（秒）。未確定なら None"""
+    value = block.get("out_time_us") or block.get("out_time_ms")
+    try:
+        return int(value) / 1_000_000 if value else None
+    except ValueError:
+        return None
+
+
+def _read_proc_io(pid: int) -> dict[str, int]:
+    """/proc/<pid>/io から子プロセスのI/Oバイト数を読む（Linuxのみ）"""
+    try:
+        text = Path(f"/proc/{pid}/io").read_text()
+    except OSError:
+        return {}
+    values = {}
+    for line in text.splitlines():
+        key, _, value = line.partition(":")
+        if key in ("rchar", "wchar", "read_bytes", "write_bytes"):
+            values[key] = int(value.strip())
+    return values
+
+
+async def _poll_proc_io(pid: int, sink: dict[str, int]) -> None:
+    while True:
+        if sample := _read_proc_io(pid):
+            sink.update(sample)
+        await asyncio.sleep(PROC_IO_POLL_INTERVAL)
+
+
+class FFmpegTimeoutError(RuntimeError):
+    """FFmpegが期限内に終了しなかった"""
+
+
+ProgressCallback = Callable[[dict[str, str]], None]
+
+
+async def _read_progress(
+    stream: asyncio.StreamReader,
+    latest: dict[str, str],
+    on_progress: ProgressCallback | None,
+) -> None:
+    """``-progress pipe:1`` の出力をブロック単位で読み、コールバックに渡す"""
+    block: dict[str, str] = {}
+    async for raw in stream:
+        key, sep, value = raw.decode("utf-8", errors="replace").strip().partition("=")
+        if not sep:
+            continue
+        block[key] = value.strip()
+        # 各ブロックは progress=continue|end で終わる
+        if key == "progress":
+            latest.update(block)
+            if on_progress is not None:
+                on_progress(dict(block))
+            block = {}
+
+
+async def _read_stderr_tail(stream: asyncio.StreamReader, tail: deque[str]) -> None:
+    """stderrは末尾の一定行数だけ保持する（冗長な出力でもメモリを抑える）"""
+    pending = ""
+    while chunk := await stream.read(STDERR_CHUNK_BYTES):
+        pending += chunk.decode("utf-8", errors="replace").replace("\r", "\n")
+        *lines, pending = pending.split("\n")
+        tail.extend(line for line in lines if line.strip())
+        # 改行のない巨大な出力でも保持量を抑える
+        pending = pending[-STDERR_CHUNK_BYTES:]
+    if pending.strip():
+        tail.append(pending)
+
+
+async def _terminate(process: asyncio.subprocess.Process) -> None:
+    """FFmpegを停止する（応答がなければkill）"""
+    if process.returncode is not None:
+        return
+    process.terminate()
+    try:
+        await asyncio.wait_for(process.wait(), timeout=TERMINATE_GRACE_SECONDS)
+    except TimeoutError:
+        process.kill()
+        await process.wait()
+
+
+async def run_ffmpeg(
+    cmd: list[str],
+    *,
+    label: str = "ffmpeg",
+    on_progress: ProgressCallback | None = None,
+    timeout: float | None = None,
+) -> FFmpegResult:
+    """
+    FFmpegを実行する
+
+    ``-progress pipe:1`` の出力を逐次パースして ``on_progress`` に渡し、
+    stderrは末尾 ``STDERR_TAIL_LINES`` 行のみ保持する。``timeout`` 秒を超えるか
+    呼び出し元のタスクがキャンセルされた場合はサブプロセスを停止する。
+
+    プロファイル中は ``-benchmark`` も付与し、CPU時間・最大RSS・I/Oバイト数・
+    進捗をプロファイルに記録する。
+
+    Args:
+        cmd: ``ffmpeg`` から始まるコマンドライン
+        label: プロファイル上の識別名
+        on_progress: 進捗ブロックごとに呼ばれるコールバック
+        timeout: 実行期限（秒）
+
+    Returns:
+        実行結果（終了コードの確認は呼び出し側で行う）
+
+    Raises:
+        FFmpegTimeoutError: 期限内に終了しなかった場合
+    """
+    profile = active_profile()
+    meter = active_meter()
+    extra_args = ["-nostats", "-progress", "pipe:1"]
+    if profile is not None or meter is not None:
+        extra_args.insert(0, "-benchmark")
+    cmd = [cmd[0], *extra_args, *cmd[1:]]
+
+    logger.debug(f"FFmpeg command: {' '.join(cmd)}")
+    start = time.perf_counter()
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    progress: dict[str, str] = {}
+    stderr_tail: deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+    io: dict[str, int] = {}
+    readers = [
+        asyncio.create_task(_read_progress(process.stdout, progress, on_progress)),
+        asyncio.create_task(_read_stderr_tail(process.stderr, stderr_tail)),
+    ]
+    poller = (
+        asyncio.create_task(_poll_proc_io(process.pid, io))
+        if profile is not None
+        else None
+    )
+    try:
+        async with asyncio.timeout(timeout):
+            await asyncio.gather(*readers)
+            await process.wait()
+    except TimeoutError:
+        logger.warning(f"FFmpeg ({label}) exceeded {timeout}s deadline, killing")
+        await _terminate(process)
+        msg = f"FFmpeg timed out after {timeout:g} seconds"
+        raise FFmpegTimeoutError(msg) from None
+    except asyncio.CancelledError:
+        logger.info(f"FFmpeg ({label}) cancelled, killing subprocess")
+        await asyncio.shield(_terminate(process))
+        raise
+    finally:
+        for task in readers:
+            task.cancel()
+        if poller is not None:
+            poller.cancel()
+    wall_time = time.perf_counter() - start
+
+    stderr_text = "\n".join(stderr_tail)
+    result = FFmpegResult(
+        returncode=process.returncode or 0,
+        stderr=stderr_text,
+        wall_time=wall_time,
+        progress=progress,
+    )
+    if profile is not None or meter is not None:
+        result.benchmark = parse_benchmark(stderr_text)
+    if meter is not None:
+        meter.add(
+            ffmpeg_cpu_seconds=result.benchmark.get("utime_seconds", 0.0)
+            + result.benchmark.get("stime_seconds", 0.0)
+        )
+    if profile is not None:
+        result.io = io
+        profile.record_ffmpeg(ffmpeg_profile_entry(label, cmd, result))
+    return result
+
+
+async def run_ffmpeg_pipe(
+    cmd: list[str], *, label: str = "ffmpeg_pipe", timeout: float | None = None
+) -> bytes:
+    """
+    標準出力に書き出すFFmpeg（rawvideo / image2pipe など）を実行し、出力を返す
+
+    一時ファイルを使わずにフレームをメモリ上で受け取るために使う。
+
+    Raises:
+        RuntimeError: FFmpegが失敗した場合
+        FFmpegTimeoutError: 期限内に終了しなかった場合
+    """
+    cmd = [cmd[0], "-nostats", "-loglevel", "error", *cmd[1:]]
+    logger.debug(f"FFmpeg pipe command: {' '.join(cmd)}")
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        async with asyncio.timeout(timeout):
+            stdout, stderr = await process.communicate()
+    except TimeoutError:
+        await _terminate(process)
+        msg = f"FFmpeg ({label}) timed out after {timeout:g} seconds"
+        raise FFmpegTimeoutError(msg) from None
+    except asyncio.CancelledError:
+        await asyncio.shield(_terminate(process))
+        raise
+    if process.returncode != 0:
+        error_message = stderr.decode("utf-8", errors="replace")[-4000:]
+        msg = f"FFmpeg ({label}) error: {error_message}"
+        raise RuntimeError(msg)
+    return stdout
+
+
+def ffmpeg_profile_entry(
+    label: str, cmd: list[str], result: FFmpegResult
+) -> dict[str, Any]:
+    return {
+        "label": label,
+        "command": cmd,
+        "returncode": result.returncode,
+        "wall_time_seconds": round(result.wall_time, 6),
+        "benchmark": result.benchmark,
+        "progress": result.progress,
+        "io": result.io,
+    }
@@ -0,0 +1,294 @@
+"""
+Perceptual fingerprints for reusing analyses of near-duplicate videos
+
+Re-exports, trims and re-encodes of the same footage differ byte for byte, so
+the content hash of ``/api/upload/init`` misses them. With
+``FINGERPRINT_ENABLED=true`` each video gets one 64-bit difference hash per
+second, computed in a single FFmpeg decode that scales frames down to 9x8
+grayscale (at ingest, or on the first analysis). When a video is analyzed,
+videos sharing hash bands (``app.store.fingerprints``) are aligned with it by
+the most common time offset. Highlights of their stored analysis (same model
+and prompt) are shifted into the aligned ranges, and only the rest of the
+video is sent to the model as range analyses.
+"""
+
+from __future__ import annotations
+
+import logging
+import tempfile
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.core.lazy import lazy_import
+from app.core.settings import Settings
+from app.core.telemetry import REGISTRY, span
+from app.models.schemas import Highlight
+from app.services.ffmpeg import run_ffmpeg_pipe
+from app.services.gcs_utils import find_upload_blob
+from app.services.library import find_stored_analysis, known_duration
+from app.services.transfer import download_blob
+from app.store import FingerprintRecord, get_store
+from app.store.fingerprints import hash_bands
+
+storage = lazy_import("google.cloud.storage")
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_WIDTH = 9
+FINGERPRINT_HEIGHT = 8
+_FRAME_BYTES = FINGERPRINT_WIDTH * FINGERPRINT_HEIGHT
+# 一致した秒の間に挟まってもよい、一致しない秒の数（再エンコードの揺らぎ）
+MAX_GAP_SECONDS = 2
+# 多くの秒に現れる帯（静止画・タイトル画面）はずれの推定に使わない
+MAX_BAND_OCCURRENCES = 32
+MIN_HIGHLIGHT_SECONDS = 0.5
+# これより短い一致しなかった区間はモデルに送らない
+MIN_WINDOW_SECONDS = 1.0
+
+NEAR_DUPLICATES = REGISTRY.counter(
+    "near_duplicate_matches_total",
+    "Analyses that reused highlights of an already analyzed near-duplicate video",
+)
+REUSED_SECONDS = REGISTRY.counter(
+    "near_duplicate_seconds_reused_total",
+    "Seconds of video whose highlights were mapped from a near-duplicate",
+)
+
+
+@dataclass
+class Alignment:
+    # 解析済みの動画の時刻 = この動画の時刻 + offset
+    offset: int
+    # 解析済みの動画と一致した、この動画の区間（秒）
+    ranges: list[tuple[float, float]]
+
+    @property
+    def seconds(self) -> float:
+        return sum(end - start for start, end in self.ranges)
+
+
+@dataclass
+class NearDuplicate:
+    """解析済みの近い動画から引き継ぐハイライトと、まだ解析が必要な区間"""
+
+    source_file_id: str
+    alignment: Alignment
+    highlights: list[Highlight]
+    windows: list[tuple[float, float]]
+
+
+def build_fingerprint_command(source: str) -> list[str]:
+    """1秒1フレームを 9x8 のグレースケールに縮小して標準出力に書き出すコマンド"""
+    return [
+        "ffmpeg",
+        "-i",
+        source,
+        "-an",
+        "-vf",
+        f"fps=1,scale={FINGERPRINT_WIDTH}:{FINGERPRINT_HEIGHT}:flags=area,format=gray",
+        "-f",
+        "rawvideo",
+        "pipe:1",
+    ]
+
+
+def difference_hash(pixels: bytes) -> int:
+    """9x8 の各行で、左の画素が右の画素より明るいところを1にした64ビット"""
+    value = 0
+    for row in range(FINGERPRINT_HEIGHT):
+        offset = row * FINGERPRINT_WIDTH
+        for col in range(FINGERPRINT_WIDTH - 1):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def frame_hashes(data: bytes) -> list[int]:
+    """連結された 9x8 のフレームごとの差分ハッシュ（端数のバイトは無視する）"""
+    return [
+        difference_hash(data[start : start + _FRAME_BYTES])
+        for start in range(0, len(data) - _FRAME_BYTES + 1, _FRAME_BYTES)
+    ]
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def best_offset(hashes: list[int], other: list[int]) -> int | None:
+    """帯の一致から投票して、最も多い時刻のずれ（秒）"""
+    index: dict[int, list[int]] = defaultdict(list)
+    for second, value in enumerate(other):
+        for band in hash_bands(value):
+            index[band].append(second)
+    votes: Counter[int] = Counter()
+    for second, value in enumerate(hashes):
+        for band in hash_bands(value):
+            matches = index.get(band, [])
+            if len(matches) > MAX_BAND_OCCURRENCES:
+                continue
+            votes.update(match - second for match in matches)
+    if not votes:
+        return None
+    return votes.most_common(1)[0][0]
+
+
+def matched_ranges(
+    hashes: list[int],
+    other: list[int],
+    offset: int,
+    max_distance: int,
+    min_seconds: float,
+) -> list[tuple[float, float]]:
+    """ずれを補正して比べ、ハッシュが近い秒の連続（min_seconds 以上）"""
+    runs: list[tuple[int, int]] = []
+    start = last = None
+    for second, value in enumerate(hashes):
+        counterpart = second + offset
+        if not 0 <= counterpart < len(other):
+            continue
+        if hamming(value, other[counterpart]) > max_distance:
+            continue
+        if start is None or second - last > MAX_GAP_SECONDS + 1:
+            if start is not None:
+                runs.append((start, last + 1))
+            start = second
+        last = second
+    if start is not None:
+        runs.append((start, last + 1))
+    return [(float(s), float(e)) for s, e in runs if e - s >= min_seconds]
+
+
+def align(
+    hashes: list[int], other: list[int], max_distance: int, min_seconds: float
+) -> Alignment | None:
+    """解析済みの動画 other との時間の対応（一致する区間がなければ None）"""
+    offset = best_offset(hashes, other)
+    if offset is None:
+        return None
+    ranges = matched_ranges(hashes, other, offset, max_distance, min_seconds)
+    return Alignment(offset, ranges) if ranges else None
+
+
+def map_highlights(
+    highlights: list[Highlight], alignment: Alignment
+) -> list[Highlight]:
+    """解析済みの動画のハイライトをこの動画の時刻に移し、一致した区間に収める"""
+    mapped = []
+    for highlight in highlights:
+        start = highlight.start - alignment.offset
+        end = highlight.end - alignment.offset
+        for range_start, range_end in alignment.ranges:
+            clipped_start = max(start, range_start)
+            clipped_end = min(end, range_end)
+            if clipped_end - clipped_start < MIN_HIGHLIGHT_SECONDS:
+                continue
+            mapped.append(
+                highlight.model_copy(
+                    update={
+                        "start": round(clipped_start, 3),
+                        "end": round(clipped_end, 3),
+                    }
+                )
+            )
+    return sorted(mapped, key=lambda h: (h.start, h.end))
+
+
+def uncovered_windows(
+    ranges: list[tuple[float, float]], duration: float
+) -> list[tuple[float, float]]:
+    """一致した区間の外側（モデルで解析する区間）"""
+    windows = []
+    cursor = 0.0
+    for start, end in [*ranges, (duration, duration)]:
+        if min(start, duration) - cursor >= MIN_WINDOW_SECONDS:
+            windows.append((round(cursor, 3), round(min(start, duration), 3)))
+        cursor = max(cursor, end)
+    return windows
+
+
+async def record_fingerprint(
+    file_id: str, source: str, settings: Settings
+) -> list[int]:
+    """動画を1回デコードして1秒ごとのハッシュを求め、保存する"""
+    with span("fingerprint.decode") as decode_span:
+        data = await run_ffmpeg_pipe(
+            build_fingerprint_command(source),
+            label="fingerprint",
+            timeout=settings.ffmpeg_timeout_seconds,
+        )
+    hashes = frame_hashes(data)
+    logger.info(
+        f"Fingerprinted {len(hashes)} seconds of {file_id} "
+        f"in {decode_span.duration:.2f} seconds"
+    )
+    await get_store().put_fingerprint(
+        FingerprintRecord(file_id=file_id, hashes=hashes, created_at=time.time())
+    )
+    return hashes
+
+
+async def ensure_fingerprint(file_id: str, settings: Settings) -> list[int]:
+    """
+    保存済みのハッシュ、なければアップロード済みの動画から求める
+
+    Raises:
+        FileNotFoundError: アップロードされた動画が見つからない場合
+    """
+    stored = await get_store().get_fingerprint(file_id)
+    if stored is not None:
+        return stored.hashes
+
+    bucket = storage.Client().bucket(settings.gcs_bucket_name)
+    blob = find_upload_blob(bucket, file_id, settings)
+    if blob is None:
+        msg = f"Input file not found in GCS for fileId: {file_id}"
+        raise FileNotFoundError(msg)
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+        source = Path(temp_dir) / Path(blob.name).name
+        with span("fingerprint.download", blob=blob.name) as download_span:
+            size = await download_blob(blob, source, settings)
+            download_span.set_attribute("bytes", size)
+        return await record_fingerprint(file_id, str(source), settings)
+
+
+async def find_near_duplicate(
+    file_id: str, model: str, version: str, settings: Settings
+) -> NearDuplicate | None:
+    """
+    同じモデル・プロンプトで解析済みの、最も長く重なる動画
+
+    重なりが ``FINGERPRINT_MIN_OVERLAP_SECONDS`` 未満なら None。
+    """
+    hashes = await ensure_fingerprint(file_id, settings)
+    store = get_store()
+    best = None
+    for candidate in await store.find_fingerprint_candidates(file_id):
+        analysis = await find_stored_analysis(candidate, model=model, version=version)
+        fingerprint = await store.get_fingerprint(candidate)
+        if analysis is None or fingerprint is None:
+            continue
+        alignment = align(
+            hashes,
+            fingerprint.hashes,
+            settings.fingerprint_max_distance,
+            settings.fingerprint_min_overlap_seconds,
+        )
+        if alignment is not None and (
+            best is None or alignment.seconds > best[1].seconds
+        ):
+            best = (candidate, alignment, analysis)
+    if best is None:
+        return None
+
+    source_file_id, alignment, analysis = best
+    duration = await known_duration(file_id) or float(len(hashes))
+    NEAR_DUPLICATES.inc()
+    REUSED_SECONDS.inc(alignment.seconds)
+    return NearDuplicate(
+        source_file_id=source_file_id,
+        alignment=alignment,
+        highlights=map_highlights(analysis.highlights, alignment),
+        windows=uncovered_windows(alignment.ranges, duration),
+    )
@@ -2,15 +2,23 @@
 Google Cloud Storage utilities
 """
 
+from __future__ import annotations
+
 import logging
+import threading
 import time
+from collections import OrderedDict
 from datetime import timedelta
 from pathlib import Path
 
-from google import auth
-from google.cloud import storage
-
+from app.core.lazy import lazy_import
 from app.core.settings import Settings
+from app.core.telemetry import span
+from app.services.transfer import download_blob
+
+auth = lazy_import("google.auth")
+auth_requests = lazy_import("google.auth.transport.requests")
+storage = lazy_import("google.cloud.storage")
 
 logger = logging.getLogger(__name__)
 
@@ -48,12 +56,13 @@ def generate_signed_url(
             "https://www.googleapis.com/auth/iam",
         ]
 
-        # Get credentials using Application Default Credentials
-        # This will use GOOGLE_APPLICATION_CREDENTIALS env var if set
-        credentials, _ = auth.default(scopes=scopes)
+        with span("gcs.sign_url.credentials"):
+            # Get credentials using Application Default Credentials
+            # This will use GOOGLE_APPLICATION_CREDENTIALS env var if set
+            credentials, _ = auth.default(scopes=scopes)
 
-        # Refresh token to ensure it's valid
-        credentials.refresh(auth.transport.requests.Request())
+            # Refresh token to ensure it's valid
+            credentials.refresh(auth_requests.Request())
 
         # Build parameters for signed URL
         url_params = {
@@ -69,7 +78,8 @@ def generate_signed_url(
             url_params["content_type"] = content_type
 
         # Generate and return the signed URL
-        signed_url = blob.generate_signed_url(**url_params)
+        with span("gcs.sign_url", method=method):
+            signed_url = blob.generate_signed_url(**url_params)
 
         logger.debug(f"Generated signed URL for {blob.name} with method {method}")
 
@@ -79,52 +89,154 @@ def generate_signed_url(
         raise
 
 
-async def get_file_info(file_id: str, settings: Settings) -> tuple[str, str]:
+class SignedUrlCache:
     """
-    ファイルIDから実際のファイル情報を取得
-    Returns: (file_extension, mime_type)
+    署名付きURLのキャッシュ
+
+    署名には認証情報の取得・更新が伴うため、有効期限の残りが十分なURLは
+    再利用する（サムネイルなど、同じオブジェクトのURLを繰り返し返す用途向け）。
     """
-    # サポートする動画形式
-    video_formats = [
-        (".mp4", "video/mp4"),
-        (".mov", "video/quicktime"),
-        (".avi", "video/x-msvideo"),
-        (".webm", "video/webm"),
-    ]
 
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, str, str], tuple[str, float]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple[str, str, str], min_remaining: float) -> str | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            url, expires_at = entry
+            if expires_at - time.time() < min_remaining:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return url
+
+    def expires_at(self, key: tuple[str, str, str]) -> float | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[1] if entry is not None else None
+
+    def put(self, key: tuple[str, str, str], url: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (url, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+signed_url_cache = SignedUrlCache()
+
+
+def cached_signed_url(
+    blob: storage.Blob,
+    expiration: timedelta = timedelta(days=1),
+    settings: Settings | None = None,
+) -> str:
+    """
+    GET用の署名付きURLを返す（有効期限が半分以上残っていればキャッシュを使う）
+    """
+    key = (blob.bucket.name, blob.name, "GET")
+    lifetime = expiration.total_seconds()
+    if url := signed_url_cache.get(key, min_remaining=lifetime / 2):
+        return url
+    url = generate_signed_url(
+        blob, method="GET", expiration=expiration, settings=settings
+    )
+    signed_url_cache.put(key, url, time.time() + lifetime)
+    return url
+
+
+def signed_url_expires_at(blob: storage.Blob) -> float | None:
+    """``cached_signed_url`` が返したURLの有効期限（UNIX時刻）"""
+    return signed_url_cache.expires_at((blob.bucket.name, blob.name, "GET"))
+
+
+# アップロードを受け付ける拡張子と MIME タイプ
+VIDEO_CONTENT_TYPES = {
+    "mp4": "video/mp4",
+    "mov": "video/quicktime",
+    "avi": "video/x-msvideo",
+    "webm": "video/webm",
+}
+UPLOAD_EXTENSIONS = tuple(VIDEO_CONTENT_TYPES)
+
+
+def normalized_blob_name(file_id: str, settings: Settings) -> str:
+    """取り込み時に正規化した faststart MP4 のオブジェクト名"""
+    return f"{settings.gcs_normalized_prefix}{file_id}.mp4"
+
+
+def find_original_blob(
+    bucket: storage.Bucket, file_id: str, settings: Settings
+) -> storage.Blob | None:
+    """アップロードされた元の動画のBlobを探す（複数の拡張子を試す）"""
+    for ext in UPLOAD_EXTENSIONS:
+        blob = bucket.blob(f"{settings.gcs_uploads_prefix}{file_id}.{ext}")
+        if blob.exists():
+            return blob
+    return None
+
+
+def find_upload_blob(
+    bucket: storage.Bucket, file_id: str, settings: Settings
+) -> storage.Blob | None:
+    """
+    解析・切り出しの元になる動画のBlobを探す
+
+    取り込み時に正規化した動画があればそれを、なければ元の動画を返す。
+    """
+    with span("gcs.find_upload"):
+        blob = bucket.blob(normalized_blob_name(file_id, settings))
+        if blob.exists():
+            return blob
+        return find_original_blob(bucket, file_id, settings)
+
+
+async def get_file_info(file_id: str, settings: Settings) -> tuple[str, str]:
+    """
+    ファイルIDから元になる動画のオブジェクト名とMIMEタイプを取得
+    Returns: (blob_name, mime_type)
+    """
+    default = f"{settings.gcs_uploads_prefix}{file_id}.mp4", "video/mp4"
     try:
         storage_client = storage.Client()
         bucket = storage_client.bucket(settings.gcs_bucket_name)
 
-        # 各拡張子で試す
-        for ext, mime_type in video_formats:
-            blob_name = f"{settings.gcs_uploads_prefix}{file_id}{ext}"
-            blob = bucket.blob(blob_name)
-
-            if blob.exists():
-                logger.info(f"Found video file: {blob_name}")
-                return ext, mime_type
+        with span("gcs.get_file_info"):
+            blob = find_upload_blob(bucket, file_id, settings)
+        if blob is not None:
+            logger.info(f"Found video file: {blob.name}")
+            ext = blob.name.rsplit(".", 1)[-1]
+            return blob.name, VIDEO_CONTENT_TYPES[ext]
 
         # ファイルが見つからない場合はデフォルトで.mp4
         logger.warning(
             f"No video file found for file_id: {file_id}, defaulting to .mp4"
         )
-        return ".mp4", "video/mp4"
+        return default
 
     except Exception as e:
         logger.error(f"Error checking file existence: {e!s}")
-        return ".mp4", "video/mp4"
+        return default
 
 
 async def download_video_from_gcs(
-    file_id: str, file_extension: str, temp_path: Path, settings: Settings
+    blob_name: str, temp_path: Path, settings: Settings
 ) -> Path:
     """
     GCSから動画をダウンロード
 
     Args:
-        file_id: ファイルID
-        file_extension: ファイル拡張子（.mp4など）
+        blob_name: オブジェクト名（``get_file_info`` の結果）
         temp_path: ダウンロード先の一時ディレクトリパス
         settings: アプリケーション設定
 
@@ -133,19 +245,17 @@ async def download_video_from_gcs(
     """
     storage_client = storage.Client()
     bucket = storage_client.bucket(settings.gcs_bucket_name)
-
-    blob_name = f"{settings.gcs_uploads_prefix}{file_id}{file_extension}"
     blob = bucket.blob(blob_name)
 
-    local_path = temp_path / f"{file_id}{file_extension}"
+    local_path = temp_path / Path(blob_name).name
 
     logger.info(f"Downloading video from GCS: {blob_name}")
-    download_start = time.time()
-    blob.download_to_filename(str(local_path))
-    download_time = time.time() - download_start
-    file_size_mb = local_path.stat().st_size / (1024 * 1024)
+    with span("gcs.download", blob=blob_name) as download_span:
+        file_size = await download_blob(blob, local_path, settings)
+        download_span.set_attribute("bytes", file_size)
+    file_size_mb = file_size / (1024 * 1024)
     logger.info(
-        f"Download completed: {blob_name} ({file_size_mb:.2f} MB) in {download_time:.2f} seconds"
+        f"Download completed: {blob_name} ({file_size_mb:.2f} MB) in {download_span.duration:.2f} seconds"
     )
 
     return local_path
@@ -0,0 +1,315 @@
+"""
+Ingest normalization of uploaded videos
+
+Browsers upload whatever the user picked (``.mov`` from phones, ``.avi``,
+``.webm``), often with the ``moov`` atom at the end. After the upload the
+original is probed once, so videos that cannot be read are rejected here
+instead of deep inside a later FFmpeg run. Everything else is rewritten as a
+faststart MP4 (``moov`` first) under ``GCS_NORMALIZED_PREFIX``: streams MP4
+can carry are copied and only incompatible codecs are transcoded. The
+normalized object becomes the canonical source of analyze/extract/render
+(``find_upload_blob``); the original is kept or deleted according to
+``INGEST_KEEP_ORIGINAL``. An MP4 upload that is already faststart with
+compatible codecs is used as is.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import struct
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.core.lazy import lazy_import
+from app.core.settings import Settings
+from app.core.telemetry import REGISTRY, span
+from app.models.schemas import IngestResponse
+from app.services.ffmpeg import MediaInfo, probe_media, progress_seconds, run_ffmpeg
+from app.services.fingerprints import record_fingerprint
+from app.services.gcs_utils import find_original_blob, normalized_blob_name
+from app.services.library import record_video_metadata
+from app.services.progress import finish_progress, report_progress
+from app.services.transfer import download_blob, upload_blob
+from app.services.upload import verify_upload_hash
+from app.store import get_store
+
+storage = lazy_import("google.cloud.storage")
+
+logger = logging.getLogger(__name__)
+
+# MP4 にストリームコピーできるコーデック（それ以外は再エンコードする）
+MP4_VIDEO_CODECS = frozenset({"h264", "hevc", "mpeg4"})
+MP4_AUDIO_CODECS = frozenset({"aac", "mp3", "ac3", "eac3", "alac"})
+INGEST_AUDIO_BITRATE = "192k"
+
+# トップレベルのボックスを探す上限（壊れたファイルで読み続けないため）
+MAX_TOP_LEVEL_BOXES = 64
+
+INGESTS = REGISTRY.counter(
+    "ingest_videos_total",
+    "Uploads normalized at ingest by action (none, remux, transcode)",
+    ("action",),
+)
+
+
+@dataclass
+class IngestPlan:
+    # none: 元の動画をそのまま使う / remux: ストリームコピー / transcode: 再エンコード
+    action: str
+    # copy またはエンコーダ名
+    video: str
+    # copy / エンコーダ名 / None（音声なし）
+    audio: str | None
+
+
+def top_level_boxes(path: Path) -> list[str]:
+    """MP4/MOV のトップレベルのボックス名（ファイル先頭から順に）"""
+    total = path.stat().st_size
+    boxes: list[str] = []
+    offset = 0
+    with path.open("rb") as f:
+        while offset + 8 <= total and len(boxes) < MAX_TOP_LEVEL_BOXES:
+            f.seek(offset)
+            size, kind = struct.unpack(">I4s", f.read(8))
+            if size == 1:
+                # 64ビットのサイズが続く
+                size = struct.unpack(">Q", f.read(8))[0]
+            elif size == 0:
+                # ファイル末尾まで
+                size = total - offset
+            if size < 8:
+                break
+            boxes.append(kind.decode("latin-1"))
+            offset += size
+    return boxes
+
+
+def is_faststart(path: Path) -> bool:
+    """moov が mdat より前にある（先頭から読むだけで再生・シークできる）か"""
+    boxes = top_level_boxes(path)
+    if "moov" not in boxes:
+        return False
+    return "mdat" not in boxes or boxes.index("moov") < boxes.index("mdat")
+
+
+def plan_ingest(media: MediaInfo, *, extension: str, faststart: bool) -> IngestPlan:
+    """元の動画の形式から正規化の方法を決める"""
+    video = "copy" if media.video_codec in MP4_VIDEO_CODECS else "libx264"
+    audio = None
+    if media.has_audio:
+        audio = "copy" if media.audio_codec in MP4_AUDIO_CODECS else "aac"
+    if video != "copy" or audio not in (None, "copy"):
+        return IngestPlan("transcode", video, audio)
+    if extension == "mp4" and faststart:
+        return IngestPlan("none", video, audio)
+    return IngestPlan("remux", video, audio)
+
+
+def build_ingest_command(
+    input_path: str,
+    output_path: str,
+    media: MediaInfo,
+    plan: IngestPlan,
+    settings: Settings,
+) -> list[str]:
+    """先頭の映像・音声ストリームだけを faststart MP4 に書き出すコマンド"""
+    # AVI などはタイムスタンプが欠けていることがあるため生成させる
+    cmd = ["ffmpeg", "-y", "-fflags", "+genpts", "-i", input_path, "-map", "0:v:0"]
+    if plan.audio is not None:
+        cmd += ["-map", "0:a:0"]
+    if plan.video == "copy":
+        cmd += ["-c:v", "copy"]
+        if media.video_codec == "hevc":
+            # Apple の再生環境は hev1 タグの HEVC を再生できない
+            cmd += ["-tag:v", "hvc1"]
+    else:
+        cmd += [
+            "-vf",
+            "scale=trunc(iw/2)*2:trunc(ih/2)*2",
+            "-c:v",
+            plan.video,
+            "-preset",
+            settings.ingest_x264_preset,
+            "-crf",
+            str(settings.ingest_crf),
+            "-pix_fmt",
+            "yuv420p",
+        ]
+    if plan.audio == "copy":
+        cmd += ["-c:a", "copy"]
+    elif plan.audio is not None:
+        cmd += ["-c:a", plan.audio, "-b:a", INGEST_AUDIO_BITRATE]
+    cmd += ["-movflags", "+faststart", "-f", "mp4", output_path]
+    return cmd
+
+
+async def _probe_upload(path: Path) -> MediaInfo:
+    """
+    コンテナとコーデックを検証する
+
+    Raises:
+        ValueError: 動画として読めない、または長さが分からない場合
+    """
+    try:
+        media = await probe_media(str(path))
+    except RuntimeError as e:
+        msg = f"Unsupported or corrupt video: {e!s}"
+        raise ValueError(msg) from e
+    if media.duration <= 0 or media.width <= 0 or media.height <= 0:
+        msg = "Unsupported or corrupt video: unknown duration or frame size"
+        raise ValueError(msg)
+    return media
+
+
+async def _transcode(
+    cmd: list[str], media: MediaInfo, plan: IngestPlan, settings: Settings
+) -> None:
+    def on_progress(block: dict[str, str]) -> None:
+        seconds = progress_seconds(block)
+        report_progress(
+            stage="normalizing",
+            out_time_seconds=seconds,
+            ratio=min(seconds / media.duration, 1.0) if seconds else None,
+            speed=block.get("speed"),
+        )
+
+    report_progress(stage="normalizing", ratio=0.0)
+    with span("ingest.ffmpeg", action=plan.action, duration=media.duration):
+        result = await run_ffmpeg(
+            cmd,
+            label="ingest",
+            on_progress=on_progress,
+            timeout=settings.ffmpeg_timeout_seconds,
+        )
+    if result.returncode != 0:
+        msg = f"FFmpeg error: {result.stderr}"
+        raise RuntimeError(msg)
+
+
+def _ingest_response(
+    file_id: str,
+    action: str,
+    source: str,
+    original: str | None,
+    media: MediaInfo | None,
+) -> IngestResponse:
+    return IngestResponse(
+        fileId=file_id,
+        action=action,
+        sourceBlob=source,
+        originalBlob=original,
+        duration=media.duration if media else None,
+        width=media.width if media else None,
+        height=media.height if media else None,
+        videoCodec=media.video_codec if media else None,
+        audioCodec=media.audio_codec if media else None,
+    )
+
+
+async def _existing_ingest(
+    file_id: str, normalized: storage.Blob, original: storage.Blob | None
+) -> IngestResponse:
+    """正規化済みの動画の情報（記録済みのメタデータを使う）"""
+    video = await get_store().get_video(file_id)
+    response = _ingest_response(
+        file_id, "none", normalized.name, original.name if original else None, None
+    )
+    if video is not None:
+        response.duration = video.duration
+        response.width = video.width
+        response.height = video.height
+    return response
+
+
+async def _record_fingerprint(file_id: str, path: Path, settings: Settings) -> None:
+    """近い動画の検索用の指紋（失敗しても取り込みは続ける）"""
+    try:
+        with span("ingest.fingerprint"):
+            await record_fingerprint(file_id, str(path), settings)
+    except Exception as e:
+        logger.warning(f"Failed to fingerprint {file_id}: {e!s}")
+
+
+async def ingest_video_service(file_id: str, settings: Settings) -> IngestResponse:
+    """
+    アップロードされた動画を検証し、faststart MP4 に正規化する
+
+    正規化済みの場合は何もせずにその情報を返す。
+
+    Raises:
+        FileNotFoundError: アップロードされた動画が見つからない場合
+        ValueError: 動画として読めない場合、申告されたハッシュと一致しない場合
+    """
+    bucket = storage.Client().bucket(settings.gcs_bucket_name)
+    with span("ingest.locate_input"):
+        normalized = bucket.blob(normalized_blob_name(file_id, settings))
+        original = find_original_blob(bucket, file_id, settings)
+        if normalized.exists():
+            return await _existing_ingest(file_id, normalized, original)
+    if original is None:
+        msg = f"Input file not found in GCS for fileId: {file_id}"
+        raise FileNotFoundError(msg)
+    await verify_upload_hash(file_id, original)
+
+    try:
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+            temp_path = Path(temp_dir)
+            input_path = temp_path / Path(original.name).name
+            report_progress(stage="downloading")
+            with span("ingest.download", blob=original.name) as download_span:
+                input_size = await download_blob(original, input_path, settings)
+                download_span.set_attribute("bytes", input_size)
+
+            with span("ingest.probe"):
+                media = await _probe_upload(input_path)
+                faststart = await asyncio.to_thread(is_faststart, input_path)
+            await record_video_metadata(file_id, media)
+            if settings.fingerprint_enabled:
+                await _record_fingerprint(file_id, input_path, settings)
+            extension = original.name.rsplit(".", 1)[-1].lower()
+            plan = plan_ingest(media, extension=extension, faststart=faststart)
+            logger.info(
+                f"Ingesting {original.name}: {plan.action} "
+                f"(video {media.video_codec} -> {plan.video}, "
+                f"audio {media.audio_codec} -> {plan.audio}, faststart={faststart})"
+            )
+            INGESTS.inc(action=plan.action)
+            if plan.action == "none":
+                finish_progress()
+                return _ingest_response(
+                    file_id, plan.action, original.name, original.name, media
+                )
+
+            output_path = temp_path / f"{file_id}.normalized.mp4"
+            cmd = build_ingest_command(
+                str(input_path), str(output_path), media, plan, settings
+            )
+            await _transcode(cmd, media, plan, settings)
+
+            report_progress(stage="uploading")
+            output_size = output_path.stat().st_size
+            with span("ingest.upload", blob=normalized.name, bytes=output_size):
+                await upload_blob(
+                    normalized, output_path, settings, content_type="video/mp4"
+                )
+
+        kept = original.name
+        if not settings.ingest_keep_original:
+            await asyncio.to_thread(original.delete)
+            kept = None
+        finish_progress()
+        return _ingest_response(file_id, plan.action, normalized.name, kept, media)
+
+    except asyncio.CancelledError:
+        finish_progress(error="cancelled")
+        raise
+    except ValueError as e:
+        finish_progress(error=str(e))
+        raise
+    except Exception as e:
+        logger.exception(f"Ingest failed: {e!s}")
+        msg = f"Ingest failed: {e!s}"
+        finish_progress(error=msg)
+        raise RuntimeError(msg)
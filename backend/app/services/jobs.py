@@ -0,0 +1,64 @@
+"""
+Enqueueing analyze/extract jobs for the worker tier and reading their results
+"""
+
+from datetime import UTC, datetime
+from typing import Any
+
+from app.core.scheduling import TenantLimitError, tenant_weight
+from app.core.settings import Settings
+from app.jobs import JobRecord, QueueFullError, get_broker
+from app.models.schemas import JobInfo
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=UTC).isoformat()
+
+
+def job_info(job: JobRecord) -> JobInfo:
+    return JobInfo(
+        jobId=job.job_id,
+        kind=job.kind,
+        status=job.status,
+        attempts=job.attempts,
+        createdAt=_iso(job.created_at),
+        updatedAt=_iso(job.updated_at),
+        result=job.result,
+        error=job.error,
+    )
+
+
+async def enqueue_job_service(
+    kind: str, payload: dict[str, Any], tenant: str, settings: Settings
+) -> JobInfo:
+    """
+    ジョブをキューに登録する（ワーカーが実行する）
+
+    テナントの重みで仮想終了時刻を決め、待ちジョブは TENANT_MAX_QUEUED まで。
+
+    Raises:
+        TenantLimitError: テナントの待ちジョブが上限に達している場合
+    """
+    try:
+        job = await get_broker().enqueue(
+            kind,
+            payload,
+            tenant=tenant,
+            weight=tenant_weight(tenant, settings),
+            max_queued=settings.tenant_max_queued,
+        )
+    except QueueFullError as e:
+        raise TenantLimitError(str(e), {"Retry-After": "1"}, reason="queue_full")
+    return job_info(job)
+
+
+async def job_status_service(job_id: str, tenant: str) -> JobInfo | None:
+    """
+    ジョブの状態と、完了していればその結果
+
+    他のテナントのジョブは存在しないものとして None を返す。
+    """
+    job = await get_broker().get(job_id)
+    if job is None or job.tenant != tenant:
+        return None
+    return job_info(job)
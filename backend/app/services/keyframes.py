@@ -0,0 +1,248 @@
+"""
+Keyframe sampling for image-based analysis
+
+``ANALYSIS_SEGMENTATION=keyframes`` sends the model a few small JPEGs per
+candidate segment instead of the video stream. Candidate windows come from
+scene cuts and audio pauses (``app.services.scenes``), so sampled frames never
+straddle a cut; ``KEYFRAMES_PER_SEGMENT`` frames are taken at evenly spaced
+points inside each window.
+
+The video is decoded twice: the scene and silence detection pass (at
+``SCAN_WIDTH``) has to finish before the target times are known, and a second
+pass keeps only the first frame at or after each target time with ``select``.
+The selected frames are encoded as MJPEG to ``image2pipe`` and split in
+memory; their timestamps are written by ``metadata=print`` so that each JPEG
+is matched to the target it satisfied rather than by position.
+"""
+
+from __future__ import annotations
+
+import logging
+import re
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.core.lazy import lazy_import
+from app.core.settings import Settings
+from app.core.telemetry import span
+from app.services.ffmpeg import probe_media, run_ffmpeg_pipe
+from app.services.gcs_utils import find_upload_blob
+from app.services.scenes import candidate_segments, detect_boundaries
+from app.services.transfer import download_blob
+
+storage = lazy_import("google.cloud.storage")
+
+logger = logging.getLogger(__name__)
+
+KEYFRAME_QUALITY = 5
+# これより近い目標時刻はまとめる（1フレームで2つの目標を満たさないため）
+MIN_FRAME_GAP_SECONDS = 0.5
+
+_JPEG_END = b"\xff\xd9"
+# 選んだフレームの pts の単位（目標時刻と同じミリ秒）
+_MILLIS = 1000
+_PTS_RE = re.compile(r"\bpts:(?P<pts>-?\d+)")
+
+
+@dataclass
+class Keyframe:
+    # 候補セグメントの番号
+    index: int
+    time: float
+    jpeg: bytes
+
+
+@dataclass
+class KeyframeContext:
+    """代表フレームによる解析でモデルに渡す材料"""
+
+    candidates: list[tuple[float, float]]
+    frames: list[Keyframe]
+
+
+def keyframe_targets(
+    candidates: list[tuple[float, float]], per_segment: int
+) -> list[tuple[int, float]]:
+    """
+    候補セグメントごとに等間隔の (番号, 時刻)
+
+    各セグメントを per_segment 等分した区間の中央を選ぶため、
+    セグメントの境界（シーンの切り替わり）のフレームは選ばれない。
+    """
+    targets: list[tuple[int, float]] = []
+    for index, (start, end) in enumerate(candidates):
+        step = (end - start) / per_segment
+        for i in range(per_segment):
+            time = round(start + step * (i + 0.5), 3)
+            if targets and time - targets[-1][1] < MIN_FRAME_GAP_SECONDS:
+                continue
+            targets.append((index, time))
+    return targets
+
+
+def select_expression(times: list[float]) -> str:
+    """各目標時刻以降の最初のフレームだけを選ぶ ``select`` の式"""
+    previous = "if(isnan(prev_selected_t),-1,prev_selected_t)"
+    return "+".join(f"gte(t,{time:.3f})*lt({previous},{time:.3f})" for time in times)
+
+
+def build_keyframe_command(
+    source: str, times: list[float], width: int, pts_path: str
+) -> list[str]:
+    """
+    選んだフレームだけを縮小してJPEGの連続として標準出力に書き出すコマンド
+
+    選んだフレームの pts（ミリ秒）を pts_path に書き出す。
+    """
+    return [
+        "ffmpeg",
+        "-i",
+        source,
+        "-an",
+        "-vf",
+        f"select='{select_expression(times)}',settb=1/{_MILLIS},"
+        "metadata=mode=add:key=keyframe:value=1,"
+        f"metadata=mode=print:file='{pts_path}',scale={width}:-2",
+        "-fps_mode",
+        "passthrough",
+        "-c:v",
+        "mjpeg",
+        "-q:v",
+        str(KEYFRAME_QUALITY),
+        "-f",
+        "image2pipe",
+        "pipe:1",
+    ]
+
+
+def split_jpegs(data: bytes) -> list[bytes]:
+    """連結されたJPEGを1枚ずつに分ける（EOIマーカーで区切る）"""
+    frames = []
+    start = 0
+    while (end := data.find(_JPEG_END, start)) != -1:
+        frames.append(data[start : end + len(_JPEG_END)])
+        start = end + len(_JPEG_END)
+    return frames
+
+
+def parse_frame_millis(text: str) -> list[int]:
+    """``metadata=print`` の出力から、書き出したフレームの時刻（ミリ秒）を取り出す"""
+    return [int(m["pts"]) for m in _PTS_RE.finditer(text)]
+
+
+def match_targets(
+    targets: list[tuple[int, float]], frame_millis: list[int]
+) -> list[tuple[int, float]]:
+    """
+    書き出したフレームごとに、そのフレームが満たした目標 (番号, 時刻)
+
+    フレームの間隔が目標の間隔より長く、1枚が複数の目標を満たした場合は
+    最も近い（最後の）目標に対応させ、それより前の目標にはフレームを返さない。
+
+    Raises:
+        ValueError: どの目標も満たさないフレームがある場合
+    """
+    matched = []
+    pending = 0
+    for millis in frame_millis:
+        hit = None
+        while pending < len(targets) and round(targets[pending][1] * _MILLIS) <= millis:
+            hit = targets[pending]
+            pending += 1
+        if hit is None:
+            msg = f"Keyframe at {millis / _MILLIS:g}s does not match any target time"
+            raise ValueError(msg)
+        matched.append(hit)
+    return matched
+
+
+async def sample_keyframes(
+    source: str, targets: list[tuple[int, float]], settings: Settings
+) -> list[Keyframe]:
+    """
+    目標時刻のフレームを1回のデコードで取り出す
+
+    動画の末尾より後の目標時刻や、1枚のフレームが満たした複数の目標のうち
+    最後以外にはフレームがないため、返す枚数は少なくなりうる。
+
+    Raises:
+        RuntimeError: 書き出したJPEGとその時刻の数が合わない場合
+    """
+    if not targets:
+        return []
+    with (
+        tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir,
+        span("analyze.keyframes.sample", frames=len(targets)),
+    ):
+        pts_path = Path(temp_dir) / "frames.txt"
+        data = await run_ffmpeg_pipe(
+            build_keyframe_command(
+                source,
+                [time for _, time in targets],
+                settings.keyframe_width,
+                str(pts_path),
+            ),
+            label="keyframes",
+            timeout=settings.ffmpeg_timeout_seconds,
+        )
+        frame_millis = parse_frame_millis(
+            pts_path.read_text() if pts_path.exists() else ""
+        )
+    jpegs = split_jpegs(data)
+    if len(jpegs) != len(frame_millis):
+        msg = f"FFmpeg wrote {len(jpegs)} keyframes but {len(frame_millis)} timestamps"
+        raise RuntimeError(msg)
+    return [
+        Keyframe(index, time, jpeg)
+        for (index, time), jpeg in zip(
+            match_targets(targets, frame_millis), jpegs, strict=True
+        )
+    ]
+
+
+async def prepare_keyframe_analysis(
+    file_id: str, settings: Settings
+) -> KeyframeContext:
+    """
+    アップロード済みの動画の候補セグメントと代表フレーム
+
+    シーンの検出に失敗した場合は区切りなしの候補セグメントにする。
+
+    Raises:
+        FileNotFoundError: アップロードされた動画が見つからない場合
+    """
+    bucket = storage.Client().bucket(settings.gcs_bucket_name)
+    blob = find_upload_blob(bucket, file_id, settings)
+    if blob is None:
+        msg = f"Input file not found in GCS for fileId: {file_id}"
+        raise FileNotFoundError(msg)
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+        source = str(Path(temp_dir) / Path(blob.name).name)
+        with span("analyze.keyframes.download", blob=blob.name) as download_span:
+            size = await download_blob(blob, Path(source), settings)
+            download_span.set_attribute("bytes", size)
+        media = await probe_media(source)
+        try:
+            cuts = await detect_boundaries(source, settings)
+        except Exception as e:
+            logger.warning(f"Scene detection failed for {file_id}: {e!s}")
+            cuts = []
+        candidates = candidate_segments(
+            cuts,
+            media.duration,
+            settings.segment_min_seconds,
+            settings.segment_max_seconds,
+        )
+        frames = await sample_keyframes(
+            source,
+            keyframe_targets(candidates, settings.keyframes_per_segment),
+            settings,
+        )
+    logger.info(
+        f"Sampled {len(frames)} keyframes "
+        f"({sum(len(frame.jpeg) for frame in frames)} bytes) from "
+        f"{len(candidates)} candidate segments of {file_id}"
+    )
+    return KeyframeContext(candidates=candidates, frames=frames)
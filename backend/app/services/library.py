@@ -0,0 +1,263 @@
+"""
+Video library: records uploads, analyses and clips in the persistent store
+
+Writes from the request path are best-effort: a store failure is logged and
+never fails the upload, analysis or render that triggered it.
+"""
+
+import logging
+import time
+from datetime import UTC, datetime
+from typing import Any
+
+from app.core.settings import Settings
+from app.models.schemas import (
+    AnalysesResponse,
+    AnalysisResult,
+    ClipInfo,
+    Highlight,
+    SignedUploadUrlRequest,
+    StoredAnalysis,
+    TopHighlight,
+    TopHighlightsResponse,
+    VideoInfo,
+    VideosResponse,
+)
+from app.services.ffmpeg import MediaInfo
+from app.services.similarity import index_analysis
+from app.store import (
+    AnalysisRecord,
+    ClipRecord,
+    HighlightQuery,
+    HighlightRecord,
+    Page,
+    VideoRecord,
+    get_store,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_PAGE_SIZE = 100
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=UTC).isoformat()
+
+
+async def record_upload(
+    file_id: str, request: SignedUploadUrlRequest, tenant: str
+) -> None:
+    try:
+        await get_store().upsert_video(
+            VideoRecord(
+                file_id=file_id,
+                file_name=request.fileName,
+                content_type=request.contentType,
+                file_size=request.fileSize,
+                created_at=time.time(),
+                content_hash=request.contentHash and request.contentHash.lower(),
+                tenant=tenant,
+            )
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record upload {file_id}: {e!s}")
+
+
+async def record_video_metadata(file_id: str, media: MediaInfo) -> None:
+    try:
+        await get_store().update_video_metadata(
+            file_id, duration=media.duration, width=media.width, height=media.height
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record metadata of {file_id}: {e!s}")
+
+
+async def known_duration(file_id: str) -> float | None:
+    """記録済みの動画の長さ（秒）。不明なら None"""
+    try:
+        video = await get_store().get_video(file_id)
+    except Exception as e:
+        logger.warning(f"Failed to look up video {file_id}: {e!s}")
+        return None
+    return video.duration if video is not None else None
+
+
+async def record_analysis(
+    file_id: str,
+    *,
+    provider: str,
+    model: str,
+    version: str,
+    result: AnalysisResult,
+    settings: Settings,
+) -> None:
+    """解析結果を保存し、ハイライトを意味検索の索引に追加する"""
+    try:
+        record = await get_store().add_analysis(
+            file_id,
+            provider=provider,
+            model=model,
+            prompt_version=version,
+            highlights=[h.model_dump() for h in result.highlights],
+        )
+        await index_analysis(record, settings)
+    except Exception as e:
+        logger.warning(f"Failed to record analysis of {file_id}: {e!s}")
+
+
+async def find_stored_analysis(
+    file_id: str, *, model: str, version: str
+) -> AnalysisResult | None:
+    """同じモデル・プロンプトバージョンで保存済みの解析結果"""
+    try:
+        record = await get_store().find_analysis(
+            file_id, model=model, prompt_version=version
+        )
+    except Exception as e:
+        logger.warning(f"Failed to look up analysis of {file_id}: {e!s}")
+        return None
+    if record is None:
+        return None
+    return AnalysisResult(highlights=[_highlight(h) for h in record.highlights])
+
+
+async def find_latest_analysis(
+    file_id: str, *, model: str
+) -> tuple[str, AnalysisResult] | None:
+    """
+    同じモデルで保存済みの最新の解析結果とそのプロンプトバージョン
+
+    区切り方（segmentation）はプロンプトバージョンに含まれるため問わない。
+    """
+    try:
+        records = await get_store().list_analyses(file_id)
+    except Exception as e:
+        logger.warning(f"Failed to look up analyses of {file_id}: {e!s}")
+        return None
+    for record in records:
+        if record.model == model:
+            return record.prompt_version, AnalysisResult(
+                highlights=[_highlight(h) for h in record.highlights]
+            )
+    return None
+
+
+async def record_clip(
+    file_id: str, kind: str, blob_name: str, params: dict[str, Any]
+) -> None:
+    try:
+        await get_store().add_clip(
+            ClipRecord(
+                file_id=file_id,
+                kind=kind,
+                blob_name=blob_name,
+                params=params,
+                created_at=time.time(),
+            )
+        )
+    except Exception as e:
+        logger.warning(f"Failed to record {kind} clip of {file_id}: {e!s}")
+
+
+def _highlight(record: HighlightRecord) -> Highlight:
+    return Highlight(
+        start=record.start,
+        end=record.end,
+        title=record.title,
+        description=record.description,
+        score=record.score,
+    )
+
+
+def _video_info(record: VideoRecord) -> VideoInfo:
+    return VideoInfo(
+        fileId=record.file_id,
+        fileName=record.file_name,
+        contentType=record.content_type,
+        fileSize=record.file_size,
+        createdAt=_iso(record.created_at),
+        duration=record.duration,
+        width=record.width,
+        height=record.height,
+    )
+
+
+def _stored_analysis(record: AnalysisRecord) -> StoredAnalysis:
+    return StoredAnalysis(
+        id=record.id,
+        fileId=record.file_id,
+        provider=record.provider,
+        model=record.model,
+        promptVersion=record.prompt_version,
+        createdAt=_iso(record.created_at),
+        highlights=[_highlight(h) for h in record.highlights],
+    )
+
+
+async def list_videos_service(limit: int, cursor: str | None) -> VideosResponse:
+    page = await get_store().list_videos(min(limit, MAX_PAGE_SIZE), cursor)
+    return VideosResponse(
+        videos=[_video_info(v) for v in page.items], nextCursor=page.next_cursor
+    )
+
+
+async def get_video_service(file_id: str) -> VideoInfo | None:
+    record = await get_store().get_video(file_id)
+    return _video_info(record) if record else None
+
+
+async def list_analyses_service(file_id: str) -> AnalysesResponse:
+    records = await get_store().list_analyses(file_id)
+    return AnalysesResponse(
+        fileId=file_id, analyses=[_stored_analysis(r) for r in records]
+    )
+
+
+async def list_clips_service(file_id: str) -> list[ClipInfo]:
+    records = await get_store().list_clips(file_id)
+    return [
+        ClipInfo(
+            id=r.id,
+            kind=r.kind,
+            blobName=r.blob_name,
+            params=r.params,
+            createdAt=_iso(r.created_at),
+        )
+        for r in records
+    ]
+
+
+def _top_highlights(page: Page[HighlightRecord]) -> TopHighlightsResponse:
+    return TopHighlightsResponse(
+        highlights=[
+            TopHighlight(
+                **_highlight(h).model_dump(),
+                fileId=h.file_id,
+                analysisId=h.analysis_id,
+                analyzedAt=_iso(h.created_at),
+            )
+            for h in page.items
+        ],
+        nextCursor=page.next_cursor,
+    )
+
+
+async def top_highlights_service(
+    limit: int,
+    cursor: str | None,
+    file_id: str | None = None,
+    min_score: float | None = None,
+) -> TopHighlightsResponse:
+    """各動画の最新の解析から、スコアの高い順にハイライトを返す"""
+    page = await get_store().top_highlights(
+        min(limit, MAX_PAGE_SIZE), cursor, file_id=file_id, min_score=min_score
+    )
+    return _top_highlights(page)
+
+
+async def search_highlights_service(
+    query: HighlightQuery, limit: int, cursor: str | None
+) -> TopHighlightsResponse:
+    """ライブラリ全体のハイライトを全文・スコア・解析日時で絞り込み、スコア順に返す"""
+    page = await get_store().search_highlights(query, min(limit, MAX_PAGE_SIZE), cursor)
+    return _top_highlights(page)
@@ -0,0 +1,222 @@
+"""
+Validation and repair of the model's structured output
+
+A truncated or partly malformed response no longer fails the whole analysis:
+complete segments are salvaged from the JSON prefix, times are clamped to the
+video and ``start < end`` is enforced, scores are clamped to 0..1, and when
+the response was cut off only the missing tail is requested again. Outcomes
+and repairs are counted in ``/metrics``.
+"""
+
+import json
+import logging
+import re
+from collections import Counter
+from collections.abc import Callable
+from typing import Any, TypeVar, get_args
+
+from pydantic import BaseModel, ValidationError
+
+from app.core.telemetry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ResponseT = TypeVar("ResponseT", bound=BaseModel)
+
+# 途中で途切れた応答の続きを要求する回数
+MAX_CONTINUATIONS = 2
+
+OUTPUTS = REGISTRY.counter(
+    "analysis_model_outputs_total",
+    "Model responses by handling outcome (valid, repaired, continued, failed)",
+    ("provider", "outcome"),
+)
+REPAIRS = REGISTRY.counter(
+    "analysis_model_output_repairs_total",
+    "Repairs applied to model responses by kind",
+    ("provider", "repair"),
+)
+
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+_ARRAY_RE = re.compile(r'"segments"\s*:\s*\[')
+
+
+class ModelOutputError(RuntimeError):
+    """モデルの応答を解釈できなかった（セグメントが1件も使えなかった）"""
+
+
+def salvage_items(text: str) -> tuple[list[Any] | None, bool]:
+    """
+    応答の ``segments`` 配列の要素を取り出す
+
+    JSONが途中で途切れている場合は、完結している要素だけを返す。
+
+    Returns:
+        (要素のリスト, 配列が閉じているか)。配列が見つからない場合、要素は None
+    """
+    text = _FENCE_RE.sub("", text or "")
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    else:
+        items = data.get("segments") if isinstance(data, dict) else data
+        return (items, True) if isinstance(items, list) else (None, True)
+
+    match = _ARRAY_RE.search(text)
+    if match is not None:
+        pos = match.end()
+    elif (bracket := text.find("[")) >= 0:
+        pos = bracket + 1
+    else:
+        return None, False
+    decoder = json.JSONDecoder()
+    items = []
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(text):
+            return items, False
+        if text[pos] == "]":
+            return items, True
+        try:
+            item, pos = decoder.raw_decode(text, pos)
+        except json.JSONDecodeError:
+            return items, False
+        items.append(item)
+
+
+def _item_type(response_type: type[BaseModel]) -> type[BaseModel]:
+    return get_args(response_type.model_fields["segments"].annotation)[0]
+
+
+def repair_items(
+    items: list[Any], item_type: type[BaseModel], duration: float | None = None
+) -> tuple[list[Any], Counter[str]]:
+    """
+    要素を検証し、時間とスコアを有効な範囲に収める
+
+    時間は 0〜duration 秒（不明なら上限なし）に収め、``start < end`` にならない
+    要素と必須項目が欠けた要素は捨てる。
+    """
+    repairs: Counter[str] = Counter()
+    kept = []
+    for raw in items:
+        try:
+            item = item_type.model_validate(raw)
+        except ValidationError:
+            repairs["invalid"] += 1
+            continue
+        updates: dict[str, float] = {}
+        score = getattr(item, "score", None)
+        if score is not None and not 0.0 <= score <= 1.0:
+            updates["score"] = min(max(score, 0.0), 1.0)
+            repairs["score_clamped"] += 1
+        if hasattr(item, "start") and hasattr(item, "end"):
+            start = max(item.start, 0.0)
+            end = item.end if duration is None else min(item.end, duration)
+            if end <= start:
+                repairs["dropped"] += 1
+                continue
+            if (start, end) != (item.start, item.end):
+                updates.update(start=start, end=end)
+                repairs["time_clamped"] += 1
+        kept.append(item.model_copy(update=updates) if updates else item)
+    return kept, repairs
+
+
+def continuation_prompt(prompt: str, segments: list[Any]) -> str:
+    """受け取り済みのセグメントより後ろだけを要求するプロンプト"""
+    if not segments:
+        return prompt
+    if hasattr(segments[0], "index"):
+        last = max(s.index for s in segments)
+        tail = f"番号{last}より後の候補セグメントだけ"
+    else:
+        last = max(s.end for s in segments)
+        tail = f"{last:g}秒以降のセグメントだけ"
+    return (
+        f"{prompt}\n"
+        f"        前回の応答は途中で途切れました。{tail}を同じJSON形式で返してください。"
+    )
+
+
+def _append_tail(segments: list[Any], tail: list[Any]) -> list[Any]:
+    """続きの応答のうち、受け取り済みの範囲より後ろの要素を追加する"""
+    if not segments:
+        return tail
+    if hasattr(segments[0], "index"):
+        last = max(s.index for s in segments)
+        return [*segments, *(s for s in tail if s.index > last)]
+    last = max(s.end for s in segments)
+    for segment in tail:
+        if segment.end <= last:
+            continue
+        if segment.start < last:
+            segment = segment.model_copy(update={"start": last})
+        segments = [*segments, segment]
+        last = segment.end
+    return segments
+
+
+def resolve_response(
+    text: str,
+    response_type: type[ResponseT],
+    *,
+    prompt: str,
+    generate: Callable[[str], str],
+    provider: str,
+    duration: float | None = None,
+) -> ResponseT:
+    """
+    モデルの応答を ``response_type`` に変換する（必要なら修復・続きを要求する）
+
+    Args:
+        text: 応答のテキスト
+        response_type: ``segments`` を持つ応答のモデル
+        prompt: 元のプロンプト（続きの要求に使う）
+        generate: プロンプトを送って応答のテキストを返す関数
+        provider: メトリクスのラベル
+        duration: 動画の長さ（秒）。不明なら None
+
+    Raises:
+        ModelOutputError: 応答を解釈できない場合、受け取った要素がすべて
+            不正だった場合（空の ``segments`` は空の結果として返す）
+    """
+    item_type = _item_type(response_type)
+    items, complete = salvage_items(text)
+    parsed = items is not None
+    received = len(items or [])
+    segments, repairs = repair_items(items or [], item_type, duration)
+    continuations = 0
+    while not complete and continuations < MAX_CONTINUATIONS:
+        repairs["truncated"] += 1
+        continuations += 1
+        try:
+            tail_text = generate(continuation_prompt(prompt, segments))
+        except Exception as e:
+            logger.warning(f"Continuation request failed: {e!s}")
+            break
+        tail_items, complete = salvage_items(tail_text)
+        parsed = parsed or tail_items is not None
+        received += len(tail_items or [])
+        tail, tail_repairs = repair_items(tail_items or [], item_type, duration)
+        repairs.update(tail_repairs)
+        segments = _append_tail(segments, tail)
+
+    for repair, count in repairs.items():
+        REPAIRS.inc(count, provider=provider, repair=repair)
+    if not segments and (not parsed or received):
+        OUTPUTS.inc(provider=provider, outcome="failed")
+        msg = f"Model returned no usable segments: {(text or '')[:200]!r}"
+        raise ModelOutputError(msg)
+    if continuations:
+        outcome = "continued"
+    elif repairs:
+        outcome = "repaired"
+    else:
+        outcome = "valid"
+    OUTPUTS.inc(provider=provider, outcome=outcome)
+    if repairs:
+        logger.info(f"Repaired model output ({provider}): {dict(repairs)}")
+    return response_type(segments=segments)
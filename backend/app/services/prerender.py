@@ -0,0 +1,203 @@
+"""
+Speculative pre-rendering of top highlights
+
+After an analysis, users almost always download one of its best few
+highlights. With ``PRERENDER_TOP_K`` > 0 the top-k highlights by score are cut
+and uploaded in the background, so a later ``/api/extract`` for exactly that
+segment returns the stored clip without download, cut and upload.
+
+Speculative work never delays real work: a clip is only started while the
+extraction queue has a free slot and nobody waiting, and it is cancelled as
+soon as a real job has to wait for a slot. Each tenant may pre-render at most
+``PRERENDER_TENANT_DAILY_CLIPS`` clips a day (counted in the store next to
+its daily usage), and the work is charged to the tenant's usage and quotas
+like a normal extraction. With ``JOB_EXECUTION=queue`` the worker that ran the
+analysis schedules the clips and cancels them for the extract and ingest jobs
+it runs. The background task starts with an empty context, so its logs and
+spans do not carry the analyze request's ID. Rendered, skipped and preempted
+clips, their FFmpeg CPU time and the hit rate of later extract requests are
+exported as metrics.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import contextvars
+import logging
+import weakref
+from collections.abc import Awaitable
+
+from app.core.scheduling import (
+    EXTRACTION,
+    FairQueue,
+    TenantLimitError,
+    check_quota,
+    fair_queue,
+    record_usage,
+    take_prerender_budget,
+)
+from app.core.settings import Settings
+from app.core.telemetry import REGISTRY, span
+from app.core.usage import metering
+from app.models.schemas import AnalysisResult, ExtractRequest, VideoSegment
+from app.services.extract import extract_video_service
+from app.store import get_store
+
+logger = logging.getLogger(__name__)
+
+# 実際のジョブが待っていないかを確かめる間隔（秒）
+PREEMPT_POLL_SECONDS = 0.1
+
+PRERENDERS = REGISTRY.counter(
+    "prerender_clips_total",
+    "Speculative clips by outcome (rendered, exists, busy, over_budget, preempted, failed)",
+    ("outcome",),
+)
+PRERENDER_CPU = REGISTRY.counter(
+    "prerender_ffmpeg_cpu_seconds_total",
+    "FFmpeg CPU seconds spent on speculative clips by outcome",
+    ("outcome",),
+)
+
+_tasks: set[asyncio.Task] = set()
+# 先行の切り出しを1本ずつにするロック（ロックはイベントループごとに作る）
+_locks: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock] = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _prerender_lock() -> asyncio.Lock:
+    return _locks.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+
+
+def reset_prerender() -> None:
+    """1本ずつにするロックを破棄する（テスト用）"""
+    _locks.clear()
+
+
+def prerender_targets(result: AnalysisResult, top_k: int) -> list[VideoSegment]:
+    """スコアの高い順に top_k 個のハイライトの区間（同じ区間は1つにまとめる）"""
+    ranked = sorted(result.highlights, key=lambda h: (-h.score, h.start))
+    targets: list[VideoSegment] = []
+    for highlight in ranked:
+        segment = VideoSegment(start=highlight.start, end=highlight.end)
+        if segment not in targets:
+            targets.append(segment)
+        if len(targets) == top_k:
+            break
+    return targets
+
+
+def _idle(queue: FairQueue) -> bool:
+    return queue.queued() == 0 and queue.running < queue.capacity
+
+
+async def _already_extracted(request: ExtractRequest) -> bool:
+    segments = [segment.model_dump() for segment in request.segments]
+    try:
+        clips = await get_store().list_clips(request.fileId)
+    except Exception as e:
+        logger.warning(f"Failed to look up clips of {request.fileId}: {e!s}")
+        return False
+    return any(clip.params.get("segments") == segments for clip in clips)
+
+
+async def _run_preemptible(work: Awaitable[object], queue: FairQueue) -> bool:
+    """
+    work を実行し、実際のジョブが枠を待ち始めたら中止する
+
+    Returns:
+        最後まで実行した場合は True、中止した場合は False
+    """
+    task = asyncio.ensure_future(work)
+    while not task.done():
+        await asyncio.wait({task}, timeout=PREEMPT_POLL_SECONDS)
+        if not task.done() and queue.queued() > 0:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+            return False
+    task.result()
+    return True
+
+
+async def prerender_highlights(
+    file_id: str, segments: list[VideoSegment], tenant: str, settings: Settings
+) -> None:
+    """
+    区間を順に先行して切り出す
+
+    切り出し済みの区間は飛ばし、キューが空いていない・予算がない・中止された
+    場合は残りをやめる。
+    """
+    # 先行の切り出しはプロセス全体で1本ずつ
+    async with _prerender_lock():
+        queue = fair_queue(EXTRACTION, settings)
+        for segment in segments:
+            request = ExtractRequest(fileId=file_id, segments=[segment])
+            if await _already_extracted(request):
+                PRERENDERS.inc(outcome="exists")
+                continue
+            if not _idle(queue):
+                PRERENDERS.inc(outcome="busy")
+                return
+            try:
+                await check_quota(tenant, settings)
+            except TenantLimitError:
+                PRERENDERS.inc(outcome="over_budget")
+                return
+            if not await take_prerender_budget(tenant, settings):
+                PRERENDERS.inc(outcome="over_budget")
+                return
+
+            outcome = "failed"
+            async with queue.slot(tenant):
+                with (
+                    metering() as meter,
+                    span("prerender.clip", duration=segment.end - segment.start),
+                ):
+                    try:
+                        completed = await _run_preemptible(
+                            extract_video_service(request, settings, speculative=True),
+                            queue,
+                        )
+                        outcome = "rendered" if completed else "preempted"
+                    except Exception as e:
+                        logger.warning(
+                            f"Pre-rendering {file_id} [{segment.start:g}s, "
+                            f"{segment.end:g}s] failed: {e!s}"
+                        )
+                await record_usage(tenant, meter, settings)
+            PRERENDERS.inc(outcome=outcome)
+            PRERENDER_CPU.inc(meter.ffmpeg_cpu_seconds, outcome=outcome)
+            logger.info(
+                f"Pre-render of {file_id} [{segment.start:g}s, {segment.end:g}s]: "
+                f"{outcome}"
+            )
+            if outcome != "rendered":
+                return
+
+
+def schedule_prerender(
+    file_id: str, result: AnalysisResult, tenant: str, settings: Settings
+) -> asyncio.Task | None:
+    """
+    解析結果の上位のハイライトを先行して切り出すタスクを起動する
+
+    API（JOB_EXECUTION=inline）とワーカーが解析の後に呼ぶ。無効な場合は None。
+    """
+    if settings.prerender_top_k == 0:
+        return None
+    segments = prerender_targets(result, settings.prerender_top_k)
+    if not segments:
+        return None
+    # 解析リクエストのリクエストID・スパン・プロファイルを引き継がない
+    task = asyncio.create_task(
+        prerender_highlights(file_id, segments, tenant, settings),
+        context=contextvars.Context(),
+    )
+    # 実行中のタスクが回収されないように参照を持つ
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
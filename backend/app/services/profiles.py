@@ -0,0 +1,69 @@
+"""
+Storage for profiling artifacts
+"""
+
+import asyncio
+import json
+import logging
+import re
+from typing import Any
+
+from app.core.lazy import lazy_import
+from app.core.settings import get_settings
+
+storage = lazy_import("google.cloud.storage")
+
+logger = logging.getLogger(__name__)
+
+_PROFILE_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+def is_valid_profile_id(profile_id: str) -> bool:
+    return bool(_PROFILE_ID_RE.match(profile_id))
+
+
+def _write_profile(profile_id: str, payload: bytes) -> None:
+    settings = get_settings()
+    if settings.gcs_bucket_name:
+        storage_client = storage.Client()
+        bucket = storage_client.bucket(settings.gcs_bucket_name)
+        blob = bucket.blob(f"{settings.gcs_profiles_prefix}{profile_id}.json")
+        blob.upload_from_string(payload, content_type="application/json")
+    else:
+        (settings.profiles_dir / f"{profile_id}.json").write_bytes(payload)
+
+
+async def save_profile_artifact(profile_id: str, data: dict[str, Any]) -> None:
+    """
+    プロファイル結果を保存する
+
+    GCSバケットが設定されていれば ``gcs_profiles_prefix`` 配下に、
+    そうでなければローカルの ``storage/profiles`` に保存する。
+    保存の失敗はリクエスト自体を失敗させない。
+    """
+    payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    try:
+        await asyncio.to_thread(_write_profile, profile_id, payload)
+        logger.info(f"Saved profile artifact: {profile_id}")
+    except Exception as e:
+        logger.warning(f"Failed to save profile artifact {profile_id}: {e!s}")
+
+
+def load_profile_artifact(profile_id: str) -> dict[str, Any] | None:
+    """保存済みのプロファイル結果を読み込む（存在しなければNone）"""
+    if not is_valid_profile_id(profile_id):
+        return None
+
+    settings = get_settings()
+    if settings.gcs_bucket_name:
+        storage_client = storage.Client()
+        bucket = storage_client.bucket(settings.gcs_bucket_name)
+        blob = bucket.blob(f"{settings.gcs_profiles_prefix}{profile_id}.json")
+        if not blob.exists():
+            return None
+        return json.loads(blob.download_as_bytes())
+
+    path = settings.profiles_dir / f"{profile_id}.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_bytes())
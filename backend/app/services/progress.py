@@ -0,0 +1,131 @@
+"""
+Live progress feed for long-running requests
+
+Progress is keyed by the request ID (``X-Request-ID``). A client that sets the
+header on ``POST /api/extract`` can follow the same ID on
+``GET /api/progress/{request_id}`` as a Server-Sent Events stream.
+"""
+
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+from app.core.telemetry import request_id_var
+
+# 完了済み・未開始のエントリを保持する時間（秒）
+PROGRESS_TTL_SECONDS = 300.0
+KEEPALIVE_SECONDS = 15.0
+
+
+@dataclass
+class ProgressState:
+    stage: str = "pending"
+    ratio: float | None = None
+    out_time_seconds: float | None = None
+    speed: str | None = None
+    done: bool = False
+    error: str | None = None
+    updated_at: float = field(default_factory=time.time)
+
+
+class _Entry:
+    def __init__(self):
+        self.state = ProgressState()
+        self.changed = asyncio.Event()
+
+    def publish(self) -> None:
+        self.state.updated_at = time.time()
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+class ProgressTracker:
+    """リクエストIDごとの進捗を保持し、購読者に変更を通知する"""
+
+    def __init__(self, ttl: float = PROGRESS_TTL_SECONDS):
+        self.ttl = ttl
+        self._entries: dict[str, _Entry] = {}
+
+    def _entry(self, key: str) -> _Entry:
+        self._expire()
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = _Entry()
+            self._entries[key] = entry
+        return entry
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.ttl
+        expired = [
+            key
+            for key, entry in self._entries.items()
+            if entry.state.updated_at < cutoff
+        ]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, key: str) -> ProgressState | None:
+        entry = self._entries.get(key)
+        return entry.state if entry else None
+
+    def update(self, key: str, **fields: Any) -> None:
+        entry = self._entry(key)
+        for name, value in fields.items():
+            setattr(entry.state, name, value)
+        entry.publish()
+
+    def finish(self, key: str, error: str | None = None) -> None:
+        entry = self._entry(key)
+        entry.state.done = True
+        entry.state.error = error
+        entry.state.stage = "failed" if error else "completed"
+        if not error:
+            entry.state.ratio = 1.0
+        entry.publish()
+
+    async def subscribe(self, key: str) -> AsyncIterator[ProgressState | None]:
+        """
+        進捗の変化を順に返す（完了で終了）
+
+        変化がないまま ``KEEPALIVE_SECONDS`` 経過した場合は None を返す。
+        """
+        entry = self._entry(key)
+        while True:
+            yield entry.state
+            if entry.state.done:
+                return
+            changed = entry.changed
+            try:
+                await asyncio.wait_for(changed.wait(), timeout=KEEPALIVE_SECONDS)
+            except TimeoutError:
+                yield None
+            # 期限切れで削除された場合は新しいエントリを参照する
+            entry = self._entries.get(key) or entry
+
+
+progress_tracker = ProgressTracker()
+
+
+def report_progress(**fields: Any) -> None:
+    """現在のリクエストIDに進捗を記録する（リクエスト外では何もしない）"""
+    request_id = request_id_var.get()
+    if request_id != "-":
+        progress_tracker.update(request_id, **fields)
+
+
+def finish_progress(error: str | None = None) -> None:
+    request_id = request_id_var.get()
+    if request_id != "-":
+        progress_tracker.finish(request_id, error)
+
+
+async def progress_events(key: str) -> AsyncIterator[str]:
+    """Server-Sent Events形式の進捗ストリーム"""
+    async for state in progress_tracker.subscribe(key):
+        if state is None:
+            yield ": keepalive\n\n"
+            continue
+        yield f"data: {json.dumps(asdict(state))}\n\n"
@@ -0,0 +1,212 @@
+"""
+Prompts sent to Gemini, with a version derived from their text
+
+Stored analyses are keyed by model and prompt version, so editing a prompt
+automatically invalidates the stored results made with the previous text.
+"""
+
+import hashlib
+
+# Vertex AI のシステム指示（動画とともにコンテキストキャッシュに入れる）。
+# 役割の説明のみで出力形式・採点基準は含まないため、バージョンには含めない
+ANALYSIS_SYSTEM_INSTRUCTION = """
+        あなたは動画編集者です。与えられた動画を見て、ショート動画に使える
+        見どころを見つけ、指示された形式で日本語で答えてください。
+        """
+
+# Vertex AI に動画を送るときのメディア解像度（キャッシュする動画も同じにして、
+# キャッシュの有無でトークン数が変わらないようにする）
+ANALYSIS_MEDIA_RESOLUTION = "MEDIA_RESOLUTION_LOW"
+
+# Vertex AI（response_schema で出力形式を指定する）
+SEGMENT_ANALYSIS_PROMPT = """
+        この動画を30秒ごとのセグメントに分割して分析してください。
+        各セグメントについて以下の情報を提供してください：
+        - start: セグメントの開始時間（秒）
+        - end: セグメントの終了時間（秒）
+        - title: そのセグメントの簡潔なタイトル（日本語）
+        - description: セグメントの内容説明（日本語）
+        - score: そのセグメントの重要度スコア（0.0〜1.0）
+
+        重要度スコアは以下の基準で評価してください：
+        - 視覚的に魅力的なシーン: +0.2
+        - 重要な情報が含まれている: +0.3
+        - アクションや動きがある: +0.2
+        - 音声で重要な説明がある: +0.3
+        """
+
+# Google AI API（スキーマ指定がないためJSONの例を含める）
+SEGMENT_ANALYSIS_PROMPT_WITH_EXAMPLE = """
+            この動画を30秒ごとのセグメントに分割して分析してください。
+            各セグメントについて以下の情報を提供してください：
+            - start: セグメントの開始時間（秒）
+            - end: セグメントの終了時間（秒）
+            - title: そのセグメントの簡潔なタイトル（日本語）
+            - description: セグメントの内容説明（日本語）
+            - score: そのセグメントの重要度スコア（0.0〜1.0）
+
+            重要度スコアは以下の基準で評価してください：
+            - 視覚的に魅力的なシーン: +0.2
+            - 重要な情報が含まれている: +0.3
+            - アクションや動きがある: +0.2
+            - 音声で重要な説明がある: +0.3
+
+            必ず以下のJSON形式で返答してください：
+            {
+                "segments": [
+                    {
+                        "start": 0,
+                        "end": 30,
+                        "title": "タイトル",
+                        "description": "説明",
+                        "score": 0.8
+                    }
+                ]
+            }
+            """
+
+# 区間の再解析（切り出した区間の動画に対して使う）
+RANGE_ANALYSIS_PROMPT = """
+        この動画は元の動画の {start:g}秒〜{end:g}秒 の区間を切り出したものです。
+        この動画を{granularity:g}秒ごとのセグメントに分割して分析してください。
+        時間は切り出した動画の先頭を0秒として答えてください。
+        各セグメントについて以下の情報を提供してください：
+        - start: セグメントの開始時間（秒）
+        - end: セグメントの終了時間（秒）
+        - title: そのセグメントの簡潔なタイトル（日本語）
+        - description: セグメントの内容説明（日本語）
+        - score: そのセグメントの重要度スコア（0.0〜1.0）
+
+        重要度スコアは以下の基準で評価してください：
+        - 視覚的に魅力的なシーン: +0.2
+        - 重要な情報が含まれている: +0.3
+        - アクションや動きがある: +0.2
+        - 音声で重要な説明がある: +0.3
+        """
+
+RANGE_OUTPUT_EXAMPLE = """
+        必ず以下のJSON形式で返答してください：
+        {"segments": [{"start": 0, "end": 10, "title": "タイトル", "description": "説明", "score": 0.8}]}
+        """
+
+
+def range_analysis_prompt(
+    start: float, end: float, granularity: float, *, with_example: bool
+) -> str:
+    prompt = RANGE_ANALYSIS_PROMPT.format(start=start, end=end, granularity=granularity)
+    return prompt + RANGE_OUTPUT_EXAMPLE if with_example else prompt
+
+
+# シーン・音声の区切りから求めた候補セグメントの採点（時間は出力させない）
+SCENE_ANALYSIS_PROMPT = """
+        この動画を、シーンの切り替わりと音声の区切りから求めた以下の候補セグメントに
+        分けて分析してください。
+        候補セグメント（番号: 開始時間〜終了時間、秒）：
+        {candidates}
+        各候補セグメントについて以下の情報を提供してください：
+        - index: 候補セグメントの番号
+        - title: そのセグメントの簡潔なタイトル（日本語）
+        - description: セグメントの内容説明（日本語）
+        - score: そのセグメントの重要度スコア（0.0〜1.0）
+        時間は答えず、候補セグメントの番号だけで指定してください。
+
+        重要度スコアは以下の基準で評価してください：
+        - 視覚的に魅力的なシーン: +0.2
+        - 重要な情報が含まれている: +0.3
+        - アクションや動きがある: +0.2
+        - 音声で重要な説明がある: +0.3
+        """
+
+SCENE_OUTPUT_EXAMPLE = """
+        必ず以下のJSON形式で返答してください：
+        {"segments": [{"index": 0, "title": "タイトル", "description": "説明", "score": 0.8}]}
+        """
+
+
+def scene_analysis_prompt(
+    candidates: list[tuple[float, float]], *, with_example: bool
+) -> str:
+    lines = "\n        ".join(
+        f"{i}: {start:.1f}〜{end:.1f}" for i, (start, end) in enumerate(candidates)
+    )
+    prompt = SCENE_ANALYSIS_PROMPT.format(candidates=lines)
+    return prompt + SCENE_OUTPUT_EXAMPLE if with_example else prompt
+
+
+# 文字起こしによる解析（動画の代わりに発話と代表フレームを送る）
+TRANSCRIPT_ANALYSIS_PROMPT = """
+        動画の代わりに、音声の文字起こしと代表フレームの画像を渡します。
+        画像はそれぞれ動画の {keyframes} 秒時点のフレームです。
+        以下の候補セグメントを、発話の内容と画像から分析してください。
+        候補セグメント（番号: 開始時間〜終了時間、秒「発話」）：
+        {candidates}
+        各候補セグメントについて以下の情報を提供してください：
+        - index: 候補セグメントの番号
+        - title: そのセグメントの簡潔なタイトル（日本語）
+        - description: セグメントの内容説明（日本語）
+        - score: そのセグメントの重要度スコア（0.0〜1.0）
+        時間は答えず、候補セグメントの番号だけで指定してください。
+
+        重要度スコアは以下の基準で評価してください：
+        - 重要な情報が含まれている: +0.4
+        - 発話で重要な説明がある: +0.4
+        - 画像から視覚的に魅力的と分かる: +0.2
+        """
+
+
+def transcript_analysis_prompt(
+    candidates: list[tuple[float, float]],
+    texts: list[str],
+    keyframe_times: list[float],
+    *,
+    with_example: bool,
+) -> str:
+    lines = "\n        ".join(
+        f"{i}: {start:.1f}〜{end:.1f}「{text or '（発話なし）'}」"
+        for i, ((start, end), text) in enumerate(zip(candidates, texts, strict=True))
+    )
+    times = "、".join(f"{time:.1f}" for time in keyframe_times) or "（なし）"
+    prompt = TRANSCRIPT_ANALYSIS_PROMPT.format(candidates=lines, keyframes=times)
+    return prompt + SCENE_OUTPUT_EXAMPLE if with_example else prompt
+
+
+# 代表フレームによる解析（動画の代わりに候補セグメントごとの画像を送る）
+KEYFRAME_ANALYSIS_PROMPT = """
+        動画の代わりに、候補セグメントごとの代表フレームの画像を渡します。
+        各画像の直前のテキストが、その画像の候補セグメントの番号と時刻（秒）です。
+        以下の候補セグメントを、画像から分析してください。
+        候補セグメント（番号: 開始時間〜終了時間、秒）：
+        {candidates}
+        各候補セグメントについて以下の情報を提供してください：
+        - index: 候補セグメントの番号
+        - title: そのセグメントの簡潔なタイトル（日本語）
+        - description: セグメントの内容説明（日本語）
+        - score: そのセグメントの重要度スコア（0.0〜1.0）
+        時間は答えず、候補セグメントの番号だけで指定してください。
+
+        重要度スコアは以下の基準で評価してください：
+        - 視覚的に魅力的なシーン: +0.3
+        - 重要な情報が含まれている: +0.4
+        - フレーム間の変化（アクションや動き）がある: +0.3
+        """
+
+
+def keyframe_analysis_prompt(
+    candidates: list[tuple[float, float]], *, with_example: bool
+) -> str:
+    lines = "\n        ".join(
+        f"{i}: {start:.1f}〜{end:.1f}" for i, (start, end) in enumerate(candidates)
+    )
+    prompt = KEYFRAME_ANALYSIS_PROMPT.format(candidates=lines)
+    return prompt + SCENE_OUTPUT_EXAMPLE if with_example else prompt
+
+
+def keyframe_label(index: int, time: float) -> str:
+    """画像の直前に置く、候補セグメントの番号と時刻"""
+    return f"候補{index}・{time:.1f}秒"
+
+
+def prompt_version(prompt: str) -> str:
+    """プロンプト本文から求めるバージョン（空白の違いは無視する）"""
+    normalized = " ".join(prompt.split())
+    return hashlib.sha256(normalized.encode()).hexdigest()[:12]
@@ -0,0 +1,684 @@
+"""
+Highlight reel renderer
+
+Composes an ordered list of highlights into one short video in a single FFmpeg
+pass: per-clip reframing (center or saliency crop), crossfade transitions and
+loudness-normalized audio are expressed as one filter graph, so no intermediate
+files are written. Parts that need no filtering are stream-copied.
+"""
+
+import asyncio
+import hashlib
+import logging
+import tempfile
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+
+import numpy as np
+
+from app.core.lazy import lazy_import
+from app.core.settings import Settings
+from app.core.telemetry import span
+from app.models.schemas import (
+    GenerateVideoResponse,
+    RenderOutputSpec,
+    RenderRequest,
+    VideoSegment,
+)
+from app.services.ffmpeg import (
+    MediaInfo,
+    probe_media,
+    progress_seconds,
+    run_ffmpeg,
+    run_ffmpeg_pipe,
+)
+from app.services.gcs_utils import find_upload_blob, generate_signed_url
+from app.services.library import record_clip, record_video_metadata
+from app.services.progress import finish_progress, report_progress
+from app.services.renditions import (
+    RenditionOutput,
+    build_ladder,
+    requested_ladder,
+    upload_renditions,
+)
+from app.services.transfer import download_blob, upload_blob
+
+storage = lazy_import("google.cloud.storage")
+
+logger = logging.getLogger(__name__)
+
+RENDER_PRESETS: dict[str, RenderOutputSpec] = {
+    "vertical_1080": RenderOutputSpec(aspectRatio="9:16", height=1920),
+    "vertical_720": RenderOutputSpec(aspectRatio="9:16", height=1280),
+    "vertical_1080_saliency": RenderOutputSpec(
+        aspectRatio="9:16", height=1920, cropMode="saliency"
+    ),
+    "square_1080": RenderOutputSpec(aspectRatio="1:1", height=1080),
+    "landscape_copy": RenderOutputSpec(
+        aspectRatio="source", height=4320, transition="none", normalizeAudio=False
+    ),
+}
+DEFAULT_PRESET = "vertical_1080"
+
+MAX_RENDER_SEGMENTS = 20
+
+ASPECT_RATIOS = {"9:16": (9, 16), "1:1": (1, 1), "16:9": (16, 9)}
+
+# 出力のフレームレート（xfade は全入力で同一のフレームレートを要求する）
+OUTPUT_FPS = 30
+AUDIO_SAMPLE_RATE = 48000
+# ショート動画プラットフォームで一般的なラウドネス目標
+LOUDNORM_FILTER = "loudnorm=I=-14:TP=-1.5:LRA=11"
+
+# サリエンシー推定に使う縮小フレーム
+SALIENCY_SAMPLE_WIDTH = 96
+SALIENCY_FRAMES_PER_SEGMENT = 8
+
+
+@dataclass
+class RenderPlan:
+    """1パスで実行するFFmpegコマンドと、その構成"""
+
+    command: list[str]
+    output_duration: float
+    video_copy: bool
+    audio_copy: bool
+    concat_list: str | None = None
+    filter_graph: str | None = None
+    notes: list[str] = field(default_factory=list)
+    renditions: list[RenditionOutput] = field(default_factory=list)
+
+
+def resolve_output_spec(request: RenderRequest) -> RenderOutputSpec:
+    """リクエストの出力指定（明示指定 > プリセット > 既定プリセット）"""
+    if request.output is not None:
+        return request.output
+    preset = request.preset or DEFAULT_PRESET
+    if preset not in RENDER_PRESETS:
+        msg = f"Unknown render preset: {preset}"
+        raise ValueError(msg)
+    return RENDER_PRESETS[preset]
+
+
+def validate_segments(segments: list[VideoSegment], media_duration: float) -> None:
+    if not segments:
+        msg = "No segments provided"
+        raise ValueError(msg)
+    if len(segments) > MAX_RENDER_SEGMENTS:
+        msg = f"Too many segments (max {MAX_RENDER_SEGMENTS})"
+        raise ValueError(msg)
+    for segment in segments:
+        if segment.start < 0 or segment.end <= segment.start:
+            msg = f"Invalid segment: {segment.start}s - {segment.end}s"
+            raise ValueError(msg)
+        if media_duration > 0 and segment.start >= media_duration:
+            msg = f"Segment starts after the end of the video: {segment.start}s"
+            raise ValueError(msg)
+
+
+def clip_segments(
+    segments: list[VideoSegment], media_duration: float
+) -> list[VideoSegment]:
+    """動画の長さを超える終了時刻を切り詰める"""
+    if media_duration <= 0:
+        return list(segments)
+    return [
+        VideoSegment(start=s.start, end=min(s.end, media_duration)) for s in segments
+    ]
+
+
+def _even(value: float) -> int:
+    return max(2, int(round(value / 2)) * 2)
+
+
+def output_size(spec: RenderOutputSpec, media: MediaInfo) -> tuple[int, int]:
+    """
+    出力解像度
+
+    ``source`` では元動画より大きくしない（縦横比・解像度を保つ指定のため）。
+    それ以外は配信先の規定サイズに合わせるため、必要ならアップスケールする。
+    """
+    if spec.aspectRatio == "source":
+        height = min(spec.height, media.height)
+        return _even(media.width * height / media.height), _even(height)
+    aw, ah = ASPECT_RATIOS[spec.aspectRatio]
+    return _even(spec.height * aw / ah), _even(spec.height)
+
+
+def crop_window(spec: RenderOutputSpec, media: MediaInfo) -> tuple[int, int]:
+    """元動画に収まる、指定アスペクト比の最大の切り出し領域"""
+    if spec.aspectRatio == "source":
+        return media.width, media.height
+    aw, ah = ASPECT_RATIOS[spec.aspectRatio]
+    if media.width * ah > media.height * aw:
+        # 元動画の方が横長: 高さいっぱい、幅を切る
+        height = media.height - media.height % 2
+        return min(_even(height * aw / ah), media.width), height
+    width = media.width - media.width % 2
+    return width, min(_even(width * ah / aw), media.height)
+
+
+def needs_reframe(spec: RenderOutputSpec, media: MediaInfo) -> bool:
+    crop_w, crop_h = crop_window(spec, media)
+    out_w, out_h = output_size(spec, media)
+    return (crop_w, crop_h) != (media.width, media.height) or (out_w, out_h) != (
+        media.width,
+        media.height,
+    )
+
+
+def reframe_filter(
+    spec: RenderOutputSpec, media: MediaInfo, crop_x: int | None = None
+) -> str | None:
+    """
+    切り出し＋スケールのフィルタ。変換が不要なら None
+
+    ``crop_x`` が None の場合は中央を切り出す。
+    """
+    if not needs_reframe(spec, media):
+        return None
+    crop_w, crop_h = crop_window(spec, media)
+    out_w, out_h = output_size(spec, media)
+    filters = []
+    if (crop_w, crop_h) != (media.width, media.height):
+        x = "(iw-ow)/2" if crop_x is None else str(crop_x)
+        filters.append(f"crop={crop_w}:{crop_h}:{x}:(ih-oh)/2")
+    if (out_w, out_h) != (crop_w, crop_h):
+        filters.append(f"scale={out_w}:{out_h}:flags=lanczos")
+    filters.append("setsar=1")
+    return ",".join(filters)
+
+
+def _fmt(value: float) -> str:
+    return f"{value:.3f}".rstrip("0").rstrip(".") or "0"
+
+
+def _video_encode_args(settings: Settings) -> list[str]:
+    return [
+        "-c:v",
+        "libx264",
+        "-preset",
+        settings.render_x264_preset,
+        "-crf",
+        str(settings.render_crf),
+        "-pix_fmt",
+        "yuv420p",
+    ]
+
+
+def _audio_encode_args() -> list[str]:
+    return ["-c:a", "aac", "-b:a", "160k", "-ar", str(AUDIO_SAMPLE_RATE)]
+
+
+def build_concat_list(input_path: str, segments: list[VideoSegment]) -> str:
+    """concat demuxer 用のリスト（inpoint/outpoint でコピーのまま切り出す）"""
+    escaped = input_path.replace("'", "'\\''")
+    lines = ["ffconcat version 1.0"]
+    for segment in segments:
+        lines.append(f"file '{escaped}'")
+        lines.append(f"inpoint {_fmt(segment.start)}")
+        lines.append(f"outpoint {_fmt(segment.end)}")
+    return "\n".join(lines) + "\n"
+
+
+def build_render_plan(
+    input_path: str,
+    output_path: str,
+    segments: list[VideoSegment],
+    spec: RenderOutputSpec,
+    media: MediaInfo,
+    settings: Settings,
+    *,
+    concat_list_path: str | None = None,
+    crop_offsets: list[int] | None = None,
+    renditions: list[str] | None = None,
+) -> RenderPlan:
+    """
+    レンダリング用のFFmpegコマンドを組み立てる
+
+    - 映像の変換が不要な場合は concat demuxer でストリームコピーする
+      （音声のラウドネス正規化のみ必要なら音声だけ再エンコード）
+    - それ以外は各クリップを ``-ss/-t`` 付きの入力として開き、
+      切り出し・スケール・クロスフェード・ラウドネス正規化を1つの
+      ``-filter_complex`` で処理する
+    - ``renditions`` を指定すると、同じコマンドの追加出力として
+      各レンディションを書き出す（デコードは1回）
+    """
+    ladder_names = requested_ladder(renditions or [])
+    durations = [s.end - s.start for s in segments]
+    crossfade = spec.transition == "crossfade" and len(segments) > 1
+    transition = min(spec.transitionDuration, min(durations) / 2) if crossfade else 0.0
+    output_duration = sum(durations) - transition * (len(segments) - 1)
+    reframe = needs_reframe(spec, media)
+    normalize = media.has_audio and spec.normalizeAudio
+
+    if not reframe and not crossfade:
+        return _build_concat_plan(
+            input_path,
+            output_path,
+            segments,
+            media,
+            settings,
+            normalize=normalize,
+            concat_list_path=concat_list_path,
+            output_duration=output_duration,
+            ladder_names=ladder_names,
+        )
+
+    cmd = ["ffmpeg", "-y"]
+    for segment, duration in zip(segments, durations, strict=True):
+        cmd += ["-ss", _fmt(segment.start), "-t", _fmt(duration), "-i", input_path]
+
+    graph: list[str] = []
+    for i in range(len(segments)):
+        crop_x = crop_offsets[i] if crop_offsets else None
+        chain = ["setpts=PTS-STARTPTS"]
+        if vf := reframe_filter(spec, media, crop_x):
+            chain.append(vf)
+        chain += [f"fps={OUTPUT_FPS}", "format=yuv420p", "settb=AVTB"]
+        graph.append(f"[{i}:v]{','.join(chain)}[v{i}]")
+        if media.has_audio:
+            graph.append(
+                f"[{i}:a]asetpts=PTS-STARTPTS,aresample={AUDIO_SAMPLE_RATE},"
+                f"aformat=sample_fmts=fltp:channel_layouts=stereo[a{i}]"
+            )
+
+    video_out, audio_out = _join_clips(graph, durations, transition, media.has_audio)
+    if normalize:
+        graph.append(
+            f"[{audio_out}]{LOUDNORM_FILTER},aresample={AUDIO_SAMPLE_RATE}[aout]"
+        )
+        audio_out = "aout"
+
+    ladder = None
+    if ladder_names:
+        ladder = build_ladder(
+            video_out,
+            audio_out if media.has_audio else None,
+            ladder_names,
+            Path(output_path),
+            settings,
+        )
+        graph += ladder.graph
+        video_out, audio_out = ladder.main_video, ladder.main_audio
+
+    filter_graph = ";".join(graph)
+    cmd += ["-filter_complex", filter_graph, "-map", f"[{video_out}]"]
+    cmd += _video_encode_args(settings)
+    if media.has_audio:
+        cmd += ["-map", f"[{audio_out}]", *_audio_encode_args()]
+    cmd += ["-movflags", "+faststart", output_path]
+    if ladder is not None:
+        cmd += ladder.args
+    return RenderPlan(
+        command=cmd,
+        output_duration=output_duration,
+        video_copy=False,
+        audio_copy=False,
+        filter_graph=filter_graph,
+        renditions=ladder.outputs if ladder else [],
+    )
+
+
+def _join_clips(
+    graph: list[str], durations: list[float], transition: float, has_audio: bool
+) -> tuple[str, str]:
+    """クリップを結合するフィルタを追加し、映像・音声の出力ラベルを返す"""
+    count = len(durations)
+    if count == 1:
+        return "v0", "a0"
+    if transition <= 0:
+        inputs = "".join(
+            f"[v{i}][a{i}]" if has_audio else f"[v{i}]" for i in range(count)
+        )
+        outputs = "[vcat][acat]" if has_audio else "[vcat]"
+        graph.append(f"{inputs}concat=n={count}:v=1:a={1 if has_audio else 0}{outputs}")
+        return "vcat", "acat"
+
+    video, audio = "v0", "a0"
+    offset = 0.0
+    for i in range(1, count):
+        offset += durations[i - 1] - transition
+        graph.append(
+            f"[{video}][v{i}]xfade=transition=fade:duration={_fmt(transition)}"
+            f":offset={_fmt(offset)}[vx{i}]"
+        )
+        video = f"vx{i}"
+        if has_audio:
+            graph.append(f"[{audio}][a{i}]acrossfade=d={_fmt(transition)}[ax{i}]")
+            audio = f"ax{i}"
+    return video, audio
+
+
+def _build_concat_plan(
+    input_path: str,
+    output_path: str,
+    segments: list[VideoSegment],
+    media: MediaInfo,
+    settings: Settings,
+    *,
+    normalize: bool,
+    concat_list_path: str | None,
+    output_duration: float,
+    ladder_names: list[str],
+) -> RenderPlan:
+    concat_list = build_concat_list(input_path, segments)
+    list_path = concat_list_path or f"{output_path}.ffconcat"
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-f",
+        "concat",
+        "-safe",
+        "0",
+        "-i",
+        list_path,
+        "-map",
+        "0:v:0",
+        "-c:v",
+        "copy",
+    ]
+    graph = []
+    audio_pad = None
+    if media.has_audio:
+        audio_pad = "0:a:0"
+        if normalize:
+            graph.append(
+                f"[0:a:0]{LOUDNORM_FILTER},aresample={AUDIO_SAMPLE_RATE}[aout]"
+            )
+            audio_pad = "aout"
+
+    ladder = None
+    if ladder_names:
+        ladder = build_ladder(
+            "0:v:0", audio_pad, ladder_names, Path(output_path), settings
+        )
+        graph += ladder.graph
+        audio_pad = ladder.main_audio
+
+    filter_graph = ";".join(graph) or None
+    if filter_graph:
+        cmd += ["-filter_complex", filter_graph]
+    if audio_pad == "0:a:0":
+        cmd += ["-map", "0:a:0", "-c:a", "copy"]
+    elif audio_pad is not None:
+        cmd += ["-map", f"[{audio_pad}]", *_audio_encode_args()]
+    cmd += ["-avoid_negative_ts", "make_zero", "-movflags", "+faststart", output_path]
+    if ladder is not None:
+        cmd += ladder.args
+    return RenderPlan(
+        command=cmd,
+        output_duration=output_duration,
+        video_copy=True,
+        audio_copy=media.has_audio and not normalize,
+        concat_list=concat_list,
+        filter_graph=filter_graph,
+        notes=["video stream copy: cuts snap to keyframes"],
+        renditions=ladder.outputs if ladder else [],
+    )
+
+
+def saliency_offset(frames: np.ndarray, crop_width: int) -> int:
+    """
+    縮小グレースケールフレーム列から、注目度が最大となる切り出し位置（x）を求める
+
+    注目度は列ごとのエッジ量（水平勾配）と動き（フレーム間差分）の和とし、
+    切り出し幅の窓で合計が最大となる位置を選ぶ。
+
+    Args:
+        frames: (フレーム数, 高さ, 幅) の uint8 配列
+        crop_width: 縮小座標系での切り出し幅
+    """
+    data = frames.astype(np.float32)
+    width = data.shape[2]
+    if crop_width >= width:
+        return 0
+    energy = np.zeros(width, dtype=np.float32)
+    energy[1:] += np.abs(np.diff(data, axis=2)).sum(axis=(0, 1))
+    if len(data) > 1:
+        energy += 2.0 * np.abs(np.diff(data, axis=0)).sum(axis=(0, 1))
+    # 中央寄りをわずかに優先（注目度が一様な場合は中央切り出しと同じになる）
+    center = (width - 1) / 2
+    energy += energy.mean() * 0.1 * (1 - np.abs(np.arange(width) - center) / width)
+    window = np.convolve(energy, np.ones(crop_width, dtype=np.float32), mode="valid")
+    return int(np.argmax(window))
+
+
+async def estimate_crop_offsets(
+    input_path: str,
+    segments: list[VideoSegment],
+    spec: RenderOutputSpec,
+    media: MediaInfo,
+    timeout: float | None = None,
+) -> list[int]:
+    """各クリップのサリエンシー切り出し位置（元解像度の x 座標）"""
+    crop_w, _ = crop_window(spec, media)
+    if crop_w >= media.width:
+        return [0] * len(segments)
+    sample_w = SALIENCY_SAMPLE_WIDTH
+    sample_h = _even(media.height * sample_w / media.width)
+    scale = sample_w / media.width
+    offsets = []
+    for segment in segments:
+        duration = segment.end - segment.start
+        fps = SALIENCY_FRAMES_PER_SEGMENT / duration
+        raw = await run_ffmpeg_pipe(
+            [
+                "ffmpeg",
+                "-ss",
+                _fmt(segment.start),
+                "-t",
+                _fmt(duration),
+                "-i",
+                input_path,
+                "-an",
+                "-vf",
+                f"fps={fps:.6f},scale={sample_w}:{sample_h},format=gray",
+                "-frames:v",
+                str(SALIENCY_FRAMES_PER_SEGMENT),
+                "-f",
+                "rawvideo",
+                "pipe:1",
+            ],
+            label="render_saliency",
+            timeout=timeout,
+        )
+        frame_size = sample_w * sample_h
+        count = len(raw) // frame_size
+        if count == 0:
+            offsets.append((media.width - crop_w) // 2)
+            continue
+        frames = np.frombuffer(raw[: count * frame_size], dtype=np.uint8).reshape(
+            count, sample_h, sample_w
+        )
+        x = saliency_offset(frames, max(1, round(crop_w * scale))) / scale
+        offsets.append(int(min(max(0, round(x / 2) * 2), media.width - crop_w)))
+    return offsets
+
+
+def render_output_name(
+    file_id: str, segments: list[VideoSegment], spec: RenderOutputSpec
+) -> str:
+    """同じ入力・指定なら同じ名前になる出力ファイル名"""
+    key = "|".join([spec.model_dump_json(), *(f"{s.start}-{s.end}" for s in segments)])
+    digest = hashlib.blake2b(key.encode(), digest_size=6).hexdigest()
+    return f"{file_id}_render_{digest}.mp4"
+
+
+async def render_video(
+    input_path: str,
+    output_path: str,
+    segments: list[VideoSegment],
+    spec: RenderOutputSpec,
+    settings: Settings,
+    media: MediaInfo | None = None,
+    renditions: list[str] | None = None,
+) -> RenderPlan:
+    """
+    ローカルの動画からハイライトリールを1パスでレンダリングする
+
+    ``media`` を省略した場合は ffprobe で取得する。
+    ``renditions`` のレンディションは同じFFmpegの実行で書き出す。
+    """
+    if media is None:
+        with span("render.probe"):
+            media = await probe_media(input_path)
+    validate_segments(segments, media.duration)
+    segments = clip_segments(segments, media.duration)
+
+    crop_offsets = None
+    if spec.cropMode == "saliency" and needs_reframe(spec, media):
+        report_progress(stage="analyzing_frames")
+        with span("render.saliency", clips=len(segments)):
+            crop_offsets = await estimate_crop_offsets(
+                input_path,
+                segments,
+                spec,
+                media,
+                timeout=settings.ffmpeg_timeout_seconds,
+            )
+
+    concat_list_path = f"{output_path}.ffconcat"
+    plan = build_render_plan(
+        input_path,
+        output_path,
+        segments,
+        spec,
+        media,
+        settings,
+        concat_list_path=concat_list_path,
+        crop_offsets=crop_offsets,
+        renditions=renditions,
+    )
+    if plan.concat_list is not None:
+        Path(concat_list_path).write_text(plan.concat_list)
+
+    def on_progress(block: dict[str, str]) -> None:
+        seconds = progress_seconds(block)
+        total = plan.output_duration
+        report_progress(
+            stage="rendering",
+            out_time_seconds=seconds,
+            ratio=min(seconds / total, 1.0) if seconds and total > 0 else None,
+            speed=block.get("speed"),
+        )
+
+    report_progress(stage="rendering", ratio=0.0)
+    with span(
+        "render.ffmpeg",
+        clips=len(segments),
+        duration=plan.output_duration,
+        video_copy=plan.video_copy,
+    ):
+        result = await run_ffmpeg(
+            plan.command,
+            label="render_video",
+            on_progress=on_progress,
+            timeout=settings.ffmpeg_timeout_seconds,
+        )
+    if result.returncode != 0:
+        logger.error(f"FFmpeg render failed: {result.stderr}")
+        msg = f"FFmpeg error: {result.stderr}"
+        raise RuntimeError(msg)
+    return plan
+
+
+async def render_highlights_service(
+    request: RenderRequest, settings: Settings
+) -> GenerateVideoResponse:
+    """
+    ハイライトリール生成処理
+    選択された複数セグメントを指定の出力形式で1本の動画にまとめる
+    """
+    spec = resolve_output_spec(request)
+    validate_segments(request.segments, 0)
+
+    try:
+        output_filename = render_output_name(request.fileId, request.segments, spec)
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+            temp_path = Path(temp_dir)
+            storage_client = storage.Client()
+            bucket = storage_client.bucket(settings.gcs_bucket_name)
+
+            input_blob = find_upload_blob(bucket, request.fileId, settings)
+            if not input_blob:
+                msg = f"Input file not found in GCS for fileId: {request.fileId}"
+                raise FileNotFoundError(msg)
+
+            input_path = temp_path / Path(input_blob.name).name
+            report_progress(stage="downloading")
+            with span("render.download", blob=input_blob.name) as download_span:
+                input_size = await download_blob(input_blob, input_path, settings)
+                download_span.set_attribute("bytes", input_size)
+
+            with span("render.probe"):
+                media = await probe_media(str(input_path))
+            await record_video_metadata(request.fileId, media)
+
+            output_path = temp_path / output_filename
+            plan = await render_video(
+                str(input_path),
+                str(output_path),
+                request.segments,
+                spec,
+                settings,
+                media=media,
+                renditions=request.renditions,
+            )
+            logger.info(
+                f"Rendered {len(request.segments)} clips "
+                f"({plan.output_duration:.2f}s, video_copy={plan.video_copy})"
+            )
+
+            if request.renditions:
+                report_progress(stage="uploading")
+                download_url, renditions = await upload_renditions(
+                    bucket, output_path, plan.renditions, settings
+                )
+                await record_clip(
+                    request.fileId,
+                    "render",
+                    f"{settings.gcs_processed_prefix}{output_filename}",
+                    request.model_dump(),
+                )
+                finish_progress()
+                return GenerateVideoResponse(
+                    downloadUrl=download_url, renditions=renditions
+                )
+
+            output_blob = bucket.blob(
+                f"{settings.gcs_processed_prefix}{output_filename}"
+            )
+            report_progress(stage="uploading")
+            with span(
+                "render.upload",
+                blob=output_blob.name,
+                bytes=output_path.stat().st_size,
+            ):
+                await upload_blob(output_blob, output_path, settings)
+
+            download_url = generate_signed_url(
+                output_blob,
+                method="GET",
+                expiration=timedelta(days=1),
+                settings=settings,
+            )
+
+            await record_clip(
+                request.fileId, "render", output_blob.name, request.model_dump()
+            )
+            finish_progress()
+            return GenerateVideoResponse(downloadUrl=download_url)
+
+    except asyncio.CancelledError:
+        finish_progress(error="cancelled")
+        raise
+    except ValueError as e:
+        finish_progress(error=str(e))
+        raise
+    except Exception as e:
+        logger.exception(f"Video render failed: {e!s}")
+        msg = f"Video render failed: {e!s}"
+        finish_progress(error=msg)
+        raise RuntimeError(msg)
@@ -0,0 +1,318 @@
+"""
+Multi-rendition output ladder
+
+Additional renditions (1080p / 720p / 480p MP4 and an HLS playlist) are added as
+extra outputs of the FFmpeg command that already produces the primary clip.
+The decoded video is fanned out with ``split``/``asplit``, so the source is
+decoded once no matter how many renditions are requested.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+
+from app.core.lazy import lazy_import
+from app.core.settings import Settings
+from app.core.telemetry import span
+from app.models.schemas import Rendition
+from app.services.gcs_utils import generate_signed_url
+from app.services.transfer import upload_blob
+
+storage = lazy_import("google.cloud.storage")
+
+logger = logging.getLogger(__name__)
+
+# 名前 -> 出力の高さ（元動画より大きくはしない）
+LADDER_HEIGHTS = {"1080p": 1080, "720p": 720, "480p": 480}
+HLS_HEIGHT = 720
+HLS_SEGMENT_SECONDS = 4
+AUDIO_BITRATES = {"1080p": "160k", "720p": "128k", "480p": "96k", "hls": "128k"}
+
+MP4_CONTENT_TYPE = "video/mp4"
+HLS_PLAYLIST_CONTENT_TYPE = "application/vnd.apple.mpegurl"
+HLS_SEGMENT_CONTENT_TYPE = "video/mp2t"
+
+MAX_PARALLEL_UPLOADS = 8
+SIGNED_URL_EXPIRATION = timedelta(days=1)
+
+
+@dataclass
+class RenditionOutput:
+    """ローカルに書き出されるレンディション"""
+
+    name: str
+    path: Path
+    content_type: str
+    height: int | None = None
+    # HLSのセグメントなど、プレイリストから参照される付随ファイル
+    extra_files: list[Path] = field(default_factory=list)
+
+
+@dataclass
+class LadderPlan:
+    """主出力に追加するフィルタとFFmpeg引数"""
+
+    graph: list[str]
+    args: list[str]
+    outputs: list[RenditionOutput]
+    # 主出力が使う映像・音声（split済みのラベル、または元のストリーム指定）
+    main_video: str | None = None
+    main_audio: str | None = None
+
+
+def _is_label(pad: str) -> bool:
+    """フィルタグラフ内のラベルか（``0:v:0`` のような入力ストリーム指定でないか）"""
+    return ":" not in pad
+
+
+def _map_arg(pad: str) -> str:
+    return f"[{pad}]" if _is_label(pad) else pad
+
+
+def requested_ladder(names: list[str]) -> list[str]:
+    """主出力（source）以外のレンディション名を重複なく返す"""
+    seen = []
+    for name in names:
+        if name != "source" and name not in seen:
+            seen.append(name)
+    return seen
+
+
+def _split(
+    pad: str, count: int, prefix: str, *, audio: bool, graph: list[str]
+) -> list[str]:
+    """1つのストリームを count 個に分岐する（入力ストリームの音声は分岐不要）"""
+    if count == 1:
+        return [pad]
+    if audio and not _is_label(pad):
+        # 入力ストリームはそのまま複数の出力にマップでき、デコードも1回で済む
+        return [pad] * count
+    labels = [f"{prefix}{i}" for i in range(count)]
+    filter_name = "asplit" if audio else "split"
+    graph.append(
+        f"[{pad}]{filter_name}={count}" + "".join(f"[{label}]" for label in labels)
+    )
+    return labels
+
+
+def _video_args(settings: Settings) -> list[str]:
+    return [
+        "-c:v",
+        "libx264",
+        "-preset",
+        settings.render_x264_preset,
+        "-crf",
+        str(settings.render_crf),
+        "-pix_fmt",
+        "yuv420p",
+    ]
+
+
+def build_ladder(
+    video_pad: str,
+    audio_pad: str | None,
+    names: list[str],
+    output_path: Path,
+    settings: Settings,
+) -> LadderPlan:
+    """
+    レンディションを主出力と同じFFmpegコマンドに追加するための引数を組み立てる
+
+    ``video_pad`` / ``audio_pad`` がフィルタのラベルの場合は主出力の分も含めて
+    分岐し、主出力は ``LadderPlan.main_video`` / ``main_audio`` を使う。
+
+    Args:
+        video_pad: 分岐元の映像（フィルタのラベル、または ``0:v:0`` などの入力指定）
+        audio_pad: 分岐元の音声（音声がなければ None）
+        names: レンディション名（``source`` は主出力そのものなので無視する）
+        output_path: 主出力のパス（同じディレクトリに ``<stem>_<name>`` で出力する）
+        settings: アプリケーション設定
+    """
+    ladder = requested_ladder(names)
+    output_dir = output_path.parent
+    stem = output_path.stem
+    graph: list[str] = []
+
+    def fan_out(pad: str, prefix: str, *, audio: bool) -> tuple[str, list[str]]:
+        # ラベルは1度しか参照できないため、主出力の分も分岐する
+        shared = _is_label(pad)
+        pads = _split(pad, len(ladder) + shared, prefix, audio=audio, graph=graph)
+        return (pads.pop() if shared else pad), pads
+
+    main_video, videos = fan_out(video_pad, "lv", audio=False)
+    main_audio, audios = (
+        fan_out(audio_pad, "la", audio=True)
+        if audio_pad is not None
+        else (None, [None] * len(ladder))
+    )
+    plan = LadderPlan(
+        graph=graph,
+        args=[],
+        outputs=[],
+        main_video=main_video,
+        main_audio=main_audio,
+    )
+
+    for name, video, audio in zip(ladder, videos, audios, strict=True):
+        height = HLS_HEIGHT if name == "hls" else LADDER_HEIGHTS[name]
+        scaled = f"r{name}"
+        # 元動画より大きくしない（幅は縦横比を保った偶数）
+        graph.append(
+            f"[{video}]scale=-2:'min({height},ih)':flags=lanczos,setsar=1[{scaled}]"
+        )
+        args = ["-map", f"[{scaled}]"]
+        if audio is not None:
+            args += [
+                "-map",
+                _map_arg(audio),
+                "-c:a",
+                "aac",
+                "-b:a",
+                AUDIO_BITRATES[name],
+            ]
+        args += _video_args(settings)
+
+        if name == "hls":
+            hls_dir = output_dir / f"{stem}_hls"
+            hls_dir.mkdir(parents=True, exist_ok=True)
+            playlist = hls_dir / "index.m3u8"
+            args += [
+                "-force_key_frames",
+                f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+                "-f",
+                "hls",
+                "-hls_time",
+                str(HLS_SEGMENT_SECONDS),
+                "-hls_playlist_type",
+                "vod",
+                "-hls_segment_filename",
+                str(hls_dir / "segment_%03d.ts"),
+                str(playlist),
+            ]
+            plan.outputs.append(
+                RenditionOutput(name, playlist, HLS_PLAYLIST_CONTENT_TYPE, height)
+            )
+        else:
+            path = output_dir / f"{stem}_{name}.mp4"
+            args += ["-movflags", "+faststart", str(path)]
+            plan.outputs.append(RenditionOutput(name, path, MP4_CONTENT_TYPE, height))
+        plan.args += args
+    return plan
+
+
+def collect_hls_segments(outputs: list[RenditionOutput]) -> None:
+    """FFmpeg実行後、HLSプレイリストが参照するセグメントを登録する"""
+    for output in outputs:
+        if output.content_type == HLS_PLAYLIST_CONTENT_TYPE:
+            output.extra_files = sorted(output.path.parent.glob("*.ts"))
+
+
+def rewrite_playlist(playlist: str, urls: dict[str, str]) -> str:
+    """
+    プレイリスト内のセグメント参照を署名付きURLに置き換える
+
+    署名付きURLはオブジェクトごとに発行されるため、相対パスのままでは
+    セグメントを取得できない。
+    """
+    lines = []
+    for line in playlist.splitlines():
+        stripped = line.strip()
+        if stripped and not stripped.startswith("#"):
+            line = urls.get(stripped, line)
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+async def upload_renditions(
+    bucket: storage.Bucket,
+    main_output: Path,
+    outputs: list[RenditionOutput],
+    settings: Settings,
+) -> tuple[str, list[Rendition]]:
+    """
+    主出力と各レンディションを並列にアップロードし、署名付きURLを返す
+
+    Returns:
+        (主出力のURL, レンディション一覧（先頭は source）)
+    """
+    prefix = settings.gcs_processed_prefix
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_UPLOADS)
+
+    async def upload(path: Path, blob_name: str, content_type: str) -> storage.Blob:
+        blob = bucket.blob(blob_name)
+        async with semaphore:
+            await upload_blob(blob, path, settings, content_type=content_type)
+        return blob
+
+    def sign(blob: storage.Blob) -> str:
+        return generate_signed_url(
+            blob, method="GET", expiration=SIGNED_URL_EXPIRATION, settings=settings
+        )
+
+    collect_hls_segments(outputs)
+    uploads = [upload(main_output, f"{prefix}{main_output.name}", MP4_CONTENT_TYPE)]
+    segment_uploads = []
+    for output in outputs:
+        if output.extra_files:
+            base = f"{prefix}{output.path.parent.name}/"
+            segment_uploads += [
+                upload(path, f"{base}{path.name}", HLS_SEGMENT_CONTENT_TYPE)
+                for path in output.extra_files
+            ]
+        else:
+            uploads.append(
+                upload(output.path, f"{prefix}{output.path.name}", output.content_type)
+            )
+
+    total_bytes = main_output.stat().st_size + sum(
+        path.stat().st_size
+        for output in outputs
+        for path in [output.path, *output.extra_files]
+    )
+    with span(
+        "renditions.upload",
+        files=len(uploads) + len(segment_uploads),
+        bytes=total_bytes,
+    ):
+        blobs = await asyncio.gather(*uploads)
+        segment_blobs = await asyncio.gather(*segment_uploads)
+
+        # HLSはセグメントの署名付きURLでプレイリストを書き換えてからアップロードする
+        segment_urls = {
+            blob.name.rsplit("/", 1)[-1]: sign(blob) for blob in segment_blobs
+        }
+        for output in outputs:
+            if output.extra_files:
+                playlist = rewrite_playlist(output.path.read_text(), segment_urls)
+                blob = bucket.blob(
+                    f"{prefix}{output.path.parent.name}/{output.path.name}"
+                )
+                await asyncio.to_thread(
+                    blob.upload_from_string,
+                    playlist,
+                    content_type=HLS_PLAYLIST_CONTENT_TYPE,
+                )
+                blobs.append(blob)
+
+    main_url = sign(blobs[0])
+    renditions = [
+        Rendition(name="source", downloadUrl=main_url, contentType=MP4_CONTENT_TYPE)
+    ]
+    # blobs[1:] は MP4 レンディション、その後に HLS プレイリストの順
+    ordered = [o for o in outputs if not o.extra_files] + [
+        o for o in outputs if o.extra_files
+    ]
+    for output, blob in zip(ordered, blobs[1:], strict=True):
+        renditions.append(
+            Rendition(
+                name=output.name,
+                downloadUrl=sign(blob),
+                contentType=output.content_type,
+                height=output.height,
+            )
+        )
+    return main_url, renditions
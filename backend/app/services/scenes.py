@@ -0,0 +1,151 @@
+"""
+Candidate segment boundaries from scene cuts and audio pauses
+
+One FFmpeg pass over a downscaled decode detects scene cuts (``select`` on
+the scene score) and silences (``silencedetect``); both are written to
+metadata files instead of stderr. The cut points are then bucketed into
+candidate segments of ``segment_min_seconds``–``segment_max_seconds``, which
+the model scores instead of inventing its own timestamps.
+"""
+
+import logging
+import math
+import re
+import tempfile
+from pathlib import Path
+
+from app.core.lazy import lazy_import
+from app.core.settings import Settings
+from app.core.telemetry import span
+from app.services.ffmpeg import probe_media, run_ffmpeg
+from app.services.gcs_utils import cached_signed_url, find_upload_blob
+
+storage = lazy_import("google.cloud.storage")
+
+logger = logging.getLogger(__name__)
+
+SCAN_WIDTH = 160
+SILENCE_NOISE = "-35dB"
+SILENCE_MIN_SECONDS = 0.5
+
+_PTS_TIME_RE = re.compile(r"pts_time:(?P<time>[\d.]+)")
+_SILENCE_RE = re.compile(r"lavfi\.silence_(?P<edge>start|end)=(?P<time>-?[\d.]+)")
+
+
+def build_boundary_command(
+    source: str, scenes_path: str, silences_path: str, threshold: float
+) -> list[str]:
+    """シーンの切り替わりと無音区間を検出するコマンド（出力は捨てる）"""
+    return [
+        "ffmpeg",
+        "-y",
+        "-i",
+        source,
+        "-vf",
+        f"scale={SCAN_WIDTH}:-2,select='gt(scene,{threshold})',"
+        f"metadata=mode=print:file='{scenes_path}'",
+        "-af",
+        f"silencedetect=noise={SILENCE_NOISE}:d={SILENCE_MIN_SECONDS},"
+        f"ametadata=mode=print:file='{silences_path}'",
+        "-f",
+        "null",
+        "-",
+    ]
+
+
+def parse_scene_cuts(text: str) -> list[float]:
+    """``metadata=print`` の出力からシーンの切り替わり時刻を取り出す"""
+    return [float(m["time"]) for m in _PTS_TIME_RE.finditer(text)]
+
+
+def parse_silences(text: str) -> list[tuple[float, float]]:
+    """``ametadata=print`` の出力から無音区間（開始, 終了）を取り出す"""
+    silences = []
+    start = None
+    for match in _SILENCE_RE.finditer(text):
+        time = max(float(match["time"]), 0.0)
+        if match["edge"] == "start":
+            start = time
+        elif start is not None:
+            silences.append((start, time))
+            start = None
+    return silences
+
+
+def candidate_segments(
+    cuts: list[float], duration: float, min_seconds: float, max_seconds: float
+) -> list[tuple[float, float]]:
+    """
+    区切りの候補時刻を min_seconds〜max_seconds の長さのセグメントにまとめる
+
+    短すぎる区間の区切りは捨て、区切りのない長い区間は等分する。
+    末尾の短すぎるセグメントは直前のセグメントに含める。
+    """
+    if duration <= 0:
+        return []
+    max_seconds = max(max_seconds, min_seconds)
+    points = sorted({c for c in cuts if 0 < c < duration})
+    segments: list[tuple[float, float]] = []
+    start = 0.0
+    for point in [*points, duration]:
+        if point - start < min_seconds and point < duration:
+            continue
+        pieces = max(1, math.ceil((point - start) / max_seconds))
+        step = (point - start) / pieces
+        for i in range(pieces):
+            end = point if i == pieces - 1 else start + step
+            segments.append((round(start, 3), round(end, 3)))
+            start = end
+    if len(segments) > 1 and segments[-1][1] - segments[-1][0] < min_seconds:
+        last_start, _ = segments.pop(-2)
+        segments[-1] = (last_start, segments[-1][1])
+    return segments
+
+
+async def detect_boundaries(source: str, settings: Settings) -> list[float]:
+    """シーンの切り替わりと無音区間の中央の時刻（昇順）"""
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+        scenes_path = Path(temp_dir) / "scenes.txt"
+        silences_path = Path(temp_dir) / "silences.txt"
+        result = await run_ffmpeg(
+            build_boundary_command(
+                source, str(scenes_path), str(silences_path), settings.scene_threshold
+            ),
+            label="scene_boundaries",
+            timeout=settings.ffmpeg_timeout_seconds,
+        )
+        if result.returncode != 0:
+            msg = f"FFmpeg error: {result.stderr}"
+            raise RuntimeError(msg)
+        cuts = parse_scene_cuts(scenes_path.read_text() if scenes_path.exists() else "")
+        silences = parse_silences(
+            silences_path.read_text() if silences_path.exists() else ""
+        )
+    return sorted([*cuts, *((start + end) / 2 for start, end in silences)])
+
+
+async def detect_candidates(
+    file_id: str, settings: Settings
+) -> list[tuple[float, float]]:
+    """アップロード済みの動画の候補セグメント（署名付きURLから読む）"""
+    bucket = storage.Client().bucket(settings.gcs_bucket_name)
+    blob = find_upload_blob(bucket, file_id, settings)
+    if blob is None:
+        msg = f"Input file not found in GCS for fileId: {file_id}"
+        raise FileNotFoundError(msg)
+    source = cached_signed_url(blob, settings=settings)
+
+    with span("analyze.scenes.detect") as detect_span:
+        media = await probe_media(source)
+        cuts = await detect_boundaries(source, settings)
+    candidates = candidate_segments(
+        cuts,
+        media.duration,
+        settings.segment_min_seconds,
+        settings.segment_max_seconds,
+    )
+    logger.info(
+        f"Found {len(cuts)} boundaries and {len(candidates)} candidate segments "
+        f"for {file_id} in {detect_span.duration:.2f} seconds"
+    )
+    return candidates
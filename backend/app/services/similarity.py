@@ -0,0 +1,174 @@
+"""
+Semantic highlight search over the vector index
+
+Highlights are embedded when an analysis is stored and replace the previous
+vectors of the same video. Queries embed free text (or reuse the vector of an
+existing highlight for "similar moments in other videos"), take the top-k from
+the index and resolve the hits against the store.
+"""
+
+import asyncio
+import logging
+from collections import defaultdict
+from pathlib import Path
+
+from app.core.settings import Settings, get_settings
+from app.core.telemetry import span
+from app.models.schemas import SimilarHighlight, SimilarHighlightsResponse
+from app.services.embeddings import get_embedder, highlight_text
+from app.store import AnalysisRecord, HighlightRecord, get_store
+from app.store.vectors import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+# 最新の解析に含まれないハイライトを除いても件数が足りるよう多めに引く
+OVERFETCH = 2
+BACKFILL_PAGE_SIZE = 500
+
+_index: VectorIndex | None = None
+_backfilled = False
+
+
+def vector_index_dir(settings: Settings) -> Path:
+    if settings.vector_index_dir:
+        return Path(settings.vector_index_dir)
+    return settings.storage_root / "vectors"
+
+
+def get_vector_index(settings: Settings | None = None) -> VectorIndex:
+    """プロセス共有のベクトル索引（初回呼び出し時に開く）"""
+    global _index  # noqa: PLW0603
+    if _index is None:
+        settings = settings or get_settings()
+        embedder = get_embedder(settings)
+        _index = VectorIndex(
+            vector_index_dir(settings),
+            dim=embedder.dim,
+            model=embedder.name,
+            ann_threshold=settings.vector_ann_threshold,
+        )
+    return _index
+
+
+def set_vector_index(index: VectorIndex | None) -> None:
+    """共有の索引を差し替える（テスト・ベンチマーク用）"""
+    global _index, _backfilled  # noqa: PLW0603
+    _index = index
+    _backfilled = False
+
+
+async def index_analysis(record: AnalysisRecord, settings: Settings) -> None:
+    """解析結果のハイライトを埋め込み、その動画のベクトルを置き換える"""
+    index = get_vector_index(settings)
+    texts = [highlight_text(h.title, h.description) for h in record.highlights]
+    with span("similarity.embed", highlights=len(texts)):
+        vectors = await asyncio.to_thread(get_embedder(settings).embed, texts)
+    await asyncio.to_thread(
+        index.replace_group,
+        record.file_id,
+        [h.id for h in record.highlights],
+        vectors,
+    )
+
+
+async def _backfill(settings: Settings) -> None:
+    """索引が空（初回・モデル変更後）ならストアのハイライトから作り直す"""
+    global _backfilled  # noqa: PLW0603
+    index = get_vector_index(settings)
+    if _backfilled or index.count:
+        _backfilled = True
+        return
+    _backfilled = True
+
+    by_video: dict[str, list[HighlightRecord]] = defaultdict(list)
+    cursor = None
+    while True:
+        page = await get_store().top_highlights(BACKFILL_PAGE_SIZE, cursor)
+        for highlight in page.items:
+            by_video[highlight.file_id].append(highlight)
+        cursor = page.next_cursor
+        if cursor is None:
+            break
+    for file_id, highlights in by_video.items():
+        await index_analysis(
+            AnalysisRecord(
+                id=0,
+                file_id=file_id,
+                provider="",
+                model="",
+                prompt_version="",
+                created_at=0,
+                highlights=highlights,
+            ),
+            settings,
+        )
+    if by_video:
+        logger.info(f"Indexed highlights of {len(by_video)} videos")
+
+
+async def _resolve(
+    hits: list[tuple[int, float]], limit: int
+) -> SimilarHighlightsResponse:
+    records = {h.id: h for h in await get_store().get_highlights([i for i, _ in hits])}
+    highlights = [
+        SimilarHighlight(
+            start=record.start,
+            end=record.end,
+            title=record.title,
+            description=record.description,
+            score=record.score,
+            fileId=record.file_id,
+            analysisId=record.analysis_id,
+            similarity=round(similarity, 6),
+        )
+        for highlight_id, similarity in hits
+        if (record := records.get(highlight_id)) is not None
+    ]
+    return SimilarHighlightsResponse(highlights=highlights[:limit])
+
+
+async def similar_highlights_service(
+    text: str,
+    limit: int,
+    settings: Settings,
+    *,
+    exclude_file_id: str | None = None,
+) -> SimilarHighlightsResponse:
+    """テキストに意味の近いハイライトを類似度の高い順に返す"""
+    await _backfill(settings)
+    index = get_vector_index(settings)
+    query = (await asyncio.to_thread(get_embedder(settings).embed, [text]))[0]
+    with span("similarity.search", vectors=index.count):
+        hits = await asyncio.to_thread(
+            index.search, query, limit * OVERFETCH, exclude_group=exclude_file_id
+        )
+    return await _resolve(hits, limit)
+
+
+async def similar_to_highlight_service(
+    highlight_id: int,
+    limit: int,
+    settings: Settings,
+    *,
+    other_videos: bool = True,
+) -> SimilarHighlightsResponse | None:
+    """
+    ハイライトに似た場面を返す（既定では他の動画から）
+
+    複数動画のまとめ動画を作るときの候補探しに使う。未登録のIDなら None。
+    """
+    await _backfill(settings)
+    index = get_vector_index(settings)
+    records = await get_store().get_highlights([highlight_id])
+    vector = index.vector(highlight_id)
+    if not records or vector is None:
+        return None
+    with span("similarity.search", vectors=index.count):
+        hits = await asyncio.to_thread(
+            index.search,
+            vector,
+            (limit + 1) * OVERFETCH,
+            exclude_group=records[0].file_id if other_videos else None,
+        )
+    hits = [(i, similarity) for i, similarity in hits if i != highlight_id]
+    return await _resolve(hits, limit)
@@ -0,0 +1,352 @@
+"""
+Timeline thumbnails: sprite sheets, WebVTT index and highlight thumbnails
+
+The video is decoded once at a low frame rate. The decoded frames are split
+into two branches of the same FFmpeg filter graph: one tiles them into sprite
+sheets, the other picks the frame closest to the middle of each highlight.
+Artifacts are stored next to the upload in GCS together with a manifest, so
+later requests only sign URLs.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+import tempfile
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from app.core.lazy import lazy_import
+from app.core.settings import Settings
+from app.core.telemetry import span
+from app.models.schemas import ThumbnailsResponse, VideoSegment
+from app.services.ffmpeg import MediaInfo, probe_media, run_ffmpeg
+from app.services.gcs_utils import (
+    cached_signed_url,
+    find_upload_blob,
+    signed_url_expires_at,
+)
+from app.services.library import record_video_metadata
+from app.services.progress import finish_progress, report_progress
+from app.services.transfer import download_blob
+
+storage = lazy_import("google.cloud.storage")
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+VTT_NAME = "thumbnails.vtt"
+HIGHLIGHT_THUMBNAIL_WIDTH = 480
+CONTENT_TYPES = {"jpg": "image/jpeg", "webp": "image/webp"}
+MAX_PARALLEL_UPLOADS = 8
+
+
+@dataclass
+class ThumbnailManifest:
+    interval: float
+    tile_width: int
+    tile_height: int
+    columns: int
+    rows: int
+    frame_count: int
+    sprites: list[str]
+    highlights: list[list[float]]
+    highlight_thumbnails: list[str]
+    image_format: str = "jpg"
+
+
+def thumbnails_prefix(file_id: str, settings: Settings) -> str:
+    """アップロード動画と同じ場所に置くサムネイルのプレフィックス"""
+    return f"{settings.gcs_uploads_prefix}{file_id}/thumbnails/"
+
+
+def tile_size(media: MediaInfo, width: int) -> tuple[int, int]:
+    height = max(2, round(width * media.height / media.width / 2) * 2)
+    return width, height
+
+
+def frame_count(duration: float, interval: float) -> int:
+    """``fps=1/interval`` が出力するフレーム数（t=0 から interval ごと）"""
+    return max(1, math.ceil(duration / interval))
+
+
+def highlight_frame_indices(
+    highlights: list[VideoSegment], interval: float, count: int
+) -> list[int]:
+    """各ハイライトの中央に最も近いフレーム番号"""
+    return [
+        min(count - 1, max(0, round((h.start + h.end) / 2 / interval)))
+        for h in highlights
+    ]
+
+
+def build_thumbnail_command(
+    input_path: str,
+    output_dir: Path,
+    media: MediaInfo,
+    highlights: list[VideoSegment],
+    settings: Settings,
+) -> tuple[list[str], ThumbnailManifest]:
+    """スプライトとハイライトサムネイルを1回のデコードで書き出すコマンド"""
+    interval = settings.thumbnail_interval_seconds
+    columns, rows = settings.thumbnail_columns, settings.thumbnail_rows
+    width, height = tile_size(media, settings.thumbnail_width)
+    count = frame_count(media.duration, interval)
+    image_format = settings.thumbnail_format
+    sprite_count = math.ceil(count / (columns * rows))
+
+    unique_indices = sorted(set(highlight_frame_indices(highlights, interval, count)))
+    sample = f"fps=1/{interval:g}:round=down"
+    sprite_chain = f"scale={width}:{height},tile={columns}x{rows}"
+    graph = [f"[0:v]{sample},{sprite_chain}[sprites]"]
+    if unique_indices:
+        select = "+".join(f"eq(n\\,{index})" for index in unique_indices)
+        graph = [
+            f"[0:v]{sample},split=2[frames][picks]",
+            f"[frames]{sprite_chain}[sprites]",
+            f"[picks]select='{select}',scale={HIGHLIGHT_THUMBNAIL_WIDTH}:-2[highlights]",
+        ]
+
+    quality = ["-q:v", "4"] if image_format == "jpg" else ["-quality", "75"]
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-i",
+        input_path,
+        "-filter_complex",
+        ";".join(graph),
+        "-map",
+        "[sprites]",
+        "-fps_mode",
+        "passthrough",
+        *quality,
+        "-start_number",
+        "0",
+        str(output_dir / f"sprite_%03d.{image_format}"),
+    ]
+    if unique_indices:
+        cmd += [
+            "-map",
+            "[highlights]",
+            "-fps_mode",
+            "passthrough",
+            *quality,
+            "-start_number",
+            "0",
+            str(output_dir / f"highlight_frame_%03d.{image_format}"),
+        ]
+
+    # ハイライトごとのサムネイル名（同じフレームを指す場合は共有する）
+    picked = highlight_frame_indices(highlights, interval, count)
+    highlight_names = [
+        f"highlight_frame_{unique_indices.index(index):03d}.{image_format}"
+        for index in picked
+    ]
+    manifest = ThumbnailManifest(
+        interval=interval,
+        tile_width=width,
+        tile_height=height,
+        columns=columns,
+        rows=rows,
+        frame_count=count,
+        sprites=[f"sprite_{i:03d}.{image_format}" for i in range(sprite_count)],
+        highlights=[[h.start, h.end] for h in highlights],
+        highlight_thumbnails=highlight_names,
+        image_format=image_format,
+    )
+    return cmd, manifest
+
+
+def _timestamp(seconds: float) -> str:
+    millis = round(seconds * 1000)
+    hours, millis = divmod(millis, 3_600_000)
+    minutes, millis = divmod(millis, 60_000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+def build_vtt(
+    manifest: ThumbnailManifest, sprite_urls: list[str], duration: float | None = None
+) -> str:
+    """
+    WebVTT形式のサムネイルインデックス（``url#xywh=x,y,w,h``）
+
+    ``sprite_urls`` は ``manifest.sprites`` と同じ順の参照先。
+    """
+    per_sheet = manifest.columns * manifest.rows
+    end_of_video = duration or manifest.frame_count * manifest.interval
+    lines = ["WEBVTT", ""]
+    for index in range(manifest.frame_count):
+        sheet, position = divmod(index, per_sheet)
+        if sheet >= len(sprite_urls):
+            break
+        row, column = divmod(position, manifest.columns)
+        start = index * manifest.interval
+        end = min((index + 1) * manifest.interval, end_of_video)
+        x, y = column * manifest.tile_width, row * manifest.tile_height
+        lines += [
+            f"{_timestamp(start)} --> {_timestamp(end)}",
+            f"{sprite_urls[sheet]}#xywh={x},{y},"
+            f"{manifest.tile_width},{manifest.tile_height}",
+            "",
+        ]
+    return "\n".join(lines)
+
+
+def load_manifest(
+    bucket: storage.Bucket, file_id: str, settings: Settings
+) -> ThumbnailManifest | None:
+    blob = bucket.blob(f"{thumbnails_prefix(file_id, settings)}{MANIFEST_NAME}")
+    if not blob.exists():
+        return None
+    return ThumbnailManifest(**json.loads(blob.download_as_bytes()))
+
+
+def thumbnails_response(
+    bucket: storage.Bucket,
+    file_id: str,
+    manifest: ThumbnailManifest,
+    settings: Settings,
+) -> ThumbnailsResponse:
+    """キャッシュされた署名付きURLでレスポンスを組み立てる"""
+    prefix = thumbnails_prefix(file_id, settings)
+
+    def url(name: str) -> str:
+        return cached_signed_url(bucket.blob(f"{prefix}{name}"), settings=settings)
+
+    return ThumbnailsResponse(
+        fileId=file_id,
+        interval=manifest.interval,
+        tileWidth=manifest.tile_width,
+        tileHeight=manifest.tile_height,
+        columns=manifest.columns,
+        rows=manifest.rows,
+        frameCount=manifest.frame_count,
+        sprites=[url(name) for name in manifest.sprites],
+        vttUrl=f"/api/thumbnails/{file_id}/{VTT_NAME}",
+        highlightThumbnails=[url(name) for name in manifest.highlight_thumbnails],
+    )
+
+
+async def thumbnails_vtt_service(
+    file_id: str, settings: Settings
+) -> tuple[str, float | None] | None:
+    """
+    署名付きURLを埋め込んだWebVTTと、最も早いURLの有効期限を返す（未生成なら None）
+    """
+    bucket = storage.Client().bucket(settings.gcs_bucket_name)
+    manifest = await asyncio.to_thread(load_manifest, bucket, file_id, settings)
+    if manifest is None:
+        return None
+    prefix = thumbnails_prefix(file_id, settings)
+    blobs = [bucket.blob(f"{prefix}{name}") for name in manifest.sprites]
+    urls = [cached_signed_url(blob, settings=settings) for blob in blobs]
+    expiries = [e for blob in blobs if (e := signed_url_expires_at(blob)) is not None]
+    return build_vtt(manifest, urls), min(expiries, default=None)
+
+
+async def generate_thumbnails_service(
+    file_id: str, highlights: list[VideoSegment], settings: Settings
+) -> ThumbnailsResponse:
+    """
+    タイムライン用スプライトとハイライトサムネイルを生成する
+
+    同じハイライトで生成済みなら既存の成果物を返す。
+    """
+    bucket = storage.Client().bucket(settings.gcs_bucket_name)
+    manifest = await asyncio.to_thread(load_manifest, bucket, file_id, settings)
+    requested = [[h.start, h.end] for h in highlights]
+    if manifest is not None and manifest.highlights == requested:
+        return thumbnails_response(bucket, file_id, manifest, settings)
+
+    try:
+        input_blob = find_upload_blob(bucket, file_id, settings)
+        if not input_blob:
+            msg = f"Input file not found in GCS for fileId: {file_id}"
+            raise FileNotFoundError(msg)
+
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+            temp_path = Path(temp_dir)
+            input_path = temp_path / Path(input_blob.name).name
+            report_progress(stage="downloading")
+            with span("thumbnails.download", blob=input_blob.name) as download_span:
+                input_size = await download_blob(input_blob, input_path, settings)
+                download_span.set_attribute("bytes", input_size)
+
+            with span("thumbnails.probe"):
+                media = await probe_media(str(input_path))
+            await record_video_metadata(file_id, media)
+            output_dir = temp_path / "thumbnails"
+            output_dir.mkdir()
+            cmd, manifest = build_thumbnail_command(
+                str(input_path), output_dir, media, highlights, settings
+            )
+
+            report_progress(stage="thumbnails")
+            with span("thumbnails.ffmpeg", frames=manifest.frame_count):
+                result = await run_ffmpeg(
+                    cmd,
+                    label="thumbnails",
+                    timeout=settings.ffmpeg_timeout_seconds,
+                )
+            if result.returncode != 0:
+                msg = f"FFmpeg error: {result.stderr}"
+                raise RuntimeError(msg)
+
+            # FFmpegが実際に書き出したスプライト数に合わせる
+            manifest.sprites = [
+                name for name in manifest.sprites if (output_dir / name).exists()
+            ]
+            await _upload_artifacts(bucket, file_id, output_dir, manifest, settings)
+
+        finish_progress()
+        return thumbnails_response(bucket, file_id, manifest, settings)
+
+    except asyncio.CancelledError:
+        finish_progress(error="cancelled")
+        raise
+    except Exception as e:
+        logger.exception(f"Thumbnail generation failed: {e!s}")
+        msg = f"Thumbnail generation failed: {e!s}"
+        finish_progress(error=msg)
+        raise RuntimeError(msg)
+
+
+async def _upload_artifacts(
+    bucket: storage.Bucket,
+    file_id: str,
+    output_dir: Path,
+    manifest: ThumbnailManifest,
+    settings: Settings,
+) -> None:
+    """画像を並列にアップロードし、最後にマニフェストを書き込む"""
+    prefix = thumbnails_prefix(file_id, settings)
+    content_type = CONTENT_TYPES[manifest.image_format]
+    names = [*manifest.sprites, *sorted(set(manifest.highlight_thumbnails))]
+    semaphore = asyncio.Semaphore(MAX_PARALLEL_UPLOADS)
+
+    async def upload(name: str) -> None:
+        async with semaphore:
+            await asyncio.to_thread(
+                bucket.blob(f"{prefix}{name}").upload_from_filename,
+                str(output_dir / name),
+                content_type=content_type,
+            )
+
+    report_progress(stage="uploading")
+    with span("thumbnails.upload", files=len(names)):
+        await asyncio.gather(*(upload(name) for name in names))
+        # 相対参照のVTTも保存しておく（署名付きURL版はAPIで配信する）
+        await asyncio.to_thread(
+            bucket.blob(f"{prefix}{VTT_NAME}").upload_from_string,
+            build_vtt(manifest, manifest.sprites),
+            content_type="text/vtt",
+        )
+        # マニフェストは画像のアップロード完了後に書く（存在＝生成済み）
+        await asyncio.to_thread(
+            bucket.blob(f"{prefix}{MANIFEST_NAME}").upload_from_string,
+            json.dumps(asdict(manifest)),
+            content_type="application/json",
+        )
@@ -0,0 +1,341 @@
+"""
+Local speech-to-text transcripts for transcript-first analysis
+
+``ANALYSIS_SEGMENTATION=transcript`` sends the model a timestamped transcript
+and a few keyframes instead of the whole video. The audio track is extracted
+with FFmpeg (16 kHz mono WAV) and transcribed on the CPU by the engine chosen
+with ``SPEECH_ENGINE``: faster-whisper (``poetry install -E speech``) or a
+deterministic stub for tests and benchmarks. Transcripts are stored per video
+and engine, so re-analyses (new prompts, models, ``refresh``) reuse them.
+Candidate segments are cut at utterance boundaries, like the scene/silence
+boundaries of ``segmentation=scenes``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import tempfile
+import time
+import wave
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Protocol
+
+from app.core.lazy import lazy_import
+from app.core.settings import Settings
+from app.core.telemetry import REGISTRY, span
+from app.services.ffmpeg import MediaInfo, probe_media, run_ffmpeg
+from app.services.gcs_utils import find_upload_blob
+from app.services.scenes import candidate_segments
+from app.services.transfer import download_blob
+from app.store import TranscriptRecord, get_store
+
+storage = lazy_import("google.cloud.storage")
+
+logger = logging.getLogger(__name__)
+
+SPEECH_SAMPLE_RATE = 16000
+KEYFRAME_WIDTH = 512
+KEYFRAME_QUALITY = 5
+STUB_SEGMENT_SECONDS = 5.0
+
+TRANSCRIPTS = REGISTRY.counter(
+    "transcripts_total",
+    "Transcripts used for analysis by source (stored, transcribed)",
+    ("source",),
+)
+
+
+@dataclass
+class TranscriptSegment:
+    start: float
+    end: float
+    text: str
+
+
+@dataclass
+class Transcript:
+    segments: list[TranscriptSegment]
+    language: str = ""
+
+
+class SpeechEngine(Protocol):
+    name: str
+
+    def transcribe(self, audio_path: Path) -> Transcript:
+        """16 kHz モノラルのWAVを発話ごとに文字起こしする（CPUでブロックする）"""
+        ...
+
+
+class StubSpeechEngine:
+    """
+    音声の長さから ``STUB_SEGMENT_SECONDS`` ごとの定型文を返す決定的なエンジン
+
+    音声認識のモデルなしでテスト・ベンチマークを実行するために使う。
+    """
+
+    name = "stub"
+
+    def transcribe(self, audio_path: Path) -> Transcript:
+        with wave.open(str(audio_path), "rb") as wav:
+            duration = wav.getnframes() / wav.getframerate()
+        segments = []
+        start = 0.0
+        while start < duration:
+            end = min(start + STUB_SEGMENT_SECONDS, duration)
+            segments.append(
+                TranscriptSegment(
+                    round(start, 3), round(end, 3), f"発話{len(segments) + 1}"
+                )
+            )
+            start = end
+        return Transcript(segments, language="ja")
+
+
+class FasterWhisperEngine:
+    """faster-whisper（CTranslate2）のモデルをCPU・int8で実行する"""
+
+    def __init__(self, model_name: str, language: str = ""):
+        from faster_whisper import WhisperModel  # noqa: PLC0415
+
+        self._model = WhisperModel(model_name, device="cpu", compute_type="int8")
+        self._language = language or None
+        self.name = f"faster-whisper:{model_name}"
+
+    def transcribe(self, audio_path: Path) -> Transcript:
+        segments, info = self._model.transcribe(
+            str(audio_path), language=self._language, vad_filter=True
+        )
+        return Transcript(
+            [
+                TranscriptSegment(
+                    round(segment.start, 3), round(segment.end, 3), segment.text.strip()
+                )
+                for segment in segments
+                if segment.text.strip()
+            ],
+            language=info.language or "",
+        )
+
+
+@lru_cache
+def _speech_engine(engine: str, model_name: str, language: str) -> SpeechEngine:
+    if engine == "stub":
+        return StubSpeechEngine()
+    return FasterWhisperEngine(model_name, language)
+
+
+def get_speech_engine(settings: Settings) -> SpeechEngine:
+    """
+    設定の音声認識エンジン（モデルの読み込みはプロセスごとに1回）
+
+    Raises:
+        ImportError: faster-whisper がインストールされていない場合
+    """
+    return _speech_engine(
+        settings.speech_engine, settings.speech_model, settings.speech_language
+    )
+
+
+@dataclass
+class TranscriptContext:
+    """文字起こしによる解析でモデルに渡す材料"""
+
+    candidates: list[tuple[float, float]]
+    # 候補セグメントごとの発話
+    texts: list[str]
+    # (時刻, JPEG) の代表フレーム
+    keyframes: list[tuple[float, bytes]] = field(default_factory=list)
+
+
+def build_audio_command(source: str, output_path: str) -> list[str]:
+    """音声認識用に 16 kHz モノラルのWAVを書き出すコマンド"""
+    return [
+        "ffmpeg",
+        "-y",
+        "-i",
+        source,
+        "-map",
+        "0:a:0",
+        "-vn",
+        "-ac",
+        "1",
+        "-ar",
+        str(SPEECH_SAMPLE_RATE),
+        "-c:a",
+        "pcm_s16le",
+        "-f",
+        "wav",
+        output_path,
+    ]
+
+
+def keyframe_times(duration: float, count: int) -> list[float]:
+    """動画を count 等分した各区間の中央の時刻"""
+    if duration <= 0 or count <= 0:
+        return []
+    step = duration / count
+    return [round(step * (i + 0.5), 3) for i in range(count)]
+
+
+def build_keyframe_command(
+    source: str, times: list[float], output_dir: str
+) -> list[str]:
+    """
+    指定時刻のフレームをJPEGに書き出すコマンド
+
+    時刻ごとに入力側でシークするため、動画全体はデコードしない。
+    """
+    cmd = ["ffmpeg", "-y"]
+    for time_ in times:
+        cmd += ["-ss", f"{time_:.3f}", "-i", source]
+    for index in range(len(times)):
+        cmd += [
+            "-map",
+            f"{index}:v:0",
+            "-frames:v",
+            "1",
+            "-vf",
+            f"scale={KEYFRAME_WIDTH}:-2",
+            "-q:v",
+            str(KEYFRAME_QUALITY),
+            f"{output_dir}/keyframe-{index}.jpg",
+        ]
+    return cmd
+
+
+def candidate_texts(
+    candidates: list[tuple[float, float]], segments: list[TranscriptSegment]
+) -> list[str]:
+    """候補セグメントごとの発話（中央の時刻が含まれる発話をつなげる）"""
+    texts: list[list[str]] = [[] for _ in candidates]
+    for segment in segments:
+        middle = (segment.start + segment.end) / 2
+        for index, (start, end) in enumerate(candidates):
+            if start <= middle < end or (
+                index == len(candidates) - 1 and middle == end
+            ):
+                texts[index].append(segment.text)
+                break
+    return [" ".join(parts) for parts in texts]
+
+
+async def _run(cmd: list[str], label: str, settings: Settings) -> None:
+    result = await run_ffmpeg(cmd, label=label, timeout=settings.ffmpeg_timeout_seconds)
+    if result.returncode != 0:
+        msg = f"FFmpeg error: {result.stderr}"
+        raise RuntimeError(msg)
+
+
+async def transcribe_video(
+    file_id: str, source: Path, media: MediaInfo, settings: Settings
+) -> Transcript:
+    """
+    保存済みの文字起こし、なければ音声を取り出して文字起こしし、保存する
+
+    音声のない動画は発話なしの文字起こしになる。
+    """
+    engine = get_speech_engine(settings)
+    store = get_store()
+    stored = await store.get_transcript(file_id, engine.name)
+    if stored is not None:
+        TRANSCRIPTS.inc(source="stored")
+        return Transcript(
+            [TranscriptSegment(**segment) for segment in stored.segments],
+            language=stored.language,
+        )
+
+    transcript = Transcript([])
+    if media.has_audio:
+        with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+            audio_path = Path(temp_dir) / "speech.wav"
+            with span("transcript.extract_audio"):
+                await _run(
+                    build_audio_command(str(source), str(audio_path)),
+                    "transcript_audio",
+                    settings,
+                )
+            with span(
+                "transcript.transcribe", engine=engine.name, duration=media.duration
+            ) as transcribe_span:
+                transcript = await asyncio.to_thread(engine.transcribe, audio_path)
+        logger.info(
+            f"Transcribed {media.duration:.1f}s of audio for {file_id} with "
+            f"{engine.name} in {transcribe_span.duration:.2f} seconds "
+            f"({len(transcript.segments)} utterances)"
+        )
+    TRANSCRIPTS.inc(source="transcribed")
+    await store.put_transcript(
+        TranscriptRecord(
+            file_id=file_id,
+            engine=engine.name,
+            segments=[asdict(segment) for segment in transcript.segments],
+            created_at=time.time(),
+            language=transcript.language,
+        )
+    )
+    return transcript
+
+
+async def extract_keyframes(
+    source: Path, times: list[float], settings: Settings
+) -> list[tuple[float, bytes]]:
+    if not times:
+        return []
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+        with span("transcript.keyframes", frames=len(times)):
+            await _run(
+                build_keyframe_command(str(source), times, temp_dir),
+                "transcript_keyframes",
+                settings,
+            )
+        return [
+            (time_, (Path(temp_dir) / f"keyframe-{index}.jpg").read_bytes())
+            for index, time_ in enumerate(times)
+        ]
+
+
+async def prepare_transcript_analysis(
+    file_id: str, settings: Settings
+) -> TranscriptContext:
+    """
+    アップロード済みの動画の文字起こし・候補セグメント・代表フレーム
+
+    Raises:
+        FileNotFoundError: アップロードされた動画が見つからない場合
+        ImportError: 音声認識エンジンがインストールされていない場合
+    """
+    # モデルを読み込めない場合は動画をダウンロードする前に失敗させる
+    get_speech_engine(settings)
+    bucket = storage.Client().bucket(settings.gcs_bucket_name)
+    blob = find_upload_blob(bucket, file_id, settings)
+    if blob is None:
+        msg = f"Input file not found in GCS for fileId: {file_id}"
+        raise FileNotFoundError(msg)
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as temp_dir:
+        source = Path(temp_dir) / Path(blob.name).name
+        with span("transcript.download", blob=blob.name) as download_span:
+            size = await download_blob(blob, source, settings)
+            download_span.set_attribute("bytes", size)
+        media = await probe_media(str(source))
+        transcript = await transcribe_video(file_id, source, media, settings)
+        keyframes = await extract_keyframes(
+            source,
+            keyframe_times(media.duration, settings.transcript_keyframes),
+            settings,
+        )
+
+    candidates = candidate_segments(
+        [segment.end for segment in transcript.segments],
+        media.duration,
+        settings.segment_min_seconds,
+        settings.segment_max_seconds,
+    )
+    return TranscriptContext(
+        candidates=candidates,
+        texts=candidate_texts(candidates, transcript.segments),
+        keyframes=keyframes,
+    )
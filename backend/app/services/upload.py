@@ -1,23 +1,150 @@
+from __future__ import annotations
+
+import asyncio
+import base64
 import datetime as dt
 import logging
 from uuid import uuid4
 
-from google.cloud import storage
-
+from app.core.lazy import lazy_import
+from app.core.scheduling import ANONYMOUS_TENANT
 from app.core.settings import Settings, get_settings
+from app.core.telemetry import REGISTRY, span
 from app.models.schemas import SignedUploadUrlRequest, SignedUploadUrlResponse
-from app.services.gcs_utils import generate_signed_url
+from app.services.gcs_utils import find_upload_blob, generate_signed_url
+from app.services.library import record_upload
+from app.store import get_store
+
+storage = lazy_import("google.cloud.storage")
 
 logger = logging.getLogger(__name__)
 
+DEDUPLICATED = REGISTRY.counter(
+    "uploads_deduplicated_total",
+    "Upload requests answered with an existing video of the same content",
+)
+DEDUPLICATED_BYTES = REGISTRY.counter(
+    "upload_dedup_bytes_saved_total",
+    "Bytes not uploaded thanks to content-hash deduplication",
+)
+
+
+async def find_duplicate(
+    bucket: storage.Bucket,
+    request: SignedUploadUrlRequest,
+    settings: Settings,
+    tenant: str,
+) -> str | None:
+    """
+    テナントの動画のうち、ハッシュとサイズが一致する照合済みの動画の fileId
+
+    他のテナントの動画は返さない（ハッシュとサイズを知っているだけで他のテナントの
+    fileId を得られないようにする）。
+    ストアに記録があってもオブジェクトが削除されていれば使わない
+    （記録の照合済みを取り消す）。ストアの障害時は重複なしとして扱う。
+    """
+    if request.contentHash is None:
+        return None
+    store = get_store()
+    try:
+        video = await store.find_video_by_content(
+            request.contentHash.lower(), request.fileSize, tenant=tenant
+        )
+        if video is None:
+            return None
+        with span("upload.dedup.locate", file_id=video.file_id):
+            blob = find_upload_blob(bucket, video.file_id, settings)
+        if blob is None:
+            logger.info(f"Duplicate {video.file_id} is gone from GCS; uploading again")
+            await store.set_content_verified(video.file_id, False)
+            return None
+    except Exception as e:
+        logger.warning(f"Failed to look up duplicate uploads: {e!s}")
+        return None
+    return video.file_id
+
+
+def _remote_hash(blob: storage.Blob, algorithm: str) -> str | None:
+    """GCSが計算したハッシュ（16進）。複合オブジェクトなどで無ければ None"""
+    value = blob.md5_hash if algorithm == "md5" else blob.crc32c
+    if not value:
+        return None
+    return base64.b64decode(value).hex()
+
+
+async def _unverified_hash(file_id: str) -> str | None:
+    """申告されたまま照合されていないハッシュ（なければ None）"""
+    try:
+        video = await get_store().get_video(file_id)
+    except Exception as e:
+        logger.warning(f"Failed to read upload record {file_id}: {e!s}")
+        return None
+    if video is None or video.content_verified:
+        return None
+    return video.content_hash
+
+
+async def verify_upload_hash(file_id: str, blob: storage.Blob) -> None:
+    """
+    申告されたハッシュをアップロードされたオブジェクトと照合する
+
+    一致すれば以降のアップロードの重複排除に使う。
+    GCSがハッシュを持たない場合は照合せず、重複排除の対象にしない。
+
+    Raises:
+        ValueError: オブジェクトが申告されたハッシュと一致しない場合
+    """
+    content_hash = await _unverified_hash(file_id)
+    if content_hash is None:
+        return
+
+    store = get_store()
+    algorithm, expected = content_hash.split(":", 1)
+    with span("upload.verify_hash", algorithm=algorithm):
+        await asyncio.to_thread(blob.reload)
+        actual = _remote_hash(blob, algorithm)
+    if actual is None:
+        logger.info(f"No {algorithm} for {blob.name}; {file_id} is not deduplicated")
+        return
+    if actual != expected:
+        await store.set_content_verified(file_id, False)
+        msg = (
+            f"Uploaded object does not match contentHash for fileId: {file_id} "
+            f"(expected {algorithm}:{expected}, got {algorithm}:{actual})"
+        )
+        raise ValueError(msg)
+    await store.set_content_verified(file_id, True)
+
+
+async def verify_uploaded_content(file_id: str, settings: Settings) -> None:
+    """
+    取り込み（/api/upload/{file_id}/complete）を経ずに解析される動画のハッシュを照合する
+
+    署名付きURLへのアップロード後にすぐ解析する場合もここで照合済みになり、
+    以降の同じ内容のアップロードを重複排除できる。一致しない場合は申告された
+    ハッシュを消すだけで、解析は続ける。
+    """
+    if await _unverified_hash(file_id) is None:
+        return
+    try:
+        bucket = storage.Client().bucket(settings.gcs_bucket_name)
+        blob = await asyncio.to_thread(find_upload_blob, bucket, file_id, settings)
+        if blob is not None:
+            await verify_upload_hash(file_id, blob)
+    except Exception as e:
+        logger.warning(f"Could not verify the content hash of {file_id}: {e!s}")
+
 
 async def init_upload_service(
     request: SignedUploadUrlRequest,
     settings: Settings | None = None,
+    tenant: str = ANONYMOUS_TENANT,
 ) -> SignedUploadUrlResponse:
     """
     動画アップロードの初期化処理
     Google Cloud Storageの署名付きURLを生成する
+    contentHash が同じテナントの照合済みの動画と一致する場合は、
+    署名付きURLの代わりにその fileId を返す
     """
     # Get settings if not provided
     if settings is None:
@@ -63,6 +190,14 @@ async def init_upload_service(
         storage_client = storage.Client()
         bucket = storage_client.bucket(settings.gcs_bucket_name)
 
+        # 同じ内容の動画がアップロード済みなら、その fileId を返してアップロードを省く
+        duplicate = await find_duplicate(bucket, request, settings, tenant)
+        if duplicate is not None:
+            logger.info(f"Deduplicated upload of {request.fileName} as {duplicate}")
+            DEDUPLICATED.inc()
+            DEDUPLICATED_BYTES.inc(request.fileSize)
+            return SignedUploadUrlResponse(fileId=duplicate, deduplicated=True)
+
         # Blobのパスを作成
         blob_name = f"{settings.gcs_uploads_prefix}{file_id}.{file_extension}"
         blob = bucket.blob(blob_name)
@@ -86,6 +221,8 @@ async def init_upload_service(
         logger.info(f"Content-Type: {content_type}")
         logger.debug(f"Signed URL: {signed_url}")
 
+        await record_upload(file_id, request, tenant)
+
         return SignedUploadUrlResponse(uploadUrl=signed_url, fileId=file_id)
 
     except Exception as e:
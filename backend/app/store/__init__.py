@@ -0,0 +1,99 @@
+"""
+Persistent store for uploads, analyses and generated clips
+
+The backend is selected by the scheme of ``DATABASE_URL``
+(``sqlite:///path/to/videos.db`` by default). Additional backends register a
+factory with :func:`register_store_backend`.
+"""
+
+from collections.abc import Callable
+from pathlib import Path
+
+from app.core.settings import Settings
+from app.store.base import (
+    AnalysisRecord,
+    ClipRecord,
+    ContextCacheRecord,
+    FingerprintRecord,
+    HighlightQuery,
+    HighlightRecord,
+    Page,
+    TenantUsageRecord,
+    TranscriptRecord,
+    VideoRecord,
+    VideoStore,
+)
+from app.store.sqlite import SQLiteVideoStore
+
+StoreFactory = Callable[[str, Settings], VideoStore]
+
+_BACKENDS: dict[str, StoreFactory] = {}
+_store: VideoStore | None = None
+
+
+def register_store_backend(scheme: str, factory: StoreFactory) -> None:
+    """URLスキームに対応するストアの生成関数を登録する"""
+    _BACKENDS[scheme] = factory
+
+
+def _sqlite_factory(url: str, _settings: Settings) -> VideoStore:
+    path = url.removeprefix("sqlite://")
+    # sqlite:///relative -> "/relative" ではなく "relative"、sqlite:////abs -> "/abs"
+    path = path.removeprefix("/") if path != "/:memory:" else ":memory:"
+    return SQLiteVideoStore(path or ":memory:")
+
+
+register_store_backend("sqlite", _sqlite_factory)
+
+
+def database_url(settings: Settings) -> str:
+    if settings.database_url:
+        return settings.database_url
+    return f"sqlite:///{Path(settings.storage_root) / 'videos.db'}"
+
+
+def create_store(settings: Settings) -> VideoStore:
+    url = database_url(settings)
+    scheme = url.split("://", 1)[0]
+    if scheme not in _BACKENDS:
+        msg = f"Unsupported DATABASE_URL scheme: {scheme}"
+        raise ValueError(msg)
+    return _BACKENDS[scheme](url, settings)
+
+
+def get_store(settings: Settings | None = None) -> VideoStore:
+    """プロセス共有のストア（初回呼び出し時に生成する）"""
+    global _store  # noqa: PLW0603
+    if _store is None:
+        if settings is None:
+            from app.core.settings import get_settings  # noqa: PLC0415
+
+            settings = get_settings()
+        _store = create_store(settings)
+    return _store
+
+
+def set_store(store: VideoStore | None) -> None:
+    """共有ストアを差し替える（テスト・ベンチマーク用）"""
+    global _store  # noqa: PLW0603
+    _store = store
+
+
+__all__ = [
+    "AnalysisRecord",
+    "ClipRecord",
+    "ContextCacheRecord",
+    "FingerprintRecord",
+    "HighlightQuery",
+    "HighlightRecord",
+    "Page",
+    "SQLiteVideoStore",
+    "TenantUsageRecord",
+    "TranscriptRecord",
+    "VideoRecord",
+    "VideoStore",
+    "create_store",
+    "get_store",
+    "register_store_backend",
+    "set_store",
+]
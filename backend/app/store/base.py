@@ -0,0 +1,317 @@
+"""
+Storage-agnostic interface of the video / analysis store
+"""
+
+import base64
+import json
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Generic, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class VideoRecord:
+    file_id: str
+    file_name: str
+    content_type: str
+    file_size: int
+    created_at: float
+    duration: float | None = None
+    width: int | None = None
+    height: int | None = None
+    # アップロード時に申告された内容のハッシュ（"md5:<hex>" など）
+    content_hash: str | None = None
+    # アップロード後のオブジェクトと照合済みか（照合済みのものだけを重複排除に使う）
+    content_verified: bool = False
+    # アップロードしたテナント（重複排除は同じテナントの動画だけ）
+    tenant: str | None = None
+
+
+@dataclass
+class HighlightRecord:
+    id: int
+    analysis_id: int
+    file_id: str
+    start: float
+    end: float
+    title: str
+    description: str
+    score: float
+    created_at: float = 0.0
+
+
+@dataclass
+class HighlightQuery:
+    """ハイライト検索の条件（すべて AND で絞り込む）"""
+
+    text: str = ""
+    file_id: str | None = None
+    min_score: float | None = None
+    max_score: float | None = None
+    # 解析日時（UNIX時刻）の範囲
+    since: float | None = None
+    until: float | None = None
+
+
+@dataclass
+class AnalysisRecord:
+    id: int
+    file_id: str
+    provider: str
+    model: str
+    prompt_version: str
+    created_at: float
+    highlights: list[HighlightRecord] = field(default_factory=list)
+
+
+@dataclass
+class ClipRecord:
+    file_id: str
+    kind: str
+    blob_name: str
+    params: dict[str, Any]
+    created_at: float
+    id: int | None = None
+
+
+@dataclass
+class ContextCacheRecord:
+    """Gemini のコンテキストキャッシュ（動画のトークン）の登録情報"""
+
+    name: str
+    file_id: str
+    model: str
+    token_count: int
+    created_at: float
+    expires_at: float
+    hits: int = 0
+    # キャッシュから読まれた入力トークンの累計
+    cached_tokens: int = 0
+
+
+@dataclass
+class TenantUsageRecord:
+    """テナントの1日（UTC）の資源使用量"""
+
+    tenant: str
+    day: str
+    model_seconds: float = 0.0
+    ffmpeg_cpu_seconds: float = 0.0
+    egress_bytes: int = 0
+    jobs: int = 0
+    prerender_clips: int = 0
+
+
+@dataclass
+class TranscriptRecord:
+    """音声認識の結果（発話ごとの {start, end, text}）"""
+
+    file_id: str
+    engine: str
+    segments: list[dict[str, Any]]
+    created_at: float
+    # 認識された言語（分からなければ空文字）
+    language: str = ""
+
+
+@dataclass
+class FingerprintRecord:
+    """動画の1秒ごとの知覚ハッシュ（64ビットの差分ハッシュ）"""
+
+    file_id: str
+    hashes: list[int]
+    created_at: float
+
+
+@dataclass
+class Page(Generic[T]):
+    items: list[T]
+    next_cursor: str | None = None
+
+
+def encode_cursor(*values: Any) -> str:
+    """キーセットページングのカーソル（最後に返した行のソートキー）"""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list[Any]:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, UnicodeDecodeError):
+        msg = "Invalid cursor"
+        raise ValueError(msg) from None
+    if not isinstance(values, list):
+        msg = "Invalid cursor"
+        raise ValueError(msg)
+    return values
+
+
+class VideoStore(ABC):
+    """
+    アップロード動画・解析結果・生成クリップの永続化
+
+    実装は ``app.store.register_store_backend`` で URL スキームごとに登録する。
+    一覧系はキーセットページング（``Page.next_cursor``）で、インデックス順に読む。
+    """
+
+    @abstractmethod
+    async def upsert_video(self, video: VideoRecord) -> None: ...
+
+    @abstractmethod
+    async def update_video_metadata(
+        self, file_id: str, *, duration: float, width: int, height: int
+    ) -> None: ...
+
+    @abstractmethod
+    async def get_video(self, file_id: str) -> VideoRecord | None: ...
+
+    @abstractmethod
+    async def find_video_by_content(
+        self, content_hash: str, file_size: int, *, tenant: str
+    ) -> VideoRecord | None:
+        """テナントの動画のうち、ハッシュとサイズが一致する照合済みのもの（最も古いもの）"""
+
+    @abstractmethod
+    async def set_content_verified(self, file_id: str, verified: bool) -> None:
+        """ハッシュの照合結果を記録する（一致しなければ申告されたハッシュを消す）"""
+
+    @abstractmethod
+    async def list_videos(
+        self, limit: int = 20, cursor: str | None = None
+    ) -> Page[VideoRecord]: ...
+
+    @abstractmethod
+    async def add_analysis(
+        self,
+        file_id: str,
+        *,
+        provider: str,
+        model: str,
+        prompt_version: str,
+        highlights: list[dict[str, Any]],
+        created_at: float | None = None,
+    ) -> AnalysisRecord:
+        """解析結果を追加し、その動画の最新の解析とする（created_at の既定は現在時刻）"""
+
+    @abstractmethod
+    async def list_analyses(self, file_id: str) -> list[AnalysisRecord]:
+        """解析結果を新しい順に返す"""
+
+    @abstractmethod
+    async def find_analysis(
+        self, file_id: str, *, model: str, prompt_version: str
+    ) -> AnalysisRecord | None:
+        """同じモデル・プロンプトでの最新の解析結果"""
+
+    @abstractmethod
+    async def top_highlights(
+        self,
+        limit: int = 20,
+        cursor: str | None = None,
+        *,
+        file_id: str | None = None,
+        min_score: float | None = None,
+    ) -> Page[HighlightRecord]:
+        """各動画の最新の解析に含まれるハイライトをスコア順に返す"""
+
+    @abstractmethod
+    async def search_highlights(
+        self, query: HighlightQuery, limit: int = 20, cursor: str | None = None
+    ) -> Page[HighlightRecord]:
+        """
+        各動画の最新の解析に含まれるハイライトを条件で絞り込み、スコア順に返す
+
+        ``query.text`` は空白区切りの語をすべてタイトルか説明に含むものに一致する。
+        """
+
+    @abstractmethod
+    async def get_highlights(self, ids: list[int]) -> list[HighlightRecord]:
+        """指定IDのうち、各動画の最新の解析に含まれるハイライト（順不同）"""
+
+    @abstractmethod
+    async def add_clip(self, clip: ClipRecord) -> ClipRecord: ...
+
+    @abstractmethod
+    async def list_clips(self, file_id: str) -> list[ClipRecord]: ...
+
+    @abstractmethod
+    async def put_context_cache(self, cache: ContextCacheRecord) -> None:
+        """キャッシュを登録する（同じ名前なら置き換える）"""
+
+    @abstractmethod
+    async def find_context_cache(
+        self, file_id: str, *, model: str, valid_until: float
+    ) -> ContextCacheRecord | None:
+        """``valid_until`` より後まで有効な、その動画・モデルの最新のキャッシュ"""
+
+    @abstractmethod
+    async def record_context_cache_use(
+        self, name: str, *, cached_tokens: int, expires_at: float
+    ) -> None:
+        """キャッシュの利用回数・読まれたトークン数・有効期限を更新する"""
+
+    @abstractmethod
+    async def list_context_caches(
+        self, file_id: str | None = None
+    ) -> list[ContextCacheRecord]:
+        """登録済みのキャッシュを新しい順に返す"""
+
+    @abstractmethod
+    async def delete_context_caches(
+        self, *, names: list[str] | None = None, expired_before: float | None = None
+    ) -> None:
+        """指定した名前、または ``expired_before`` までに期限切れのキャッシュを削除する"""
+
+    @abstractmethod
+    async def add_tenant_usage(
+        self,
+        tenant: str,
+        day: str,
+        *,
+        model_seconds: float,
+        ffmpeg_cpu_seconds: float,
+        egress_bytes: int,
+    ) -> TenantUsageRecord:
+        """テナントのその日の使用量に加算し、加算後の値を返す"""
+
+    @abstractmethod
+    async def get_tenant_usage(self, tenant: str, day: str) -> TenantUsageRecord:
+        """テナントのその日の使用量（記録がなければ0）"""
+
+    @abstractmethod
+    async def take_prerender_clip(self, tenant: str, day: str, limit: int) -> bool:
+        """
+        テナントのその日の先行の切り出し数が limit 未満なら1つ数える
+
+        Returns:
+            数えた場合は True、上限に達していた場合は False
+        """
+
+    @abstractmethod
+    async def put_transcript(self, transcript: TranscriptRecord) -> None:
+        """文字起こしを保存する（同じ動画・エンジンなら置き換える）"""
+
+    @abstractmethod
+    async def get_transcript(
+        self, file_id: str, engine: str
+    ) -> TranscriptRecord | None:
+        """その動画・エンジンの保存済みの文字起こし"""
+
+    @abstractmethod
+    async def put_fingerprint(self, fingerprint: FingerprintRecord) -> None:
+        """知覚ハッシュを保存し、近い動画の検索用に索引する（同じ動画なら置き換える）"""
+
+    @abstractmethod
+    async def get_fingerprint(self, file_id: str) -> FingerprintRecord | None:
+        """その動画の保存済みの知覚ハッシュ"""
+
+    @abstractmethod
+    async def find_fingerprint_candidates(
+        self, file_id: str, limit: int = 5
+    ) -> list[str]:
+        """索引の帯を共有する秒の多い順に、ほかの動画の fileId"""
+
+    async def close(self) -> None:  # noqa: B027
+        """接続などを解放する"""
@@ -0,0 +1,39 @@
+"""
+Banding of perceptual frame hashes for the near-duplicate index
+
+Each second of video is summarized by a 64-bit difference hash. Re-encodes
+flip a few bits, so exact-hash lookups miss; instead the hash is split into
+four 16-bit bands and every band is indexed. Two frames within a Hamming
+distance of three always share at least one band, so a band hit finds
+candidate videos, and the full hashes are compared afterwards.
+"""
+
+import struct
+
+HASH_BITS = 64
+BAND_BITS = 16
+BANDS = HASH_BITS // BAND_BITS
+_BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def hash_bands(value: int) -> list[int]:
+    """
+    ハッシュの帯ごとの索引キー（帯の番号を上位ビットに含める）
+
+    一様なフレーム（黒画面など）のハッシュ 0 はどの動画にも現れるため索引しない。
+    """
+    if value == 0:
+        return []
+    return [
+        (band << BAND_BITS) | ((value >> (band * BAND_BITS)) & _BAND_MASK)
+        for band in range(BANDS)
+    ]
+
+
+def pack_hashes(hashes: list[int]) -> bytes:
+    """1秒8バイトのビッグエンディアンの列にする"""
+    return struct.pack(f">{len(hashes)}Q", *hashes)
+
+
+def unpack_hashes(data: bytes) -> list[int]:
+    return list(struct.unpack(f">{len(data) // 8}Q", data))
@@ -0,0 +1,868 @@
+"""
+SQLite implementation of the video store
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any, TypeVar
+
+from app.store.base import (
+    AnalysisRecord,
+    ClipRecord,
+    ContextCacheRecord,
+    FingerprintRecord,
+    HighlightQuery,
+    HighlightRecord,
+    Page,
+    TenantUsageRecord,
+    TranscriptRecord,
+    VideoRecord,
+    VideoStore,
+    decode_cursor,
+    encode_cursor,
+)
+from app.store.fingerprints import hash_bands, pack_hashes, unpack_hashes
+from app.store.text import bigrams, query_words, search_text
+
+T = TypeVar("T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    file_id TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    file_size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    duration REAL,
+    width INTEGER,
+    height INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_videos_created_at
+    ON videos (created_at DESC, file_id DESC);
+
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_id TEXT NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_file
+    ON analyses (file_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_analyses_version
+    ON analyses (file_id, model, prompt_version, created_at DESC);
+
+CREATE TABLE IF NOT EXISTS highlights (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    analysis_id INTEGER NOT NULL REFERENCES analyses (id),
+    file_id TEXT NOT NULL,
+    start REAL NOT NULL,
+    "end" REAL NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL,
+    score REAL NOT NULL,
+    current INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS idx_highlights_analysis
+    ON highlights (analysis_id);
+CREATE INDEX IF NOT EXISTS idx_highlights_top
+    ON highlights (score DESC, id DESC) WHERE current = 1;
+CREATE INDEX IF NOT EXISTS idx_highlights_file_top
+    ON highlights (file_id, score DESC, id DESC) WHERE current = 1;
+
+CREATE TABLE IF NOT EXISTS clips (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    blob_name TEXT NOT NULL,
+    params TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_clips_file
+    ON clips (file_id, created_at DESC);
+"""
+
+HIGHLIGHT_COLUMNS = (
+    'id, analysis_id, file_id, start, "end", title, description, score, created_at'
+)
+
+# これより多くのハイライトに現れる語は転置索引から引かず、スコア順の走査中に
+# 部分一致で絞り込む（該当が多いので上位はすぐ見つかる）
+MAX_DRIVING_POSTINGS = 5000
+
+
+def _add_search_index(conn: sqlite3.Connection) -> None:
+    """ハイライト検索用の列・文字bigramの転置索引・解析日時の索引を追加する"""
+    for statement in (
+        "ALTER TABLE highlights ADD COLUMN created_at REAL NOT NULL DEFAULT 0",
+        "ALTER TABLE highlights ADD COLUMN search_text TEXT NOT NULL DEFAULT ''",
+        """
+        CREATE TABLE highlight_terms (
+            term TEXT NOT NULL,
+            highlight_id INTEGER NOT NULL,
+            PRIMARY KEY (term, highlight_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX idx_highlight_terms_highlight ON highlight_terms (highlight_id)",
+        """
+        CREATE INDEX idx_highlights_recent
+            ON highlights (created_at DESC) WHERE current = 1
+        """,
+        """
+        UPDATE highlights SET created_at = (
+            SELECT created_at FROM analyses WHERE analyses.id = analysis_id
+        )
+        """,
+    ):
+        conn.execute(statement)
+    rows = conn.execute(
+        "SELECT id, title, description FROM highlights WHERE current = 1"
+    ).fetchall()
+    for row in rows:
+        _index_highlight(conn, row["id"], row["title"], row["description"])
+
+
+def _add_context_caches(conn: sqlite3.Connection) -> None:
+    """Gemini のコンテキストキャッシュの登録表を追加する"""
+    for statement in (
+        """
+        CREATE TABLE IF NOT EXISTS context_caches (
+            name TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            model TEXT NOT NULL,
+            token_count INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            cached_tokens INTEGER NOT NULL DEFAULT 0
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_context_caches_file
+            ON context_caches (file_id, model, expires_at DESC)
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_context_caches_expires "
+        "ON context_caches (expires_at)",
+    ):
+        conn.execute(statement)
+
+
+def _add_tenant_usage(conn: sqlite3.Connection) -> None:
+    """テナントごと・日ごとの資源使用量の表を追加する"""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS tenant_usage (
+            tenant TEXT NOT NULL,
+            day TEXT NOT NULL,
+            model_seconds REAL NOT NULL DEFAULT 0,
+            ffmpeg_cpu_seconds REAL NOT NULL DEFAULT 0,
+            egress_bytes INTEGER NOT NULL DEFAULT 0,
+            jobs INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (tenant, day)
+        ) WITHOUT ROWID
+        """
+    )
+
+
+def _add_transcripts(conn: sqlite3.Connection) -> None:
+    """動画ごと・音声認識エンジンごとの文字起こしの表を追加する"""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS transcripts (
+            file_id TEXT NOT NULL,
+            engine TEXT NOT NULL,
+            language TEXT NOT NULL DEFAULT '',
+            segments TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (file_id, engine)
+        )
+        """
+    )
+
+
+def _add_content_hash(conn: sqlite3.Connection) -> None:
+    """アップロードの重複排除用に内容のハッシュの列と索引を追加する"""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(videos)")}
+    if "content_hash" not in columns:
+        conn.execute("ALTER TABLE videos ADD COLUMN content_hash TEXT")
+    if "content_verified" not in columns:
+        conn.execute(
+            "ALTER TABLE videos ADD COLUMN content_verified INTEGER NOT NULL DEFAULT 0"
+        )
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_videos_content
+            ON videos (content_hash, file_size, created_at) WHERE content_verified = 1
+        """
+    )
+
+
+def _add_fingerprints(conn: sqlite3.Connection) -> None:
+    """知覚ハッシュの表と、近い動画を探すための帯の索引を追加する"""
+    for statement in (
+        """
+        CREATE TABLE IF NOT EXISTS fingerprints (
+            file_id TEXT PRIMARY KEY,
+            hashes BLOB NOT NULL,
+            created_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS fingerprint_bands (
+            band INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            second INTEGER NOT NULL,
+            PRIMARY KEY (band, file_id, second)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fingerprint_bands_file "
+        "ON fingerprint_bands (file_id)",
+    ):
+        conn.execute(statement)
+
+
+def _add_prerender_clips(conn: sqlite3.Connection) -> None:
+    """テナントの日ごとの使用量に先行の切り出し数の列を追加する"""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(tenant_usage)")}
+    if "prerender_clips" not in columns:
+        conn.execute(
+            "ALTER TABLE tenant_usage "
+            "ADD COLUMN prerender_clips INTEGER NOT NULL DEFAULT 0"
+        )
+
+
+def _add_video_tenant(conn: sqlite3.Connection) -> None:
+    """アップロードしたテナントの列を追加し、重複排除の索引をテナントごとにする"""
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(videos)")}
+    if "tenant" not in columns:
+        conn.execute("ALTER TABLE videos ADD COLUMN tenant TEXT")
+    conn.execute("DROP INDEX IF EXISTS idx_videos_content")
+    conn.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_videos_tenant_content
+            ON videos (tenant, content_hash, file_size, created_at)
+            WHERE content_verified = 1
+        """
+    )
+
+
+# user_version ごとのマイグレーション（MIGRATIONS[i] で i+1 になる）
+MIGRATIONS: list[Callable[[sqlite3.Connection], None]] = [
+    _add_search_index,
+    _add_context_caches,
+    _add_tenant_usage,
+    _add_transcripts,
+    _add_content_hash,
+    _add_fingerprints,
+    _add_prerender_clips,
+    _add_video_tenant,
+]
+
+
+def _index_highlight(
+    conn: sqlite3.Connection, highlight_id: int, title: str, description: str
+) -> None:
+    conn.execute(
+        "UPDATE highlights SET search_text = ? WHERE id = ?",
+        (search_text(title, description), highlight_id),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO highlight_terms (term, highlight_id) VALUES (?, ?)",
+        [(term, highlight_id) for term in bigrams(f"{title}\n{description}")],
+    )
+
+
+def _video(row: sqlite3.Row) -> VideoRecord:
+    return VideoRecord(
+        **{**dict(row), "content_verified": bool(row["content_verified"])}
+    )
+
+
+def _highlight(row: sqlite3.Row) -> HighlightRecord:
+    return HighlightRecord(**dict(row))
+
+
+def _analysis(row: sqlite3.Row) -> AnalysisRecord:
+    return AnalysisRecord(**dict(row))
+
+
+def _rarest_term(conn: sqlite3.Connection, terms: set[str]) -> str | None:
+    """
+    候補を絞り込む語（出現数が最も少ないbigram）
+
+    どの語も多くのハイライトに現れる場合は None（索引を使わずスコア順に走査する）。
+    残りの語は部分一致の検証で確かめる。
+    """
+    best: tuple[int, str] | None = None
+    for term in terms:
+        count = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM highlight_terms WHERE term = ? "
+            "LIMIT ?)",
+            (term, MAX_DRIVING_POSTINGS + 1),
+        ).fetchone()[0]
+        if best is None or count < best[0]:
+            best = (count, term)
+    if best is None or best[0] > MAX_DRIVING_POSTINGS:
+        return None
+    return best[1]
+
+
+class SQLiteVideoStore(VideoStore):
+    """
+    SQLiteによるストア（ローカル開発・単一インスタンス向け）
+
+    接続は1本を共有し、ロックで直列化したうえでスレッドで実行する。
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = str(path)
+        if self.path != ":memory:":
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+
+    def _migrate(self) -> None:
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            # DDLも含めて1つのトランザクションで適用する
+            self._conn.execute("BEGIN")
+            try:
+                migration(self._conn)
+                self._conn.execute(f"PRAGMA user_version = {target}")
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._conn.commit()
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], T]) -> T:
+        def locked() -> T:
+            with self._lock, self._conn:
+                return fn(self._conn)
+
+        return await asyncio.to_thread(locked)
+
+    async def upsert_video(self, video: VideoRecord) -> None:
+        def run(conn: sqlite3.Connection) -> None:
+            conn.execute(
+                """
+                INSERT INTO videos (file_id, file_name, content_type, file_size,
+                                    created_at, duration, width, height,
+                                    content_hash, content_verified, tenant)
+                VALUES (:file_id, :file_name, :content_type, :file_size,
+                        :created_at, :duration, :width, :height,
+                        :content_hash, :content_verified, :tenant)
+                ON CONFLICT (file_id) DO UPDATE SET
+                    file_name = excluded.file_name,
+                    content_type = excluded.content_type,
+                    file_size = excluded.file_size
+                """,
+                video.__dict__,
+            )
+
+        await self._run(run)
+
+    async def update_video_metadata(
+        self, file_id: str, *, duration: float, width: int, height: int
+    ) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "UPDATE videos SET duration = ?, width = ?, height = ? WHERE file_id = ?",
+                (duration, width, height, file_id),
+            )
+        )
+
+    async def get_video(self, file_id: str) -> VideoRecord | None:
+        row = await self._run(
+            lambda conn: conn.execute(
+                "SELECT * FROM videos WHERE file_id = ?", (file_id,)
+            ).fetchone()
+        )
+        return _video(row) if row else None
+
+    async def find_video_by_content(
+        self, content_hash: str, file_size: int, *, tenant: str
+    ) -> VideoRecord | None:
+        row = await self._run(
+            lambda conn: conn.execute(
+                "SELECT * FROM videos WHERE tenant = ? AND content_hash = ? "
+                "AND file_size = ? AND content_verified = 1 "
+                "ORDER BY created_at LIMIT 1",
+                (tenant, content_hash, file_size),
+            ).fetchone()
+        )
+        return _video(row) if row else None
+
+    async def set_content_verified(self, file_id: str, verified: bool) -> None:
+        if verified:
+            sql = "UPDATE videos SET content_verified = 1 WHERE file_id = ?"
+        else:
+            sql = (
+                "UPDATE videos SET content_hash = NULL, content_verified = 0 "
+                "WHERE file_id = ?"
+            )
+        await self._run(lambda conn: conn.execute(sql, (file_id,)))
+
+    async def list_videos(
+        self, limit: int = 20, cursor: str | None = None
+    ) -> Page[VideoRecord]:
+        def run(conn: sqlite3.Connection) -> list[sqlite3.Row]:
+            if cursor is None:
+                return conn.execute(
+                    "SELECT * FROM videos ORDER BY created_at DESC, file_id DESC "
+                    "LIMIT ?",
+                    (limit + 1,),
+                ).fetchall()
+            created_at, file_id = decode_cursor(cursor)
+            return conn.execute(
+                "SELECT * FROM videos WHERE (created_at, file_id) < (?, ?) "
+                "ORDER BY created_at DESC, file_id DESC LIMIT ?",
+                (created_at, file_id, limit + 1),
+            ).fetchall()
+
+        rows = await self._run(run)
+        videos = [_video(row) for row in rows[:limit]]
+        next_cursor = (
+            encode_cursor(videos[-1].created_at, videos[-1].file_id)
+            if len(rows) > limit
+            else None
+        )
+        return Page(videos, next_cursor)
+
+    async def add_analysis(
+        self,
+        file_id: str,
+        *,
+        provider: str,
+        model: str,
+        prompt_version: str,
+        highlights: list[dict[str, Any]],
+        created_at: float | None = None,
+    ) -> AnalysisRecord:
+        if created_at is None:
+            created_at = time.time()
+
+        def run(conn: sqlite3.Connection) -> AnalysisRecord:
+            cursor = conn.execute(
+                "INSERT INTO analyses (file_id, provider, model, prompt_version, "
+                "created_at) VALUES (?, ?, ?, ?, ?)",
+                (file_id, provider, model, prompt_version, created_at),
+            )
+            analysis_id = cursor.lastrowid
+            # 上位ハイライト・検索の対象は各動画の最新の解析のみ
+            conn.execute(
+                "DELETE FROM highlight_terms WHERE highlight_id IN "
+                "(SELECT id FROM highlights WHERE file_id = ? AND current = 1)",
+                (file_id,),
+            )
+            conn.execute(
+                "UPDATE highlights SET current = 0 WHERE file_id = ? AND current = 1",
+                (file_id,),
+            )
+            for h in highlights:
+                highlight_id = conn.execute(
+                    'INSERT INTO highlights (analysis_id, file_id, start, "end", '
+                    "title, description, score, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        analysis_id,
+                        file_id,
+                        h["start"],
+                        h["end"],
+                        h["title"],
+                        h["description"],
+                        h["score"],
+                        created_at,
+                    ),
+                ).lastrowid
+                _index_highlight(conn, highlight_id, h["title"], h["description"])
+            return self._load_analysis(conn, analysis_id)
+
+        return await self._run(run)
+
+    @staticmethod
+    def _load_analysis(conn: sqlite3.Connection, analysis_id: int) -> AnalysisRecord:
+        analysis = _analysis(
+            conn.execute(
+                "SELECT id, file_id, provider, model, prompt_version, created_at "
+                "FROM analyses WHERE id = ?",
+                (analysis_id,),
+            ).fetchone()
+        )
+        analysis.highlights = [
+            _highlight(row)
+            for row in conn.execute(
+                f"SELECT {HIGHLIGHT_COLUMNS} FROM highlights "  # noqa: S608
+                "WHERE analysis_id = ? ORDER BY start",
+                (analysis_id,),
+            )
+        ]
+        return analysis
+
+    async def list_analyses(self, file_id: str) -> list[AnalysisRecord]:
+        def run(conn: sqlite3.Connection) -> list[AnalysisRecord]:
+            ids = [
+                row["id"]
+                for row in conn.execute(
+                    "SELECT id FROM analyses WHERE file_id = ? "
+                    "ORDER BY created_at DESC, id DESC",
+                    (file_id,),
+                )
+            ]
+            return [self._load_analysis(conn, analysis_id) for analysis_id in ids]
+
+        return await self._run(run)
+
+    async def find_analysis(
+        self, file_id: str, *, model: str, prompt_version: str
+    ) -> AnalysisRecord | None:
+        def run(conn: sqlite3.Connection) -> AnalysisRecord | None:
+            row = conn.execute(
+                "SELECT id FROM analyses "
+                "WHERE file_id = ? AND model = ? AND prompt_version = ? "
+                "ORDER BY created_at DESC, id DESC LIMIT 1",
+                (file_id, model, prompt_version),
+            ).fetchone()
+            return self._load_analysis(conn, row["id"]) if row else None
+
+        return await self._run(run)
+
+    async def top_highlights(
+        self,
+        limit: int = 20,
+        cursor: str | None = None,
+        *,
+        file_id: str | None = None,
+        min_score: float | None = None,
+    ) -> Page[HighlightRecord]:
+        return await self.search_highlights(
+            HighlightQuery(file_id=file_id, min_score=min_score), limit, cursor
+        )
+
+    async def search_highlights(
+        self, query: HighlightQuery, limit: int = 20, cursor: str | None = None
+    ) -> Page[HighlightRecord]:
+        conditions = ["current = 1"]
+        params: list[Any] = []
+        for column, operator, value in (
+            ("file_id", "=", query.file_id),
+            ("score", ">=", query.min_score),
+            ("score", "<=", query.max_score),
+            ("created_at", ">=", query.since),
+            ("created_at", "<", query.until),
+        ):
+            if value is not None:
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        if cursor is not None:
+            score, highlight_id = decode_cursor(cursor)
+            conditions.append("(score, id) < (?, ?)")
+            params += [score, highlight_id]
+        words = query_words(query.text)
+        for word in words:
+            conditions.append("instr(search_text, ?) > 0")
+            params.append(word)
+        terms = set().union(*(bigrams(word) for word in words))
+
+        def run(conn: sqlite3.Connection) -> list[sqlite3.Row]:
+            where, args = list(conditions), list(params)
+            driving = _rarest_term(conn, terms)
+            if driving is not None:
+                where.append(
+                    "id IN (SELECT highlight_id FROM highlight_terms WHERE term = ?)"
+                )
+                args.append(driving)
+            return conn.execute(
+                f"SELECT {HIGHLIGHT_COLUMNS} FROM highlights "  # noqa: S608
+                f"WHERE {' AND '.join(where)} "
+                "ORDER BY score DESC, id DESC LIMIT ?",
+                [*args, limit + 1],
+            ).fetchall()
+
+        rows = await self._run(run)
+        items = [_highlight(row) for row in rows[:limit]]
+        next_cursor = (
+            encode_cursor(items[-1].score, items[-1].id) if len(rows) > limit else None
+        )
+        return Page(items, next_cursor)
+
+    async def get_highlights(self, ids: list[int]) -> list[HighlightRecord]:
+        if not ids:
+            return []
+        placeholders = ", ".join("?" * len(ids))
+        rows = await self._run(
+            lambda conn: conn.execute(
+                f"SELECT {HIGHLIGHT_COLUMNS} FROM highlights "  # noqa: S608
+                f"WHERE current = 1 AND id IN ({placeholders})",
+                ids,
+            ).fetchall()
+        )
+        return [_highlight(row) for row in rows]
+
+    async def add_clip(self, clip: ClipRecord) -> ClipRecord:
+        def run(conn: sqlite3.Connection) -> int:
+            cursor = conn.execute(
+                "INSERT INTO clips (file_id, kind, blob_name, params, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    clip.file_id,
+                    clip.kind,
+                    clip.blob_name,
+                    json.dumps(clip.params),
+                    clip.created_at,
+                ),
+            )
+            return cursor.lastrowid
+
+        clip.id = await self._run(run)
+        return clip
+
+    async def list_clips(self, file_id: str) -> list[ClipRecord]:
+        rows = await self._run(
+            lambda conn: conn.execute(
+                "SELECT * FROM clips WHERE file_id = ? ORDER BY created_at DESC",
+                (file_id,),
+            ).fetchall()
+        )
+        return [
+            ClipRecord(**{**dict(row), "params": json.loads(row["params"])})
+            for row in rows
+        ]
+
+    async def put_context_cache(self, cache: ContextCacheRecord) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                """
+                INSERT OR REPLACE INTO context_caches
+                    (name, file_id, model, token_count, created_at, expires_at,
+                     hits, cached_tokens)
+                VALUES (:name, :file_id, :model, :token_count, :created_at,
+                        :expires_at, :hits, :cached_tokens)
+                """,
+                cache.__dict__,
+            )
+        )
+
+    async def find_context_cache(
+        self, file_id: str, *, model: str, valid_until: float
+    ) -> ContextCacheRecord | None:
+        row = await self._run(
+            lambda conn: conn.execute(
+                "SELECT * FROM context_caches "
+                "WHERE file_id = ? AND model = ? AND expires_at > ? "
+                "ORDER BY expires_at DESC LIMIT 1",
+                (file_id, model, valid_until),
+            ).fetchone()
+        )
+        return ContextCacheRecord(**dict(row)) if row else None
+
+    async def record_context_cache_use(
+        self, name: str, *, cached_tokens: int, expires_at: float
+    ) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                "UPDATE context_caches SET hits = hits + 1, "
+                "cached_tokens = cached_tokens + ?, expires_at = ? WHERE name = ?",
+                (cached_tokens, expires_at, name),
+            )
+        )
+
+    async def list_context_caches(
+        self, file_id: str | None = None
+    ) -> list[ContextCacheRecord]:
+        def run(conn: sqlite3.Connection) -> list[sqlite3.Row]:
+            if file_id is None:
+                return conn.execute(
+                    "SELECT * FROM context_caches ORDER BY created_at DESC"
+                ).fetchall()
+            return conn.execute(
+                "SELECT * FROM context_caches WHERE file_id = ? "
+                "ORDER BY created_at DESC",
+                (file_id,),
+            ).fetchall()
+
+        return [ContextCacheRecord(**dict(row)) for row in await self._run(run)]
+
+    async def delete_context_caches(
+        self, *, names: list[str] | None = None, expired_before: float | None = None
+    ) -> None:
+        def run(conn: sqlite3.Connection) -> None:
+            if names:
+                conn.executemany(
+                    "DELETE FROM context_caches WHERE name = ?",
+                    [(name,) for name in names],
+                )
+            if expired_before is not None:
+                conn.execute(
+                    "DELETE FROM context_caches WHERE expires_at <= ?",
+                    (expired_before,),
+                )
+
+        await self._run(run)
+
+    async def add_tenant_usage(
+        self,
+        tenant: str,
+        day: str,
+        *,
+        model_seconds: float,
+        ffmpeg_cpu_seconds: float,
+        egress_bytes: int,
+    ) -> TenantUsageRecord:
+        def run(conn: sqlite3.Connection) -> sqlite3.Row:
+            return conn.execute(
+                """
+                INSERT INTO tenant_usage (tenant, day, model_seconds,
+                                          ffmpeg_cpu_seconds, egress_bytes, jobs)
+                VALUES (?, ?, ?, ?, ?, 1)
+                ON CONFLICT (tenant, day) DO UPDATE SET
+                    model_seconds = model_seconds + excluded.model_seconds,
+                    ffmpeg_cpu_seconds =
+                        ffmpeg_cpu_seconds + excluded.ffmpeg_cpu_seconds,
+                    egress_bytes = egress_bytes + excluded.egress_bytes,
+                    jobs = jobs + 1
+                RETURNING *
+                """,
+                (tenant, day, model_seconds, ffmpeg_cpu_seconds, egress_bytes),
+            ).fetchone()
+
+        return TenantUsageRecord(**dict(await self._run(run)))
+
+    async def get_tenant_usage(self, tenant: str, day: str) -> TenantUsageRecord:
+        row = await self._run(
+            lambda conn: conn.execute(
+                "SELECT * FROM tenant_usage WHERE tenant = ? AND day = ?",
+                (tenant, day),
+            ).fetchone()
+        )
+        return TenantUsageRecord(**dict(row)) if row else TenantUsageRecord(tenant, day)
+
+    async def take_prerender_clip(self, tenant: str, day: str, limit: int) -> bool:
+        if limit <= 0:
+            return False
+
+        def run(conn: sqlite3.Connection) -> sqlite3.Row | None:
+            # 上限に達していれば更新せず、行を返さない
+            return conn.execute(
+                """
+                INSERT INTO tenant_usage (tenant, day, prerender_clips)
+                VALUES (?, ?, 1)
+                ON CONFLICT (tenant, day) DO UPDATE SET
+                    prerender_clips = prerender_clips + 1
+                    WHERE prerender_clips < ?
+                RETURNING prerender_clips
+                """,
+                (tenant, day, limit),
+            ).fetchone()
+
+        return await self._run(run) is not None
+
+    async def put_transcript(self, transcript: TranscriptRecord) -> None:
+        await self._run(
+            lambda conn: conn.execute(
+                """
+                INSERT OR REPLACE INTO transcripts
+                    (file_id, engine, language, segments, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (
+                    transcript.file_id,
+                    transcript.engine,
+                    transcript.language,
+                    json.dumps(transcript.segments, ensure_ascii=False),
+                    transcript.created_at,
+                ),
+            )
+        )
+
+    async def get_transcript(
+        self, file_id: str, engine: str
+    ) -> TranscriptRecord | None:
+        row = await self._run(
+            lambda conn: conn.execute(
+                "SELECT * FROM transcripts WHERE file_id = ? AND engine = ?",
+                (file_id, engine),
+            ).fetchone()
+        )
+        if row is None:
+            return None
+        return TranscriptRecord(
+            **{**dict(row), "segments": json.loads(row["segments"])}
+        )
+
+    async def put_fingerprint(self, fingerprint: FingerprintRecord) -> None:
+        def run(conn: sqlite3.Connection) -> None:
+            conn.execute(
+                "INSERT OR REPLACE INTO fingerprints (file_id, hashes, created_at) "
+                "VALUES (?, ?, ?)",
+                (
+                    fingerprint.file_id,
+                    pack_hashes(fingerprint.hashes),
+                    fingerprint.created_at,
+                ),
+            )
+            conn.execute(
+                "DELETE FROM fingerprint_bands WHERE file_id = ?",
+                (fingerprint.file_id,),
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO fingerprint_bands (band, file_id, second) "
+                "VALUES (?, ?, ?)",
+                (
+                    (band, fingerprint.file_id, second)
+                    for second, value in enumerate(fingerprint.hashes)
+                    for band in hash_bands(value)
+                ),
+            )
+
+        await self._run(run)
+
+    async def get_fingerprint(self, file_id: str) -> FingerprintRecord | None:
+        row = await self._run(
+            lambda conn: conn.execute(
+                "SELECT * FROM fingerprints WHERE file_id = ?", (file_id,)
+            ).fetchone()
+        )
+        if row is None:
+            return None
+        return FingerprintRecord(
+            file_id=row["file_id"],
+            hashes=unpack_hashes(row["hashes"]),
+            created_at=row["created_at"],
+        )
+
+    async def find_fingerprint_candidates(
+        self, file_id: str, limit: int = 5
+    ) -> list[str]:
+        rows = await self._run(
+            lambda conn: conn.execute(
+                """
+                SELECT file_id, COUNT(DISTINCT second) AS hits
+                FROM fingerprint_bands
+                WHERE band IN (
+                    SELECT band FROM fingerprint_bands WHERE file_id = ?
+                ) AND file_id != ?
+                GROUP BY file_id
+                ORDER BY hits DESC, file_id
+                LIMIT ?
+                """,
+                (file_id, file_id, limit),
+            ).fetchall()
+        )
+        return [row["file_id"] for row in rows]
+
+    async def close(self) -> None:
+        with self._lock:
+            self._conn.close()
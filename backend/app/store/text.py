@@ -0,0 +1,41 @@
+"""
+Character-bigram tokenization for the highlight full-text index
+
+Japanese titles have no word boundaries, so text is indexed as overlapping
+character bigrams of each run of word characters. A query matches a highlight
+when all bigrams of every query word are present; the candidates are then
+verified by substring match on the normalized text.
+"""
+
+import re
+import unicodedata
+
+_WORD_RUN = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """全角・半角や大文字小文字の違いを吸収する"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def bigrams(text: str) -> set[str]:
+    """
+    単語文字の連続ごとの文字bigram
+
+    1文字だけの連続は索引しない（その検索語は部分一致の検証だけで絞り込む）。
+    """
+    return {
+        run[i : i + 2]
+        for run in _WORD_RUN.findall(normalize(text))
+        for i in range(len(run) - 1)
+    }
+
+
+def query_words(query: str) -> list[str]:
+    """空白区切りの検索語（すべて含むものに一致する）"""
+    return [word for word in normalize(query).split() if word]
+
+
+def search_text(title: str, description: str) -> str:
+    """部分一致の検証に使う正規化済みテキスト"""
+    return f"{normalize(title)}\n{normalize(description)}"
@@ -0,0 +1,273 @@
+"""
+Vector index for semantic highlight search
+
+Vectors are kept in a memory-mapped float32 matrix (``vectors.f32``) next to
+parallel ``int64`` arrays of highlight IDs and video keys. ``meta.json`` holds
+the row count and is written last, so a crash never exposes half-written rows.
+Search is an exact vectorized dot product; at or above ``ann_threshold`` live
+vectors an IVF (inverted file) index built by spherical k-means narrows the
+scan to the lists closest to the query.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+META_NAME = "meta.json"
+INITIAL_CAPACITY = 1024
+# IVFの再構築: 構築後に増えたベクトルがこの割合を超えたら作り直す
+IVF_REBUILD_RATIO = 0.2
+IVF_KMEANS_ITERATIONS = 8
+IVF_TRAINING_SAMPLE = 64
+IVF_NPROBE = 8
+SEARCH_CHUNK_ROWS = 65536
+
+
+def group_key(name: str) -> int:
+    """動画ID などのグループ名を int64 のキーにする"""
+    digest = hashlib.blake2b(name.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+
+@dataclass
+class IVFIndex:
+    centroids: np.ndarray
+    # リストごとの行番号（offsets[i]:offsets[i+1] が i 番目のリスト）
+    rows: np.ndarray
+    offsets: np.ndarray
+    built_count: int
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """スコアの高い順の添字（上位kのみ部分ソート）"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def build_ivf(vectors: np.ndarray, live: np.ndarray, seed: int = 0) -> IVFIndex:
+    """有効な行を球面k-meansで sqrt(n) 個のリストに分ける"""
+    live_rows = np.flatnonzero(live)
+    lists = max(1, int(math.sqrt(len(live_rows))))
+    rng = np.random.default_rng(seed)
+    sample_size = min(len(live_rows), lists * IVF_TRAINING_SAMPLE)
+    sample = vectors[rng.choice(live_rows, sample_size, replace=False)]
+    centroids = sample[rng.choice(sample_size, lists, replace=False)].copy()
+    for _ in range(IVF_KMEANS_ITERATIONS):
+        assignment = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, sample)
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = sums / np.maximum(
+            np.linalg.norm(sums, axis=1, keepdims=True), 1e-12
+        )
+
+    assignment = np.empty(len(live_rows), dtype=np.int64)
+    for start in range(0, len(live_rows), SEARCH_CHUNK_ROWS):
+        chunk = live_rows[start : start + SEARCH_CHUNK_ROWS]
+        assignment[start : start + len(chunk)] = np.argmax(
+            vectors[chunk] @ centroids.T, axis=1
+        )
+    order = np.argsort(assignment, kind="stable")
+    offsets = np.searchsorted(assignment[order], np.arange(lists + 1))
+    return IVFIndex(
+        centroids=centroids.astype(np.float32),
+        rows=live_rows[order],
+        offsets=offsets,
+        built_count=len(vectors),
+    )
+
+
+class VectorIndex:
+    """
+    ハイライトの埋め込みベクトルの索引
+
+    ``path`` が None の場合はメモリ上の配列を使う（テスト用）。
+    行は動画ごとのグループで置き換え、削除した行はIDを -1 にして無効化する。
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None,
+        *,
+        dim: int,
+        model: str,
+        ann_threshold: int = 50_000,
+    ):
+        self.path = Path(path) if path is not None else None
+        self.dim = dim
+        self.model = model
+        self.ann_threshold = ann_threshold
+        self.count = 0
+        self._capacity = 0
+        self._lock = threading.Lock()
+        self._ivf: IVFIndex | None = None
+        self._vectors = np.zeros((0, dim), dtype=np.float32)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._groups = np.zeros(0, dtype=np.int64)
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            self._open()
+        else:
+            self._resize(INITIAL_CAPACITY)
+
+    # --- storage ---
+
+    def _open(self) -> None:
+        meta_path = self.path / META_NAME
+        if meta_path.exists():
+            meta = json.loads(meta_path.read_text())
+            if meta.get("dim") == self.dim and meta.get("model") == self.model:
+                self.count = meta["count"]
+                self._map(meta["capacity"])
+                return
+            logger.warning(
+                f"Vector index at {self.path} was built with {meta.get('model')}; "
+                f"rebuilding for {self.model}"
+            )
+            for name in ("vectors.f32", "ids.i64", "groups.i64"):
+                (self.path / name).unlink(missing_ok=True)
+        self.count = 0
+        self._resize(INITIAL_CAPACITY)
+        self._write_meta()
+
+    def _map(self, capacity: int) -> None:
+        def memmap(name: str, dtype: type, shape: tuple[int, ...]) -> np.memmap:
+            file = self.path / name
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            with file.open("ab") as f:
+                if f.tell() < size:
+                    f.truncate(size)
+            return np.memmap(file, dtype=dtype, mode="r+", shape=shape)
+
+        self._vectors = memmap("vectors.f32", np.float32, (capacity, self.dim))
+        self._ids = memmap("ids.i64", np.int64, (capacity,))
+        self._groups = memmap("groups.i64", np.int64, (capacity,))
+        self._capacity = capacity
+
+    def _resize(self, capacity: int) -> None:
+        if self.path is not None:
+            self._flush()
+            self._map(capacity)
+            return
+        vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+        ids = np.full(capacity, -1, dtype=np.int64)
+        groups = np.zeros(capacity, dtype=np.int64)
+        vectors[: self.count] = self._vectors[: self.count]
+        ids[: self.count] = self._ids[: self.count]
+        groups[: self.count] = self._groups[: self.count]
+        self._vectors, self._ids, self._groups = vectors, ids, groups
+        self._capacity = capacity
+
+    def _flush(self) -> None:
+        for array in (self._vectors, self._ids, self._groups):
+            if isinstance(array, np.memmap):
+                array.flush()
+
+    def _write_meta(self) -> None:
+        if self.path is None:
+            return
+        self._flush()
+        meta = {
+            "dim": self.dim,
+            "model": self.model,
+            "count": self.count,
+            "capacity": self._capacity,
+        }
+        tmp = self.path / f"{META_NAME}.tmp"
+        tmp.write_text(json.dumps(meta))
+        tmp.replace(self.path / META_NAME)
+
+    # --- updates ---
+
+    def replace_group(self, group: str, ids: list[int], vectors: np.ndarray) -> None:
+        """グループ（動画）の行をすべて無効化し、新しいベクトルを追加する"""
+        key = group_key(group)
+        with self._lock:
+            stale = self._groups[: self.count] == key
+            self._ids[: self.count][stale] = -1
+            needed = self.count + len(ids)
+            if needed > self._capacity:
+                capacity = max(INITIAL_CAPACITY, self._capacity)
+                while capacity < needed:
+                    capacity *= 2
+                self._resize(capacity)
+            rows = slice(self.count, needed)
+            self._vectors[rows] = vectors
+            self._ids[rows] = ids
+            self._groups[rows] = key
+            self.count = needed
+            self._write_meta()
+
+    def live_count(self) -> int:
+        return int(np.count_nonzero(self._ids[: self.count] >= 0))
+
+    # --- queries ---
+
+    def vector(self, highlight_id: int) -> np.ndarray | None:
+        rows = np.flatnonzero(self._ids[: self.count] == highlight_id)
+        return np.array(self._vectors[rows[-1]]) if len(rows) else None
+
+    def search(
+        self, query: np.ndarray, k: int, *, exclude_group: str | None = None
+    ) -> list[tuple[int, float]]:
+        """
+        コサイン類似度の上位k件（ハイライトID, 類似度）
+
+        ``exclude_group`` のグループ（動画）の行は除外する。
+        """
+        query = np.asarray(query, dtype=np.float32)
+        with self._lock:
+            rows = self._candidate_rows(query)
+            ids = self._ids[rows] if rows is not None else self._ids[: self.count]
+            valid = ids >= 0
+            if exclude_group is not None:
+                groups = (
+                    self._groups[rows]
+                    if rows is not None
+                    else self._groups[: self.count]
+                )
+                valid &= groups != group_key(exclude_group)
+            if rows is None:
+                scores = np.empty(self.count, dtype=np.float32)
+                for start in range(0, self.count, SEARCH_CHUNK_ROWS):
+                    end = min(start + SEARCH_CHUNK_ROWS, self.count)
+                    scores[start:end] = self._vectors[start:end] @ query
+            else:
+                scores = self._vectors[rows] @ query
+            scores = np.where(valid, scores, -np.inf)
+            top = _top_k(scores, min(k, int(valid.sum())))
+            return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def _candidate_rows(self, query: np.ndarray) -> np.ndarray | None:
+        """IVFで走査する行（全件走査する場合は None）"""
+        if self.live_count() < max(self.ann_threshold, 1):
+            self._ivf = None
+            return None
+        ivf = self._ivf
+        if (
+            ivf is None
+            or self.count - ivf.built_count > IVF_REBUILD_RATIO * ivf.built_count
+        ):
+            ivf = self._ivf = build_ivf(
+                self._vectors[: self.count], self._ids[: self.count] >= 0
+            )
+        probes = _top_k(ivf.centroids @ query, IVF_NPROBE)
+        lists = [ivf.rows[ivf.offsets[p] : ivf.offsets[p + 1]] for p in probes]
+        # IVF構築後に追加された行は全件走査する
+        tail = np.arange(ivf.built_count, self.count)
+        return np.sort(np.concatenate([*lists, tail]))
+
+    def close(self) -> None:
+        with self._lock:
+            self._write_meta()
@@ -0,0 +1,262 @@
+"""
+Worker process running queued analyze/extract/ingest jobs
+
+With ``JOB_EXECUTION=queue`` the API only enqueues jobs and serves their
+status, so API instances stay small while FFmpeg, downloads and model waits
+run here; the two tiers scale independently. Run with::
+
+    python -m app.worker [--concurrency N] [--kinds analyze,extract,ingest] [--drain]
+
+Each job is claimed with a lease that is extended while it runs. A job whose
+worker dies is claimed again once the lease expires, and failed jobs are
+retried with exponential backoff up to ``JOB_MAX_ATTEMPTS``. Jobs are claimed
+in weighted fair order across tenants, each tenant running at most
+``TENANT_CONCURRENCY`` jobs across all workers. After an analysis the worker
+pre-renders its top highlights (``PRERENDER_TOP_K``) in the background,
+giving way to the extract and ingest jobs it claims. SIGTERM stops claiming
+new jobs and waits for the running ones; pending pre-renders are cancelled.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import signal
+import socket
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from app.core.scheduling import EXTRACTION, fair_queue, record_usage, tenant_weight
+from app.core.settings import Settings, get_settings
+from app.core.telemetry import REGISTRY, configure_telemetry, span
+from app.core.usage import metering
+from app.jobs import JobBroker, JobRecord, get_broker
+from app.models.schemas import AnalysisResult, ExtractRequest
+from app.services.analyze import analyze_video_service
+from app.services.extract import extract_video_service
+from app.services.ingest import ingest_video_service
+from app.services.prerender import schedule_prerender
+
+logger = logging.getLogger(__name__)
+
+JobHandler = Callable[[dict[str, Any], Settings], Awaitable[dict[str, Any]]]
+
+# 再試行までの待ち時間（秒）の上限
+MAX_BACKOFF_SECONDS = 300
+
+WORKER_JOBS = REGISTRY.counter(
+    "worker_jobs_total",
+    "Jobs run by workers by outcome (succeeded, retried, failed)",
+    ("kind", "outcome"),
+)
+
+
+async def _run_analyze(payload: dict[str, Any], settings: Settings) -> dict[str, Any]:
+    result = await analyze_video_service(
+        payload["fileId"],
+        settings,
+        refresh=payload.get("refresh", False),
+        segmentation=payload.get("segmentation"),
+    )
+    return result.model_dump(mode="json")
+
+
+async def _run_extract(payload: dict[str, Any], settings: Settings) -> dict[str, Any]:
+    request = ExtractRequest.model_validate(payload)
+    result = await extract_video_service(request, settings)
+    return result.model_dump(mode="json")
+
+
+async def _run_ingest(payload: dict[str, Any], settings: Settings) -> dict[str, Any]:
+    result = await ingest_video_service(payload["fileId"], settings)
+    return result.model_dump(mode="json")
+
+
+JOB_HANDLERS: dict[str, JobHandler] = {
+    "analyze": _run_analyze,
+    "extract": _run_extract,
+    "ingest": _run_ingest,
+}
+
+# プロセス内の抽出キューの枠で実行するジョブ（先行の切り出しはこれらに枠を譲る）
+EXTRACTION_KINDS = frozenset({"extract", "ingest"})
+
+
+def retry_delay(attempts: int) -> float:
+    """attempts 回目の失敗後、再実行までの待ち時間"""
+    return min(MAX_BACKOFF_SECONDS, 2.0**attempts)
+
+
+class Worker:
+    """ブローカーからジョブを取り出して実行するワーカー"""
+
+    def __init__(
+        self,
+        settings: Settings,
+        broker: JobBroker | None = None,
+        *,
+        concurrency: int | None = None,
+        kinds: list[str] | None = None,
+    ):
+        self.settings = settings
+        self.broker = broker or get_broker(settings)
+        self.concurrency = concurrency or settings.worker_concurrency
+        self.kinds = kinds or list(JOB_HANDLERS)
+        self.worker_id = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+
+    async def _claim(self) -> JobRecord | None:
+        return await self.broker.claim(
+            self.worker_id,
+            lease_seconds=self.settings.job_lease_seconds,
+            max_attempts=self.settings.job_max_attempts,
+            kinds=self.kinds,
+            per_tenant=self.settings.tenant_concurrency,
+        )
+
+    async def run(self, stop: asyncio.Event | None = None, *, drain: bool = False):
+        """
+        stop がセットされるまでジョブを実行する
+
+        drain=True の場合はキューが空になった時点で終了する。
+        """
+        stop = stop or asyncio.Event()
+        running: set[asyncio.Task] = set()
+        logger.info(f"Worker {self.worker_id} started (kinds: {self.kinds})")
+        while not stop.is_set():
+            while len(running) < self.concurrency and not stop.is_set():
+                job = await self._claim()
+                if job is None:
+                    break
+                running.add(asyncio.create_task(self.run_job(job)))
+            if drain and not running:
+                break
+            if running:
+                _, running = await asyncio.wait(
+                    running,
+                    timeout=self.settings.worker_poll_seconds,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+            else:
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(
+                        stop.wait(), self.settings.worker_poll_seconds
+                    )
+        # 停止時は実行中のジョブの完了を待つ
+        if running:
+            await asyncio.wait(running)
+        logger.info(f"Worker {self.worker_id} stopped")
+
+    async def _heartbeat(self, job: JobRecord, work: asyncio.Task) -> None:
+        """リースを延長し続け、他のワーカーに取られていたら実行を中止する"""
+        interval = self.settings.job_lease_seconds / 3
+        while True:
+            await asyncio.sleep(interval)
+            extended = await self.broker.extend_lease(
+                job.job_id,
+                self.worker_id,
+                lease_seconds=self.settings.job_lease_seconds,
+            )
+            if not extended:
+                logger.warning(f"Lost lease of job {job.job_id}, cancelling")
+                work.cancel()
+                return
+
+    async def _execute(self, handler: JobHandler, job: JobRecord) -> dict[str, Any]:
+        if job.kind not in EXTRACTION_KINDS:
+            return await handler(job.payload, self.settings)
+        queue = fair_queue(EXTRACTION, self.settings)
+        async with queue.slot(job.tenant, tenant_weight(job.tenant, self.settings)):
+            return await handler(job.payload, self.settings)
+
+    async def run_job(self, job: JobRecord) -> None:
+        handler = JOB_HANDLERS.get(job.kind)
+        if handler is None:
+            await self.broker.fail(
+                job.job_id,
+                self.worker_id,
+                f"Unknown job kind: {job.kind}",
+                retry_at=None,
+            )
+            WORKER_JOBS.inc(kind=job.kind, outcome="failed")
+            return
+
+        with metering() as meter, span("worker.job", kind=job.kind):
+            work = asyncio.create_task(self._execute(handler, job))
+            heartbeat = asyncio.create_task(self._heartbeat(job, work))
+            try:
+                result = await work
+            except asyncio.CancelledError:
+                work.cancel()
+                if asyncio.current_task().cancelling():
+                    raise
+                # リースを失った（他のワーカーが再実行する）
+                return
+            except Exception as e:
+                # 入力の誤りは再試行しても失敗する
+                retry = (
+                    not isinstance(e, ValueError)
+                    and job.attempts < self.settings.job_max_attempts
+                )
+                retry_at = time.time() + retry_delay(job.attempts) if retry else None
+                logger.warning(
+                    f"Job {job.job_id} ({job.kind}) failed "
+                    f"(attempt {job.attempts}): {e!s}"
+                )
+                await self.broker.fail(
+                    job.job_id, self.worker_id, str(e), retry_at=retry_at
+                )
+                WORKER_JOBS.inc(kind=job.kind, outcome="retried" if retry else "failed")
+            else:
+                await self.broker.complete(job.job_id, self.worker_id, result)
+                WORKER_JOBS.inc(kind=job.kind, outcome="succeeded")
+                if job.kind == "analyze":
+                    schedule_prerender(
+                        job.payload["fileId"],
+                        AnalysisResult.model_validate(result),
+                        job.tenant,
+                        self.settings,
+                    )
+            finally:
+                heartbeat.cancel()
+                await record_usage(job.tenant, meter, self.settings)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=None)
+    parser.add_argument(
+        "--kinds",
+        default=",".join(JOB_HANDLERS),
+        help="Comma-separated job kinds to run",
+    )
+    parser.add_argument(
+        "--drain", action="store_true", help="Exit when the queue is empty"
+    )
+    args = parser.parse_args(argv)
+
+    settings = get_settings()
+    # ログの書式（リクエストID付き）と出力レベルも設定する
+    configure_telemetry(settings)
+    worker = Worker(
+        settings,
+        concurrency=args.concurrency,
+        kinds=[k.strip() for k in args.kinds.split(",") if k.strip()],
+    )
+
+    async def serve() -> None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, stop.set)
+        try:
+            await worker.run(stop, drain=args.drain)
+        finally:
+            await worker.broker.close()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
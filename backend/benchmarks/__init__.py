@@ -0,0 +1,6 @@
+"""
+Offline benchmark suite for the backend API
+
+Runs the FastAPI app in-process against a local GCS stand-in and a fake
+Gemini client so throughput and latency can be measured without cloud access.
+"""
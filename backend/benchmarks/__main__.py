@@ -0,0 +1,76 @@
+"""
+Run the offline benchmark suite
+
+Usage:
+    python -m benchmarks --requests 50 --concurrency 8 --output bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+from benchmarks.harness import WORKLOADS, BenchmarkConfig, run_benchmark
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--workloads",
+        default="upload_init,analyze,extract",
+        help=f"Comma-separated workloads ({', '.join(WORKLOADS)})",
+    )
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--gemini-latency",
+        type=float,
+        default=0.1,
+        help="Seconds the fake Gemini waits before responding",
+    )
+    parser.add_argument(
+        "--gemini-seconds-per-1k-tokens",
+        type=float,
+        default=0.0,
+        help="Extra fake Gemini latency per 1000 estimated input tokens",
+    )
+    parser.add_argument("--video-duration", type=float, default=60.0)
+    parser.add_argument("--video-size", default="1280x720")
+    parser.add_argument("--clip-seconds", type=float, default=10.0)
+    parser.add_argument("--request-timeout", type=float, default=300.0)
+    parser.add_argument(
+        "--work-dir",
+        type=Path,
+        default=None,
+        help="Directory for cached synthetic videos (default: temporary)",
+    )
+    parser.add_argument("--output", type=Path, default=None, help="JSON output path")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    config = BenchmarkConfig(
+        workloads=[name.strip() for name in args.workloads.split(",") if name.strip()],
+        requests=args.requests,
+        concurrency=args.concurrency,
+        gemini_latency=args.gemini_latency,
+        gemini_seconds_per_1k_tokens=args.gemini_seconds_per_1k_tokens,
+        video_duration=args.video_duration,
+        video_size=args.video_size,
+        clip_seconds=args.clip_seconds,
+        request_timeout=args.request_timeout,
+        work_dir=args.work_dir,
+    )
+    result = asyncio.run(run_benchmark(config))
+    output = json.dumps(result, indent=2, ensure_ascii=False, sort_keys=True)
+    if args.output:
+        args.output.write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
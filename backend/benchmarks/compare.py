@@ -0,0 +1,76 @@
+"""
+Compare two benchmark JSON results
+
+Usage:
+    python -m benchmarks.compare base.json head.json
+"""
+
+import json
+import sys
+from pathlib import Path
+from typing import Any
+
+METRICS = (
+    ("throughput_rps",),
+    ("latency_ms", "p50"),
+    ("latency_ms", "p95"),
+    ("latency_ms", "p99"),
+    ("bytes_moved", "downloaded"),
+    ("bytes_moved", "uploaded"),
+    ("model_input_tokens",),
+    ("model_inline_bytes",),
+)
+
+
+def _lookup(data: dict[str, Any], path: tuple[str, ...]) -> float | None:
+    value: Any = data
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value if isinstance(value, int | float) else None
+
+
+def compare(base: dict[str, Any], head: dict[str, Any]) -> list[dict[str, Any]]:
+    """ワークロード・指標ごとの差分（変化率）を返す"""
+    rows = []
+    workloads = sorted(set(base.get("workloads", {})) | set(head.get("workloads", {})))
+    for name in workloads:
+        base_workload = base.get("workloads", {}).get(name, {})
+        head_workload = head.get("workloads", {}).get(name, {})
+        for path in METRICS:
+            before = _lookup(base_workload, path)
+            after = _lookup(head_workload, path)
+            change = None
+            if before and after is not None:
+                change = round((after - before) / before * 100, 2)
+            rows.append(
+                {
+                    "workload": name,
+                    "metric": ".".join(path),
+                    "base": before,
+                    "head": after,
+                    "change_pct": change,
+                }
+            )
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = argv if argv is not None else sys.argv[1:]
+    if len(args) != 2:  # noqa: PLR2004
+        print(__doc__.strip())
+        return 2
+    base = json.loads(Path(args[0]).read_text(encoding="utf-8"))
+    head = json.loads(Path(args[1]).read_text(encoding="utf-8"))
+    for row in compare(base, head):
+        change = "n/a" if row["change_pct"] is None else f"{row['change_pct']:+.2f}%"
+        print(
+            f"{row['workload']:<20} {row['metric']:<22} "
+            f"{row['base']!s:>14} -> {row['head']!s:>14}  {change}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""
+In-process stand-ins for Google Cloud Storage and Gemini
+"""
+
+import base64
+import hashlib
+import json
+import shutil
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+import google_crc32c
+
+
+class FakeGCS:
+    """
+    ローカルディレクトリをバケットとして扱うGCSの代替
+
+    ダウンロード・アップロードしたバイト数を記録する。
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+        self._lock = threading.Lock()
+
+    def path_for(self, bucket_name: str, blob_name: str) -> Path:
+        return self.root / bucket_name / blob_name
+
+    def seed(self, bucket_name: str, blob_name: str, source: Path) -> None:
+        """ベンチマーク用のオブジェクトを配置する（転送量には数えない）"""
+        destination = self.path_for(bucket_name, blob_name)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(source, destination)
+
+    def record_download(self, size: int) -> None:
+        with self._lock:
+            self.bytes_downloaded += size
+
+    def record_upload(self, size: int) -> None:
+        with self._lock:
+            self.bytes_uploaded += size
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.bytes_downloaded = 0
+            self.bytes_uploaded = 0
+
+    def client(self, *_args: Any, **_kwargs: Any) -> "FakeStorageClient":
+        """``storage.Client`` の代わりにパッチするファクトリ"""
+        return FakeStorageClient(self)
+
+
+class FakeBlob:
+    def __init__(self, gcs: FakeGCS, bucket_name: str, name: str):
+        self._gcs = gcs
+        self.bucket_name = bucket_name
+        self.name = name
+        self.content_type: str | None = None
+
+    @property
+    def _path(self) -> Path:
+        return self._gcs.path_for(self.bucket_name, self.name)
+
+    @property
+    def bucket(self) -> "FakeBucket":
+        return FakeBucket(self._gcs, self.bucket_name)
+
+    @property
+    def size(self) -> int | None:
+        return self._path.stat().st_size if self._path.exists() else None
+
+    @property
+    def md5_hash(self) -> str | None:
+        """GCSと同じくbase64のMD5"""
+        if not self._path.exists():
+            return None
+        digest = hashlib.md5(self._path.read_bytes(), usedforsecurity=False).digest()
+        return base64.b64encode(digest).decode()
+
+    @property
+    def crc32c(self) -> str | None:
+        """GCSと同じくbase64のビッグエンディアンのCRC32C"""
+        if not self._path.exists():
+            return None
+        digest = google_crc32c.Checksum(self._path.read_bytes()).digest()
+        return base64.b64encode(digest).decode()
+
+    def exists(self, *_args: Any, **_kwargs: Any) -> bool:
+        return self._path.exists()
+
+    def reload(self, *_args: Any, **_kwargs: Any) -> None:
+        if not self._path.exists():
+            msg = f"404 No such object: {self.bucket_name}/{self.name}"
+            raise FileNotFoundError(msg)
+
+    def download_to_filename(self, filename: str, *_args: Any, **_kwargs: Any) -> None:
+        shutil.copyfile(self._path, filename)
+        self._gcs.record_download(self._path.stat().st_size)
+
+    def download_as_bytes(self, *_args: Any, **_kwargs: Any) -> bytes:
+        data = self._path.read_bytes()
+        self._gcs.record_download(len(data))
+        return data
+
+    def upload_from_filename(
+        self, filename: str, content_type: str | None = None, **_kwargs: Any
+    ) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(filename, self._path)
+        self.content_type = content_type
+        self._gcs.record_upload(self._path.stat().st_size)
+
+    def upload_from_string(
+        self, data: bytes | str, content_type: str | None = None, **_kwargs: Any
+    ) -> None:
+        payload = data.encode("utf-8") if isinstance(data, str) else data
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self._path.write_bytes(payload)
+        self.content_type = content_type
+        self._gcs.record_upload(len(payload))
+
+    def delete(self, *_args: Any, **_kwargs: Any) -> None:
+        self._path.unlink(missing_ok=True)
+
+    def generate_signed_url(self, method: str = "GET", **_kwargs: Any) -> str:
+        return f"http://fake-gcs.local/{self.bucket_name}/{self.name}?method={method}"
+
+
+class FakeBucket:
+    def __init__(self, gcs: FakeGCS, name: str):
+        self._gcs = gcs
+        self.name = name
+
+    def blob(self, blob_name: str, *_args: Any, **_kwargs: Any) -> FakeBlob:
+        return FakeBlob(self._gcs, self.name, blob_name)
+
+    def get_blob(self, blob_name: str, *_args: Any, **_kwargs: Any) -> FakeBlob | None:
+        blob = self.blob(blob_name)
+        return blob if blob.exists() else None
+
+
+class FakeStorageClient:
+    def __init__(self, gcs: FakeGCS):
+        self._gcs = gcs
+
+    def bucket(self, bucket_name: str) -> FakeBucket:
+        return FakeBucket(self._gcs, bucket_name)
+
+
+class FakeCredentials:
+    """``google.auth.default`` が返す認証情報の代替"""
+
+    service_account_email = "benchmark@fake.iam.gserviceaccount.com"
+    token = "fake-token"  # noqa: S105
+
+    def refresh(self, _request: Any) -> None:
+        return None
+
+
+def fake_auth_default(*_args: Any, **_kwargs: Any) -> tuple[FakeCredentials, str]:
+    return FakeCredentials(), "benchmark-project"
+
+
+# 入力トークンの概算（MEDIA_RESOLUTION_LOW: 映像1フレーム/秒 + 音声）
+VIDEO_TOKENS_PER_SECOND = 66 + 32
+IMAGE_TOKENS = 66
+TEXT_BYTES_PER_TOKEN = 4
+
+
+class FakeGemini:
+    """
+    設定可能なレイテンシでセグメントJSONを返すGeminiクライアントの代替
+
+    ``genai.Client`` の代わりにパッチし、``client.models.generate_content``
+    の呼び出しに応答する。``response_schema`` が候補の番号（``index``）で
+    答える形式なら番号で、それ以外は時間で答える。送られた動画・画像・テキストの
+    入力トークン数を概算して ``input_tokens`` に、リクエストに含めて送られた
+    バイト数（画像・テキスト）を ``inline_bytes`` に積算する。
+    ``seconds_per_1k_tokens`` を指定すると、入力トークン数に比例する処理時間を
+    ``latency`` に加える。
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        video_duration: float = 60.0,
+        segment_seconds: float = 30.0,
+        seconds_per_1k_tokens: float = 0.0,
+    ):
+        self.latency = latency
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.video_duration = video_duration
+        self.segment_seconds = segment_seconds
+        self.calls = 0
+        self.input_tokens = 0
+        self.inline_bytes = 0
+        self._lock = threading.Lock()
+
+    def client(self, *_args: Any, **_kwargs: Any) -> SimpleNamespace:
+        """``genai.Client`` の代わりにパッチするファクトリ"""
+        return SimpleNamespace(models=SimpleNamespace(generate_content=self.generate))
+
+    def estimate_tokens(self, contents: list[Any]) -> int:
+        """``contents`` の入力トークン数の概算"""
+        tokens = 0
+        for item in contents:
+            text = item if isinstance(item, str) else getattr(item, "text", None)
+            if text is not None:
+                tokens += len(text.encode()) // TEXT_BYTES_PER_TOKEN
+            elif getattr(item, "file_data", None) is not None:
+                tokens += int(self.video_duration * VIDEO_TOKENS_PER_SECOND)
+            elif getattr(item, "inline_data", None) is not None:
+                tokens += IMAGE_TOKENS
+        return tokens
+
+    @staticmethod
+    def inline_size(contents: list[Any]) -> int:
+        """リクエストに含めて送られるバイト数（参照で渡す動画は含まない）"""
+        size = 0
+        for item in contents:
+            text = item if isinstance(item, str) else getattr(item, "text", None)
+            if text is not None:
+                size += len(text.encode())
+            elif (inline := getattr(item, "inline_data", None)) is not None:
+                size += len(inline.data)
+        return size
+
+    def response_text(self, *, indexed: bool = False) -> str:
+        segments = []
+        start = 0.0
+        index = 0
+        while start < self.video_duration:
+            end = min(start + self.segment_seconds, self.video_duration)
+            position = {"index": index} if indexed else {"start": start, "end": end}
+            segments.append(
+                {
+                    **position,
+                    "title": f"セグメント{index + 1}",
+                    "description": "ベンチマーク用の合成セグメント",
+                    "score": round(((index * 37) % 100) / 100, 2),
+                }
+            )
+            start = end
+            index += 1
+        return json.dumps({"segments": segments}, ensure_ascii=False)
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.input_tokens = 0
+            self.inline_bytes = 0
+
+    def generate(
+        self, *_args: Any, contents: list[Any] | None = None, **kwargs: Any
+    ) -> SimpleNamespace:
+        contents = contents or []
+        tokens = self.estimate_tokens(contents)
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += tokens
+            self.inline_bytes += self.inline_size(contents)
+        schema = getattr(kwargs.get("config"), "response_schema", None)
+        indexed = hasattr(schema, "model_json_schema") and '"index"' in json.dumps(
+            schema.model_json_schema()
+        )
+        # 実際のSDK呼び出しと同じく同期的にブロックする
+        time.sleep(self.latency + tokens / 1000 * self.seconds_per_1k_tokens)
+        return SimpleNamespace(text=self.response_text(indexed=indexed))
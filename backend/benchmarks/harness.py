@@ -0,0 +1,366 @@
+"""
+Benchmark harness: drives concurrent workloads against the in-process app
+"""
+
+import asyncio
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from collections.abc import Awaitable, Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any
+from unittest.mock import patch
+
+import httpx
+
+from app.core.settings import Settings, get_settings
+from app.services.embeddings import HashingEmbedder
+from app.services.similarity import set_vector_index
+from app.store import SQLiteVideoStore, set_store
+from app.store.vectors import VectorIndex
+from benchmarks.fakes import FakeGCS, FakeGemini, fake_auth_default
+from benchmarks.videos import ffmpeg_available, generate_test_video
+
+BENCH_BUCKET = "benchmark-bucket"
+
+
+@dataclass
+class BenchmarkConfig:
+    workloads: list[str] = field(
+        default_factory=lambda: ["upload_init", "analyze", "extract"]
+    )
+    requests: int = 50
+    concurrency: int = 8
+    gemini_latency: float = 0.1
+    gemini_seconds_per_1k_tokens: float = 0.0
+    video_duration: float = 60.0
+    video_size: str = "1280x720"
+    clip_seconds: float = 10.0
+    request_timeout: float = 300.0
+    work_dir: Path | None = None
+
+
+@dataclass
+class BenchmarkContext:
+    client: httpx.AsyncClient
+    gcs: FakeGCS
+    gemini: FakeGemini
+    settings: Settings
+    config: BenchmarkConfig
+    work_dir: Path
+    file_ids: list[str] = field(default_factory=list)
+
+
+WorkloadFn = Callable[[BenchmarkContext, int], Awaitable[httpx.Response]]
+
+
+@dataclass
+class Workload:
+    fn: WorkloadFn
+    needs_video: bool = False
+    needs_ffmpeg: bool = False
+
+
+WORKLOADS: dict[str, Workload] = {}
+
+
+def workload(
+    name: str, *, needs_video: bool = False, needs_ffmpeg: bool = False
+) -> Callable[[WorkloadFn], WorkloadFn]:
+    """ワークロードを登録するデコレータ"""
+
+    def decorator(fn: WorkloadFn) -> WorkloadFn:
+        WORKLOADS[name] = Workload(
+            fn, needs_video=needs_video, needs_ffmpeg=needs_ffmpeg
+        )
+        return fn
+
+    return decorator
+
+
+@workload("upload_init")
+async def upload_init_workload(ctx: BenchmarkContext, index: int) -> httpx.Response:
+    return await ctx.client.post(
+        "/api/upload/init",
+        json={
+            "fileName": f"bench_{index}.mp4",
+            "fileSize": 1024 * 1024,
+            "contentType": "video/mp4",
+        },
+    )
+
+
+@workload("analyze", needs_video=True)
+async def analyze_workload(ctx: BenchmarkContext, index: int) -> httpx.Response:
+    file_id = ctx.file_ids[index % len(ctx.file_ids)]
+    # 保存済みの解析結果を使わずモデル呼び出しまでを計測する
+    return await ctx.client.post(f"/api/analyze/{file_id}", params={"refresh": "true"})
+
+
+@workload("analyze_keyframes", needs_video=True, needs_ffmpeg=True)
+async def analyze_keyframes_workload(
+    ctx: BenchmarkContext, index: int
+) -> httpx.Response:
+    """代表フレームだけを送る解析（analyze の動画を送る経路と比べる）"""
+    file_id = ctx.file_ids[index % len(ctx.file_ids)]
+    return await ctx.client.post(
+        f"/api/analyze/{file_id}",
+        params={"refresh": "true", "segmentation": "keyframes"},
+    )
+
+
+@workload("analyze_transcript", needs_video=True, needs_ffmpeg=True)
+async def analyze_transcript_workload(
+    ctx: BenchmarkContext, index: int
+) -> httpx.Response:
+    """文字起こしと代表フレームを送る解析（analyze の動画を送る経路と比べる）"""
+    file_id = ctx.file_ids[index % len(ctx.file_ids)]
+    return await ctx.client.post(
+        f"/api/analyze/{file_id}",
+        params={"refresh": "true", "segmentation": "transcript"},
+    )
+
+
+@workload("extract", needs_video=True, needs_ffmpeg=True)
+async def extract_workload(ctx: BenchmarkContext, index: int) -> httpx.Response:
+    file_id = ctx.file_ids[index % len(ctx.file_ids)]
+    span = ctx.config.clip_seconds
+    max_start = max(ctx.config.video_duration - span, 0.0)
+    start = (index * 7.0) % max_start if max_start else 0.0
+    return await ctx.client.post(
+        "/api/extract",
+        json={"fileId": file_id, "segments": [{"start": start, "end": start + span}]},
+    )
+
+
+@workload("render", needs_video=True, needs_ffmpeg=True)
+async def render_workload(ctx: BenchmarkContext, index: int) -> httpx.Response:
+    file_id = ctx.file_ids[index % len(ctx.file_ids)]
+    span = ctx.config.clip_seconds / 2
+    segments = [
+        {"start": offset, "end": offset + span}
+        for offset in (0.0, ctx.config.video_duration / 2)
+    ]
+    return await ctx.client.post(
+        "/api/render",
+        json={"fileId": file_id, "segments": segments, "preset": "vertical_720"},
+    )
+
+
+def percentile(values: list[float], q: float) -> float:
+    """線形補間によるパーセンタイル（q は 0〜100）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    rank = (len(ordered) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize_latencies(latencies: list[float]) -> dict[str, float]:
+    return {
+        "p50": round(percentile(latencies, 50) * 1000, 3),
+        "p95": round(percentile(latencies, 95) * 1000, 3),
+        "p99": round(percentile(latencies, 99) * 1000, 3),
+        "mean": round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0,
+        "max": round(max(latencies, default=0.0) * 1000, 3),
+    }
+
+
+def peak_rss_mb() -> dict[str, float]:
+    """自プロセスと子プロセス（FFmpeg）のピークRSS"""
+    # Linuxではru_maxrssはKB単位
+    scale = 1024 * 1024 if platform.system() == "Darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 2),
+        "children": round(
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 2
+        ),
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],  # noqa: S607
+            capture_output=True,
+            check=True,
+            text=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+async def run_workload(
+    ctx: BenchmarkContext, name: str, requests: int, concurrency: int
+) -> dict[str, Any]:
+    """ワークロードを指定の並列度で実行し、統計を返す"""
+    fn = WORKLOADS[name].fn
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    status_codes: dict[str, int] = {}
+
+    async def one(index: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                # ASGITransport はクライアントのタイムアウトを適用しないため、ここで打ち切る
+                response = await asyncio.wait_for(
+                    fn(ctx, index), timeout=ctx.config.request_timeout
+                )
+                status = str(response.status_code)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            status_codes[status] = status_codes.get(status, 0) + 1
+
+    ctx.gcs.reset_counters()
+    ctx.gemini.reset_counters()
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall_time = time.perf_counter() - wall_start
+
+    errors = sum(count for code, count in status_codes.items() if code != "200")
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "status_codes": status_codes,
+        "duration_s": round(wall_time, 3),
+        "throughput_rps": round(requests / wall_time, 3) if wall_time else 0.0,
+        "latency_ms": summarize_latencies(latencies),
+        "bytes_moved": {
+            "downloaded": ctx.gcs.bytes_downloaded,
+            "uploaded": ctx.gcs.bytes_uploaded,
+        },
+        "model_input_tokens": ctx.gemini.input_tokens,
+        "model_inline_bytes": ctx.gemini.inline_bytes,
+    }
+
+
+@contextmanager
+def offline_environment(gcs: FakeGCS, gemini: FakeGemini) -> Iterator[Settings]:
+    """GCS・Geminiをローカルの代替に差し替えた環境"""
+    env = {
+        "GCS_BUCKET_NAME": BENCH_BUCKET,
+        "GCS_PROJECT_ID": "benchmark-project",
+        "USE_MOCK_STORAGE": "false",
+        "LOG_LEVEL": "WARNING",
+        # 音声認識のモデルを使わず決定的な文字起こしにする
+        "SPEECH_ENGINE": "stub",
+    }
+    with (
+        patch.dict(os.environ, env),
+        patch("google.cloud.storage.Client", gcs.client),
+        patch("google.auth.default", fake_auth_default),
+        patch("google.genai.Client", gemini.client),
+    ):
+        # Vertex AI経路（FakeGemini）を通すためGoogle AI APIキーは外す
+        os.environ.pop("GOOGLE_API_KEY", None)
+        get_settings.cache_clear()
+        set_store(SQLiteVideoStore(":memory:"))
+        embedder = HashingEmbedder()
+        set_vector_index(VectorIndex(None, dim=embedder.dim, model=embedder.name))
+        try:
+            yield get_settings()
+        finally:
+            set_store(None)
+            set_vector_index(None)
+            get_settings.cache_clear()
+
+
+def _seed_videos(ctx: BenchmarkContext, count: int) -> None:
+    video = generate_test_video(
+        ctx.work_dir / "videos",
+        duration=ctx.config.video_duration,
+        size=ctx.config.video_size,
+    )
+    for index in range(count):
+        file_id = f"bench-video-{index}"
+        ctx.gcs.seed(
+            BENCH_BUCKET, f"{ctx.settings.gcs_uploads_prefix}{file_id}.mp4", video
+        )
+        ctx.file_ids.append(file_id)
+
+
+async def run_benchmark(config: BenchmarkConfig) -> dict[str, Any]:
+    """
+    ベンチマークを実行し、差分比較可能なJSON互換の辞書を返す
+    """
+    unknown = [name for name in config.workloads if name not in WORKLOADS]
+    if unknown:
+        msg = f"Unknown workloads: {', '.join(unknown)}"
+        raise ValueError(msg)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = config.work_dir or Path(temp_dir)
+        gcs = FakeGCS(Path(temp_dir) / "gcs")
+        gemini = FakeGemini(
+            latency=config.gemini_latency,
+            video_duration=config.video_duration,
+            seconds_per_1k_tokens=config.gemini_seconds_per_1k_tokens,
+        )
+
+        with offline_environment(gcs, gemini) as settings:
+            from main import app  # noqa: PLC0415
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport,
+                base_url="http://benchmark",
+                timeout=config.request_timeout,
+            ) as client:
+                ctx = BenchmarkContext(
+                    client=client,
+                    gcs=gcs,
+                    gemini=gemini,
+                    settings=settings,
+                    config=config,
+                    work_dir=work_dir,
+                )
+                results: dict[str, Any] = {}
+                skipped: dict[str, str] = {}
+                for name in config.workloads:
+                    spec = WORKLOADS[name]
+                    if spec.needs_ffmpeg and not ffmpeg_available():
+                        skipped[name] = "ffmpeg not found"
+                        continue
+                    if spec.needs_video and not ctx.file_ids:
+                        if not ffmpeg_available():
+                            skipped[name] = "ffmpeg not found (needed for testsrc)"
+                            continue
+                        _seed_videos(ctx, count=max(1, config.concurrency))
+                    results[name] = await run_workload(
+                        ctx, name, config.requests, config.concurrency
+                    )
+
+    return {
+        "meta": {
+            "git_commit": git_commit(),
+            "timestamp": datetime.now(UTC).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                "requests": config.requests,
+                "concurrency": config.concurrency,
+                "gemini_latency": config.gemini_latency,
+                "gemini_seconds_per_1k_tokens": config.gemini_seconds_per_1k_tokens,
+                "video_duration": config.video_duration,
+                "video_size": config.video_size,
+                "clip_seconds": config.clip_seconds,
+            },
+        },
+        "workloads": results,
+        "skipped": skipped,
+        "peak_rss_mb": peak_rss_mb(),
+    }
@@ -0,0 +1,154 @@
+"""
+Per-preset render benchmark
+
+Renders the same highlight list with every render preset (or a subset) against
+a synthetic ``testsrc`` video and reports wall time and the realtime factor
+(seconds of output produced per second of wall time).
+
+Usage:
+    python -m benchmarks.render --presets vertical_1080,landscape_copy --repeat 3
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any
+
+from app.core.settings import Settings
+from app.models.schemas import VideoSegment
+from app.services.ffmpeg import MediaInfo
+from app.services.render import RENDER_PRESETS, render_video
+from benchmarks.harness import git_commit, peak_rss_mb, summarize_latencies
+from benchmarks.videos import ffmpeg_available, generate_test_video
+
+
+def highlight_segments(
+    video_duration: float, clips: int, clip_seconds: float
+) -> list[VideoSegment]:
+    """動画全体に等間隔で並べたハイライト"""
+    stride = video_duration / clips
+    return [
+        VideoSegment(
+            start=round(i * stride, 3),
+            end=round(min(i * stride + clip_seconds, video_duration), 3),
+        )
+        for i in range(clips)
+    ]
+
+
+async def benchmark_presets(
+    presets: list[str],
+    *,
+    video_duration: float = 60.0,
+    video_size: str = "1280x720",
+    clips: int = 3,
+    clip_seconds: float = 5.0,
+    repeat: int = 1,
+    work_dir: Path | None = None,
+    settings: Settings | None = None,
+) -> dict[str, Any]:
+    """プリセットごとにレンダリング時間とリアルタイム倍率を計測する"""
+    settings = settings or Settings()
+    width, height = (int(v) for v in video_size.split("x"))
+    media = MediaInfo(
+        duration=video_duration, width=width, height=height, has_audio=True
+    )
+    segments = highlight_segments(video_duration, clips, clip_seconds)
+
+    results: dict[str, Any] = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        video = generate_test_video(
+            (work_dir or Path(temp_dir)) / "videos",
+            duration=video_duration,
+            size=video_size,
+        )
+        for name in presets:
+            spec = RENDER_PRESETS[name]
+            timings = []
+            plan = None
+            for attempt in range(repeat):
+                output = Path(temp_dir) / f"{name}_{attempt}.mp4"
+                start = time.perf_counter()
+                plan = await render_video(
+                    str(video), str(output), segments, spec, settings, media=media
+                )
+                timings.append(time.perf_counter() - start)
+            mean = sum(timings) / len(timings)
+            results[name] = {
+                "output_duration_s": round(plan.output_duration, 3),
+                "render_s": round(mean, 3),
+                "realtime_factor": round(plan.output_duration / mean, 3),
+                "latency_ms": summarize_latencies(timings),
+                "video_copy": plan.video_copy,
+                "audio_copy": plan.audio_copy,
+            }
+    return results
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--presets",
+        default=",".join(RENDER_PRESETS),
+        help=f"Comma-separated presets ({', '.join(RENDER_PRESETS)})",
+    )
+    parser.add_argument("--video-duration", type=float, default=60.0)
+    parser.add_argument("--video-size", default="1280x720")
+    parser.add_argument("--clips", type=int, default=3)
+    parser.add_argument("--clip-seconds", type=float, default=5.0)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--work-dir", type=Path, default=None)
+    parser.add_argument("--output", type=Path, default=None, help="JSON output path")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    presets = [name.strip() for name in args.presets.split(",") if name.strip()]
+    unknown = [name for name in presets if name not in RENDER_PRESETS]
+    if unknown:
+        print(f"Unknown presets: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    if not ffmpeg_available():
+        print("ffmpeg not found", file=sys.stderr)
+        return 1
+
+    presets_result = asyncio.run(
+        benchmark_presets(
+            presets,
+            video_duration=args.video_duration,
+            video_size=args.video_size,
+            clips=args.clips,
+            clip_seconds=args.clip_seconds,
+            repeat=args.repeat,
+            work_dir=args.work_dir,
+        )
+    )
+    result = {
+        "meta": {
+            "git_commit": git_commit(),
+            "config": {
+                "video_duration": args.video_duration,
+                "video_size": args.video_size,
+                "clips": args.clips,
+                "clip_seconds": args.clip_seconds,
+                "repeat": args.repeat,
+            },
+        },
+        "presets": presets_result,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    output = json.dumps(result, indent=2, ensure_ascii=False, sort_keys=True)
+    if args.output:
+        args.output.write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Highlight search benchmark
+
+Fills an in-memory store with synthetic analyses (Japanese titles and
+descriptions, random scores spread over a month) and measures the latency of a
+mix of library-wide highlight searches.
+
+Usage:
+    python -m benchmarks.search --highlights 100000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+from app.store import HighlightQuery, SQLiteVideoStore
+from benchmarks.harness import git_commit, peak_rss_mb, summarize_latencies
+
+SUBJECTS = ["ゴール", "シュート", "セーブ", "ドリブル", "パス", "タックル", "歓声"]
+MODIFIERS = ["決定的な", "華麗な", "劇的な", "惜しい", "連続", "逆転の", "終盤の"]
+SCENES = ["前半", "後半", "延長", "ハーフタイム", "試合終了間際", "インタビュー"]
+DAY = 86400.0
+
+QUERIES: dict[str, HighlightQuery] = {
+    "top": HighlightQuery(),
+    "text_common": HighlightQuery(text="ゴール"),
+    "text_rare": HighlightQuery(text="逆転のゴール"),
+    "text_score": HighlightQuery(text="ゴール", min_score=0.8),
+    "text_recent": HighlightQuery(text="シュート", min_score=0.8, since=-7 * DAY),
+    "two_words": HighlightQuery(text="劇的な 延長"),
+    "no_match": HighlightQuery(text="オフサイド"),
+}
+
+
+def synthetic_highlights(rng: random.Random, count: int) -> list[dict[str, Any]]:
+    return [
+        {
+            "start": i * 30.0,
+            "end": i * 30.0 + 30.0,
+            "title": f"{rng.choice(MODIFIERS)}{rng.choice(SUBJECTS)}",
+            "description": f"{rng.choice(SCENES)}の{rng.choice(SUBJECTS)}シーン",
+            "score": round(rng.random(), 4),
+        }
+        for i in range(count)
+    ]
+
+
+async def populate(
+    store: SQLiteVideoStore, highlights: int, per_video: int, seed: int
+) -> float:
+    """解析結果を追加し、追加にかかった時間（秒）を返す"""
+    rng = random.Random(seed)
+    now = time.time()
+    start = time.perf_counter()
+    for index in range(max(1, highlights // per_video)):
+        await store.add_analysis(
+            f"video-{index}",
+            provider="benchmark",
+            model="synthetic",
+            prompt_version="v1",
+            highlights=synthetic_highlights(rng, per_video),
+            # 解析日時を過去30日に散らす
+            created_at=now - (index % 30) * DAY,
+        )
+    return time.perf_counter() - start
+
+
+async def benchmark_search(
+    highlights: int = 100_000,
+    *,
+    per_video: int = 20,
+    limit: int = 20,
+    repeat: int = 20,
+    seed: int = 0,
+) -> dict[str, Any]:
+    store = SQLiteVideoStore(":memory:")
+    populate_s = await populate(store, highlights, per_video, seed)
+    now = time.time()
+
+    queries: dict[str, Any] = {}
+    for name, query in QUERIES.items():
+        if query.since is not None:
+            query = HighlightQuery(**{**query.__dict__, "since": now + query.since})
+        timings = []
+        page = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            page = await store.search_highlights(query, limit)
+            timings.append(time.perf_counter() - start)
+        queries[name] = {
+            "results": len(page.items),
+            "latency_ms": summarize_latencies(timings),
+        }
+    await store.close()
+    return {
+        "highlights": highlights,
+        "populate_s": round(populate_s, 3),
+        "queries": queries,
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--highlights", type=int, default=100_000)
+    parser.add_argument("--per-video", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, default=None, help="JSON output path")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    search_result = asyncio.run(
+        benchmark_search(
+            args.highlights,
+            per_video=args.per_video,
+            limit=args.limit,
+            repeat=args.repeat,
+            seed=args.seed,
+        )
+    )
+    result = {
+        "meta": {
+            "git_commit": git_commit(),
+            "config": {
+                "highlights": args.highlights,
+                "per_video": args.per_video,
+                "limit": args.limit,
+                "repeat": args.repeat,
+                "seed": args.seed,
+            },
+        },
+        "search": search_result,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    output = json.dumps(result, indent=2, ensure_ascii=False, sort_keys=True)
+    if args.output:
+        args.output.write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+Cold-start benchmark: import time breakdown, time to the first /health, idle RSS
+
+Usage:
+    python -m benchmarks.startup --repeat 3 --output startup.json
+
+Each run starts a fresh interpreter. With uvicorn installed the app is served
+on a local port and polled until ``/health`` answers; otherwise the first
+request is sent in-process through the ASGI interface.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# 起動時に読み込まれてはいけない重いSDK（初回利用時に読み込む）
+LAZY_SDKS = (
+    "google.genai",
+    "google.generativeai",
+    "google.cloud.storage",
+    "google.auth",
+)
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+# in-process で最初の /health を送る子プロセス
+_ASGI_PROBE = """
+import asyncio, json, sys, time
+import httpx
+import main
+
+async def first_health():
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://startup") as c:
+        return (await c.get("/health")).status_code
+
+status = asyncio.run(first_health())
+print(json.dumps({"status": status}), flush=True)
+time.sleep(float(sys.argv[1]))
+print(json.dumps({"sdks": [m for m in %r if m in sys.modules]}), flush=True)
+sys.stdin.read()
+"""
+
+
+def _env() -> dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("GCS_BUCKET_NAME", "startup-benchmark")
+    env.setdefault("LOG_LEVEL", "WARNING")
+    return env
+
+
+def rss_mb(pid: int) -> float | None:
+    """プロセスの現在のRSS（MB、取得できない環境では None）"""
+    try:
+        status = Path(f"/proc/{pid}/status").read_text()
+    except OSError:
+        return None
+    match = re.search(r"VmRSS:\s+(\d+) kB", status)
+    return int(match.group(1)) / 1024 if match else None
+
+
+def measure_imports(module: str = "main", top: int = 15) -> dict[str, Any]:
+    """
+    ``python -X importtime -c "import <module>"`` の結果を集計する
+
+    ``modules`` は累積時間の大きいモジュール、``sdksLoaded`` は起動時に
+    読み込まれてしまった重いSDK。
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        env=_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative: dict[str, float] = {}
+    for line in completed.stderr.splitlines():
+        if match := _IMPORTTIME_RE.match(line):
+            cumulative[match.group(4)] = int(match.group(2)) / 1e6
+    heaviest = sorted(
+        (item for item in cumulative.items() if item[0] != module),
+        key=lambda item: item[1],
+        reverse=True,
+    )[:top]
+    return {
+        "totalSeconds": cumulative.get(module, 0.0),
+        "modules": dict(heaviest),
+        "sdksLoaded": [name for name in LAZY_SDKS if name in cumulative],
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _startup_uvicorn(idle_seconds: float, timeout: float) -> dict[str, Any]:
+    port = _free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port)],
+        cwd=BACKEND_DIR,
+        env=_env(),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        status = None
+        while time.perf_counter() - started < timeout:
+            try:
+                status = httpx.get(f"http://127.0.0.1:{port}/health").status_code
+                break
+            except httpx.TransportError:
+                time.sleep(0.01)
+        time_to_health = time.perf_counter() - started
+        time.sleep(idle_seconds)
+        return {
+            "mode": "uvicorn",
+            "status": status,
+            "timeToHealthSeconds": time_to_health,
+            "rssIdleMb": rss_mb(process.pid),
+        }
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def _startup_asgi(idle_seconds: float, timeout: float) -> dict[str, Any]:
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", _ASGI_PROBE % (LAZY_SDKS,), str(idle_seconds)],
+        cwd=BACKEND_DIR,
+        env=_env(),
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    try:
+        first = json.loads(process.stdout.readline() or "{}")
+        time_to_health = time.perf_counter() - started
+        idle = json.loads(process.stdout.readline() or "{}")
+        return {
+            "mode": "asgi",
+            "status": first.get("status"),
+            "timeToHealthSeconds": time_to_health,
+            "rssIdleMb": rss_mb(process.pid),
+            "sdksLoadedAtIdle": idle.get("sdks"),
+        }
+    finally:
+        process.kill()
+        process.wait(timeout=timeout)
+
+
+def measure_startup(
+    *, server: bool | None = None, idle_seconds: float = 0.5, timeout: float = 30.0
+) -> dict[str, Any]:
+    """
+    新しいインタプリタで起動し、最初の /health が返るまでの時間とアイドル時のRSS
+
+    server=None の場合は uvicorn があればサーバーとして起動する。
+    """
+    if server is None:
+        server = importlib.util.find_spec("uvicorn") is not None
+    if server:
+        return _startup_uvicorn(idle_seconds, timeout)
+    return _startup_asgi(idle_seconds, timeout)
+
+
+def run_startup_benchmark(
+    repeat: int = 3, *, server: bool | None = None, idle_seconds: float = 0.5
+) -> dict[str, Any]:
+    runs = [
+        measure_startup(server=server, idle_seconds=idle_seconds) for _ in range(repeat)
+    ]
+    times = [run["timeToHealthSeconds"] for run in runs]
+    rss = [run["rssIdleMb"] for run in runs if run["rssIdleMb"] is not None]
+    return {
+        "python": sys.version.split()[0],
+        "imports": measure_imports(),
+        "mode": runs[0]["mode"],
+        "timeToHealthSeconds": {
+            "median": statistics.median(times),
+            "min": min(times),
+            "max": max(times),
+        },
+        "rssIdleMb": statistics.median(rss) if rss else None,
+        "runs": runs,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--idle-seconds",
+        type=float,
+        default=3.0,
+        help="Wait before sampling RSS (covers the background SDK preload)",
+    )
+    parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Send the first request through ASGI instead of starting uvicorn",
+    )
+    parser.add_argument("--output", type=Path, default=None, help="JSON output path")
+    args = parser.parse_args(argv)
+
+    result = run_startup_benchmark(
+        args.repeat,
+        server=False if args.in_process else None,
+        idle_seconds=args.idle_seconds,
+    )
+    output = json.dumps(result, indent=2, sort_keys=True)
+    if args.output:
+        args.output.write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""
+Synthetic test videos generated with FFmpeg's ``testsrc``
+"""
+
+import shutil
+import subprocess
+from pathlib import Path
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which("ffmpeg") is not None
+
+
+def generate_test_video(
+    output_dir: Path,
+    duration: float = 60.0,
+    size: str = "1280x720",
+    rate: int = 30,
+) -> Path:
+    """
+    testsrc映像とサイン波音声からなるH.264/AACのテスト動画を生成する
+
+    同じパラメータの動画が既にあれば再利用する。
+
+    Args:
+        output_dir: 出力ディレクトリ
+        duration: 動画の長さ（秒）
+        size: 解像度（WIDTHxHEIGHT）
+        rate: フレームレート
+
+    Returns:
+        生成した動画のパス
+    """
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_path = output_dir / f"testsrc_{size}_{rate}fps_{duration:g}s.mp4"
+    if output_path.exists():
+        return output_path
+
+    cmd = [
+        "ffmpeg",
+        "-y",
+        "-f",
+        "lavfi",
+        "-i",
+        f"testsrc=duration={duration}:size={size}:rate={rate}",
+        "-f",
+        "lavfi",
+        "-i",
+        f"sine=frequency=440:duration={duration}",
+        "-c:v",
+        "libx264",
+        "-preset",
+        "ultrafast",
+        "-pix_fmt",
+        "yuv420p",
+        "-g",
+        str(rate * 2),
+        "-c:a",
+        "aac",
+        "-shortest",
+        "-movflags",
+        "+faststart",
+        str(output_path),
+    ]
+    result = subprocess.run(cmd, capture_output=True, check=False)  # noqa: S603
+    if result.returncode != 0:
+        msg = f"FFmpeg testsrc generation failed: {result.stderr.decode('utf-8')}"
+        raise RuntimeError(msg)
+    return output_path
@@ -1,33 +1,148 @@
+import asyncio
+import contextlib
+import functools
+from contextlib import asynccontextmanager
+from datetime import datetime
 from typing import Annotated
 
-from fastapi import Depends, FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import (
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 
-from app.core.settings import MODEL_CONFIGS, Settings, get_settings
+from app.core.cancellation import (
+    CLIENT_CLOSED_REQUEST,
+    ClientDisconnectedError,
+    run_until_disconnect,
+)
+from app.core.http_cache import (
+    CompressionMiddleware,
+    PreserializedJSON,
+    cached_json,
+    conditional_response,
+    signed_url_cache_control,
+)
+from app.core.lazy import warm_lazy_modules
+from app.core.profiling import ProfilingMiddleware
+from app.core.scheduling import (
+    ANALYSIS,
+    EXTRACTION,
+    QUOTA_HEADERS,
+    TenantLimitError,
+    UnknownTenantError,
+    admit,
+    check_quota,
+    resolve_tenant,
+)
+from app.core.settings import MODEL_CONFIGS, Segmentation, Settings, get_settings
+from app.core.telemetry import (
+    RequestContextMiddleware,
+    configure_telemetry,
+    render_metrics,
+)
 from app.models.schemas import (
+    AnalysesResponse,
     AnalysisResult,
+    ClipInfo,
+    ContextCachesResponse,
+    DeleteContextCachesResponse,
     ExtractRequest,
     GenerateVideoResponse,
+    IngestResponse,
+    JobInfo,
     ModelInfo,
     ModelsResponse,
     ProviderModels,
+    RangeAnalysisRequest,
+    RenderRequest,
     SignedUploadUrlRequest,
     SignedUploadUrlResponse,
+    SimilarHighlightsResponse,
+    ThumbnailRequest,
+    ThumbnailsResponse,
+    TopHighlightsResponse,
+    VideoInfo,
+    VideosResponse,
 )
-from app.services.analyze import analyze_video_service
+from app.services.analyze import analyze_video_service, vertex_client
+from app.services.analyze_range import analyze_range_service
+from app.services.context_cache import context_caches_service, delete_video_caches
 from app.services.extract import extract_video_service
+from app.services.ingest import ingest_video_service
+from app.services.jobs import enqueue_job_service, job_status_service
+from app.services.library import (
+    get_video_service,
+    list_analyses_service,
+    list_clips_service,
+    list_videos_service,
+    search_highlights_service,
+    top_highlights_service,
+)
+from app.services.model_output import ModelOutputError
+from app.services.prerender import schedule_prerender
+from app.services.profiles import load_profile_artifact, save_profile_artifact
+from app.services.progress import progress_events
+from app.services.render import render_highlights_service
+from app.services.similarity import (
+    similar_highlights_service,
+    similar_to_highlight_service,
+)
+from app.services.thumbnails import (
+    generate_thumbnails_service,
+    thumbnails_vtt_service,
+)
 from app.services.upload import init_upload_service
+from app.store import HighlightQuery
 
 # Get settings instance
 settings = get_settings()
+configure_telemetry(settings)
+
+# 待ち受け開始後にSDKを読み込むまでの待ち時間（秒）
+PRELOAD_DELAY_SECONDS = 1.0
+
+# モデル一覧はデプロイまで変わらない
+MODELS_MAX_AGE_SECONDS = 3600
+
+
+async def preload_sdks() -> None:
+    await asyncio.sleep(PRELOAD_DELAY_SECONDS)
+    await asyncio.to_thread(warm_lazy_modules)
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    """
+    重いSDKは初回利用時に読み込むため、起動はSDKの import を待たない。
+    PRELOAD_SDKS=true の場合は待ち受け開始後にバックグラウンドで読み込み、
+    最初の解析・アップロードのリクエストが import を待たないようにする。
+    """
+    preload = asyncio.create_task(preload_sdks()) if settings.preload_sdks else None
+    yield
+    if preload is not None:
+        preload.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await preload
+
 
 # FastAPI app instance
 app = FastAPI(
     title=settings.app_name,
     description="API for AI-powered short video generation",
     version=settings.version,
+    lifespan=lifespan,
 )
 
+# Compression of JSON/text responses (br / gzip)
+if settings.http_compression_enabled:
+    app.add_middleware(
+        CompressionMiddleware, minimum_size=settings.http_compression_min_bytes
+    )
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -35,41 +150,110 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Request-ID",
+        "X-Profile-Id",
+        "Link",
+        "ETag",
+        "Retry-After",
+        *QUOTA_HEADERS.values(),
+    ],
 )
 
+
+def profile_tenant(scope: dict) -> str | None:
+    """プロファイルを読めるテナント（登録されていないAPIキーは None）"""
+    try:
+        return resolve_tenant(Request(scope), settings)
+    except UnknownTenantError:
+        return None
+
+
+# Opt-in profiling of extract/analyze requests
+app.add_middleware(
+    ProfilingMiddleware,
+    settings=settings,
+    save_artifact=save_profile_artifact,
+    tenant_of=profile_tenant,
+)
+
+# Request ID propagation and HTTP metrics
+app.add_middleware(RequestContextMiddleware)
+
 # --- Routes ---
 
 
+def request_tenant(
+    request: Request, settings: Annotated[Settings, Depends(get_settings)]
+) -> str:
+    """リクエストのテナント（登録されていないAPIキーは 401）"""
+    try:
+        return resolve_tenant(request, settings)
+    except UnknownTenantError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+
 @app.get("/health")
 async def get_health():
     """ヘルスチェックエンドポイント"""
     return {"status": "healthy"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Prometheus形式のメトリクス（ステージ別レイテンシ・HTTPリクエスト数）"""
+    return PlainTextResponse(
+        render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+@app.get("/api/profiles/{profile_id}")
+async def get_profile(profile_id: str, tenant: Annotated[str, Depends(request_tenant)]):
+    """
+    プロファイル結果（Pythonサンプリング、ステージ別時間、FFmpegの資源使用量）を返します。
+    プロファイル対象リクエストのレスポンスヘッダー X-Profile-Id / Link で参照されます。
+    他のテナントのリクエストのプロファイルは 404 を返します。
+    """
+    profile = load_profile_artifact(profile_id)
+    if profile is None or profile.get("tenant") != tenant:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+
+@functools.cache
+def models_response() -> PreserializedJSON:
+    """MODEL_CONFIGS から組み立てたモデル一覧（一度だけシリアライズする）"""
+    # Convert the MODEL_CONFIGS dictionary to the response format
+    response_data = {"providers": {}}
+
+    for provider_key, provider_data in MODEL_CONFIGS["providers"].items():
+        models = {}
+        for model_key, model_data in provider_data["models"].items():
+            models[model_key] = ModelInfo(
+                id=model_data["id"],
+                name=model_data["name"],
+                description=model_data["description"],
+            )
+
+        response_data["providers"][provider_key] = ProviderModels(
+            name=provider_data["name"], models=models
+        )
+
+    return PreserializedJSON(
+        ModelsResponse(**response_data),
+        cache_control=f"public, max-age={MODELS_MAX_AGE_SECONDS}",
+    )
+
+
 @app.get("/api/v1/models", response_model=ModelsResponse)
-async def get_models():
+async def get_models(request: Request):
     """
     利用可能なAIモデルとプロバイダーの一覧を返します。
     各プロバイダーごとに利用可能なモデルのIDと説明を含みます。
+    ETag が If-None-Match と一致する場合は 304 を返します。
     """
     try:
-        # Convert the MODEL_CONFIGS dictionary to the response format
-        response_data = {"providers": {}}
-
-        for provider_key, provider_data in MODEL_CONFIGS["providers"].items():
-            models = {}
-            for model_key, model_data in provider_data["models"].items():
-                models[model_key] = ModelInfo(
-                    id=model_data["id"],
-                    name=model_data["name"],
-                    description=model_data["description"],
-                )
-
-            response_data["providers"][provider_key] = ProviderModels(
-                name=provider_data["name"], models=models
-            )
-
-        return ModelsResponse(**response_data)
+        return models_response().response(request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -78,55 +262,480 @@ async def get_models():
 async def init_upload(
     request: SignedUploadUrlRequest,
     settings: Annotated[Settings, Depends(get_settings)],
+    tenant: Annotated[str, Depends(request_tenant)],
 ):
     """
     動画アップロードの初期化を行います。
     ファイル名とコンテンツタイプを受け取り、Cloud Storageへの直接アップロード用の
     署名付きURLを生成します。同時に、一意のファイルIDを生成します。
+    contentHash（"md5:<hex>" または "crc32c:<hex>"）とファイルサイズが
+    同じテナントの照合済みの動画と一致する場合は、uploadUrl の代わりにその fileId を
+    deduplicated=true で返します（アップロードと取り込みは不要です）。
+    ハッシュは取り込み（/api/upload/{file_id}/complete）または最初の解析で
+    アップロードされたオブジェクトと照合されます。
+    """
+    try:
+        response = await init_upload_service(request, settings, tenant)
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def enqueue_job(
+    tenant: str, kind: str, payload: dict, settings: Settings
+) -> JSONResponse:
+    """
+    ジョブをワーカーに任せ、202 とジョブの状態URLを返す
+
+    Raises:
+        TenantLimitError: クォータ超過・待ちジョブ数の上限の場合
+    """
+    await check_quota(tenant, settings)
+    job = await enqueue_job_service(kind, payload, tenant, settings)
+    return JSONResponse(
+        status_code=202,
+        content=job.model_dump(),
+        headers={"Location": f"/api/jobs/{job.jobId}"},
+    )
+
+
+@app.post(
+    "/api/upload/{file_id}/complete",
+    response_model=IngestResponse,
+    responses={202: {"model": JobInfo}},
+)
+async def complete_upload(
+    file_id: str,
+    http_request: Request,
+    http_response: Response,
+    settings: Annotated[Settings, Depends(get_settings)],
+    tenant: Annotated[str, Depends(request_tenant)],
+):
+    """
+    署名付きURLへのアップロード完了後に呼び出し、動画を取り込みます。
+    ffprobe でコンテナとコーデックを検証し、faststart の MP4 に変換します
+    （可能な限りストリームコピーし、MP4に入らないコーデックだけ再エンコード）。
+    変換後の動画が以降の解析・切り出しの元になります。
+    読めない動画、contentHash と一致しない動画は 400 を返します。
+    JOB_EXECUTION=queue の場合はワーカーに任せて 202 を返します。
     """
     try:
-        response = await init_upload_service(request, settings)
+        if settings.job_execution == "queue":
+            return await enqueue_job(tenant, "ingest", {"fileId": file_id}, settings)
+        async with admit(tenant, http_response, EXTRACTION, settings):
+            response = await run_until_disconnect(
+                http_request, ingest_video_service(file_id, settings)
+            )
         return response
+    except TenantLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=e.headers)
+    except ClientDisconnectedError:
+        raise HTTPException(
+            status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request"
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/analyze/{file_id}", response_model=AnalysisResult)
+@app.post(
+    "/api/analyze/{file_id}",
+    response_model=AnalysisResult,
+    responses={202: {"model": JobInfo}},
+)
 async def analyze_video(
     file_id: str,
+    http_response: Response,
     settings: Annotated[Settings, Depends(get_settings)],
+    tenant: Annotated[str, Depends(request_tenant)],
+    refresh: bool = False,
+    segmentation: Segmentation | None = None,
 ):
     """
     アップロードされた動画のAI解析を実行します。
     Vertex AI（Gemini API）を使用して動画を解析し、
     30秒ごとのセグメントに対してハイライトスコアを算出します。
+    segmentation=scenes の場合はシーンの切り替わりと音声の区切りから求めた
+    候補セグメントを採点します。segmentation=transcript の場合は動画の代わりに
+    ローカルの音声認識による文字起こしと代表フレームを送り、発話の区切りから
+    求めた候補セグメントを採点します。segmentation=keyframes の場合は動画の代わりに
+    シーンの候補セグメントごとの代表フレームの画像だけを送ります
+    （省略時は ANALYSIS_SEGMENTATION）。
+    同じモデル・プロンプトで解析済みの場合は保存済みの結果を返します
+    （refresh=true で再解析）。
+    JOB_EXECUTION=queue の場合はワーカーに任せて 202 を返します
+    （結果は GET /api/jobs/{job_id}）。
+    PRERENDER_TOP_K を設定すると、スコア上位のハイライトを抽出キューが空いている
+    間に先行して切り出します（同じ区間の /api/extract はすぐに返ります）。
     """
     try:
-        response = await analyze_video_service(file_id, settings)
+        if settings.job_execution == "queue":
+            return await enqueue_job(
+                tenant,
+                "analyze",
+                {"fileId": file_id, "refresh": refresh, "segmentation": segmentation},
+                settings,
+            )
+        async with admit(tenant, http_response, ANALYSIS, settings):
+            response = await analyze_video_service(
+                file_id, settings, refresh=refresh, segmentation=segmentation
+            )
+        schedule_prerender(file_id, response, tenant, settings)
         return response
+    except TenantLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=e.headers)
+    except ModelOutputError as e:
+        raise HTTPException(status_code=502, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/extract", response_model=GenerateVideoResponse)
+@app.post("/api/analyze/{file_id}/range", response_model=AnalysisResult)
+async def analyze_video_range(
+    file_id: str,
+    request: RangeAnalysisRequest,
+    http_request: Request,
+    http_response: Response,
+    settings: Annotated[Settings, Depends(get_settings)],
+    tenant: Annotated[str, Depends(request_tenant)],
+):
+    """
+    解析済みの動画の指定区間（start〜end秒）だけを再解析します。
+    区間を granularity 秒ごとに分割し直してスコアを付け、保存済みの解析結果の
+    区間内のハイライトだけを差し替えた全体の結果を返します。
+    """
+    try:
+        async with admit(tenant, http_response, ANALYSIS, settings):
+            response = await run_until_disconnect(
+                http_request, analyze_range_service(file_id, request, settings)
+            )
+        return response
+    except TenantLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=e.headers)
+    except ClientDisconnectedError:
+        raise HTTPException(
+            status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request"
+        )
+    except ModelOutputError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post(
+    "/api/extract",
+    response_model=GenerateVideoResponse,
+    responses={202: {"model": JobInfo}},
+)
 async def extract_video(
     request: ExtractRequest,
+    http_request: Request,
+    http_response: Response,
     settings: Annotated[Settings, Depends(get_settings)],
+    tenant: Annotated[str, Depends(request_tenant)],
 ):
     """
     選択されたハイライトセグメントから新しい動画を生成します。
     複数のセグメントを結合し、適切なトランジションを適用した上で、
     最終的な動画ファイルを生成します。
+    X-Request-ID を指定すると GET /api/progress/{request_id} で進捗を購読でき、
+    クライアントが切断した場合はFFmpegの処理も中断されます。
+    JOB_EXECUTION=queue の場合はワーカーに任せて 202 を返します。
+    """
+    try:
+        if settings.job_execution == "queue":
+            return await enqueue_job(
+                tenant, "extract", request.model_dump(mode="json"), settings
+            )
+        async with admit(tenant, http_response, EXTRACTION, settings):
+            response = await run_until_disconnect(
+                http_request, extract_video_service(request, settings)
+            )
+        return response
+    except TenantLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=e.headers)
+    except ClientDisconnectedError:
+        raise HTTPException(
+            status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request"
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/render", response_model=GenerateVideoResponse)
+async def render_video(
+    request: RenderRequest,
+    http_request: Request,
+    http_response: Response,
+    settings: Annotated[Settings, Depends(get_settings)],
+    tenant: Annotated[str, Depends(request_tenant)],
+):
+    """
+    複数のハイライトを1本のショート動画にまとめます。
+    縦型（9:16）などへの切り出し（中央またはサリエンシー）、クロスフェード、
+    ラウドネス正規化を1回のFFmpeg実行で行います。
+    preset（vertical_1080 など）または output で出力形式を指定します。
     """
     try:
-        response = await extract_video_service(request, settings)
+        async with admit(tenant, http_response, EXTRACTION, settings):
+            response = await run_until_disconnect(
+                http_request, render_highlights_service(request, settings)
+            )
         return response
+    except TenantLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=e.headers)
+    except ClientDisconnectedError:
+        raise HTTPException(
+            status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request"
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/thumbnails/{file_id}", response_model=ThumbnailsResponse)
+async def generate_thumbnails(
+    file_id: str,
+    request: ThumbnailRequest,
+    http_request: Request,
+    http_response: Response,
+    settings: Annotated[Settings, Depends(get_settings)],
+    tenant: Annotated[str, Depends(request_tenant)],
+):
+    """
+    タイムライン用のスプライト画像とハイライトごとのサムネイルを生成します。
+    動画は低フレームレートで1回だけデコードされ、生成済みの場合は再利用されます。
+    """
+    try:
+        async with admit(tenant, http_response, EXTRACTION, settings):
+            response = await run_until_disconnect(
+                http_request,
+                generate_thumbnails_service(file_id, request.highlights, settings),
+            )
+        return response
+    except TenantLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=e.headers)
+    except ClientDisconnectedError:
+        raise HTTPException(
+            status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request"
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/jobs/{job_id}", response_model=JobInfo)
+async def get_job(job_id: str, tenant: Annotated[str, Depends(request_tenant)]):
+    """
+    ワーカーに任せたジョブの状態を返します。
+    成功した場合は result に解析結果・生成した動画の情報が入ります。
+    他のテナントのジョブは 404 を返します。
+    """
+    job = await job_status_service(job_id, tenant)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/api/thumbnails/{file_id}/thumbnails.vtt")
+async def get_thumbnails_vtt(
+    file_id: str,
+    request: Request,
+    settings: Annotated[Settings, Depends(get_settings)],
+):
+    """
+    タイムラインプレビュー用のWebVTT（署名付きスプライトURL + #xywh）を返します。
+    埋め込んだURLの有効期限が近づくまでキャッシュできます。
+    """
+    result = await thumbnails_vtt_service(file_id, settings)
+    if result is None:
+        raise HTTPException(status_code=404, detail="Thumbnails not found")
+    vtt, expires_at = result
+    return conditional_response(
+        request,
+        vtt.encode(),
+        media_type="text/vtt",
+        cache_control=signed_url_cache_control(
+            expires_at, settings.signed_url_cache_margin_seconds
+        ),
+    )
+
+
+@app.get("/api/videos", response_model=VideosResponse)
+async def list_videos(
+    request: Request,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: str | None = None,
+):
+    """
+    アップロード済み動画の一覧を新しい順に返します。
+    続きは nextCursor を cursor に指定して取得します。
+    """
+    try:
+        return cached_json(request, await list_videos_service(limit, cursor))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/videos/{file_id}", response_model=VideoInfo)
+async def get_video(file_id: str, request: Request):
+    """アップロード済み動画の情報（メタデータを含む）を返します。"""
+    video = await get_video_service(file_id)
+    if video is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+    return cached_json(request, video)
+
+
+@app.get("/api/videos/{file_id}/analyses", response_model=AnalysesResponse)
+async def list_video_analyses(file_id: str, request: Request):
+    """
+    動画の解析結果を新しい順に返します。
+    各結果にはモデルとプロンプトのバージョンが含まれます。
+    内容のハッシュを ETag とし、変わっていなければ 304 を返します。
+    """
+    return cached_json(request, await list_analyses_service(file_id))
+
+
+@app.get("/api/videos/{file_id}/clips", response_model=list[ClipInfo])
+async def list_video_clips(file_id: str, request: Request):
+    """動画から生成したクリップ（切り出し・レンダリング結果）の一覧を返します。"""
+    return cached_json(request, await list_clips_service(file_id))
+
+
+@app.get("/api/context-caches", response_model=ContextCachesResponse)
+async def list_context_caches(
+    settings: Annotated[Settings, Depends(get_settings)],
+    file_id: Annotated[str | None, Query(alias="fileId")] = None,
+):
+    """
+    Gemini のコンテキストキャッシュ（動画のトークン）の登録情報を返します。
+    キャッシュのトークン数・利用回数・キャッシュから読まれたトークン数と、
+    それによる節約量の見積もりを含みます。
+    """
+    return await context_caches_service(settings, file_id)
+
+
+@app.delete("/api/context-caches/{file_id}", response_model=DeleteContextCachesResponse)
+async def delete_context_caches(
+    file_id: str, settings: Annotated[Settings, Depends(get_settings)]
+):
+    """動画のコンテキストキャッシュを期限前に削除します。"""
+    try:
+        deleted = await delete_video_caches(vertex_client(settings), file_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return DeleteContextCachesResponse(deleted=deleted)
+
+
+@app.get("/api/highlights/top", response_model=TopHighlightsResponse)
+async def get_top_highlights(
+    request: Request,
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: str | None = None,
+    file_id: Annotated[str | None, Query(alias="fileId")] = None,
+    min_score: Annotated[float | None, Query(alias="minScore")] = None,
+):
+    """
+    各動画の最新の解析結果から、スコアの高いハイライトを順に返します。
+    fileId で動画を、minScore で最低スコアを絞り込めます。
+    """
+    try:
+        response = await top_highlights_service(limit, cursor, file_id, min_score)
+        return cached_json(request, response)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/highlights/search", response_model=TopHighlightsResponse)
+async def search_highlights(
+    request: Request,
+    q: str = "",
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    cursor: str | None = None,
+    file_id: Annotated[str | None, Query(alias="fileId")] = None,
+    min_score: Annotated[float | None, Query(alias="minScore")] = None,
+    max_score: Annotated[float | None, Query(alias="maxScore")] = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+):
+    """
+    全動画のハイライトを検索し、スコアの高い順に返します。
+    q は空白区切りの語をすべてタイトルか説明に含むもの（日本語は部分一致）、
+    since / until は解析日時（ISO 8601）の範囲で絞り込みます。
+    """
+    query = HighlightQuery(
+        text=q,
+        file_id=file_id,
+        min_score=min_score,
+        max_score=max_score,
+        since=since.timestamp() if since else None,
+        until=until.timestamp() if until else None,
+    )
+    try:
+        response = await search_highlights_service(query, limit, cursor)
+        return cached_json(request, response)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/api/highlights/similar", response_model=SimilarHighlightsResponse)
+async def get_similar_highlights(
+    q: str,
+    settings: Annotated[Settings, Depends(get_settings)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    exclude_file_id: Annotated[str | None, Query(alias="excludeFileId")] = None,
+):
+    """
+    テキストと意味の近いハイライトを、全動画から類似度の高い順に返します。
+    キーワード検索では見つからない言い換えにも一致します。
+    """
+    return await similar_highlights_service(
+        q, limit, settings, exclude_file_id=exclude_file_id
+    )
+
+
+@app.get(
+    "/api/highlights/{highlight_id}/similar",
+    response_model=SimilarHighlightsResponse,
+)
+async def get_highlights_similar_to(
+    highlight_id: int,
+    settings: Annotated[Settings, Depends(get_settings)],
+    limit: Annotated[int, Query(ge=1, le=100)] = 20,
+    other_videos: Annotated[bool, Query(alias="otherVideos")] = True,
+):
+    """
+    指定したハイライトに似た場面を返します（既定では他の動画から）。
+    複数の動画からまとめ動画を作る際の候補探しに使います。
+    """
+    response = await similar_to_highlight_service(
+        highlight_id, limit, settings, other_videos=other_videos
+    )
+    if response is None:
+        raise HTTPException(status_code=404, detail="Highlight not found")
+    return response
+
+
+@app.get("/api/progress/{request_id}")
+async def get_progress(request_id: str):
+    """
+    X-Request-ID で指定した処理の進捗を Server-Sent Events で配信します。
+    処理の開始前に購読を始めることもできます。
+    """
+    return StreamingResponse(
+        progress_events(request_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # Entry point for direct execution
 if __name__ == "__main__":
     import os
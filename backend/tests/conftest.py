@@ -1,10 +1,37 @@
+from unittest.mock import patch
+
 import pytest
 from fastapi.testclient import TestClient
 
+from app.services.embeddings import HashingEmbedder
+from app.services.similarity import set_vector_index
+from app.store import SQLiteVideoStore, set_store
+from app.store.vectors import VectorIndex
+from benchmarks.fakes import FakeGCS
 from main import app
 
 
+@pytest.fixture(autouse=True)
+def store():
+    """テストごとにインメモリのストアとベクトル索引を使う"""
+    memory_store = SQLiteVideoStore(":memory:")
+    embedder = HashingEmbedder()
+    set_store(memory_store)
+    set_vector_index(VectorIndex(None, dim=embedder.dim, model=embedder.name))
+    yield memory_store
+    set_store(None)
+    set_vector_index(None)
+
+
 @pytest.fixture
 def client():
     """テストクライアントのフィクスチャ"""
     return TestClient(app)
+
+
+@pytest.fixture
+def gcs(tmp_path):
+    """GCSクライアントをローカルディレクトリ上の偽物に差し替える"""
+    fake = FakeGCS(tmp_path / "gcs")
+    with patch("google.cloud.storage.Client", fake.client):
+        yield fake
@@ -0,0 +1,158 @@
+import asyncio
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.core.settings import Settings
+from app.models.schemas import AnalysisResult, Highlight, RangeAnalysisRequest
+from app.services.analyze import GeminiResponse, GeminiSegment, analysis_prompt
+from app.services.analyze_range import (
+    analyze_range_service,
+    build_window_command,
+    splice_highlights,
+    validate_range,
+    window_highlights,
+)
+from app.services.library import record_analysis
+from app.services.prompts import SEGMENT_ANALYSIS_PROMPT, prompt_version
+from benchmarks.videos import ffmpeg_available, generate_test_video
+
+
+def _highlight(start: float, end: float, title: str = "", score: float = 0.5):
+    return Highlight(
+        start=start, end=end, title=title or f"{start:g}", description="", score=score
+    )
+
+
+def test_splice_replaces_only_the_window():
+    """区間内だけを差し替え、またがるハイライトは区間外の部分を残すこと"""
+    existing = [_highlight(0, 30), _highlight(30, 60), _highlight(60, 90)]
+    replacement = [_highlight(40, 45, "new1"), _highlight(45, 50, "new2")]
+
+    spliced = splice_highlights(existing, replacement, 40, 50)
+
+    assert [(h.start, h.end, h.title) for h in spliced] == [
+        (0, 30, "0"),
+        (30, 40, "30"),
+        (40, 45, "new1"),
+        (45, 50, "new2"),
+        (50, 60, "30"),
+        (60, 90, "60"),
+    ]
+
+
+def test_window_highlights_offsets_and_clamps():
+    """クリップ内の時刻を元の動画の時刻に直し、区間内に収めること"""
+    segments = [
+        GeminiSegment(start=0, end=10, title="a", description="", score=0.4),
+        GeminiSegment(start=10, end=25, title="b", description="", score=0.9),
+        GeminiSegment(start=40, end=50, title="outside", description="", score=1),
+    ]
+    highlights = window_highlights(segments, 100, 120)
+    assert [(h.start, h.end, h.title) for h in highlights] == [
+        (100, 110, "a"),
+        (110, 120, "b"),
+    ]
+
+
+def test_window_command_seeks_before_input():
+    """入力シークで区間だけを読み、低解像度のクリップにすること"""
+    cmd = build_window_command("https://signed/url", "out.mp4", 12.5, 42.5)
+    assert cmd.index("-ss") < cmd.index("-i")
+    assert cmd[cmd.index("-t") + 1] == "30.000"
+    assert "fps=5" in cmd[cmd.index("-vf") + 1]
+
+
+def test_validate_range():
+    with pytest.raises(ValueError, match="greater"):
+        validate_range(RangeAnalysisRequest(start=10, end=5))
+    with pytest.raises(ValueError, match="at most"):
+        validate_range(RangeAnalysisRequest(start=0, end=1000))
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg is not installed")
+def test_analyze_range_sends_only_the_window(tmp_path, monkeypatch):
+    """区間のクリップだけをモデルに送り、保存済みの解析に差し込むこと"""
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    settings = Settings(gcs_project_id="project")
+    video = generate_test_video(tmp_path, duration=12, size="320x180", rate=15)
+    full = AnalysisResult(highlights=[_highlight(0, 6), _highlight(6, 12)])
+    asyncio.run(
+        record_analysis(
+            "vid",
+            provider="vertex_ai",
+            model=settings.vertex_ai_model,
+            version=prompt_version(SEGMENT_ANALYSIS_PROMPT),
+            result=full,
+            settings=settings,
+        )
+    )
+    sent = {}
+
+    def fake_generate(part, prompt, _settings):
+        sent["bytes"] = len(part.inline_data.data)
+        sent["prompt"] = prompt
+        return GeminiResponse(
+            segments=[
+                GeminiSegment(start=0, end=2, title="細分1", description="", score=0.9),
+                GeminiSegment(start=2, end=4, title="細分2", description="", score=0.2),
+            ]
+        )
+
+    blob = SimpleNamespace(name="uploads/vid.mp4")
+    with (
+        patch("app.services.analyze_range.storage.Client"),
+        patch("app.services.analyze_range.find_upload_blob", return_value=blob),
+        patch("app.services.analyze_range.window_source", return_value=str(video)),
+        patch("app.services.analyze_range.generate_with_vertex", fake_generate),
+    ):
+        result = asyncio.run(
+            analyze_range_service(
+                "vid", RangeAnalysisRequest(start=4, end=8, granularity=2), settings
+            )
+        )
+
+    assert 0 < sent["bytes"] < video.stat().st_size
+    assert "4秒〜8秒" in sent["prompt"]
+    assert [(h.start, h.end, h.title) for h in result.highlights] == [
+        (0, 4, "0"),
+        (4, 6, "細分1"),
+        (6, 8, "細分2"),
+        (8, 12, "6"),
+    ]
+
+
+def test_range_splices_into_analysis_of_any_segmentation(monkeypatch, store):
+    """全体の解析が既定と異なる区切り方でも、その解析に差し込んで保存すること"""
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    settings = Settings(analysis_segmentation="fixed")
+    scenes_version = prompt_version(analysis_prompt("vertex_ai", "scenes"))
+    asyncio.run(
+        record_analysis(
+            "vid",
+            provider="vertex_ai",
+            model=settings.vertex_ai_model,
+            version=scenes_version,
+            result=AnalysisResult(highlights=[_highlight(0, 20)]),
+            settings=settings,
+        )
+    )
+    window = AsyncMock(return_value=[_highlight(5, 10, "new")])
+
+    with (
+        patch("app.services.analyze_range.storage.Client"),
+        patch("app.services.analyze_range.find_upload_blob"),
+        patch("app.services.analyze_range.window_source", return_value="src"),
+        patch("app.services.analyze_range.analyze_window", window),
+    ):
+        result = asyncio.run(
+            analyze_range_service(
+                "vid", RangeAnalysisRequest(start=5, end=10, granularity=5), settings
+            )
+        )
+
+    assert [(h.start, h.end) for h in result.highlights] == [(0, 5), (5, 10), (10, 20)]
+    latest = asyncio.run(store.list_analyses("vid"))[0]
+    assert latest.prompt_version == scenes_version
+    assert len(latest.highlights) == 3
@@ -0,0 +1,112 @@
+import json
+
+import pytest
+
+from benchmarks.compare import compare
+from benchmarks.fakes import FakeGCS, FakeGemini
+from benchmarks.harness import BenchmarkConfig, percentile, run_benchmark
+from benchmarks.startup import measure_imports, measure_startup
+from benchmarks.transfer import parse_size, write_synthetic_file
+
+
+def test_percentile_interpolates():
+    """パーセンタイルが線形補間で計算されること"""
+    values = [1.0, 2.0, 3.0, 4.0]
+    assert percentile(values, 50) == pytest.approx(2.5)
+    assert percentile(values, 100) == 4.0
+    assert percentile([], 95) == 0.0
+
+
+def test_fake_gcs_counts_bytes(tmp_path):
+    """FakeGCSが転送バイト数を記録すること"""
+    gcs = FakeGCS(tmp_path / "gcs")
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"x" * 100)
+
+    blob = gcs.client().bucket("bucket").blob("uploads/a.mp4")
+    assert not blob.exists()
+    blob.upload_from_filename(str(source))
+    blob.download_to_filename(str(tmp_path / "copy.bin"))
+
+    assert blob.exists()
+    assert gcs.bytes_uploaded == 100
+    assert gcs.bytes_downloaded == 100
+
+
+def test_fake_gemini_covers_video_duration():
+    """FakeGeminiのセグメントが動画全体を覆うこと"""
+    gemini = FakeGemini(video_duration=75, segment_seconds=30)
+    segments = json.loads(gemini.response_text())["segments"]
+    assert [(s["start"], s["end"]) for s in segments] == [
+        (0, 30),
+        (30, 60),
+        (60, 75),
+    ]
+
+
+def test_fake_gemini_estimates_tokens_and_answers_by_index():
+    """動画は長さから、画像は枚数から入力トークンを概算し、候補の番号で答えること"""
+    from google.genai import types  # noqa: PLC0415
+
+    from app.services.analyze import GeminiCandidateResponse  # noqa: PLC0415
+
+    gemini = FakeGemini(video_duration=60, segment_seconds=30)
+    video = types.Part.from_uri(file_uri="gs://b/v.mp4", mime_type="video/mp4")
+    image = types.Part.from_bytes(data=b"\xff\xd8", mime_type="image/jpeg")
+    gemini.generate(model="m", contents=[video, "x" * 40])
+    assert gemini.input_tokens == 60 * 98 + 10
+
+    gemini.reset_counters()
+    response = gemini.generate(
+        model="m",
+        contents=[image, image, "x" * 40],
+        config=types.GenerateContentConfig(response_schema=GeminiCandidateResponse),
+    )
+    assert gemini.input_tokens == 2 * 66 + 10
+    assert gemini.inline_bytes == 2 * 2 + 40
+    segments = json.loads(response.text)["segments"]
+    assert [s["index"] for s in segments] == [0, 1]
+
+
+def test_compare_reports_change():
+    """ベンチマーク結果の変化率が計算されること"""
+    base = {"workloads": {"upload_init": {"throughput_rps": 100.0}}}
+    head = {"workloads": {"upload_init": {"throughput_rps": 150.0}}}
+    rows = compare(base, head)
+    throughput = next(row for row in rows if row["metric"] == "throughput_rps")
+    assert throughput["change_pct"] == 50.0
+
+
+@pytest.mark.asyncio
+async def test_run_benchmark_upload_init():
+    """upload_initワークロードがオフラインで実行できること"""
+    result = await run_benchmark(
+        BenchmarkConfig(workloads=["upload_init"], requests=5, concurrency=2)
+    )
+    upload = result["workloads"]["upload_init"]
+    assert upload["requests"] == 5
+    assert upload["errors"] == 0
+    assert set(upload["latency_ms"]) == {"p50", "p95", "p99", "mean", "max"}
+    assert result["peak_rss_mb"]["self"] > 0
+
+
+def test_startup_does_not_import_sdks():
+    """起動時に重いSDKを読み込まず、最初の /health が返ること"""
+    imports = measure_imports()
+    assert imports["sdksLoaded"] == []
+    assert imports["totalSeconds"] > 0
+
+    startup = measure_startup(server=False, idle_seconds=0)
+    assert startup["status"] == 200
+    assert startup["timeToHealthSeconds"] > 0
+    assert startup["sdksLoadedAtIdle"] == []
+
+
+def test_transfer_benchmark_sizes(tmp_path):
+    assert parse_size("100M") == 100 * 1024 * 1024
+    assert parse_size("5GB") == 5 * 1024**3
+    assert parse_size("1000") == 1000
+
+    path = tmp_path / "synthetic"
+    write_synthetic_file(path, 5 * 1024 * 1024 + 3)
+    assert path.stat().st_size == 5 * 1024 * 1024 + 3
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from app.core.cancellation import ClientDisconnectedError, run_until_disconnect
+
+
+class FakeRequest:
+    def __init__(self, disconnected):
+        self.disconnected = disconnected
+        self.url = type("URL", (), {"path": "/api/extract"})()
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+@pytest.mark.asyncio
+async def test_returns_result_when_connected():
+    """接続中は処理結果をそのまま返すこと"""
+
+    async def work():
+        return "done"
+
+    assert await run_until_disconnect(FakeRequest(False), work()) == "done"
+
+
+@pytest.mark.asyncio
+async def test_cancels_work_when_client_disconnects():
+    """クライアント切断時に処理がキャンセルされること"""
+    cancelled = asyncio.Event()
+
+    async def work():
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(ClientDisconnectedError):
+        await run_until_disconnect(FakeRequest(True), work(), poll_interval=0.01)
+    assert cancelled.is_set()
@@ -0,0 +1,229 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
+
+from google.genai import errors
+from google.genai.types import Part
+
+from app.core.settings import Settings
+from app.services.analyze import generate_for_upload
+from app.services.context_cache import context_caches_service
+from app.store import ContextCacheRecord, VideoRecord
+
+RESPONSE = json.dumps(
+    {
+        "segments": [
+            {"start": 0, "end": 30, "title": "a", "description": "", "score": 0.5}
+        ]
+    }
+)
+CACHE_TOKENS = 5000
+
+
+class FakeVertex:
+    """キャッシュ作成と生成の呼び出しを記録する genai.Client の代替"""
+
+    def __init__(self, fail_cached: bool = False):
+        self.fail_cached = fail_cached
+        self.created = []
+        self.generated = []
+        self.caches = SimpleNamespace(
+            create=self._create, update=lambda **_: None, delete=lambda **_: None
+        )
+        self.models = SimpleNamespace(generate_content=self._generate)
+
+    def client(self, *_args, **_kwargs):
+        return self
+
+    def _create(self, *, config, **_):
+        self.created.append(config)
+        return SimpleNamespace(
+            name=f"cachedContents/{len(self.created)}",
+            usage_metadata=SimpleNamespace(total_token_count=CACHE_TOKENS),
+            expire_time=None,
+        )
+
+    def _generate(self, *, contents, config, **_):
+        self.generated.append((contents, config))
+        if config.cached_content and self.fail_cached:
+            raise errors.ClientError(404, {"error": {"message": "cache not found"}})
+        return SimpleNamespace(
+            text=RESPONSE,
+            usage_metadata=SimpleNamespace(
+                cached_content_token_count=CACHE_TOKENS
+                if config.cached_content
+                else None
+            ),
+        )
+
+
+def _analyze(fake: FakeVertex, settings: Settings, prompt: str = "P"):
+    video = Part.from_uri(file_uri="gs://bucket/uploads/vid.mp4", mime_type="video/mp4")
+    with (
+        patch("app.services.analyze.genai.Client", fake.client),
+        patch(
+            "app.services.analyze.uploaded_video_part", AsyncMock(return_value=video)
+        ),
+    ):
+        return asyncio.run(generate_for_upload("vid", prompt, settings))
+
+
+def _settings(**kwargs):
+    return Settings(gcs_project_id="project", context_cache_enabled=True, **kwargs)
+
+
+def test_follow_up_prompts_reuse_the_cached_video():
+    """動画のキャッシュを1回だけ作り、以後の解析はプロンプトだけを送ること"""
+    fake = FakeVertex()
+    settings = _settings()
+
+    _analyze(fake, settings, "rubric A")
+    _analyze(fake, settings, "rubric B")
+
+    assert len(fake.created) == 1
+    assert fake.created[0].system_instruction
+    # キャッシュする動画も、キャッシュを使わないときと同じ解像度で送る
+    cached_video = fake.created[0].contents[0].parts[0]
+    assert cached_video.media_resolution.level == "MEDIA_RESOLUTION_LOW"
+    assert {config.media_resolution for _, config in fake.generated} == {
+        "MEDIA_RESOLUTION_LOW"
+    }
+    assert [contents for contents, _ in fake.generated] == [["rubric A"], ["rubric B"]]
+    assert {config.cached_content for _, config in fake.generated} == {
+        "cachedContents/1"
+    }
+
+    report = asyncio.run(context_caches_service(settings))
+    assert report.caches[0].tokenCount == CACHE_TOKENS
+    assert report.caches[0].hits == 2
+    assert report.totalCachedTokens == 2 * CACHE_TOKENS
+    assert report.totalEstimatedTokensSaved == round(2 * CACHE_TOKENS * 0.75)
+
+
+def test_caching_disabled_sends_the_video():
+    fake = FakeVertex()
+    _analyze(fake, Settings(gcs_project_id="project"))
+
+    assert fake.created == []
+    contents, config = fake.generated[0]
+    assert len(contents) == 2
+    assert config.cached_content is None
+    assert config.system_instruction
+
+
+def test_unusable_cache_falls_back_and_is_forgotten(store):
+    """期限切れなどで使えないキャッシュは登録から外し、動画を送って解析すること"""
+    fake = FakeVertex(fail_cached=True)
+    settings = _settings()
+
+    response = _analyze(fake, settings)
+
+    assert len(response.segments) == 1
+    assert fake.generated[-1][1].cached_content is None
+    assert asyncio.run(store.list_context_caches()) == []
+
+
+def test_short_videos_are_not_cached(store):
+    asyncio.run(store.upsert_video(_video(duration=10)))
+    fake = FakeVertex()
+
+    _analyze(fake, _settings())
+
+    assert fake.created == []
+
+
+def test_expired_caches_are_not_used(store):
+    now = time.time()
+    asyncio.run(
+        store.put_context_cache(
+            ContextCacheRecord(
+                name="cachedContents/old",
+                file_id="vid",
+                model=Settings().vertex_ai_model,
+                token_count=1,
+                created_at=now - 7200,
+                expires_at=now - 10,
+            )
+        )
+    )
+    fake = FakeVertex()
+
+    _analyze(fake, _settings())
+
+    assert len(fake.created) == 1
+    names = [c.name for c in asyncio.run(store.list_context_caches())]
+    assert names == ["cachedContents/1"]
+
+
+def test_api_lists_context_caches(client, store):
+    now = time.time()
+    asyncio.run(
+        store.put_context_cache(
+            ContextCacheRecord(
+                name="cachedContents/1",
+                file_id="vid",
+                model="m",
+                token_count=100,
+                created_at=now,
+                expires_at=now + 3600,
+                hits=3,
+                cached_tokens=300,
+            )
+        )
+    )
+
+    response = client.get("/api/context-caches", params={"fileId": "vid"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["caches"][0]["expired"] is False
+    assert body["totalEstimatedTokensSaved"] == 225
+
+
+def _video(duration: float) -> VideoRecord:
+    return VideoRecord(
+        file_id="vid",
+        file_name="vid.mp4",
+        content_type="video/mp4",
+        file_size=1,
+        created_at=time.time(),
+        duration=duration,
+    )
+
+
+def test_model_call_does_not_block_the_event_loop():
+    """モデルの応答を待つ間も、他のリクエストの処理が進むこと"""
+
+    class SlowVertex(FakeVertex):
+        def _generate(self, **kwargs):
+            time.sleep(0.3)
+            return super()._generate(**kwargs)
+
+    fake = SlowVertex()
+    video = Part.from_uri(file_uri="gs://bucket/uploads/vid.mp4", mime_type="video/mp4")
+    ticks = []
+
+    async def ticker() -> None:
+        for _ in range(5):
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.02)
+
+    async def scenario() -> None:
+        await asyncio.gather(
+            generate_for_upload("vid", "P", Settings(gcs_project_id="project")),
+            ticker(),
+        )
+
+    with (
+        patch("app.services.analyze.genai.Client", fake.client),
+        patch(
+            "app.services.analyze.uploaded_video_part", AsyncMock(return_value=video)
+        ),
+    ):
+        started = time.monotonic()
+        asyncio.run(scenario())
+
+    assert len(fake.generated) == 1
+    assert ticks[-1] - started < 0.25
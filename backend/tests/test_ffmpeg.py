@@ -0,0 +1,93 @@
+import asyncio
+import os
+import stat
+import time
+
+import pytest
+
+from app.services.ffmpeg import (
+    STDERR_TAIL_LINES,
+    FFmpegTimeoutError,
+    progress_seconds,
+    run_ffmpeg,
+)
+
+
+def make_fake_ffmpeg(tmp_path, body):
+    """引数を無視してシェルスクリプトを実行する偽のffmpeg"""
+    script = tmp_path / "ffmpeg"
+    script.write_text("#!/bin/sh\n" + body)
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    return str(script)
+
+
+@pytest.mark.asyncio
+async def test_run_ffmpeg_streams_progress_blocks(tmp_path):
+    """-progress の出力がブロックごとにコールバックへ渡されること"""
+    ffmpeg = make_fake_ffmpeg(
+        tmp_path,
+        "echo out_time_us=1000000\n"
+        "echo speed=2x\n"
+        "echo progress=continue\n"
+        "echo out_time_us=3000000\n"
+        "echo progress=end\n",
+    )
+    blocks = []
+
+    result = await run_ffmpeg([ffmpeg, "-i", "in.mp4"], on_progress=blocks.append)
+
+    assert result.returncode == 0
+    assert [progress_seconds(block) for block in blocks] == [1.0, 3.0]
+    assert result.progress["progress"] == "end"
+
+
+@pytest.mark.asyncio
+async def test_run_ffmpeg_keeps_bounded_stderr_tail(tmp_path):
+    """stderrは末尾の一定行数のみ保持されること"""
+    ffmpeg = make_fake_ffmpeg(
+        tmp_path,
+        'i=0\nwhile [ $i -lt 500 ]; do echo "line $i" >&2; i=$((i+1)); done\nexit 1\n',
+    )
+
+    result = await run_ffmpeg([ffmpeg])
+
+    lines = result.stderr.splitlines()
+    assert result.returncode == 1
+    assert len(lines) == STDERR_TAIL_LINES
+    assert lines[-1] == "line 499"
+
+
+@pytest.mark.asyncio
+async def test_run_ffmpeg_kills_process_after_deadline(tmp_path):
+    """期限を超えたらサブプロセスを停止して例外を送出すること"""
+    ffmpeg = make_fake_ffmpeg(tmp_path, "exec sleep 30\n")
+
+    start = time.perf_counter()
+    with pytest.raises(FFmpegTimeoutError):
+        await run_ffmpeg([ffmpeg], timeout=0.2)
+    assert time.perf_counter() - start < 5
+
+
+@pytest.mark.asyncio
+async def test_run_ffmpeg_kills_process_on_cancel(tmp_path):
+    """呼び出し元がキャンセルされたらサブプロセスを停止すること"""
+    pid_file = tmp_path / "pid"
+    ffmpeg = make_fake_ffmpeg(tmp_path, f"echo $$ > {pid_file}\nexec sleep 30\n")
+
+    task = asyncio.create_task(run_ffmpeg([ffmpeg]))
+    while not pid_file.exists() or not pid_file.read_text().strip():
+        await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+
+    pid = int(pid_file.read_text())
+    # 終了済みのプロセスにはシグナルを送れない
+    with pytest.raises(ProcessLookupError):
+        os.kill(pid, 0)
+
+
+def test_progress_seconds_handles_unknown_values():
+    """out_time_us が N/A の場合は None を返すこと"""
+    assert progress_seconds({"out_time_us": "N/A"}) is None
+    assert progress_seconds({"out_time_us": "2500000"}) == 2.5
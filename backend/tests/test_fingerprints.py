@@ -0,0 +1,169 @@
+import asyncio
+import random
+import subprocess
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.core.settings import Settings
+from app.models.schemas import AnalysisResult, Highlight
+from app.services.analyze import analysis_prompt, analyze_video_service
+from app.services.ffmpeg import run_ffmpeg_pipe
+from app.services.fingerprints import (
+    Alignment,
+    align,
+    build_fingerprint_command,
+    difference_hash,
+    frame_hashes,
+    map_highlights,
+    uncovered_windows,
+)
+from app.services.library import record_analysis
+from app.services.prompts import prompt_version
+from app.store import FingerprintRecord
+from app.store.fingerprints import hash_bands, pack_hashes, unpack_hashes
+from benchmarks.videos import ffmpeg_available
+
+
+def _highlight(start: float, end: float, title: str = "h") -> Highlight:
+    return Highlight(start=start, end=end, title=title, description="", score=0.5)
+
+
+def _flip(value: int, bits: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(64), bits):
+        value ^= 1 << bit
+    return value
+
+
+def test_difference_hash_compares_neighbouring_pixels():
+    assert difference_hash(bytes(range(72))) == 0
+    assert difference_hash(bytes(range(72, 0, -1))) == (1 << 64) - 1
+    assert pack_hashes([1, 2**64 - 1]) == b"\0" * 7 + b"\1" + b"\xff" * 8
+    assert unpack_hashes(pack_hashes([5, 7])) == [5, 7]
+    assert hash_bands(0) == []
+    assert hash_bands(0x0004_0003_0002_0001) == [1, 0x10002, 0x20003, 0x30004]
+
+
+def test_align_finds_trimmed_reencode():
+    """切り出して再エンコードした動画のずれと一致区間を求めること"""
+    rng = random.Random(0)
+    original = [rng.getrandbits(64) for _ in range(120)]
+    copy = [_flip(value, 3, rng) for value in original[30:90]]
+    copy += [rng.getrandbits(64) for _ in range(20)]
+
+    alignment = align(copy, original, max_distance=10, min_seconds=10)
+
+    assert alignment == Alignment(offset=30, ranges=[(0.0, 60.0)])
+    assert align(copy[60:], original, max_distance=10, min_seconds=10) is None
+
+
+def test_map_highlights_into_aligned_ranges():
+    alignment = Alignment(offset=30, ranges=[(0.0, 60.0)])
+    highlights = [_highlight(10, 25), _highlight(40, 70), _highlight(85, 100)]
+
+    assert [(h.start, h.end) for h in map_highlights(highlights, alignment)] == [
+        (10.0, 40.0),
+        (55.0, 60.0),
+    ]
+    assert uncovered_windows(alignment.ranges, 80.0) == [(60.0, 80.0)]
+    assert uncovered_windows([(5.0, 20.0), (20.5, 70.0)], 70.4) == [(0.0, 5.0)]
+
+
+def test_store_finds_videos_sharing_bands(store):
+    rng = random.Random(1)
+    original = [rng.getrandbits(64) for _ in range(40)]
+    other = [rng.getrandbits(64) for _ in range(40)]
+
+    def put(file_id: str, hashes: list[int]) -> None:
+        asyncio.run(store.put_fingerprint(FingerprintRecord(file_id, hashes, 1.0)))
+
+    put("original", original)
+    put("other", other)
+    put("copy", [_flip(value, 2, rng) for value in original[5:30]])
+
+    assert asyncio.run(store.find_fingerprint_candidates("copy")) == ["original"]
+    assert asyncio.run(store.get_fingerprint("original")).hashes == original
+    assert asyncio.run(store.get_fingerprint("missing")) is None
+
+
+def _make_video(path, *extra: str) -> str:
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-y",
+            "-loglevel",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            "nullsrc=s=160x90:r=10:d=30,"
+            "geq=lum='128+100*sin(X/9+T*2)*cos(Y/6-T*1.3)':cb=128:cr=128",
+            *extra,
+            "-c:v",
+            "libx264",
+            "-pix_fmt",
+            "yuv420p",
+            str(path),
+        ],
+        check=True,
+    )
+    return str(path)
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg is not installed")
+def test_fingerprints_survive_trim_and_reencode(tmp_path):
+    original = _make_video(tmp_path / "original.mp4")
+    copy = _make_video(
+        tmp_path / "copy.mp4", "-ss", "7", "-t", "15", "-crf", "38", "-s", "128x72"
+    )
+
+    def fingerprint(source: str) -> list[int]:
+        return frame_hashes(
+            asyncio.run(run_ffmpeg_pipe(build_fingerprint_command(source)))
+        )
+
+    original_hashes = fingerprint(original)
+    copy_hashes = fingerprint(copy)
+
+    assert len(original_hashes) == 30
+    assert align(copy_hashes, original_hashes, 10, 10) == Alignment(
+        offset=7, ranges=[(0.0, 15.0)]
+    )
+
+
+def test_analysis_reuses_near_duplicate(monkeypatch, store):
+    """重なる区間は解析済みの動画のハイライトを使い、残りだけを解析すること"""
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    settings = Settings(fingerprint_enabled=True)
+    version = prompt_version(analysis_prompt("vertex_ai"))
+    rng = random.Random(2)
+    original = [rng.getrandbits(64) for _ in range(90)]
+    copy = original[20:80] + [rng.getrandbits(64) for _ in range(30)]
+    for file_id, hashes in (("original", original), ("copy", copy)):
+        asyncio.run(store.put_fingerprint(FingerprintRecord(file_id, hashes, 1.0)))
+    asyncio.run(
+        record_analysis(
+            "original",
+            provider="vertex_ai",
+            model=settings.vertex_ai_model,
+            version=version,
+            result=AnalysisResult(highlights=[_highlight(30, 60, "引き継ぎ")]),
+            settings=settings,
+        )
+    )
+    windows = AsyncMock(return_value=[_highlight(70, 90, "新規")])
+
+    with (
+        patch("app.services.analyze_range.analyze_windows", windows),
+        patch("app.services.analyze.generate_with_vertex") as generate,
+    ):
+        result = asyncio.run(analyze_video_service("copy", settings))
+
+    assert [(h.start, h.end, h.title) for h in result.highlights] == [
+        (10.0, 40.0, "引き継ぎ"),
+        (70.0, 90.0, "新規"),
+    ]
+    assert windows.call_args.args[1] == [(60.0, 90.0)]
+    generate.assert_not_called()
+    stored = asyncio.run(store.list_analyses("copy"))
+    assert stored[0].prompt_version == version
@@ -0,0 +1,108 @@
+import asyncio
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from app.core.http_cache import (
+    CompressionMiddleware,
+    accepted_encoding,
+    signed_url_cache_control,
+)
+
+
+def test_models_are_served_with_etag_and_304(client):
+    """モデル一覧にETagが付き、一致する If-None-Match には 304 を返すこと"""
+    first = client.get("/api/v1/models")
+    assert first.status_code == 200
+    assert "vertex_ai" in first.json()["providers"]
+    assert first.headers["cache-control"] == "public, max-age=3600"
+    etag = first.headers["etag"]
+
+    second = client.get("/api/v1/models", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+
+
+def test_analysis_etag_changes_with_new_analysis(client, store):
+    """解析結果のETagが内容のハッシュで、新しい解析が増えると変わること"""
+
+    def add(version: str) -> None:
+        asyncio.run(
+            store.add_analysis(
+                "vid",
+                provider="vertex_ai",
+                model="m",
+                prompt_version=version,
+                highlights=[
+                    {"start": 0, "end": 30, "title": "t", "description": "", "score": 1}
+                ],
+            )
+        )
+
+    add("v1")
+    first = client.get("/api/videos/vid/analyses")
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "private, no-cache"
+    unchanged = client.get("/api/videos/vid/analyses", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+
+    add("v2")
+    changed = client.get("/api/videos/vid/analyses", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert len(changed.json()["analyses"]) == 2
+
+
+def test_signed_url_cache_control_stops_before_expiry():
+    assert signed_url_cache_control(2000, 300, now=1000) == "private, max-age=700"
+    assert signed_url_cache_control(1200, 300, now=1000) == "private, no-store"
+    assert signed_url_cache_control(None, 300) == "private, no-store"
+
+
+def test_accepted_encoding_respects_q_zero():
+    assert accepted_encoding("gzip, deflate") == "gzip"
+    assert accepted_encoding("gzip;q=0, identity") is None
+    assert accepted_encoding("") is None
+
+
+def _compressed_app() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+    @app.get("/large")
+    async def large():
+        return PlainTextResponse("ハイライト" * 200, headers={"ETag": '"abc"'})
+
+    @app.get("/small")
+    async def small():
+        return PlainTextResponse("ok")
+
+    @app.get("/stream")
+    async def stream():
+        async def events():
+            for index in range(3):
+                yield f"data: {index}\n\n" * 50
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return TestClient(app)
+
+
+def test_compression_of_complete_bodies_only():
+    """大きな本文だけを圧縮し、ストリーミングはそのまま流すこと"""
+    client = _compressed_app()
+    headers = {"Accept-Encoding": "gzip"}
+
+    large = client.get("/large", headers=headers)
+    assert large.headers["content-encoding"] == "gzip"
+    assert large.headers["etag"] == 'W/"abc"'
+    assert large.headers["vary"] == "Accept-Encoding"
+    assert large.text == "ハイライト" * 200
+    assert int(large.headers["content-length"]) < len(("ハイライト" * 200).encode())
+
+    assert "content-encoding" not in client.get("/small", headers=headers).headers
+    stream = client.get("/stream", headers=headers)
+    assert "content-encoding" not in stream.headers
+    assert stream.text.count("data:") == 150
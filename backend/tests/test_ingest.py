@@ -0,0 +1,170 @@
+import asyncio
+import subprocess
+from unittest.mock import patch
+
+import pytest
+
+from app.core.settings import Settings
+from app.services.ffmpeg import MediaInfo
+from app.services.gcs_utils import find_upload_blob
+from app.services.ingest import (
+    build_ingest_command,
+    ingest_video_service,
+    is_faststart,
+    plan_ingest,
+)
+from benchmarks.videos import ffmpeg_available, generate_test_video
+
+H264_AAC = MediaInfo(
+    duration=6,
+    width=320,
+    height=180,
+    has_audio=True,
+    video_codec="h264",
+    audio_codec="aac",
+)
+
+
+@pytest.mark.parametrize(
+    ("video_codec", "audio_codec", "extension", "faststart", "expected"),
+    [
+        ("h264", "aac", "mp4", True, ("none", "copy", "copy")),
+        ("h264", "aac", "mp4", False, ("remux", "copy", "copy")),
+        ("hevc", "aac", "mov", True, ("remux", "copy", "copy")),
+        ("mpeg4", "pcm_s16le", "avi", False, ("transcode", "copy", "aac")),
+        ("vp9", "opus", "webm", False, ("transcode", "libx264", "aac")),
+        ("h264", None, "mov", False, ("remux", "copy", None)),
+    ],
+)
+def test_plan_copies_compatible_streams(
+    video_codec, audio_codec, extension, faststart, expected
+):
+    """MP4に入るストリームはコピーし、入らないものだけ再エンコードすること"""
+    media = MediaInfo(
+        duration=10,
+        width=1920,
+        height=1080,
+        has_audio=audio_codec is not None,
+        video_codec=video_codec,
+        audio_codec=audio_codec,
+    )
+    plan = plan_ingest(media, extension=extension, faststart=faststart)
+    assert (plan.action, plan.video, plan.audio) == expected
+
+
+def test_ingest_command_writes_faststart_mp4():
+    settings = Settings(ingest_crf=20)
+    hevc = MediaInfo(
+        duration=10, width=1920, height=1080, has_audio=False, video_codec="hevc"
+    )
+    cmd = build_ingest_command(
+        "in.mov",
+        "out.mp4",
+        hevc,
+        plan_ingest(hevc, extension="mov", faststart=False),
+        settings,
+    )
+    assert cmd[-5:] == ["-movflags", "+faststart", "-f", "mp4", "out.mp4"]
+    assert ["-c:v", "copy", "-tag:v", "hvc1"] == cmd[cmd.index("-c:v") :][:4]
+    assert "-c:a" not in cmd
+
+    vp9 = MediaInfo(
+        duration=10,
+        width=1279,
+        height=720,
+        has_audio=True,
+        video_codec="vp9",
+        audio_codec="opus",
+    )
+    cmd = build_ingest_command(
+        "in.webm",
+        "out.mp4",
+        vp9,
+        plan_ingest(vp9, extension="webm", faststart=False),
+        settings,
+    )
+    assert cmd[cmd.index("-c:v") + 1] == "libx264"
+    assert cmd[cmd.index("-crf") + 1] == "20"
+    assert cmd[cmd.index("-c:a") + 1] == "aac"
+
+
+def _moov_last_mov(tmp_path):
+    """moov が末尾にある（スマートフォンの書き出しと同じ）.mov"""
+    video = generate_test_video(tmp_path, duration=2, size="320x180", rate=15)
+    mov = tmp_path / "phone.mov"
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-y",
+            "-i",
+            str(video),
+            "-c",
+            "copy",
+            str(mov),
+        ],
+        check=True,
+    )
+    return video, mov
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg is not installed")
+def test_is_faststart_reads_box_order(tmp_path):
+    faststart, mov = _moov_last_mov(tmp_path)
+    assert is_faststart(faststart)
+    assert not is_faststart(mov)
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg is not installed")
+@pytest.mark.parametrize("keep_original", [True, False])
+def test_ingest_remuxes_upload_into_canonical_source(gcs, tmp_path, keep_original):
+    """.mov を faststart MP4 にして、以降の処理の元にすること"""
+    _, mov = _moov_last_mov(tmp_path)
+    gcs.seed("bucket", "uploads/vid.mov", mov)
+    settings = Settings(gcs_bucket_name="bucket", ingest_keep_original=keep_original)
+
+    with patch("app.services.ingest.probe_media", return_value=H264_AAC):
+        response = asyncio.run(ingest_video_service("vid", settings))
+
+    assert response.action == "remux"
+    assert response.sourceBlob == "normalized/vid.mp4"
+    normalized = gcs.path_for("bucket", "normalized/vid.mp4")
+    assert is_faststart(normalized)
+    assert gcs.path_for("bucket", "uploads/vid.mov").exists() is keep_original
+    assert response.originalBlob == ("uploads/vid.mov" if keep_original else None)
+
+    bucket = gcs.client().bucket("bucket")
+    assert find_upload_blob(bucket, "vid", settings).name == "normalized/vid.mp4"
+
+    # 2回目は正規化済みの動画をそのまま返す
+    gcs.reset_counters()
+    again = asyncio.run(ingest_video_service("vid", settings))
+    assert again.sourceBlob == "normalized/vid.mp4"
+    assert gcs.bytes_downloaded == 0
+
+
+def test_ingest_rejects_unreadable_upload(gcs, tmp_path):
+    broken = tmp_path / "broken.mp4"
+    broken.write_bytes(b"not a video")
+    gcs.seed("bucket", "uploads/vid.mp4", broken)
+    settings = Settings(gcs_bucket_name="bucket")
+
+    with (
+        patch(
+            "app.services.ingest.probe_media",
+            side_effect=RuntimeError("ffprobe error: Invalid data"),
+        ),
+        pytest.raises(ValueError, match="Unsupported or corrupt video"),
+    ):
+        asyncio.run(ingest_video_service("vid", settings))
+    assert not gcs.path_for("bucket", "normalized/vid.mp4").exists()
+
+
+def test_complete_upload_returns_400_for_unreadable_video(client):
+    with patch(
+        "main.ingest_video_service",
+        side_effect=ValueError("Unsupported or corrupt video: moov atom not found"),
+    ):
+        response = client.post("/api/upload/vid/complete")
+    assert response.status_code == 400
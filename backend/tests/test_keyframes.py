@@ -0,0 +1,163 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.core.settings import Settings
+from app.services.analyze import (
+    GeminiCandidate,
+    GeminiCandidateResponse,
+    GeminiResponse,
+    GeminiSegment,
+    analysis_prompt,
+    analyze_video_service,
+)
+from app.services.keyframes import (
+    Keyframe,
+    KeyframeContext,
+    keyframe_targets,
+    match_targets,
+    parse_frame_millis,
+    sample_keyframes,
+    select_expression,
+    split_jpegs,
+)
+from app.services.prompts import prompt_version
+from app.store import get_store
+from benchmarks.videos import ffmpeg_available, generate_test_video
+
+
+def test_targets_stay_inside_candidate_windows():
+    """候補セグメントの内側を等間隔に選び、近すぎる時刻はまとめること"""
+    assert keyframe_targets([(0.0, 6.0), (6.0, 18.0)], 2) == [
+        (0, 1.5),
+        (0, 4.5),
+        (1, 9.0),
+        (1, 15.0),
+    ]
+    assert keyframe_targets([(0.0, 0.6)], 3) == [(0, 0.1)]
+
+
+def test_select_expression_picks_first_frame_after_each_target():
+    assert select_expression([1.5, 4.0]) == (
+        "gte(t,1.500)*lt(if(isnan(prev_selected_t),-1,prev_selected_t),1.500)"
+        "+gte(t,4.000)*lt(if(isnan(prev_selected_t),-1,prev_selected_t),4.000)"
+    )
+
+
+def test_frames_are_matched_to_targets_by_timestamp():
+    """1枚で複数の目標を満たしたフレームは最後の目標に対応させること"""
+    targets = [(0, 1.2), (1, 1.8), (1, 2.5)]
+    assert parse_frame_millis("frame:0    pts:2000   pts_time:2\nkeyframe=1\n") == [
+        2000
+    ]
+    assert match_targets(targets, [2000, 3000]) == [(1, 1.8), (1, 2.5)]
+    assert match_targets(targets, [1200, 1800, 2500]) == targets
+    with pytest.raises(ValueError, match="does not match"):
+        match_targets(targets, [1000])
+
+
+def test_split_jpegs_at_end_markers():
+    assert split_jpegs(b"\xff\xd8a\xff\xd9\xff\xd8bb\xff\xd9") == [
+        b"\xff\xd8a\xff\xd9",
+        b"\xff\xd8bb\xff\xd9",
+    ]
+    assert split_jpegs(b"") == []
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg is not installed")
+def test_sample_keyframes_in_one_pass(tmp_path):
+    """1回のデコードで目標時刻ごとに1枚ずつ、動画の範囲内のフレームを返すこと"""
+    video = generate_test_video(tmp_path, duration=6, size="320x180", rate=15)
+    targets = [(0, 1.0), (0, 2.5), (1, 4.0), (1, 30.0)]
+
+    frames = asyncio.run(
+        sample_keyframes(str(video), targets, Settings(keyframe_width=160))
+    )
+
+    assert [(frame.index, frame.time) for frame in frames] == targets[:3]
+    assert all(frame.jpeg.startswith(b"\xff\xd8") for frame in frames)
+    assert len({frame.jpeg for frame in frames}) == 3
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg is not installed")
+def test_sparse_frames_keep_their_targets(tmp_path):
+    """フレームの間隔が目標の間隔より長くても、後のフレームの時刻がずれないこと"""
+    video = generate_test_video(tmp_path, duration=5, size="320x180", rate=1)
+
+    frames = asyncio.run(
+        sample_keyframes(
+            str(video), [(0, 1.2), (1, 1.8), (1, 2.5)], Settings(keyframe_width=160)
+        )
+    )
+
+    assert [(frame.index, frame.time) for frame in frames] == [(1, 1.8), (1, 2.5)]
+
+
+def test_keyframe_analysis_sends_labeled_images(monkeypatch):
+    """動画の代わりに、候補番号と時刻のラベル付きの画像を送ること"""
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    settings = Settings(analysis_segmentation="keyframes")
+    context = KeyframeContext(
+        candidates=[(0.0, 10.0), (10.0, 24.0)],
+        frames=[Keyframe(0, 5.0, b"\xff\xd8a"), Keyframe(1, 17.0, b"\xff\xd8b")],
+    )
+    sent = {}
+
+    def fake_generate(media, prompt, _settings, _response_type=GeminiResponse, **_):
+        sent["media"] = media
+        sent["prompt"] = prompt
+        return GeminiCandidateResponse(
+            segments=[GeminiCandidate(index=1, title="山場", description="", score=1)]
+        )
+
+    with (
+        patch(
+            "app.services.analyze.prepare_keyframe_analysis",
+            AsyncMock(return_value=context),
+        ),
+        patch("app.services.analyze.generate_with_vertex", fake_generate),
+    ):
+        result = asyncio.run(analyze_video_service("vid", settings))
+
+    assert "1: 10.0〜24.0" in sent["prompt"]
+    assert [part.text for part in sent["media"][::2]] == [
+        "候補0・5.0秒",
+        "候補1・17.0秒",
+    ]
+    assert [part.inline_data.data for part in sent["media"][1::2]] == [
+        b"\xff\xd8a",
+        b"\xff\xd8b",
+    ]
+    assert [(h.start, h.end) for h in result.highlights] == [(10.0, 24.0)]
+    stored = asyncio.run(get_store().list_analyses("vid"))
+    assert stored[0].prompt_version == prompt_version(
+        analysis_prompt("vertex_ai", "keyframes")
+    )
+
+
+def test_keyframe_failure_falls_back_to_fixed_segments(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+
+    def fake_generate(*_args, **_kwargs):
+        return GeminiResponse(
+            segments=[
+                GeminiSegment(start=0, end=30, title="a", description="", score=0.5)
+            ]
+        )
+
+    with (
+        patch(
+            "app.services.analyze.prepare_keyframe_analysis",
+            AsyncMock(side_effect=RuntimeError("FFmpeg error")),
+        ),
+        patch("app.services.analyze.uploaded_video_part", AsyncMock()),
+        patch("app.services.analyze.generate_with_vertex", fake_generate),
+    ):
+        result = asyncio.run(
+            analyze_video_service("vid", Settings(), segmentation="keyframes")
+        )
+
+    assert [(h.start, h.end) for h in result.highlights] == [(0, 30)]
+    stored = asyncio.run(get_store().list_analyses("vid"))
+    assert stored[0].prompt_version == prompt_version(analysis_prompt("vertex_ai"))
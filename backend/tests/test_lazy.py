@@ -0,0 +1,31 @@
+import sys
+from unittest.mock import patch
+
+from app.core.lazy import LazyModule, lazy_import, warm_lazy_modules
+
+
+def test_lazy_module_imports_on_first_attribute():
+    proxy = lazy_import("colorsys")
+    assert isinstance(proxy, LazyModule)
+    assert lazy_import("colorsys") is proxy
+
+    assert proxy.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert proxy.loaded
+    assert "colorsys" in sys.modules
+
+
+def test_patches_through_the_proxy_and_the_module():
+    """代理・実際のモジュールのどちらにパッチしても呼び出し側に反映されること"""
+    proxy = lazy_import("json")
+
+    with patch("json.dumps", lambda _obj: "module"):
+        assert proxy.dumps({}) == "module"
+    with patch.object(proxy, "dumps", lambda _obj: "proxy"):
+        assert proxy.dumps({}) == "proxy"
+    assert proxy.dumps({}) == "{}"
+
+
+def test_warm_lazy_modules_reports_timings():
+    lazy_import("wave")
+    timings = warm_lazy_modules()
+    assert "wave" in timings
@@ -0,0 +1,183 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+
+from app.core.settings import Settings
+from app.services.analyze import (
+    GeminiCandidateResponse,
+    GeminiResponse,
+    GeminiSegment,
+    generate_with_vertex,
+)
+from app.services.model_output import (
+    OUTPUTS,
+    REPAIRS,
+    ModelOutputError,
+    repair_items,
+    resolve_response,
+    salvage_items,
+)
+
+
+def _segment(start, end, score=0.5, title="t"):
+    return {
+        "start": start,
+        "end": end,
+        "title": title,
+        "description": "",
+        "score": score,
+    }
+
+
+def _no_continuation(_prompt):
+    msg = "continuation should not be requested"
+    raise AssertionError(msg)
+
+
+def test_salvage_complete_segments_from_truncated_json():
+    text = json.dumps({"segments": [_segment(0, 30), _segment(30, 60)]})
+    truncated = text[: text.index('"start": 30') + 12]
+
+    items, complete = salvage_items(truncated)
+
+    assert not complete
+    assert items == [_segment(0, 30)]
+
+
+def test_salvage_fenced_json():
+    text = "```json\n" + json.dumps({"segments": [_segment(0, 30)]}) + "\n```"
+    assert salvage_items(text) == ([_segment(0, 30)], True)
+
+
+def test_repair_clamps_times_and_scores():
+    """時間を動画の範囲に収め、start < end にならない要素と不正な要素を捨てること"""
+    items = [
+        _segment(-2, 30, score=1.4),
+        _segment(50, 90, score=-0.1),
+        _segment(40, 40),
+        _segment(100, 120),
+        {"start": 0, "title": "missing end"},
+    ]
+
+    kept, repairs = repair_items(items, GeminiSegment, duration=75)
+
+    assert [(s.start, s.end, s.score) for s in kept] == [
+        (0, 30, 1.0),
+        (50, 75, 0.0),
+    ]
+    assert repairs == {
+        "score_clamped": 2,
+        "time_clamped": 2,
+        "dropped": 2,
+        "invalid": 1,
+    }
+
+
+def test_truncated_response_requests_only_the_tail():
+    """途中で途切れた場合は、受け取り済みの範囲より後ろだけを要求して結合すること"""
+    full = json.dumps({"segments": [_segment(0, 30), _segment(30, 60)]})
+    truncated = full[: full.index('"start": 30') + 5]
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return json.dumps({"segments": [_segment(25, 60), _segment(60, 90)]})
+
+    before = OUTPUTS.value(provider="test", outcome="continued")
+    response = resolve_response(
+        truncated, GeminiResponse, prompt="P", generate=generate, provider="test"
+    )
+
+    assert len(prompts) == 1
+    assert prompts[0].startswith("P") and "30秒以降" in prompts[0]
+    assert [(s.start, s.end) for s in response.segments] == [
+        (0, 30),
+        (30, 60),
+        (60, 90),
+    ]
+    assert OUTPUTS.value(provider="test", outcome="continued") == before + 1
+    assert REPAIRS.value(provider="test", repair="truncated") >= 1
+
+
+def test_candidate_continuation_uses_indexes():
+    truncated = '{"segments": [{"index": 0, "title": "a", "description": "", "score": 0.5}, {"ind'
+    prompts = []
+
+    def generate(prompt):
+        prompts.append(prompt)
+        return json.dumps(
+            {
+                "segments": [
+                    {"index": 0, "title": "again", "description": "", "score": 0.1},
+                    {"index": 1, "title": "b", "description": "", "score": 0.7},
+                ]
+            }
+        )
+
+    response = resolve_response(
+        truncated,
+        GeminiCandidateResponse,
+        prompt="P",
+        generate=generate,
+        provider="test",
+    )
+
+    assert "番号0より後" in prompts[0]
+    assert [(s.index, s.title) for s in response.segments] == [(0, "a"), (1, "b")]
+
+
+def test_valid_response_is_counted_without_repairs():
+    text = json.dumps({"segments": [_segment(0, 30)]})
+    before = OUTPUTS.value(provider="test", outcome="valid")
+    response = resolve_response(
+        text, GeminiResponse, prompt="P", generate=_no_continuation, provider="test"
+    )
+    assert len(response.segments) == 1
+    assert OUTPUTS.value(provider="test", outcome="valid") == before + 1
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["I could not find any highlights.", json.dumps({"segments": [{"start": 0}]})],
+)
+def test_unusable_response_raises(text):
+    with pytest.raises(ModelOutputError):
+        resolve_response(
+            text,
+            GeminiResponse,
+            prompt="P",
+            generate=lambda _prompt: "still not JSON",
+            provider="test",
+        )
+
+
+def test_empty_response_is_an_empty_result():
+    """ハイライトのない正しい応答は失敗にせず、空の結果を返すこと"""
+    response = resolve_response(
+        '{"segments": []}',
+        GeminiResponse,
+        prompt="P",
+        generate=_no_continuation,
+        provider="test",
+    )
+    assert response.segments == []
+
+
+def test_vertex_repairs_out_of_range_segments():
+    """Vertex AIの応答を検証・修復してから返すこと"""
+    text = json.dumps({"segments": [_segment(0, 30, score=2), _segment(30, 80)]})
+    client = SimpleNamespace(
+        models=SimpleNamespace(
+            generate_content=lambda **_kwargs: SimpleNamespace(text=text)
+        )
+    )
+    with patch("app.services.analyze.genai.Client", return_value=client):
+        response = generate_with_vertex(
+            None, "P", Settings(gcs_project_id="project"), duration=60
+        )
+    assert [(s.start, s.end, s.score) for s in response.segments] == [
+        (0, 30, 1.0),
+        (30, 60, 0.5),
+    ]
@@ -0,0 +1,183 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.core.scheduling import EXTRACTION, _today, fair_queue, reset_queues
+from app.core.settings import Settings
+from app.core.telemetry import request_id_var
+from app.models.schemas import (
+    AnalysisResult,
+    ExtractRequest,
+    GenerateVideoResponse,
+    Highlight,
+    VideoSegment,
+)
+from app.services.extract import PRERENDER_LOOKUPS, extract_video_service
+from app.services.prerender import (
+    PRERENDERS,
+    prerender_highlights,
+    prerender_targets,
+    reset_prerender,
+    schedule_prerender,
+)
+from app.services.progress import progress_tracker
+from benchmarks.videos import ffmpeg_available, generate_test_video
+
+
+@pytest.fixture(autouse=True)
+def fresh_state():
+    reset_queues()
+    reset_prerender()
+    yield
+    reset_queues()
+    reset_prerender()
+
+
+@pytest.fixture
+def gcs(gcs):
+    """署名付きURLの発行も差し替える"""
+    with patch(
+        "app.services.extract.generate_signed_url",
+        side_effect=lambda blob, **_: f"https://signed/{blob.name}",
+    ):
+        yield gcs
+
+
+def _highlight(start: float, end: float, score: float) -> Highlight:
+    return Highlight(start=start, end=end, title="t", description="", score=score)
+
+
+def test_targets_are_top_highlights_by_score():
+    result = AnalysisResult(
+        highlights=[
+            _highlight(0, 10, 0.2),
+            _highlight(10, 20, 0.9),
+            _highlight(10, 20, 0.8),
+            _highlight(20, 30, 0.7),
+        ]
+    )
+    assert prerender_targets(result, 2) == [
+        VideoSegment(start=10, end=20),
+        VideoSegment(start=20, end=30),
+    ]
+    assert schedule_prerender("vid", result, "tenant", Settings()) is None
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg is not installed")
+def test_prerendered_clip_is_returned_without_extracting(gcs, tmp_path, store):
+    """先行して切り出した区間の切り出し要求は、ダウンロードせずにそのクリップを返すこと"""
+    video = generate_test_video(tmp_path, duration=6, size="320x180", rate=15)
+    gcs.seed("bucket", "uploads/vid.mp4", video)
+    settings = Settings(gcs_bucket_name="bucket", prerender_top_k=1)
+    segment = VideoSegment(start=1, end=3)
+
+    asyncio.run(prerender_highlights("vid", [segment], "tenant", settings))
+    clips = asyncio.run(store.list_clips("vid"))
+    assert [clip.kind for clip in clips] == ["prerender"]
+    assert gcs.path_for("bucket", clips[0].blob_name).exists()
+
+    async def extract_with_progress() -> GenerateVideoResponse:
+        request_id_var.set("extract-request")
+        return await extract_video_service(
+            ExtractRequest(fileId="vid", segments=[segment]), settings
+        )
+
+    hits = PRERENDER_LOOKUPS.value(outcome="hit")
+    gcs.reset_counters()
+    with patch("app.services.extract.extract_video_segment") as extract:
+        response = asyncio.run(extract_with_progress())
+    extract.assert_not_called()
+    assert progress_tracker.get("extract-request").stage == "completed"
+    assert gcs.bytes_downloaded == 0
+    assert response.downloadUrl == f"https://signed/{clips[0].blob_name}"
+    assert PRERENDER_LOOKUPS.value(outcome="hit") == hits + 1
+    kinds = sorted(clip.kind for clip in asyncio.run(store.list_clips("vid")))
+    assert kinds == ["extract", "prerender"]
+
+
+def test_busy_queue_and_budget_stop_prerendering(store):
+    settings = Settings(
+        prerender_top_k=3, prerender_tenant_daily_clips=1, extraction_concurrency=1
+    )
+    segments = [VideoSegment(start=0, end=5), VideoSegment(start=5, end=10)]
+    extract = AsyncMock()
+
+    async def run_while_busy() -> None:
+        async with fair_queue(EXTRACTION, settings).slot("someone"):
+            await prerender_highlights("vid", segments, "tenant", settings)
+
+    busy = PRERENDERS.value(outcome="busy")
+    over_budget = PRERENDERS.value(outcome="over_budget")
+    with patch("app.services.prerender.extract_video_service", extract):
+        asyncio.run(run_while_busy())
+        assert extract.await_count == 0
+        assert PRERENDERS.value(outcome="busy") == busy + 1
+
+        asyncio.run(prerender_highlights("vid", segments, "tenant", settings))
+    assert extract.await_count == 1
+    assert extract.await_args.kwargs == {"speculative": True}
+    assert PRERENDERS.value(outcome="over_budget") == over_budget + 1
+    usage = asyncio.run(store.get_tenant_usage("tenant", _today()))
+    assert usage.prerender_clips == 1
+
+    # 予算はストアに残るため、ロックを作り直しても（再起動しても）戻らない
+    reset_prerender()
+    with patch("app.services.prerender.extract_video_service", extract):
+        asyncio.run(prerender_highlights("vid", segments, "tenant", settings))
+    assert extract.await_count == 1
+    assert asyncio.run(store.take_prerender_clip("other", _today(), 1))
+
+
+def test_scheduled_task_does_not_inherit_the_request_context():
+    """先行の切り出しのログ・スパンに解析リクエストのIDが付かないこと"""
+    seen = []
+
+    async def record_context(*_args):
+        seen.append(request_id_var.get())
+
+    async def scenario() -> None:
+        request_id_var.set("analyze-request")
+        task = schedule_prerender(
+            "vid",
+            AnalysisResult(highlights=[_highlight(0, 5, 0.9)]),
+            "tenant",
+            Settings(prerender_top_k=1),
+        )
+        await task
+
+    with patch("app.services.prerender.prerender_highlights", record_context):
+        asyncio.run(scenario())
+    assert seen == ["-"]
+
+
+def test_prerender_yields_to_waiting_job():
+    """実際のジョブが枠を待ち始めたら、先行の切り出しを中止して枠を譲ること"""
+    settings = Settings(prerender_top_k=1, extraction_concurrency=1)
+    cancelled = asyncio.Event()
+
+    async def slow_extract(*_args, **_kwargs):
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def scenario() -> None:
+        queue = fair_queue(EXTRACTION, settings)
+        speculative = asyncio.create_task(
+            prerender_highlights(
+                "vid", [VideoSegment(start=0, end=5)], "tenant", settings
+            )
+        )
+        while queue.running == 0:
+            await asyncio.sleep(0.01)
+        async with asyncio.timeout(2):
+            async with queue.slot("someone"):
+                assert cancelled.is_set()
+            await speculative
+
+    preempted = PRERENDERS.value(outcome="preempted")
+    with patch("app.services.prerender.extract_video_service", slow_extract):
+        asyncio.run(scenario())
+    assert PRERENDERS.value(outcome="preempted") == preempted + 1
@@ -0,0 +1,126 @@
+import json
+import time
+from unittest.mock import AsyncMock, patch
+
+from app.core.profiling import ProfileSession
+from app.core.settings import Settings, get_settings
+from app.models.schemas import GenerateVideoResponse
+from app.services.ffmpeg import parse_benchmark
+from main import app
+
+
+def test_parse_benchmark():
+    """-benchmark の出力からCPU時間と最大RSSを取得できること"""
+    stderr = (
+        "frame=  10 fps=0.0\n"
+        "bench: utime=1.250s stime=0.125s rtime=2.000s\n"
+        "bench: maxrss=51200KiB\n"
+    )
+    assert parse_benchmark(stderr) == {
+        "utime_seconds": 1.25,
+        "stime_seconds": 0.125,
+        "rtime_seconds": 2.0,
+        "maxrss_kb": 51200.0,
+    }
+
+
+def test_profile_session_collects_samples():
+    """サンプリングプロファイラがスタックを収集すること"""
+    session = ProfileSession("POST", "/api/extract", sample_interval=0.001)
+    session.start()
+    deadline = time.perf_counter() + 0.05
+    while time.perf_counter() < deadline:
+        pass
+    session.record_span("extract.download", 0.5, "ok")
+    session.record_span("extract.download", 0.25, "ok")
+    session.finish()
+
+    data = session.to_dict()
+    assert data["python_samples"]["sample_count"] > 0
+    assert data["python_samples"]["collapsed"]
+    assert data["stages"] == {"extract.download": 0.75}
+
+
+def test_profile_header_links_artifact(client):
+    """X-Profile ヘッダー付きリクエストでプロファイルが保存・参照されること"""
+    saved = {}
+
+    def fake_write(profile_id, payload):
+        saved[profile_id] = json.loads(payload)
+
+    with (
+        patch("app.services.profiles._write_profile", fake_write),
+        patch(
+            "main.extract_video_service",
+            AsyncMock(return_value=GenerateVideoResponse(downloadUrl="https://x")),
+        ),
+    ):
+        response = client.post(
+            "/api/extract",
+            json={"fileId": "abc", "segments": [{"start": 0, "end": 5}]},
+            headers={"X-Profile": "1"},
+        )
+
+    assert response.status_code == 200
+    profile_id = response.headers["X-Profile-Id"]
+    assert profile_id in saved
+    assert response.headers["Link"] == f'</api/profiles/{profile_id}>; rel="profile"'
+    assert saved[profile_id]["path"] == "/api/extract"
+
+
+def test_profile_is_visible_only_to_its_tenant(client):
+    """プロファイルはリクエストしたテナントにだけ返すこと"""
+    saved = {}
+
+    def fake_write(profile_id, payload):
+        saved[profile_id] = json.loads(payload)
+
+    with (
+        patch("app.services.profiles._write_profile", fake_write),
+        patch(
+            "main.extract_video_service",
+            AsyncMock(return_value=GenerateVideoResponse(downloadUrl="https://x")),
+        ),
+    ):
+        response = client.post(
+            "/api/extract",
+            json={"fileId": "abc", "segments": [{"start": 0, "end": 5}]},
+            headers={"X-Profile": "1"},
+        )
+    profile_id = response.headers["X-Profile-Id"]
+    assert saved[profile_id]["tenant"] == "anonymous"
+
+    with patch("main.load_profile_artifact", lambda pid: saved.get(pid)):
+        assert client.get(f"/api/profiles/{profile_id}").status_code == 200
+
+        settings = Settings(tenant_keys={"k1": "alpha"})
+        app.dependency_overrides[get_settings] = lambda: settings
+        try:
+            other = client.get(
+                f"/api/profiles/{profile_id}", headers={"X-API-Key": "k1"}
+            )
+            missing_key = client.get(f"/api/profiles/{profile_id}")
+        finally:
+            app.dependency_overrides.clear()
+    assert other.status_code == 404
+    assert missing_key.status_code == 401
+
+
+def test_unprofiled_request_has_no_profile_header(client):
+    """X-Profile ヘッダーがなければプロファイルしないこと"""
+    with patch(
+        "main.extract_video_service",
+        AsyncMock(return_value=GenerateVideoResponse(downloadUrl="https://x")),
+    ):
+        response = client.post(
+            "/api/extract",
+            json={"fileId": "abc", "segments": [{"start": 0, "end": 5}]},
+        )
+    assert response.status_code == 200
+    assert "X-Profile-Id" not in response.headers
+
+
+def test_get_profile_rejects_invalid_id(client):
+    """不正なプロファイルIDは404になること"""
+    response = client.get("/api/profiles/..%2Fsecrets")
+    assert response.status_code == 404
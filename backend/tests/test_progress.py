@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+import pytest
+
+from app.services.progress import ProgressTracker, progress_events, progress_tracker
+
+
+@pytest.mark.asyncio
+async def test_subscribe_receives_updates_until_done():
+    """購読者が更新を受け取り、完了で終了すること"""
+    tracker = ProgressTracker()
+    received = []
+
+    async def consume():
+        async for state in tracker.subscribe("req-1"):
+            received.append((state.stage, state.ratio, state.done))
+
+    consumer = asyncio.create_task(consume())
+    await asyncio.sleep(0.01)
+    tracker.update("req-1", stage="extracting", ratio=0.5)
+    await asyncio.sleep(0.01)
+    tracker.finish("req-1")
+    await asyncio.wait_for(consumer, timeout=1)
+
+    assert received[0] == ("pending", None, False)
+    assert ("extracting", 0.5, False) in received
+    assert received[-1] == ("completed", 1.0, True)
+
+
+@pytest.mark.asyncio
+async def test_progress_events_format_as_sse():
+    """進捗がServer-Sent Events形式で出力されること"""
+    progress_tracker.finish("req-sse", error="cancelled")
+    events = [event async for event in progress_events("req-sse")]
+
+    assert len(events) == 1
+    assert events[0].startswith("data: ")
+    payload = json.loads(events[0].removeprefix("data: "))
+    assert payload["stage"] == "failed"
+    assert payload["error"] == "cancelled"
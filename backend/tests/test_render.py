@@ -0,0 +1,130 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from app.core.settings import Settings
+from app.models.schemas import RenderOutputSpec, RenderRequest, VideoSegment
+from app.services.ffmpeg import MediaInfo, parse_probe
+from app.services.render import (
+    build_concat_list,
+    build_render_plan,
+    output_size,
+    reframe_filter,
+    render_video,
+    resolve_output_spec,
+    saliency_offset,
+)
+from benchmarks.videos import ffmpeg_available, generate_test_video
+
+LANDSCAPE = MediaInfo(duration=60.0, width=1920, height=1080, has_audio=True)
+SEGMENTS = [
+    VideoSegment(start=5, end=10),
+    VideoSegment(start=20, end=24),
+    VideoSegment(start=40, end=46),
+]
+
+
+def test_parse_probe():
+    """ffprobe の出力から解像度・長さ・音声の有無を取得できること"""
+    media = parse_probe(
+        {
+            "streams": [
+                {
+                    "codec_type": "video",
+                    "codec_name": "h264",
+                    "width": 1280,
+                    "height": 720,
+                },
+                {"codec_type": "audio", "codec_name": "aac"},
+            ],
+            "format": {"duration": "12.5", "format_name": "mov,mp4"},
+        }
+    )
+    assert (media.width, media.height, media.duration) == (1280, 720, 12.5)
+    assert media.has_audio
+    assert media.video_codec == "h264"
+
+
+def test_resolve_output_spec_rejects_unknown_preset():
+    """未知のプリセットはValueErrorになること"""
+    request = RenderRequest(fileId="abc", segments=SEGMENTS, preset="nope")
+    with pytest.raises(ValueError, match="Unknown render preset"):
+        resolve_output_spec(request)
+
+
+def test_vertical_center_crop_filter():
+    """横長動画から9:16を中央で切り出してスケールすること"""
+    spec = RenderOutputSpec(aspectRatio="9:16", height=1920)
+    assert output_size(spec, LANDSCAPE) == (1080, 1920)
+    assert reframe_filter(spec, LANDSCAPE) == (
+        "crop=608:1080:(iw-ow)/2:(ih-oh)/2,scale=1080:1920:flags=lanczos,setsar=1"
+    )
+    assert reframe_filter(spec, LANDSCAPE, crop_x=100).startswith("crop=608:1080:100:")
+
+
+def test_crossfade_plan_is_single_filter_graph():
+    """クロスフェードを含む全処理が1つのfilter_complexになること"""
+    spec = RenderOutputSpec(transition="crossfade", transitionDuration=0.5)
+    plan = build_render_plan("in.mp4", "out.mp4", SEGMENTS, spec, LANDSCAPE, Settings())
+
+    assert plan.command.count("-filter_complex") == 1
+    assert plan.command.count("-i") == len(SEGMENTS)
+    graph = plan.filter_graph
+    assert "xfade=transition=fade:duration=0.5:offset=4.5[vx1]" in graph
+    assert "xfade=transition=fade:duration=0.5:offset=8[vx2]" in graph
+    assert graph.count("acrossfade") == 2
+    assert "loudnorm" in graph
+    assert plan.output_duration == pytest.approx(15 - 2 * 0.5)
+    assert not plan.video_copy
+
+
+def test_copy_plan_when_no_filtering_needed():
+    """映像の変換が不要ならストリームコピーし、音声だけ正規化すること"""
+    spec = RenderOutputSpec(aspectRatio="source", height=4320, transition="none")
+    plan = build_render_plan("in.mp4", "out.mp4", SEGMENTS, spec, LANDSCAPE, Settings())
+
+    assert plan.video_copy
+    assert not plan.audio_copy
+    assert plan.command[plan.command.index("-c:v") + 1] == "copy"
+    assert plan.filter_graph.startswith("[0:a:0]loudnorm")
+    assert plan.concat_list.count("inpoint") == len(SEGMENTS)
+
+
+def test_concat_list_escapes_quotes():
+    """concatリストのパスが引用符エスケープされること"""
+    listing = build_concat_list("/tmp/it's.mp4", [VideoSegment(start=1.5, end=3)])
+    assert "file '/tmp/it'\\''s.mp4'" in listing
+    assert "inpoint 1.5\noutpoint 3\n" in listing
+
+
+def test_saliency_offset_follows_detail():
+    """エッジや動きが集中する位置を切り出すこと"""
+    frames = np.zeros((4, 20, 96), dtype=np.uint8)
+    frames[:, :, 70:80:2] = 255
+    frames[1::2, :, 72:78] = 128
+    offset = saliency_offset(frames, crop_width=24)
+    assert 56 <= offset <= 70
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg is not installed")
+def test_render_video_crossfade(tmp_path):
+    """実際のFFmpegで縦型・クロスフェードのリールを生成できること"""
+    video = generate_test_video(tmp_path, duration=6, size="320x180", rate=15)
+    media = MediaInfo(duration=6, width=320, height=180, has_audio=True)
+    spec = RenderOutputSpec(aspectRatio="9:16", height=320, transitionDuration=0.4)
+    output = tmp_path / "reel.mp4"
+
+    plan = asyncio.run(
+        render_video(
+            str(video),
+            str(output),
+            [VideoSegment(start=0, end=2), VideoSegment(start=3, end=5)],
+            spec,
+            Settings(render_x264_preset="ultrafast"),
+            media=media,
+        )
+    )
+
+    assert output.stat().st_size > 0
+    assert plan.output_duration == pytest.approx(3.6)
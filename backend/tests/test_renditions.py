@@ -0,0 +1,70 @@
+from pathlib import Path
+
+from app.core.settings import Settings
+from app.models.schemas import RenderOutputSpec, VideoSegment
+from app.services.ffmpeg import MediaInfo
+from app.services.render import build_render_plan
+from app.services.renditions import build_ladder, rewrite_playlist
+
+
+def test_ladder_splits_input_stream_once(tmp_path):
+    """入力ストリームを1回のsplitで各レンディションに分岐すること"""
+    plan = build_ladder(
+        "0:v:0",
+        "0:a:0?",
+        ["source", "720p", "480p", "720p"],
+        tmp_path / "clip.mp4",
+        Settings(),
+    )
+
+    assert plan.graph[0] == "[0:v:0]split=2[lv0][lv1]"
+    assert [output.name for output in plan.outputs] == ["720p", "480p"]
+    assert plan.outputs[0].path == tmp_path / "clip_720p.mp4"
+    # 音声は入力ストリームをそのまま各出力にマップする
+    assert plan.args.count("0:a:0?") == 2
+    assert plan.main_video == "0:v:0"
+
+
+def test_ladder_shares_filter_output_with_main(tmp_path):
+    """フィルタ出力は主出力の分も含めて分岐すること"""
+    plan = build_ladder("vout", "aout", ["hls"], tmp_path / "reel.mp4", Settings())
+
+    assert "[vout]split=2[lv0][lv1]" in plan.graph
+    assert "[aout]asplit=2[la0][la1]" in plan.graph
+    assert (plan.main_video, plan.main_audio) == ("lv1", "la1")
+    assert plan.outputs[0].path == tmp_path / "reel_hls" / "index.m3u8"
+    assert plan.args[plan.args.index("-f") + 1] == "hls"
+
+
+def test_render_plan_adds_renditions_to_single_command(tmp_path):
+    """レンディションがレンダリングと同じFFmpegコマンドに追加されること"""
+    media = MediaInfo(duration=60, width=1920, height=1080, has_audio=True)
+    plan = build_render_plan(
+        "in.mp4",
+        str(tmp_path / "reel.mp4"),
+        [VideoSegment(start=0, end=5), VideoSegment(start=10, end=15)],
+        RenderOutputSpec(),
+        media,
+        Settings(),
+        renditions=["720p", "480p"],
+    )
+
+    assert plan.command.count("-filter_complex") == 1
+    assert plan.command.count("-i") == 2
+    assert [Path(output.path).name for output in plan.renditions] == [
+        "reel_720p.mp4",
+        "reel_480p.mp4",
+    ]
+    assert "split=3" in plan.filter_graph
+
+
+def test_rewrite_playlist_signs_segments():
+    """HLSプレイリストのセグメント参照が署名付きURLに置き換わること"""
+    playlist = "#EXTM3U\n#EXTINF:4.0,\nsegment_000.ts\n#EXT-X-ENDLIST\n"
+    rewritten = rewrite_playlist(playlist, {"segment_000.ts": "https://signed/0"})
+    assert rewritten.splitlines() == [
+        "#EXTM3U",
+        "#EXTINF:4.0,",
+        "https://signed/0",
+        "#EXT-X-ENDLIST",
+    ]
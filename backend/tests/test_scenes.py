@@ -0,0 +1,184 @@
+import asyncio
+import subprocess
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.core.settings import Settings
+from app.services.analyze import (
+    GeminiCandidate,
+    GeminiCandidateResponse,
+    GeminiResponse,
+    GeminiSegment,
+    analysis_prompt,
+    analyze_video_service,
+    candidate_highlights,
+)
+from app.services.prompts import prompt_version
+from app.services.scenes import (
+    candidate_segments,
+    detect_boundaries,
+    parse_scene_cuts,
+    parse_silences,
+)
+from app.store import get_store
+from benchmarks.videos import ffmpeg_available
+
+
+def test_candidate_segments_bucket_cuts():
+    """短すぎる区切りは捨て、長すぎる区間は等分し、末尾の短い区間は前に含めること"""
+    cuts = [2.0, 12.0, 13.0, 20.0, 118.0]
+    assert candidate_segments(cuts, 120.0, 5, 45) == [
+        (0.0, 12.0),
+        (12.0, 20.0),
+        (20.0, 52.667),
+        (52.667, 85.333),
+        (85.333, 120.0),
+    ]
+
+
+def test_candidate_segments_without_cuts():
+    assert candidate_segments([], 30.0, 5, 45) == [(0.0, 30.0)]
+    assert candidate_segments([], 0.0, 5, 45) == []
+
+
+def test_parse_metadata_output():
+    scenes = "frame:0    pts:61440   pts_time:4\nlavfi.scene_score=0.400000\n"
+    silences = (
+        "frame:236  pts:241664  pts_time:5.479909\n"
+        "lavfi.silence_start=4.999977\n"
+        "frame:301  pts:308224  pts_time:6.989206\n"
+        "lavfi.silence_end=7.000045\n"
+        "lavfi.silence_duration=2.000068\n"
+    )
+    assert parse_scene_cuts(scenes) == [4.0]
+    assert parse_silences(silences) == [(4.999977, 7.000045)]
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg is not installed")
+def test_detect_boundaries_finds_cuts_and_pauses(tmp_path):
+    """シーンの切り替わり（4秒・9秒）と無音区間の中央（6秒）を検出すること"""
+    video = tmp_path / "scenes.mp4"
+    subprocess.run(
+        [
+            "ffmpeg",
+            "-loglevel",
+            "error",
+            "-y",
+            "-f",
+            "lavfi",
+            "-i",
+            "color=red:s=320x180:d=4:r=15",
+            "-f",
+            "lavfi",
+            "-i",
+            "color=blue:s=320x180:d=5:r=15",
+            "-f",
+            "lavfi",
+            "-i",
+            "testsrc=s=320x180:d=3:r=15",
+            "-f",
+            "lavfi",
+            "-i",
+            "sine=f=440:d=5",
+            "-f",
+            "lavfi",
+            "-i",
+            "anullsrc=r=44100:cl=mono:d=2",
+            "-f",
+            "lavfi",
+            "-i",
+            "sine=f=880:d=5",
+            "-filter_complex",
+            "[0][1][2]concat=n=3:v=1:a=0[v];[3][4][5]concat=n=3:v=0:a=1[a]",
+            "-map",
+            "[v]",
+            "-map",
+            "[a]",
+            "-c:v",
+            "libx264",
+            "-c:a",
+            "aac",
+            str(video),
+        ],
+        check=True,
+    )
+
+    boundaries = asyncio.run(detect_boundaries(str(video), Settings()))
+
+    assert [round(b) for b in boundaries] == [4, 6, 9]
+
+
+def test_candidate_highlights_use_candidate_times():
+    candidates = [(0.0, 12.0), (12.0, 20.0), (20.0, 30.0)]
+    scores = [
+        GeminiCandidate(index=2, title="c", description="", score=0.9),
+        GeminiCandidate(index=0, title="a", description="", score=0.4),
+        GeminiCandidate(index=0, title="dup", description="", score=1.0),
+        GeminiCandidate(index=7, title="unknown", description="", score=1.0),
+    ]
+    highlights = candidate_highlights(candidates, scores)
+    assert [(h.start, h.end, h.title) for h in highlights] == [
+        (0.0, 12.0, "a"),
+        (20.0, 30.0, "c"),
+    ]
+
+
+def test_scene_analysis_scores_candidates(monkeypatch):
+    """候補セグメントをプロンプトに含め、番号で返された採点を時間に戻すこと"""
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    settings = Settings(analysis_segmentation="scenes")
+    sent = {}
+
+    def fake_generate(_part, prompt, _settings, response_type=GeminiResponse, **_):
+        sent["prompt"] = prompt
+        sent["response_type"] = response_type
+        return GeminiCandidateResponse(
+            segments=[GeminiCandidate(index=1, title="山場", description="", score=1)]
+        )
+
+    with (
+        patch(
+            "app.services.analyze.detect_candidates",
+            AsyncMock(return_value=[(0.0, 8.5), (8.5, 21.0)]),
+        ),
+        patch("app.services.analyze.uploaded_video_part", AsyncMock()),
+        patch("app.services.analyze.generate_with_vertex", fake_generate),
+    ):
+        result = asyncio.run(analyze_video_service("vid", settings))
+
+    assert "1: 8.5〜21.0" in sent["prompt"]
+    assert sent["response_type"] is GeminiCandidateResponse
+    assert [(h.start, h.end) for h in result.highlights] == [(8.5, 21.0)]
+    stored = asyncio.run(get_store().list_analyses("vid"))
+    assert stored[0].prompt_version == prompt_version(
+        analysis_prompt("vertex_ai", "scenes")
+    )
+
+
+def test_scene_detection_failure_falls_back_to_fixed_segments(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    settings = Settings()
+
+    def fake_generate(*_args, **_kwargs):
+        return GeminiResponse(
+            segments=[
+                GeminiSegment(start=0, end=30, title="a", description="", score=0.5)
+            ]
+        )
+
+    with (
+        patch(
+            "app.services.analyze.detect_candidates",
+            AsyncMock(side_effect=RuntimeError("no ffprobe")),
+        ),
+        patch("app.services.analyze.uploaded_video_part", AsyncMock()),
+        patch("app.services.analyze.generate_with_vertex", fake_generate),
+    ):
+        result = asyncio.run(
+            analyze_video_service("vid", settings, segmentation="scenes")
+        )
+
+    assert [(h.start, h.end) for h in result.highlights] == [(0, 30)]
+    stored = asyncio.run(get_store().list_analyses("vid"))
+    assert stored[0].prompt_version == prompt_version(analysis_prompt("vertex_ai"))
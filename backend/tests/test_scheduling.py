@@ -0,0 +1,212 @@
+import asyncio
+import stat
+from unittest.mock import patch
+
+import pytest
+
+from app.core.scheduling import (
+    FairQueue,
+    TenantLimitError,
+    _today,
+    reset_queues,
+)
+from app.core.settings import Settings, get_settings
+from app.core.telemetry import span
+from app.core.usage import charge, metering
+from app.models.schemas import AnalysisResult
+from app.services.ffmpeg import run_ffmpeg
+from app.services.transfer import download_blob, upload_blob
+from main import app
+
+
+@pytest.fixture(autouse=True)
+def fresh_queues():
+    reset_queues()
+    yield
+    reset_queues()
+    app.dependency_overrides.clear()
+
+
+async def _run_jobs(queue: FairQueue, jobs: list[tuple[str, float]]) -> list[str]:
+    """1つ目のジョブが枠を持つ間に残りを投入し、枠が割り当てられた順を返す"""
+    order = []
+    gate = asyncio.Event()
+
+    async def job(tenant: str, weight: float):
+        async with queue.slot(tenant, weight):
+            order.append(tenant)
+            await gate.wait()
+
+    tasks = []
+    for tenant, weight in jobs:
+        tasks.append(asyncio.create_task(job(tenant, weight)))
+        await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(*tasks)
+    return order
+
+
+@pytest.mark.asyncio
+async def test_heavy_tenant_does_not_starve_others():
+    """大量に投入したテナントがいても、後から来たテナントが割り込めること"""
+    queue = FairQueue("test", capacity=1, per_tenant=1, max_queued=10)
+
+    order = await _run_jobs(queue, [("a", 1.0)] * 4 + [("b", 1.0)] * 2)
+
+    assert order == ["a", "b", "a", "b", "a", "a"]
+
+
+@pytest.mark.asyncio
+async def test_slots_follow_tenant_weights():
+    queue = FairQueue("test", capacity=1, per_tenant=1, max_queued=10)
+
+    order = await _run_jobs(
+        queue, [("blocker", 1.0)] + [("a", 2.0)] * 6 + [("b", 1.0)] * 6
+    )
+
+    assert order[1:7].count("a") == 4
+
+
+@pytest.mark.asyncio
+async def test_per_tenant_concurrency_leaves_slots_for_others():
+    queue = FairQueue("test", capacity=3, per_tenant=1, max_queued=10)
+    await queue.acquire("a")
+
+    second = asyncio.create_task(queue.acquire("a"))
+    await queue.acquire("b")
+    await asyncio.sleep(0)
+
+    assert not second.done()
+    assert queue.running == 2
+    queue.release("a")
+    await second
+    assert queue.running == 2
+
+
+@pytest.mark.asyncio
+async def test_queue_full_and_cancelled_waiters():
+    queue = FairQueue("test", capacity=1, per_tenant=1, max_queued=1)
+    await queue.acquire("a")
+    waiting = asyncio.create_task(queue.acquire("a"))
+    await asyncio.sleep(0)
+
+    with pytest.raises(TenantLimitError) as excinfo:
+        await queue.acquire("a")
+    assert excinfo.value.reason == "queue_full"
+
+    waiting.cancel()
+    await asyncio.sleep(0)
+    assert queue.queued() == 0
+    queue.release("a")
+    assert queue.running == 0
+
+
+@pytest.mark.asyncio
+async def test_meter_collects_ffmpeg_cpu_time(tmp_path):
+    """計測中のFFmpegは -benchmark のCPU時間が使用量に加算されること"""
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text(
+        "#!/bin/sh\necho 'bench: utime=1.250s stime=0.250s rtime=2.000s' >&2\n"
+    )
+    ffmpeg.chmod(ffmpeg.stat().st_mode | stat.S_IEXEC)
+
+    with metering() as meter:
+        await run_ffmpeg([str(ffmpeg), "-i", "in.mp4"])
+        charge(model_seconds=2.0, egress_bytes=100)
+
+    assert meter.ffmpeg_cpu_seconds == pytest.approx(1.5)
+    assert meter.model_seconds == 2.0
+    assert meter.egress_bytes == 100
+
+
+@pytest.mark.asyncio
+async def test_only_uploads_are_charged_as_egress(gcs, tmp_path):
+    """GCSからのダウンロードはテナントの送信量に計上しないこと"""
+    source = tmp_path / "clip.mp4"
+    source.write_bytes(b"v" * 1000)
+    gcs.seed("bucket", "uploads/vid.mp4", source)
+    bucket = gcs.client().bucket("bucket")
+
+    with metering() as meter:
+        with span("ingest.download") as download_span:
+            size = await download_blob(
+                bucket.blob("uploads/vid.mp4"), tmp_path / "in.mp4", Settings()
+            )
+            download_span.set_attribute("bytes", size)
+        assert meter.egress_bytes == 0
+
+        await upload_blob(bucket.blob("processed/out.mp4"), source, Settings())
+
+    assert meter.egress_bytes == 1000
+
+
+def _quota_settings() -> Settings:
+    settings = Settings(
+        tenant_daily_model_seconds=10, tenant_keys={"k1": "alpha", "k2": "beta"}
+    )
+    app.dependency_overrides[get_settings] = lambda: settings
+    return settings
+
+
+async def _fake_analysis(*_args, **_kwargs):
+    charge(model_seconds=3.0)
+    return AnalysisResult(highlights=[])
+
+
+def test_usage_is_charged_and_remaining_budget_returned(client, store):
+    _quota_settings()
+    with patch("main.analyze_video_service", _fake_analysis):
+        response = client.post("/api/analyze/vid", headers={"X-API-Key": "k1"})
+
+    assert response.status_code == 200
+    assert response.headers["X-Quota-Remaining-Model-Seconds"] == "7.0"
+    usage = asyncio.run(store.get_tenant_usage("alpha", _today()))
+    assert usage.model_seconds == 3.0
+    assert usage.jobs == 1
+
+
+def test_exhausted_quota_returns_429(client, store):
+    _quota_settings()
+    asyncio.run(
+        store.add_tenant_usage(
+            "alpha",
+            _today(),
+            model_seconds=12.0,
+            ffmpeg_cpu_seconds=0,
+            egress_bytes=0,
+        )
+    )
+    with patch("main.analyze_video_service", _fake_analysis):
+        response = client.post("/api/analyze/vid", headers={"X-API-Key": "k1"})
+        other = client.post("/api/analyze/vid", headers={"X-API-Key": "k2"})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert response.headers["X-Quota-Remaining-Model-Seconds"] == "0.0"
+    assert other.status_code == 200
+
+
+def test_unregistered_keys_are_rejected(client, store):
+    """登録されていないキーはテナントにならず 401 になること"""
+    _quota_settings()
+    with patch("main.analyze_video_service", _fake_analysis):
+        unknown = client.post("/api/analyze/vid", headers={"X-API-Key": "random"})
+        missing = client.post("/api/analyze/vid")
+
+    assert unknown.status_code == 401
+    assert missing.status_code == 401
+    assert asyncio.run(store.get_tenant_usage("random", _today())).jobs == 0
+
+
+def test_keys_are_ignored_without_registry(client, store):
+    """キーが登録されていなければ、送られたキーによらず匿名のテナントになること"""
+    settings = Settings(tenant_daily_model_seconds=10)
+    app.dependency_overrides[get_settings] = lambda: settings
+    with patch("main.analyze_video_service", _fake_analysis):
+        for key in ("a", "b"):
+            response = client.post("/api/analyze/vid", headers={"X-API-Key": key})
+            assert response.status_code == 200
+
+    usage = asyncio.run(store.get_tenant_usage("anonymous", _today()))
+    assert usage.jobs == 2
+    assert response.headers["X-Quota-Remaining-Model-Seconds"] == "4.0"
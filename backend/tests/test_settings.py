@@ -1,7 +1,9 @@
 """Test pydantic-settings integration"""
 
-import pytest
 from unittest.mock import patch
+
+import pytest
+
 from app.core.settings import Settings, get_settings
 
 
@@ -45,6 +47,16 @@ def test_settings_validation():
     with pytest.raises(ValueError, match="GCS_BUCKET_NAME"):
         settings.validate_gcs_config()
 
+    # FFmpegの期限が0以下だとすべての実行がすぐに期限切れになる
+    for timeout in (0, -1):
+        with pytest.raises(ValueError, match="ffmpeg_timeout_seconds"):
+            Settings(ffmpeg_timeout_seconds=timeout)
+
+    # サンプリング間隔が0以下だとサンプラーのスレッドが空回りする
+    for interval in (0, -1):
+        with pytest.raises(ValueError, match="profiling_sample_interval_ms"):
+            Settings(profiling_sample_interval_ms=interval)
+
 
 def test_get_settings_cached():
     """Test that get_settings returns cached instance"""
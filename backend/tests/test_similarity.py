@@ -0,0 +1,108 @@
+import asyncio
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from app.core.settings import Settings
+from app.models.schemas import AnalysisResult, Highlight
+from app.services.embeddings import HashingEmbedder
+from app.services.library import record_analysis
+from app.store import HighlightQuery
+from app.store.vectors import VectorIndex, build_ivf
+
+
+def _unit(rng: np.random.Generator, rows: int, dim: int) -> np.ndarray:
+    vectors = rng.standard_normal((rows, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def test_hashing_embedder_is_deterministic():
+    """ハッシュ埋め込みが決定的で、表記の近いテキストほど近いこと"""
+    embedder = HashingEmbedder()
+    a, b, c = embedder.embed(["劇的な逆転ゴール", "逆転のゴール", "ハーフタイムの様子"])
+
+    assert np.allclose(embedder.embed(["劇的な逆転ゴール"])[0], a)
+    assert np.linalg.norm(a) == pytest.approx(1.0)
+    assert a @ b > a @ c
+
+
+def test_vector_index_replaces_group_and_excludes(tmp_path):
+    """動画ごとの置き換え・除外が効き、メモリマップから再読み込みできること"""
+    rng = np.random.default_rng(0)
+    vectors = _unit(rng, 4, 16)
+    index = VectorIndex(tmp_path, dim=16, model="test")
+    index.replace_group("a", [1, 2], vectors[:2])
+    index.replace_group("b", [3], vectors[2:3])
+    index.replace_group("a", [4], vectors[3:4])
+
+    assert [i for i, _ in index.search(vectors[0], 10)] in ([4, 3], [3, 4])
+    assert [i for i, _ in index.search(vectors[3], 10, exclude_group="a")] == [3]
+    index.close()
+
+    reopened = VectorIndex(tmp_path, dim=16, model="test")
+    assert reopened.count == 4
+    assert reopened.search(vectors[2], 1)[0] == (3, pytest.approx(1.0, abs=1e-5))
+    # モデルが変わった索引は作り直す
+    assert VectorIndex(tmp_path, dim=16, model="other").count == 0
+
+
+def test_ivf_search_matches_exact_top_hits():
+    """IVF索引の上位結果が全件走査とほぼ一致すること"""
+    rng = np.random.default_rng(1)
+    centers = _unit(rng, 20, 32)
+    vectors = centers[rng.integers(0, 20, 4000)] + 0.05 * rng.standard_normal(
+        (4000, 32)
+    ).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    exact = VectorIndex(None, dim=32, model="test", ann_threshold=10**9)
+    approximate = VectorIndex(None, dim=32, model="test", ann_threshold=1000)
+    for index in (exact, approximate):
+        index.replace_group("all", list(range(4000)), vectors)
+
+    query = vectors[123]
+    expected = {i for i, _ in exact.search(query, 10)}
+    with patch("app.store.vectors.build_ivf", wraps=build_ivf) as build:
+        found = {i for i, _ in approximate.search(query, 10)}
+    build.assert_called_once()
+    assert len(expected & found) >= 9
+
+
+def test_api_similar_moments_in_other_videos(client, store):
+    """解析時に索引され、他の動画の似た場面を返すこと"""
+    settings = Settings()
+
+    def analyze(file_id: str, titles: list[str]) -> None:
+        result = AnalysisResult(
+            highlights=[
+                Highlight(
+                    start=i * 30, end=i * 30 + 30, title=t, description="", score=50
+                )
+                for i, t in enumerate(titles)
+            ]
+        )
+        asyncio.run(
+            record_analysis(
+                file_id,
+                provider="p",
+                model="m",
+                version="v",
+                result=result,
+                settings=settings,
+            )
+        )
+
+    analyze("a", ["逆転ゴールの瞬間", "ハーフタイム"])
+    analyze("b", ["ゴールの瞬間", "選手インタビュー"])
+
+    response = client.get("/api/highlights/similar", params={"q": "ゴールの瞬間"})
+    top = response.json()["highlights"][0]
+    assert (top["fileId"], top["title"]) == ("b", "ゴールの瞬間")
+
+    source = asyncio.run(store.search_highlights(HighlightQuery(text="逆転"))).items[0]
+    similar = client.get(f"/api/highlights/{source.id}/similar").json()["highlights"]
+    assert {h["fileId"] for h in similar} == {"b"}
+    assert similar[0]["title"] == "ゴールの瞬間"
+
+    assert client.get("/api/highlights/999/similar").status_code == 404
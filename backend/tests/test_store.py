@@ -0,0 +1,251 @@
+import asyncio
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from app.store import HighlightQuery, SQLiteVideoStore, VideoRecord
+from app.store.text import bigrams
+
+
+def _highlight(
+    start: float, score: float, title: str = "", description: str = ""
+) -> dict:
+    return {
+        "start": start,
+        "end": start + 30,
+        "title": title or f"h{start:g}",
+        "description": description,
+        "score": score,
+    }
+
+
+@pytest.mark.asyncio
+async def test_list_videos_paginates_newest_first(store):
+    """動画一覧が新しい順にキーセットページングされること"""
+    for index in range(5):
+        await store.upsert_video(
+            VideoRecord(f"video-{index}", f"{index}.mp4", "video/mp4", 1, index)
+        )
+
+    first = await store.list_videos(limit=2)
+    second = await store.list_videos(limit=2, cursor=first.next_cursor)
+    last = await store.list_videos(limit=2, cursor=second.next_cursor)
+
+    assert [v.file_id for v in first.items] == ["video-4", "video-3"]
+    assert [v.file_id for v in second.items] == ["video-2", "video-1"]
+    assert [v.file_id for v in last.items] == ["video-0"]
+    assert last.next_cursor is None
+
+
+@pytest.mark.asyncio
+async def test_analyses_are_versioned_by_model_and_prompt(store):
+    """解析結果がモデル・プロンプトのバージョンごとに引けること"""
+    await store.add_analysis(
+        "a",
+        provider="vertex_ai",
+        model="m1",
+        prompt_version="p1",
+        highlights=[_highlight(0, 50)],
+    )
+    await store.add_analysis(
+        "a",
+        provider="vertex_ai",
+        model="m1",
+        prompt_version="p2",
+        highlights=[_highlight(30, 70)],
+    )
+
+    found = await store.find_analysis("a", model="m1", prompt_version="p1")
+    assert [h.score for h in found.highlights] == [50]
+    assert await store.find_analysis("a", model="m2", prompt_version="p1") is None
+    assert [a.prompt_version for a in await store.list_analyses("a")] == ["p2", "p1"]
+
+
+@pytest.mark.asyncio
+async def test_top_highlights_use_latest_analysis_only(store):
+    """上位ハイライトが各動画の最新の解析だけから、スコア順に返ること"""
+    await store.add_analysis(
+        "a",
+        provider="p",
+        model="m",
+        prompt_version="v",
+        highlights=[_highlight(0, 99)],
+    )
+    await store.add_analysis(
+        "a",
+        provider="p",
+        model="m",
+        prompt_version="v",
+        highlights=[_highlight(0, 60), _highlight(30, 80)],
+    )
+    await store.add_analysis(
+        "b",
+        provider="p",
+        model="m",
+        prompt_version="v",
+        highlights=[_highlight(0, 70), _highlight(30, 40)],
+    )
+
+    first = await store.top_highlights(limit=2)
+    rest = await store.top_highlights(limit=2, cursor=first.next_cursor)
+    assert [h.score for h in first.items] == [80, 70]
+    assert [h.score for h in rest.items] == [60, 40]
+    assert rest.next_cursor is None
+
+    filtered = await store.top_highlights(file_id="b", min_score=50)
+    assert [(h.file_id, h.score) for h in filtered.items] == [("b", 70)]
+
+
+def test_top_highlights_query_uses_score_index(tmp_path):
+    """上位ハイライトの取得がスコアのインデックスを使うこと"""
+    path = tmp_path / "videos.db"
+    asyncio.run(SQLiteVideoStore(path).close())
+    with closing(sqlite3.connect(path)) as conn:
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM highlights WHERE current = 1 "
+            "AND (score, id) < (?, ?) ORDER BY score DESC, id DESC LIMIT 20",
+            (50, 10),
+        ).fetchall()
+    detail = " ".join(row[3] for row in plan)
+
+    assert "idx_highlights_top" in detail
+    assert "TEMP B-TREE" not in detail
+
+
+def test_api_video_library(client, store):
+    """アップロード・解析の記録がAPIから参照できること"""
+    asyncio.run(
+        store.upsert_video(VideoRecord("vid", "clip.mp4", "video/mp4", 10, 1.0))
+    )
+    asyncio.run(
+        store.add_analysis(
+            "vid",
+            provider="p",
+            model="m",
+            prompt_version="v",
+            highlights=[_highlight(0, 90)],
+        )
+    )
+
+    videos = client.get("/api/videos").json()
+    assert videos["videos"][0]["fileId"] == "vid"
+    assert videos["nextCursor"] is None
+
+    analyses = client.get("/api/videos/vid/analyses").json()["analyses"]
+    assert analyses[0]["promptVersion"] == "v"
+
+    top = client.get("/api/highlights/top", params={"minScore": 80}).json()
+    assert top["highlights"][0]["fileId"] == "vid"
+
+    assert client.get("/api/videos/missing").status_code == 404
+    assert client.get("/api/highlights/top?cursor=***").status_code == 400
+
+
+def test_bigrams_normalize_width_and_case():
+    """全角・半角と大文字小文字を正規化して文字bigramにすること"""
+    assert bigrams("ＧＯＡＬ！ゴール") == {"go", "oa", "al", "ゴー", "ール"}
+    assert bigrams("a b") == set()
+
+
+@pytest.mark.asyncio
+async def test_search_highlights_by_text_score_and_time(store):
+    """全文・スコア・解析日時の条件を組み合わせて検索できること"""
+    await store.add_analysis(
+        "a",
+        provider="p",
+        model="m",
+        prompt_version="v",
+        highlights=[
+            _highlight(0, 0.9, "劇的なゴール", "後半のシュート"),
+            _highlight(30, 0.5, "ゴール前の攻防"),
+            _highlight(60, 0.95, "ハーフタイム"),
+        ],
+    )
+    await store.add_analysis(
+        "b",
+        provider="p",
+        model="m",
+        prompt_version="v",
+        highlights=[_highlight(0, 0.85, "Goal!", "ロスタイムのゴール")],
+        created_at=100,
+    )
+
+    async def search(**kwargs) -> list[tuple[str, float]]:
+        page = await store.search_highlights(HighlightQuery(**kwargs))
+        return [(h.file_id, h.score) for h in page.items]
+
+    assert await search(text="ゴール") == [("a", 0.9), ("b", 0.85), ("a", 0.5)]
+    assert await search(text="ゴール", min_score=0.8) == [("a", 0.9), ("b", 0.85)]
+    assert await search(text="ゴール シュート") == [("a", 0.9)]
+    assert await search(text="ＧＯＡＬ") == [("b", 0.85)]
+    assert await search(text="ゴール", since=1000) == [("a", 0.9), ("a", 0.5)]
+    assert await search(text="ゴール", until=1000) == [("b", 0.85)]
+    assert await search(text="オフサイド") == []
+
+
+@pytest.mark.asyncio
+async def test_search_index_follows_latest_analysis(store):
+    """再解析で古いハイライトが検索対象から外れること"""
+    for title in ("古いゴール", "新しいセーブ"):
+        await store.add_analysis(
+            "a",
+            provider="p",
+            model="m",
+            prompt_version="v",
+            highlights=[_highlight(0, 0.9, title)],
+        )
+
+    assert (await store.search_highlights(HighlightQuery(text="ゴール"))).items == []
+    found = await store.search_highlights(HighlightQuery(text="セーブ"))
+    assert [h.title for h in found.items] == ["新しいセーブ"]
+
+
+@pytest.mark.asyncio
+async def test_migration_indexes_existing_highlights(tmp_path):
+    """検索索引のない既存のデータベースが移行され、検索できること"""
+    path = tmp_path / "videos.db"
+    store = SQLiteVideoStore(path)
+    await store.add_analysis(
+        "a",
+        provider="p",
+        model="m",
+        prompt_version="v",
+        highlights=[_highlight(0, 0.9, "逆転ゴール")],
+    )
+    await store.close()
+    # 索引を作る前の状態に戻す
+    with closing(sqlite3.connect(path)) as conn, conn:
+        conn.execute("DROP TABLE highlight_terms")
+        conn.execute("PRAGMA user_version = 0")
+        conn.execute("ALTER TABLE highlights DROP COLUMN search_text")
+        conn.execute("DROP INDEX idx_highlights_recent")
+        conn.execute("ALTER TABLE highlights DROP COLUMN created_at")
+
+    migrated = SQLiteVideoStore(path)
+    page = await migrated.search_highlights(HighlightQuery(text="ゴール"))
+    assert [h.title for h in page.items] == ["逆転ゴール"]
+    assert page.items[0].created_at > 0
+    await migrated.close()
+
+
+def test_api_search_highlights(client, store):
+    """検索APIがクエリ条件を受け付けること"""
+    asyncio.run(
+        store.add_analysis(
+            "vid",
+            provider="p",
+            model="m",
+            prompt_version="v",
+            highlights=[_highlight(0, 0.9, "決勝ゴール"), _highlight(30, 0.4)],
+        )
+    )
+
+    response = client.get(
+        "/api/highlights/search",
+        params={"q": "ゴール", "minScore": 0.8, "since": "2000-01-01T00:00:00Z"},
+    )
+    assert response.status_code == 200
+    highlights = response.json()["highlights"]
+    assert [h["title"] for h in highlights] == ["決勝ゴール"]
+    assert highlights[0]["analyzedAt"]
@@ -0,0 +1,84 @@
+import logging
+
+import pytest
+
+from app.core.telemetry import (
+    REQUEST_ID_HEADER,
+    STAGE_DURATION,
+    Histogram,
+    MetricsRegistry,
+    request_id_var,
+    span,
+)
+
+
+def test_histogram_render_is_cumulative():
+    """ヒストグラムのバケットが累積で出力されること"""
+    histogram = Histogram("test_seconds", "test", ("stage",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, stage="a")
+    histogram.observe(0.5, stage="a")
+    histogram.observe(5.0, stage="a")
+
+    lines = histogram.render()
+    assert 'test_seconds_bucket{stage="a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="a",le="1"} 2' in lines
+    assert 'test_seconds_bucket{stage="a",le="+Inf"} 3' in lines
+    assert 'test_seconds_count{stage="a"} 3' in lines
+
+
+def test_registry_reuses_metrics():
+    """同名のメトリクスは同一インスタンスが返ること"""
+    registry = MetricsRegistry()
+    counter = registry.counter("test_total", "test", ("kind",))
+    assert registry.counter("test_total", "test", ("kind",)) is counter
+    counter.inc(kind='quote"d')
+    assert 'test_total{kind="quote\\"d"} 1' in registry.render()
+
+
+def test_span_records_stage_duration():
+    """スパンがステージ別ヒストグラムに記録されること"""
+    before = STAGE_DURATION.count(stage="test.stage", status="ok")
+    with span("test.stage") as current:
+        pass
+    assert current.duration >= 0
+    assert STAGE_DURATION.count(stage="test.stage", status="ok") == before + 1
+
+
+def test_span_marks_errors():
+    """例外発生時はstatus=errorで記録されること"""
+    before = STAGE_DURATION.count(stage="test.failing", status="error")
+    with pytest.raises(RuntimeError), span("test.failing"):
+        msg = "boom"
+        raise RuntimeError(msg)
+    assert STAGE_DURATION.count(stage="test.failing", status="error") == before + 1
+
+
+def test_request_id_propagates_to_response_and_logs(client, caplog):
+    """X-Request-IDがレスポンスとログレコードに伝播すること"""
+    response = client.get("/health", headers={REQUEST_ID_HEADER: "req-123"})
+    assert response.headers[REQUEST_ID_HEADER] == "req-123"
+
+    token = request_id_var.set("req-456")
+    try:
+        with caplog.at_level(logging.INFO):
+            logging.getLogger("app.test").info("hello")
+    finally:
+        request_id_var.reset(token)
+    assert caplog.records[-1].request_id == "req-456"
+
+
+def test_request_id_generated_when_missing(client):
+    """X-Request-IDがない場合は採番されること"""
+    response = client.get("/health")
+    assert len(response.headers[REQUEST_ID_HEADER]) == 32
+
+
+def test_metrics_endpoint(client):
+    """/metricsがPrometheus形式でHTTPメトリクスを返すこと"""
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_requests_total{method="GET",route="/health",status="200"}' in (
+        response.text
+    )
@@ -0,0 +1,67 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.core.settings import Settings
+from app.models.schemas import VideoSegment
+from app.services.ffmpeg import MediaInfo
+from app.services.gcs_utils import cached_signed_url, signed_url_cache
+from app.services.thumbnails import build_thumbnail_command, build_vtt
+
+MEDIA = MediaInfo(duration=250.0, width=1920, height=1080, has_audio=True)
+
+
+def test_thumbnail_command_single_decode(tmp_path):
+    """スプライトとハイライトサムネイルを1つのフィルタグラフで書き出すこと"""
+    settings = Settings(thumbnail_interval_seconds=2.0)
+    highlights = [
+        VideoSegment(start=10, end=20),
+        VideoSegment(start=14, end=16),
+        VideoSegment(start=100, end=110),
+    ]
+    cmd, manifest = build_thumbnail_command(
+        "in.mp4", tmp_path, MEDIA, highlights, settings
+    )
+
+    assert cmd.count("-i") == 1
+    graph = cmd[cmd.index("-filter_complex") + 1]
+    assert "split=2[frames][picks]" in graph
+    assert "tile=10x10" in graph
+    assert "select='eq(n\\,8)+eq(n\\,52)'" in graph
+    assert manifest.frame_count == 125
+    assert manifest.sprites == ["sprite_000.jpg", "sprite_001.jpg"]
+    assert (manifest.tile_width, manifest.tile_height) == (160, 90)
+    # 同じフレームを指すハイライトはサムネイルを共有する
+    assert manifest.highlight_thumbnails == [
+        "highlight_frame_000.jpg",
+        "highlight_frame_000.jpg",
+        "highlight_frame_001.jpg",
+    ]
+
+
+def test_vtt_points_into_sprite_tiles(tmp_path):
+    """WebVTTの各キューがスプライト内のタイル座標を指すこと"""
+    settings = Settings(thumbnail_columns=2, thumbnail_rows=2)
+    _, manifest = build_thumbnail_command("in.mp4", tmp_path, MEDIA, [], settings)
+
+    vtt = build_vtt(manifest, ["a.jpg", "b.jpg"]).split("\n\n")
+    assert vtt[0] == "WEBVTT"
+    assert vtt[1] == "00:00:00.000 --> 00:00:02.000\na.jpg#xywh=0,0,160,90"
+    assert vtt[4] == "00:00:06.000 --> 00:00:08.000\na.jpg#xywh=160,90,160,90"
+    assert vtt[5] == "00:00:08.000 --> 00:00:10.000\nb.jpg#xywh=0,0,160,90"
+
+
+def test_cached_signed_url_reuses_url():
+    """有効期限が十分残っている署名付きURLは再利用されること"""
+    signed_url_cache.clear()
+    blob = SimpleNamespace(bucket=SimpleNamespace(name="bucket"), name="a.jpg")
+    with patch(
+        "app.services.gcs_utils.generate_signed_url",
+        side_effect=["https://signed/1", "https://signed/2"],
+    ) as sign:
+        first = cached_signed_url(blob, expiration=timedelta(hours=1))
+        second = cached_signed_url(blob, expiration=timedelta(hours=1))
+
+    assert first == second == "https://signed/1"
+    assert sign.call_count == 1
+    signed_url_cache.clear()
@@ -0,0 +1,204 @@
+import asyncio
+import wave
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from app.core.settings import Settings
+from app.services.analyze import (
+    GeminiCandidate,
+    GeminiCandidateResponse,
+    GeminiResponse,
+    GeminiSegment,
+    analysis_prompt,
+    analyze_video_service,
+)
+from app.services.ffmpeg import MediaInfo
+from app.services.prompts import prompt_version
+from app.services.transcripts import (
+    StubSpeechEngine,
+    TranscriptContext,
+    TranscriptSegment,
+    build_keyframe_command,
+    candidate_texts,
+    keyframe_times,
+    prepare_transcript_analysis,
+)
+from app.store import TranscriptRecord, get_store
+from benchmarks.videos import ffmpeg_available, generate_test_video
+
+MEDIA = MediaInfo(
+    duration=12,
+    width=320,
+    height=180,
+    has_audio=True,
+    video_codec="h264",
+    audio_codec="aac",
+)
+
+
+def test_keyframes_are_sampled_by_input_seeking():
+    assert keyframe_times(60, 4) == [7.5, 22.5, 37.5, 52.5]
+    assert keyframe_times(60, 0) == []
+
+    cmd = build_keyframe_command("in.mp4", [7.5, 22.5], "/tmp/frames")
+    assert cmd[2:10] == [
+        "-ss",
+        "7.500",
+        "-i",
+        "in.mp4",
+        "-ss",
+        "22.500",
+        "-i",
+        "in.mp4",
+    ]
+    assert cmd.count("-frames:v") == 2
+    assert cmd[-1] == "/tmp/frames/keyframe-1.jpg"
+
+
+def test_candidate_texts_group_utterances_by_midpoint():
+    segments = [
+        TranscriptSegment(0.0, 4.0, "こんにちは"),
+        TranscriptSegment(4.0, 11.0, "今日は"),
+        TranscriptSegment(11.0, 20.0, "山場です"),
+    ]
+    candidates = [(0.0, 8.0), (8.0, 15.0), (15.0, 20.0)]
+    assert candidate_texts(candidates, segments) == [
+        "こんにちは 今日は",
+        "",
+        "山場です",
+    ]
+
+
+def test_stub_engine_is_deterministic(tmp_path):
+    audio = tmp_path / "speech.wav"
+    with wave.open(str(audio), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(b"\0\0" * 16000 * 12)
+
+    transcript = StubSpeechEngine().transcribe(audio)
+
+    assert [(s.start, s.end, s.text) for s in transcript.segments] == [
+        (0.0, 5.0, "発話1"),
+        (5.0, 10.0, "発話2"),
+        (10.0, 12.0, "発話3"),
+    ]
+
+
+@pytest.mark.skipif(not ffmpeg_available(), reason="ffmpeg is not installed")
+def test_prepare_transcribes_once_and_samples_keyframes(gcs, tmp_path):
+    """音声を文字起こしして保存し、2回目は保存済みの文字起こしを使うこと"""
+    video = generate_test_video(tmp_path, duration=12, size="320x180", rate=15)
+    gcs.seed("bucket", "uploads/vid.mp4", video)
+    settings = Settings(
+        gcs_bucket_name="bucket",
+        speech_engine="stub",
+        transcript_keyframes=3,
+        segment_min_seconds=4,
+    )
+
+    with patch("app.services.transcripts.probe_media", AsyncMock(return_value=MEDIA)):
+        context = asyncio.run(prepare_transcript_analysis("vid", settings))
+        stored = asyncio.run(get_store().get_transcript("vid", "stub"))
+        with patch.object(
+            StubSpeechEngine, "transcribe", side_effect=AssertionError("reused")
+        ):
+            again = asyncio.run(prepare_transcript_analysis("vid", settings))
+
+    assert context.candidates == [(0.0, 5.0), (5.0, 12.0)]
+    assert context.texts == ["発話1", "発話2 発話3"]
+    assert [time for time, _ in context.keyframes] == [2.0, 6.0, 10.0]
+    assert all(jpeg.startswith(b"\xff\xd8") for _, jpeg in context.keyframes)
+    assert [s["text"] for s in stored.segments] == ["発話1", "発話2", "発話3"]
+    assert again.texts == context.texts
+
+
+def test_store_replaces_transcript_per_engine(store):
+    def put(text: str) -> None:
+        asyncio.run(
+            store.put_transcript(
+                TranscriptRecord(
+                    file_id="vid",
+                    engine="stub",
+                    segments=[{"start": 0.0, "end": 1.0, "text": text}],
+                    created_at=1.0,
+                )
+            )
+        )
+
+    put("古い")
+    put("新しい")
+    assert asyncio.run(store.get_transcript("vid", "stub")).segments[0]["text"] == (
+        "新しい"
+    )
+    assert asyncio.run(store.get_transcript("vid", "faster-whisper:small")) is None
+
+
+def test_transcript_analysis_sends_text_and_keyframes(monkeypatch):
+    """動画の代わりに発話と代表フレームを送り、番号の採点を時間に戻すこと"""
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    settings = Settings(analysis_segmentation="transcript")
+    context = TranscriptContext(
+        candidates=[(0.0, 8.0), (8.0, 20.0)],
+        texts=["導入", "山場の説明"],
+        keyframes=[(5.0, b"\xff\xd8a"), (15.0, b"\xff\xd8b")],
+    )
+    sent = {}
+
+    def fake_generate(media, prompt, _settings, _response_type=GeminiResponse, **_):
+        sent["media"] = media
+        sent["prompt"] = prompt
+        return GeminiCandidateResponse(
+            segments=[GeminiCandidate(index=1, title="山場", description="", score=1)]
+        )
+
+    with (
+        patch(
+            "app.services.analyze.prepare_transcript_analysis",
+            AsyncMock(return_value=context),
+        ),
+        patch("app.services.analyze.generate_with_vertex", fake_generate),
+    ):
+        result = asyncio.run(analyze_video_service("vid", settings))
+
+    assert "1: 8.0〜20.0「山場の説明」" in sent["prompt"]
+    assert "5.0、15.0 秒" in sent["prompt"]
+    assert [part.inline_data.mime_type for part in sent["media"]] == [
+        "image/jpeg",
+        "image/jpeg",
+    ]
+    assert [(h.start, h.end) for h in result.highlights] == [(8.0, 20.0)]
+    stored = asyncio.run(get_store().list_analyses("vid"))
+    assert stored[0].prompt_version == prompt_version(
+        analysis_prompt("vertex_ai", "transcript")
+    )
+
+
+def test_missing_speech_engine_falls_back_to_fixed_segments(monkeypatch):
+    monkeypatch.delenv("GOOGLE_API_KEY", raising=False)
+    settings = Settings()
+
+    def fake_generate(*_args, **_kwargs):
+        return GeminiResponse(
+            segments=[
+                GeminiSegment(start=0, end=30, title="a", description="", score=0.5)
+            ]
+        )
+
+    with (
+        patch(
+            "app.services.analyze.prepare_transcript_analysis",
+            AsyncMock(side_effect=ImportError("No module named 'faster_whisper'")),
+        ),
+        patch("app.services.analyze.uploaded_video_part", AsyncMock()),
+        patch("app.services.analyze.generate_with_vertex", fake_generate),
+    ):
+        result = asyncio.run(
+            analyze_video_service("vid", settings, segmentation="transcript")
+        )
+
+    assert [(h.start, h.end) for h in result.highlights] == [(0, 30)]
+    stored = asyncio.run(get_store().list_analyses("vid"))
+    assert stored[0].prompt_version == prompt_version(analysis_prompt("vertex_ai"))
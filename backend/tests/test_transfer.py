@@ -0,0 +1,107 @@
+import asyncio
+import shutil
+from unittest.mock import patch
+
+import pytest
+
+from app.core.settings import Settings
+from app.services.transfer import (
+    TransferChecksumError,
+    download_blob,
+    file_crc32c,
+    upload_blob,
+)
+from benchmarks.fakes import FakeGCS
+
+MIB = 1024 * 1024
+
+
+def _settings(**kwargs) -> Settings:
+    return Settings(
+        transfer_slice_threshold_bytes=MIB,
+        transfer_slice_bytes=5 * MIB,
+        transfer_workers=4,
+        **kwargs,
+    )
+
+
+def _seed(gcs: FakeGCS, tmp_path, size: int):
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"v" * size)
+    gcs.seed("bucket", "uploads/vid.mp4", source)
+    return gcs.client().bucket("bucket").blob("uploads/vid.mp4")
+
+
+def test_file_crc32c_matches_gcs_encoding(tmp_path):
+    path = tmp_path / "data"
+    path.write_bytes(b"123456789")
+    assert file_crc32c(path) == "4waSgw=="
+
+
+def test_small_objects_use_a_single_stream(gcs, tmp_path):
+    blob = _seed(gcs, tmp_path, 1000)
+
+    with patch(
+        "app.services.transfer.transfer_manager.download_chunks_concurrently"
+    ) as sliced:
+        size = asyncio.run(download_blob(blob, tmp_path / "copy.bin", _settings()))
+
+    sliced.assert_not_called()
+    assert size == 1000
+    assert gcs.bytes_downloaded == 1000
+
+
+def test_large_objects_are_downloaded_in_parallel_slices(gcs, tmp_path):
+    blob = _seed(gcs, tmp_path, 2 * MIB)
+    calls = []
+
+    def download_chunks(blob, filename, **kwargs):
+        calls.append(kwargs)
+        blob.download_to_filename(filename)
+
+    with patch(
+        "app.services.transfer.transfer_manager.download_chunks_concurrently",
+        download_chunks,
+    ):
+        size = asyncio.run(download_blob(blob, tmp_path / "copy.bin", _settings()))
+
+    assert size == 2 * MIB
+    assert calls[0]["chunk_size"] == 5 * MIB
+    assert calls[0]["max_workers"] == 4
+    assert calls[0]["worker_type"] == "thread"
+    assert calls[0]["crc32c_checksum"] is True
+
+
+class ChecksummedBlob:
+    """アップロードされた内容のCRC32Cをメタデータとして返すBlob"""
+
+    def __init__(self, root, corrupt: bool = False):
+        self.name = "processed/out.mp4"
+        self.path = root / "remote.bin"
+        self.corrupt = corrupt
+        self.crc32c = None
+
+    def reload(self):
+        self.crc32c = "AAAAAA==" if self.corrupt else file_crc32c(self.path)
+
+
+def _upload_chunks(filename, blob, **_kwargs):
+    shutil.copyfile(filename, blob.path)
+
+
+@pytest.mark.parametrize("corrupt", [False, True])
+def test_sliced_uploads_verify_the_assembled_object(tmp_path, corrupt):
+    local = tmp_path / "out.mp4"
+    local.write_bytes(b"o" * 2 * MIB)
+    blob = ChecksummedBlob(tmp_path, corrupt=corrupt)
+
+    with patch(
+        "app.services.transfer.transfer_manager.upload_chunks_concurrently",
+        _upload_chunks,
+    ):
+        upload = upload_blob(blob, local, _settings(), content_type="video/mp4")
+        if corrupt:
+            with pytest.raises(TransferChecksumError):
+                asyncio.run(upload)
+        else:
+            assert asyncio.run(upload) == 2 * MIB
@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+from unittest.mock import patch
+
+import google_crc32c
+import pytest
+
+from app.core.settings import Settings
+from app.models.schemas import SignedUploadUrlRequest
+from app.services.ingest import ingest_video_service
+from app.services.upload import (
+    init_upload_service,
+    verify_upload_hash,
+    verify_uploaded_content,
+)
+from benchmarks.fakes import FakeGCS
+
+CONTENT = b"video bytes" * 100
+MD5 = f"md5:{hashlib.md5(CONTENT, usedforsecurity=False).hexdigest()}"
+SETTINGS = Settings(gcs_bucket_name="bucket", gcs_project_id="project")
+
+
+@pytest.fixture
+def gcs(gcs):
+    """署名付きURLの発行も差し替える"""
+    with patch(
+        "app.services.upload.generate_signed_url",
+        return_value="https://example.com/signed-url",
+    ):
+        yield gcs
+
+
+def _init(
+    content_hash: str | None = MD5, size: int = len(CONTENT), tenant: str = "alpha"
+):
+    request = SignedUploadUrlRequest(
+        fileName="clip.mp4",
+        fileSize=size,
+        contentType="video/mp4",
+        contentHash=content_hash,
+    )
+    return asyncio.run(init_upload_service(request, SETTINGS, tenant))
+
+
+def _upload(gcs: FakeGCS, tmp_path, file_id: str, content: bytes = CONTENT) -> None:
+    source = tmp_path / "clip.mp4"
+    source.write_bytes(content)
+    gcs.seed("bucket", f"uploads/{file_id}.mp4", source)
+
+
+def _verify(gcs: FakeGCS, file_id: str) -> None:
+    blob = gcs.client().bucket("bucket").blob(f"uploads/{file_id}.mp4")
+    asyncio.run(verify_upload_hash(file_id, blob))
+
+
+def test_verified_upload_is_deduplicated(gcs, tmp_path, store):
+    """照合済みの動画と同じハッシュ・サイズならアップロードを省くこと"""
+    first = _init()
+    assert first.uploadUrl is not None
+    assert not first.deduplicated
+    # 照合前は重複排除しない
+    assert _init().fileId != first.fileId
+
+    _upload(gcs, tmp_path, first.fileId)
+    _verify(gcs, first.fileId)
+    assert asyncio.run(store.get_video(first.fileId)).content_verified
+
+    again = _init(MD5.upper().replace("MD5", "md5"))
+    assert again.fileId == first.fileId
+    assert again.deduplicated
+    assert again.uploadUrl is None
+    assert _init(size=len(CONTENT) + 1).fileId != first.fileId
+    assert _init(content_hash=None).fileId != first.fileId
+
+
+def test_other_tenants_videos_are_not_deduplicated(gcs, tmp_path):
+    """ハッシュとサイズが一致しても他のテナントの fileId は返さないこと"""
+    first = _init()
+    _upload(gcs, tmp_path, first.fileId)
+    _verify(gcs, first.fileId)
+
+    other = _init(tenant="beta")
+    assert not other.deduplicated
+    assert other.fileId != first.fileId
+    assert other.uploadUrl is not None
+
+
+def test_analysis_verifies_uploads_without_complete(gcs, tmp_path, store):
+    """取り込みを経ずに解析される動画も照合され、重複排除に使われること"""
+    first = _init()
+    _upload(gcs, tmp_path, first.fileId)
+
+    asyncio.run(verify_uploaded_content(first.fileId, SETTINGS))
+
+    assert asyncio.run(store.get_video(first.fileId)).content_verified
+    assert _init().fileId == first.fileId
+
+
+def test_analysis_drops_mismatching_hash_without_failing(gcs, tmp_path, store):
+    first = _init()
+    _upload(gcs, tmp_path, first.fileId, content=b"other bytes")
+
+    asyncio.run(verify_uploaded_content(first.fileId, SETTINGS))
+
+    assert asyncio.run(store.get_video(first.fileId)).content_hash is None
+
+
+def test_crc32c_hash_is_verified(gcs, tmp_path):
+    crc = google_crc32c.Checksum(CONTENT).digest().hex()
+    first = _init(f"crc32c:{crc}")
+    _upload(gcs, tmp_path, first.fileId)
+    _verify(gcs, first.fileId)
+
+    assert _init(f"crc32c:{crc}").fileId == first.fileId
+
+
+def test_deleted_object_is_not_deduplicated(gcs, tmp_path, store):
+    first = _init()
+    _upload(gcs, tmp_path, first.fileId)
+    _verify(gcs, first.fileId)
+    gcs.path_for("bucket", f"uploads/{first.fileId}.mp4").unlink()
+
+    again = _init()
+    assert not again.deduplicated
+    assert not asyncio.run(store.get_video(first.fileId)).content_verified
+
+
+def test_ingest_rejects_upload_that_does_not_match_hash(gcs, tmp_path, store):
+    """申告と違う内容は取り込まず、ハッシュを消して重複排除に使わないこと"""
+    first = _init()
+    _upload(gcs, tmp_path, first.fileId, content=b"other bytes")
+
+    with pytest.raises(ValueError, match="does not match contentHash"):
+        asyncio.run(ingest_video_service(first.fileId, SETTINGS))
+
+    video = asyncio.run(store.get_video(first.fileId))
+    assert video.content_hash is None
+    assert not video.content_verified
+    assert gcs.bytes_downloaded == 0
+
+
+def test_malformed_content_hash_is_rejected(client):
+    response = client.post(
+        "/api/upload/init",
+        json={
+            "fileName": "clip.mp4",
+            "fileSize": 10,
+            "contentType": "video/mp4",
+            "contentHash": "sha256:abc",
+        },
+    )
+    assert response.status_code == 422
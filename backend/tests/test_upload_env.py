@@ -37,9 +37,12 @@ async def test_upload_validates_gcs_config():
         gcs_project_id="test-project",
     )
 
-    with patch("app.services.upload.storage.Client") as mock_client, patch(
-        "app.services.upload.generate_signed_url",
-        return_value="https://example.com/signed",
+    with (
+        patch("app.services.upload.storage.Client") as mock_client,
+        patch(
+            "app.services.upload.generate_signed_url",
+            return_value="https://example.com/signed",
+        ),
     ):
         # Mock the bucket and blob
         mock_bucket = mock_client.return_value.bucket.return_value
@@ -0,0 +1,274 @@
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+
+from app.core.scheduling import EXTRACTION, _today, fair_queue, reset_queues
+from app.core.settings import Settings, get_settings
+from app.core.usage import charge
+from app.jobs import FAILED, QUEUED, RUNNING, SUCCEEDED, SQLiteJobBroker, set_broker
+from app.models.schemas import AnalysisResult, GenerateVideoResponse, Highlight
+from app.services.prerender import reset_prerender, schedule_prerender
+from app.worker import Worker
+from main import app
+
+
+@pytest.fixture
+def broker():
+    """テストごとにインメモリのジョブキューを使う"""
+    memory_broker = SQLiteJobBroker(":memory:")
+    set_broker(memory_broker)
+    yield memory_broker
+    set_broker(None)
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture(autouse=True)
+def fresh_queues():
+    reset_queues()
+    reset_prerender()
+    yield
+    reset_queues()
+    reset_prerender()
+
+
+async def _fake_analysis(file_id, *_args, **_kwargs):
+    charge(model_seconds=2.0)
+    return AnalysisResult(
+        highlights=[
+            Highlight(start=0, end=30, title=file_id, description="", score=0.9)
+        ]
+    )
+
+
+def test_queue_mode_enqueues_and_worker_completes(client, broker, store):
+    """API はジョブを登録するだけで、ワーカーが実行した結果を取得できること"""
+    settings = Settings(job_execution="queue")
+    app.dependency_overrides[get_settings] = lambda: settings
+
+    with patch("main.analyze_video_service") as inline:
+        response = client.post("/api/analyze/vid", params={"refresh": True})
+    inline.assert_not_called()
+    assert response.status_code == 202
+    job_id = response.json()["jobId"]
+    assert response.headers["Location"] == f"/api/jobs/{job_id}"
+    assert client.get(f"/api/jobs/{job_id}").json()["status"] == QUEUED
+
+    with patch("app.worker.analyze_video_service", _fake_analysis):
+        asyncio.run(Worker(settings, broker).run(drain=True))
+
+    body = client.get(f"/api/jobs/{job_id}").json()
+    assert body["status"] == SUCCEEDED
+    assert body["result"]["highlights"][0]["title"] == "vid"
+    usage = asyncio.run(store.get_tenant_usage("anonymous", _today()))
+    assert usage.model_seconds == 2.0
+
+
+@pytest.mark.usefixtures("broker")
+def test_unknown_job_returns_404(client):
+    assert client.get("/api/jobs/missing").status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_claimed_again(broker):
+    """ワーカーが停止してリースが切れたジョブは別のワーカーが取り出すこと"""
+    job = await broker.enqueue("analyze", {"fileId": "vid"}, tenant="t")
+    first = await broker.claim("w1", lease_seconds=0.01, max_attempts=3)
+    assert first.job_id == job.job_id
+    assert first.status == RUNNING
+    assert await broker.claim("w2", lease_seconds=60, max_attempts=3) is None
+
+    await asyncio.sleep(0.02)
+    second = await broker.claim("w2", lease_seconds=60, max_attempts=3)
+
+    assert second.job_id == job.job_id
+    assert second.attempts == 2
+    assert not await broker.extend_lease(job.job_id, "w1", lease_seconds=60)
+
+
+async def _failing(*_args, **_kwargs):
+    msg = "model unavailable"
+    raise RuntimeError(msg)
+
+
+@pytest.mark.asyncio
+async def test_failed_jobs_are_retried_with_backoff(broker):
+    job = await broker.enqueue("analyze", {"fileId": "vid"}, tenant="t")
+
+    with patch("app.worker.analyze_video_service", _failing):
+        await Worker(Settings(), broker).run(drain=True)
+
+    retried = await broker.get(job.job_id)
+    assert retried.status == QUEUED
+    assert retried.available_at > time.time()
+    assert retried.error == "model unavailable"
+
+
+@pytest.mark.asyncio
+async def test_jobs_fail_after_max_attempts(broker):
+    job = await broker.enqueue("analyze", {"fileId": "vid"}, tenant="t")
+
+    with (
+        patch("app.worker.analyze_video_service", _failing),
+        patch("app.worker.retry_delay", lambda _attempts: 0.0),
+    ):
+        await Worker(Settings(job_max_attempts=2), broker).run(drain=True)
+
+    failed = await broker.get(job.job_id)
+    assert failed.status == FAILED
+    assert failed.attempts == 2
+
+
+@pytest.mark.asyncio
+async def test_invalid_jobs_are_not_retried(broker):
+    job = await broker.enqueue("extract", {"fileId": "vid"}, tenant="t")
+
+    await Worker(Settings(), broker).run(drain=True)
+
+    failed = await broker.get(job.job_id)
+    assert failed.status == FAILED
+    assert failed.attempts == 1
+
+
+@pytest.mark.usefixtures("broker")
+def test_jobs_are_visible_only_to_their_tenant(client):
+    """ジョブの状態・結果は登録したテナントにだけ返すこと"""
+    settings = Settings(
+        job_execution="queue", tenant_keys={"k1": "alpha", "k2": "beta"}
+    )
+    app.dependency_overrides[get_settings] = lambda: settings
+
+    response = client.post("/api/analyze/vid", headers={"X-API-Key": "k1"})
+    job_id = response.json()["jobId"]
+
+    own = client.get(f"/api/jobs/{job_id}", headers={"X-API-Key": "k1"})
+    other = client.get(f"/api/jobs/{job_id}", headers={"X-API-Key": "k2"})
+    assert own.status_code == 200
+    assert other.status_code == 404
+    assert client.get(f"/api/jobs/{job_id}").status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_tenants_are_claimed_interleaved(broker):
+    """先に多くのジョブを登録したテナントがほかのテナントを待たせないこと"""
+    for i in range(3):
+        await broker.enqueue("analyze", {"fileId": f"a{i}"}, tenant="alpha")
+    for i in range(3):
+        await broker.enqueue("analyze", {"fileId": f"b{i}"}, tenant="beta")
+
+    claimed = [
+        await broker.claim(f"w{i}", lease_seconds=60, max_attempts=3) for i in range(6)
+    ]
+
+    assert [job.tenant for job in claimed] == ["alpha", "beta"] * 3
+
+
+@pytest.mark.asyncio
+async def test_weighted_tenants_get_more_claims(broker):
+    for i in range(4):
+        await broker.enqueue("analyze", {"fileId": f"a{i}"}, tenant="alpha")
+        await broker.enqueue("analyze", {"fileId": f"b{i}"}, tenant="beta", weight=2.0)
+
+    claimed = [
+        await broker.claim(f"w{i}", lease_seconds=60, max_attempts=3) for i in range(6)
+    ]
+
+    assert [job.tenant for job in claimed].count("beta") == 4
+
+
+@pytest.mark.asyncio
+async def test_claim_respects_running_limit_per_tenant(broker):
+    for i in range(2):
+        await broker.enqueue("analyze", {"fileId": f"a{i}"}, tenant="alpha")
+
+    first = await broker.claim("w1", lease_seconds=60, max_attempts=3, per_tenant=1)
+    assert first.tenant == "alpha"
+    assert (
+        await broker.claim("w2", lease_seconds=60, max_attempts=3, per_tenant=1) is None
+    )
+
+    await broker.complete(first.job_id, "w1", {})
+    second = await broker.claim("w2", lease_seconds=60, max_attempts=3, per_tenant=1)
+    assert second.payload == {"fileId": "a1"}
+
+
+@pytest.mark.usefixtures("broker")
+def test_enqueue_over_queued_limit_returns_429(client):
+    settings = Settings(
+        job_execution="queue",
+        tenant_keys={"k1": "alpha", "k2": "beta"},
+        tenant_max_queued=2,
+    )
+    app.dependency_overrides[get_settings] = lambda: settings
+
+    statuses = [
+        client.post("/api/analyze/vid", headers={"X-API-Key": "k1"}).status_code
+        for _ in range(3)
+    ]
+    other = client.post("/api/analyze/vid", headers={"X-API-Key": "k2"})
+
+    assert statuses == [202, 202, 429]
+    assert other.status_code == 202
+
+
+@pytest.mark.asyncio
+async def test_worker_schedules_prerender_after_analyze(broker):
+    """JOB_EXECUTION=queue でも解析の後に上位のハイライトを先行して切り出すこと"""
+    settings = Settings(job_execution="queue", prerender_top_k=1)
+    await broker.enqueue("analyze", {"fileId": "vid"}, tenant="alpha")
+
+    with (
+        patch("app.worker.analyze_video_service", _fake_analysis),
+        patch("app.worker.schedule_prerender") as schedule,
+    ):
+        await Worker(settings, broker).run(drain=True)
+
+    file_id, result, tenant, passed = schedule.call_args.args
+    assert (file_id, tenant, passed) == ("vid", "alpha", settings)
+    assert result.highlights[0].title == "vid"
+
+
+@pytest.mark.asyncio
+async def test_worker_extract_jobs_preempt_prerender(broker):
+    """ワーカーが取り出した抽出ジョブは先行の切り出しを中止させること"""
+    settings = Settings(prerender_top_k=1, extraction_concurrency=1)
+    cancelled = asyncio.Event()
+
+    async def slow_prerender(*_args, **_kwargs):
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def fake_extract(*_args, **_kwargs):
+        assert cancelled.is_set()
+        return GenerateVideoResponse(downloadUrl="https://signed/clip.mp4")
+
+    with (
+        patch("app.services.prerender.extract_video_service", slow_prerender),
+        patch("app.worker.extract_video_service", fake_extract),
+    ):
+        prerender = schedule_prerender(
+            "vid",
+            AnalysisResult(
+                highlights=[
+                    Highlight(start=0, end=5, title="t", description="", score=0.9)
+                ]
+            ),
+            "alpha",
+            settings,
+        )
+        while fair_queue(EXTRACTION, settings).running == 0:
+            await asyncio.sleep(0.01)
+        job = await broker.enqueue(
+            "extract",
+            {"fileId": "vid", "segments": [{"start": 0, "end": 5}]},
+            tenant="beta",
+        )
+        async with asyncio.timeout(2):
+            await Worker(settings, broker).run(drain=True)
+            await prerender
+
+    assert (await broker.get(job.job_id)).status == SUCCEEDED
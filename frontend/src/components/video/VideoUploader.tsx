@@ -8,6 +8,7 @@ import { Progress } from '@/components/ui/progress'
 import { useVideoStore } from '@/stores/videoStore'
 import { api } from '@/lib/api/client'
 import { validateVideoFile, getVideoDuration } from '@/lib/utils/video'
+import { computeContentHash } from '@/lib/utils/hash'
 import { cn } from '@/lib/utils'
 import { getErrorMessage } from '@/lib/error-handler'
 
@@ -38,8 +39,15 @@ export function VideoUploader() {
       // Get video duration
       const duration = await getVideoDuration(file)
       
+      // 同じ内容の動画がアップロード済みならアップロードを省けるよう、ハッシュを求める
+      // （失敗してもハッシュなしでアップロードする）
+      const contentHash = await computeContentHash(file).catch((error) => {
+        console.warn('Failed to hash the video, uploading without dedup:', error)
+        return undefined
+      })
+
       // Get signed URL for upload
-      const { uploadUrl, fileId } = await api.getSignedUploadUrl(file.name, file.size)
+      const { uploadUrl, fileId, deduplicated } = await api.getSignedUploadUrl(file.name, file.size, contentHash)
       
       // Create video file object
       const videoFileObject = {
@@ -49,14 +57,19 @@ export function VideoUploader() {
         duration
       }
       
-      // Upload to Cloud Storage
-      await api.uploadVideo(uploadUrl, file, (percentage) => {
-        setUploadProgress({
-          loaded: (file.size * percentage) / 100,
-          total: file.size,
-          percentage
+      // Upload to Cloud Storage（アップロード済みの動画と同じ内容なら不要）
+      if (!deduplicated) {
+        if (!uploadUrl) {
+          throw new Error(getErrorMessage('API_UPLOAD_INIT_FAILED'))
+        }
+        await api.uploadVideo(uploadUrl, file, (percentage) => {
+          setUploadProgress({
+            loaded: (file.size * percentage) / 100,
+            total: file.size,
+            percentage
+          })
         })
-      })
+      }
       
       // Set video file in store
       setVideoFile(videoFileObject)
@@ -37,7 +37,7 @@ async function fetchWithError(url: string, options?: RequestInit) {
  * 動画処理APIクライアントの実装
  */
 class VideoApiClient implements IVideoApiClient {
-  async getSignedUploadUrl(fileName: string, fileSize: number): Promise<SignedUploadUrlResponse> {
+  async getSignedUploadUrl(fileName: string, fileSize: number, contentHash?: string): Promise<SignedUploadUrlResponse> {
     // Determine content type from file extension
     const contentTypeMap: Record<string, string> = {
       'mp4': 'video/mp4',
@@ -51,7 +51,7 @@ class VideoApiClient implements IVideoApiClient {
 
     const response = await fetchWithError('/api/upload/init', {
       method: 'POST',
-      body: JSON.stringify({ fileName, fileSize, contentType }),
+      body: JSON.stringify({ fileName, fileSize, contentType, contentHash }),
     })
 
     const data = await response.json()
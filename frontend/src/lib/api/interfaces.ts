@@ -14,9 +14,11 @@ export interface IVideoApiClient {
    * 署名付きアップロードURLを取得
    * @param fileName - ファイル名
    * @param fileSize - ファイルサイズ（バイト）
-   * @returns アップロードURLとファイルID
+   * @param contentHash - ファイル全体のハッシュ（"crc32c:<hex>"、重複排除に使う）
+   * @returns アップロードURLとファイルID（アップロード済みの動画と同じ内容なら
+   *          uploadUrl の代わりに deduplicated: true）
    */
-  getSignedUploadUrl(fileName: string, fileSize: number): Promise<SignedUploadUrlResponse>
+  getSignedUploadUrl(fileName: string, fileSize: number, contentHash?: string): Promise<SignedUploadUrlResponse>
 
   /**
    * Cloud Storageに動画をアップロード
@@ -0,0 +1,58 @@
+// CRC32C（Castagnoli）の多項式（反転表現）
+const CRC32C_POLYNOMIAL = 0x82f63b78
+
+// ファイルを読み込む単位（全体をメモリに載せない）
+const CHUNK_SIZE = 8 * 1024 * 1024
+
+const CRC32C_TABLE = (() => {
+  const table = new Uint32Array(256)
+  for (let i = 0; i < 256; i++) {
+    let crc = i
+    for (let bit = 0; bit < 8; bit++) {
+      crc = crc & 1 ? (crc >>> 1) ^ CRC32C_POLYNOMIAL : crc >>> 1
+    }
+    table[i] = crc >>> 0
+  }
+  return table
+})()
+
+/**
+ * CRC32Cにバイト列を追加する
+ * @param crc - これまでのCRC32C（最初は 0）
+ * @param bytes - 追加するバイト列
+ * @returns 追加後のCRC32C
+ */
+export function crc32cUpdate(crc: number, bytes: Uint8Array): number {
+  let value = ~crc >>> 0
+  for (let i = 0; i < bytes.length; i++) {
+    value = CRC32C_TABLE[(value ^ bytes[i]) & 0xff] ^ (value >>> 8)
+  }
+  return ~value >>> 0
+}
+
+/**
+ * アップロードの重複排除に使うハッシュ（"crc32c:<hex>"）
+ * GCSがオブジェクトに付けるCRC32Cと同じ値で、バックエンドが照合する
+ */
+export function formatContentHash(crc: number): string {
+  return `crc32c:${crc.toString(16).padStart(8, '0')}`
+}
+
+/**
+ * ファイル全体のハッシュを分割して読みながら求める
+ * @param file - アップロードするファイル
+ * @param onProgress - 進捗コールバック（0-100のパーセンテージ）
+ * @returns "crc32c:<hex>"
+ */
+export async function computeContentHash(
+  file: Blob,
+  onProgress?: (progress: number) => void
+): Promise<string> {
+  let crc = 0
+  for (let offset = 0; offset < file.size; offset += CHUNK_SIZE) {
+    const chunk = await file.slice(offset, offset + CHUNK_SIZE).arrayBuffer()
+    crc = crc32cUpdate(crc, new Uint8Array(chunk))
+    onProgress?.((Math.min(offset + CHUNK_SIZE, file.size) / file.size) * 100)
+  }
+  return formatContentHash(crc)
+}
@@ -19,9 +19,11 @@ export const AnalysisResultSchema = z.object({
 })
 
 // Signed upload URL response schema
+// 同じ内容の動画がアップロード済み（deduplicated）の場合は uploadUrl がない
 export const SignedUploadUrlResponseSchema = z.object({
-  uploadUrl: z.string().url(),
+  uploadUrl: z.string().url().nullish(),
   fileId: z.string().min(1),
+  deduplicated: z.boolean().optional(),
 })
 
 // Video segment schema
@@ -47,6 +49,7 @@ export const SignedUploadUrlRequestSchema = z.object({
   fileName: z.string().min(1),
   fileSize: z.number().min(1),
   contentType: z.string().regex(/^video\/.+/),
+  contentHash: z.string().regex(/^(md5:[0-9a-fA-F]{32}|crc32c:[0-9a-fA-F]{8})$/).optional(),
 })
 
 export const ExtractRequestSchema = z.object({
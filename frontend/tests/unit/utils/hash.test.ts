@@ -0,0 +1,26 @@
+import { describe, it, expect } from 'vitest'
+import { crc32cUpdate, formatContentHash } from '@/lib/utils/hash'
+
+const encode = (text: string) => new TextEncoder().encode(text)
+
+describe('crc32cUpdate', () => {
+  it('should match the CRC32C check value', () => {
+    expect(crc32cUpdate(0, encode('123456789'))).toBe(0xe3069283)
+  })
+
+  it('should give the same value when fed in chunks', () => {
+    const chunked = crc32cUpdate(crc32cUpdate(0, encode('1234')), encode('56789'))
+    expect(chunked).toBe(crc32cUpdate(0, encode('123456789')))
+  })
+
+  it('should match the CRC32C that GCS computes', () => {
+    expect(crc32cUpdate(0, encode('video bytes'.repeat(100)))).toBe(0x5bde1ac6)
+  })
+})
+
+describe('formatContentHash', () => {
+  it('should zero-pad the hex digits', () => {
+    expect(formatContentHash(0x1234)).toBe('crc32c:00001234')
+    expect(formatContentHash(0xe3069283)).toBe('crc32c:e3069283')
+  })
+})